@@ -73,6 +73,7 @@ class JsonFormatter(logging.Formatter):
             "user_id_hashed": user_id_hashed,
             "path": path,
             "latency_ms": getattr(record, "latency_ms", None),
+            "sql": getattr(record, "sql", None),
         }
         return json.dumps(payload, ensure_ascii=False)
 
@@ -153,6 +154,87 @@ def create_app():
         ),
     )
 
+    # --- Pool de conexiones SQLite (backend.db_utils.get_db) ---
+    app.config.update(
+        DB_POOL_SIZE=int(os.environ.get('DB_POOL_SIZE', 8)),
+        DB_POOL_TIMEOUT=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        SQLITE_BUSY_TIMEOUT_MS=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        SQLITE_CACHE_SIZE_KIB=int(os.environ.get('SQLITE_CACHE_SIZE_KIB', 16384)),
+        SQLITE_MMAP_SIZE=int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+    )
+    # Instrumentación SQL por petición (backend.sql_stats)
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+    app.config['SQL_SERVER_TIMING'] = os.environ.get('SQL_SERVER_TIMING', '1' if app.debug else '0') == '1'
+    # Una línea de log por petición con latency_ms (backend.request_metrics)
+    app.config['ACCESS_LOG'] = os.environ.get('ACCESS_LOG', '1') == '1'
+    # Despachador de notification_outbox (backend.outbox)
+    app.config.update(
+        OUTBOX_DISPATCHER=os.environ.get('OUTBOX_DISPATCHER', '1') == '1',
+        OUTBOX_BATCH_SIZE=int(os.environ.get('OUTBOX_BATCH_SIZE', 100)),
+        OUTBOX_SEND_CONCURRENCY=int(os.environ.get('OUTBOX_SEND_CONCURRENCY', 8)),
+        OUTBOX_MAX_ATTEMPTS=int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5)),
+        OUTBOX_RETRY_BASE_SECONDS=float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 30)),
+        OUTBOX_POLL_INTERVAL=float(os.environ.get('OUTBOX_POLL_INTERVAL', 5)),
+    )
+    # Procesador de inbound_events (backend.inbound_events)
+    app.config.update(
+        INBOUND_WORKER=os.environ.get('INBOUND_WORKER', '1') == '1',
+        INBOUND_BATCH_SIZE=int(os.environ.get('INBOUND_BATCH_SIZE', 100)),
+        INBOUND_MAX_ATTEMPTS=int(os.environ.get('INBOUND_MAX_ATTEMPTS', 5)),
+        INBOUND_RETRY_BASE_SECONDS=float(os.environ.get('INBOUND_RETRY_BASE_SECONDS', 30)),
+        INBOUND_POLL_INTERVAL=float(os.environ.get('INBOUND_POLL_INTERVAL', 5)),
+    )
+    # Backend de envío de WhatsApp (backend.messaging): meta, twilio o fake
+    app.config.update(
+        MESSAGING_BACKEND=os.environ.get('MESSAGING_BACKEND', 'meta'),
+        MESSAGING_FAKE_LATENCY=float(os.environ.get('MESSAGING_FAKE_LATENCY', 0)),
+        MESSAGING_FAKE_ERROR_RATE=float(os.environ.get('MESSAGING_FAKE_ERROR_RATE', 0)),
+    )
+    # Retención de whatsapp_message_logs (backend.wa_logs, flask wa-logs-archive)
+    app.config.update(
+        WA_LOG_RETENTION_DAYS=int(os.environ.get('WA_LOG_RETENTION_DAYS', 90)),
+        WA_LOG_ARCHIVE_BATCH_SIZE=int(os.environ.get('WA_LOG_ARCHIVE_BATCH_SIZE', 500)),
+        WA_LOG_ARCHIVE_PAUSE=float(os.environ.get('WA_LOG_ARCHIVE_PAUSE', 0.05)),
+    )
+    # Estados de entrega de WhatsApp acumulados por lotes (backend.wa_status)
+    app.config.update(
+        WA_STATUS_FLUSHER=os.environ.get('WA_STATUS_FLUSHER', '1') == '1',
+        WA_STATUS_FLUSH_INTERVAL=float(os.environ.get('WA_STATUS_FLUSH_INTERVAL', 1)),
+        WA_STATUS_BATCH_SIZE=int(os.environ.get('WA_STATUS_BATCH_SIZE', 200)),
+    )
+    # Tickets de mantenimientos programados (backend.maintenance_scheduler, flask maintenance-run)
+    app.config.update(
+        MAINTENANCE_SCHEDULER=os.environ.get('MAINTENANCE_SCHEDULER', '0') == '1',
+        MAINTENANCE_SCHEDULER_INTERVAL=float(os.environ.get('MAINTENANCE_SCHEDULER_INTERVAL', 3600)),
+        MAINTENANCE_BATCH_SIZE=int(os.environ.get('MAINTENANCE_BATCH_SIZE', 200)),
+    )
+    # Vigilante de tickets.sla_due (backend.sla_monitor, flask sla-check)
+    app.config.update(
+        SLA_MONITOR=os.environ.get('SLA_MONITOR', '1') == '1',
+        SLA_SYNC_INTERVAL=float(os.environ.get('SLA_SYNC_INTERVAL', 5)),
+        SLA_CHANGES_RETENTION=int(os.environ.get('SLA_CHANGES_RETENTION', 3600)),
+    )
+    # Recibos PDF en segundo plano (backend.receipt_worker, flask receipts-render);
+    # RECEIPT_POOL_SIZE=0 renderiza en el hilo, sin procesos
+    app.config.update(
+        RECEIPT_WORKER=os.environ.get('RECEIPT_WORKER', '1') == '1',
+        RECEIPT_POOL_SIZE=int(os.environ.get('RECEIPT_POOL_SIZE', 2)),
+        RECEIPT_BATCH_SIZE=int(os.environ.get('RECEIPT_BATCH_SIZE', 20)),
+        RECEIPT_MAX_ATTEMPTS=int(os.environ.get('RECEIPT_MAX_ATTEMPTS', 3)),
+        RECEIPT_POLL_INTERVAL=float(os.environ.get('RECEIPT_POLL_INTERVAL', 30)),
+    )
+    # Ficheros direccionados por contenido (backend.blob_store): PDF firmados y firmas
+    app.config['BLOB_FOLDER'] = os.environ.get('BLOB_FOLDER', os.path.join(app.instance_path, 'blobs'))
+    # URL pública (https://host) de los enlaces que generan los hilos en segundo plano
+    app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL')
+    # Caché LRU de backend.phone_directory (remitentes conocidos)
+    app.config['PHONE_DIRECTORY_CACHE_SIZE'] = int(os.environ.get('PHONE_DIRECTORY_CACHE_SIZE', 1024))
+    app.config['PHONE_DIRECTORY_CACHE_TTL'] = float(os.environ.get('PHONE_DIRECTORY_CACHE_TTL', 300))
+    # Cargar los índices de autocompletado al arrancar cada worker (backend.autocomplete)
+    app.config['AUTOCOMPLETE_WARM'] = os.environ.get('AUTOCOMPLETE_WARM', '1') == '1'
+    # Segundos que get_dashboard_kpis puede servir KPIs desde caché
+    app.config['KPI_CACHE_TTL'] = float(os.environ.get('KPI_CACHE_TTL', 30))
+
     # --- NEW: SQLAlchemy Configuration ---
     app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{app.config['DATABASE']}"
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -220,6 +302,21 @@ def create_app():
         db.init_app(app)
         migrate.init_app(app, db)
 
+    # --- Conexiones sqlite3 de get_db(): devolverlas al pool al acabar cada contexto ---
+    from .db_utils import init_app as init_db_pool
+
+    init_db_pool(app)
+
+    # --- Métricas SQL por petición: sqlite3 (get_db) y engine de SQLAlchemy ---
+    from .sql_stats import init_app as init_sql_stats
+
+    init_sql_stats(app, db)
+
+    # --- Latencias/códigos por endpoint y GET /metrics (Prometheus) ---
+    from .request_metrics import init_app as init_request_metrics
+
+    init_request_metrics(app)
+
     # --- Autenticación ---
     from backend.models import get_table_class
 
@@ -278,6 +375,43 @@ def create_app():
     def load_logged_in_user_to_g():
         g.user = current_user
 
+    from .wa_throttle import DEFAULT_REQUEST_MAX_WAIT, reset_wait_limit, set_wait_limit
+
+    @app.before_request
+    def _limit_whatsapp_wait():
+        # Un envío de WhatsApp dentro de una petición no espera más de
+        # WHATSAPP_REQUEST_MAX_WAIT; los hilos en segundo plano usan WHATSAPP_MAX_WAIT
+        g._wa_wait_token = set_wait_limit(
+            float(app.config.get('WHATSAPP_REQUEST_MAX_WAIT', DEFAULT_REQUEST_MAX_WAIT))
+        )
+
+    @app.teardown_request
+    def _reset_whatsapp_wait(_exc=None):
+        token = g.pop('_wa_wait_token', None)
+        if token is not None:
+            reset_wait_limit(token)
+
+    @app.before_request
+    def _start_background_workers():
+        # Una vez por proceso, con la primera petición: cada ensure_* arranca su
+        # hilo sólo si su opción de configuración está activa
+        if app.extensions.get('background_workers_started'):
+            return
+        from .autocomplete import ensure_autocomplete_warm
+        from .inbound_events import ensure_inbound_worker
+        from .maintenance_scheduler import ensure_scheduler
+        from .outbox import ensure_dispatcher
+        from .receipt_worker import ensure_receipt_worker
+        from .sla_monitor import ensure_sla_monitor
+
+        ensure_scheduler()           # MAINTENANCE_SCHEDULER=1; si no, `flask maintenance-run` desde cron
+        ensure_dispatcher()          # drena el outbox pendiente tras un reinicio
+        ensure_inbound_worker()      # reintenta los eventos entrantes pendientes
+        ensure_receipt_worker()      # recibos y presupuestos firmados encolados antes de un reinicio
+        ensure_autocomplete_warm()
+        ensure_sla_monitor()
+        app.extensions['background_workers_started'] = True
+
     # --- Simplified Global Error Handler ---
     @app.errorhandler(Exception)
     def handle_exception(e):
@@ -378,31 +512,25 @@ def create_app():
     def api_trabajos():
         """
         API endpoint to fetch jobs/events for the FullCalendar.
+
+        Sólo devuelve la ventana start/end que pide FullCalendar (ver
+        backend.calendar_feed) y responde 304 si el ETag no ha cambiado.
         """
-        Ticket = get_table_class("tickets")
-        Evento = get_table_class("eventos")
-        ScheduledMaintenance = get_table_class("scheduled_maintenances")
-        events = []
-        tickets = Ticket.query.all()
-        for ticket in tickets:
-            events.append({
-                'id': ticket.id,
-                'title': ticket.descripcion,
-                'start': ticket.fecha_creacion,
-                'end': ticket.fecha_fin,
-                'type': 'job'
-            })
-        
-        maintenances = ScheduledMaintenance.query.filter_by(estado='activo').all()
-        for maintenance in maintenances:
-            events.append({
-                'id': maintenance.id,
-                'title': maintenance.description,
-                'start': maintenance.next_due,
-                'type': 'maintenance'
-            })
-
-        return jsonify(events)
+        from .calendar_feed import fetch_events, parse_window
+        from .db_utils import get_db
+
+        try:
+            start, end = parse_window(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        db = get_db()
+        if db is None:
+            return jsonify({"error": "Database connection error"}), 500
+        response = jsonify(fetch_events(db, start, end))
+        response.add_etag()
+        # El navegador revalida siempre; si nada cambió la respuesta es un 304 sin cuerpo
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response.make_conditional(request)
 
     @app.get("/api/dashboard/kpis")
     @login_required # Added login_required as per previous context
@@ -419,6 +547,15 @@ def create_app():
 
 
 
+    @app.get("/api/sla/breaches")
+    @login_required
+    def api_sla_breaches():
+        """Incumplimientos de SLA por cliente, técnico y prioridad (contadores de backend.sla_monitor)."""
+        from .db_utils import get_db
+        from .sla_monitor import breach_stats
+
+        return jsonify({"ok": True, "data": breach_stats(get_db())})
+
     @app.route("/clientes")
     def clientes_alias():
         return redirect(url_for("clients.list_clients"))
@@ -431,6 +568,7 @@ def create_app():
         asset_management,
         auth,
         autocomplete,
+        blob_store,
         catalog,
         clients,
         feedback,
@@ -449,6 +587,7 @@ def create_app():
         quotes,
         reports,
         scheduled_maintenance,
+        search,
         services,
         shared_expenses,
         stock_movements,
@@ -489,6 +628,8 @@ def create_app():
     app.register_blueprint(whatsapp_twilio.bp)
     app.register_blueprint(catalog.bp)
     app.register_blueprint(autocomplete.bp)
+    app.register_blueprint(search.bp)
+    app.register_blueprint(blob_store.bp)
     app.register_blueprint(whatsapp_meta.whatsapp_meta_bp)
     app.register_blueprint(accounting.bp)  # Register the new accounting blueprint
 
@@ -16,7 +16,8 @@ from flask_login import UserMixin, current_user  # Import UserMixin and current_
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from backend.db_utils import get_db
-from backend.wa_client import send_whatsapp_text  # Import send_whatsapp_text
+from backend.metrics import invalidate_dashboard_kpis
+from backend.messaging import send_whatsapp_text
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -256,6 +257,7 @@ def register_client():
                 )
 
                 db.commit()
+                invalidate_dashboard_kpis()
                 flash("¡Registro exitoso! Se ha enviado un código de confirmación a tu número de WhatsApp.")
                 return redirect(url_for("auth.whatsapp_confirm", user_id=user_id))
 
@@ -350,6 +352,7 @@ def register_freelancer():
                 )
 
                 db.commit()
+                invalidate_dashboard_kpis()
                 flash("¡Registro exitoso! Se ha enviado un código de confirmación a tu número de WhatsApp.")
                 return redirect(url_for("auth.whatsapp_confirm", user_id=user_id))
 
@@ -1,61 +1,180 @@
-from flask import Blueprint, jsonify, request
+import threading
+import unicodedata
+
+from flask import Blueprint, current_app, has_app_context, jsonify, request
 
 from backend.db_utils import get_db
 
 bp = Blueprint('autocomplete', __name__, url_prefix='/autocomplete')
 
-# Autocompletion endpoint for clients
-@bp.route('/clients')
-def autocomplete_clients():
-    """Provides autocompletion suggestions for client names based on a query string."""
+# Índices de autocompletado en memoria. Cada fuente (clientes, materiales,
+# servicios, técnicos) se carga una vez por proceso en un PrefixIndex y se
+# reconstruye sólo cuando cambia su contador en autocomplete_versions, que
+# mantienen los triggers de schema.sql; así todos los workers ven las altas,
+# ediciones y bajas sin recorrer la tabla en cada pulsación.
+AUTOCOMPLETE_LIMIT = 10
+
+# fuente: (consulta, campos buscables, campo de orden, contador en autocomplete_versions)
+SOURCES = {
+    'clientes': ('SELECT id, nombre FROM clientes', ('nombre',), 'nombre', 'clientes'),
+    'materiales': ('SELECT id, nombre, sku FROM materiales', ('nombre', 'sku'), 'nombre', 'materiales'),
+    'servicios': ('SELECT id, name, description FROM servicios', ('name', 'description'), 'name', 'servicios'),
+    'tecnicos': (
+        "SELECT id, username FROM users WHERE role = 'tecnico' OR role = 'autonomo'",
+        ('username',), 'username', 'users',
+    ),
+}
+
+
+def fold(text) -> str:
+    """Minúsculas y sin acentos ('Fontanería' -> 'fontaneria')."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text).casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PrefixIndex:
+    """
+    Índice en memoria sobre `fields` de `rows`, ordenado por `sort_field`.
+
+    Consultas de 3 o más caracteres: candidatos del trigrama menos frecuente y
+    comprobación de subcadena (mismo resultado que LIKE '%q%', sin acentos ni
+    mayúsculas). Consultas de 1-2 caracteres: prefijo de cualquier palabra.
+    """
+
+    def __init__(self, rows, fields, sort_field):
+        self.rows = sorted((dict(row) for row in rows), key=lambda r: (fold(r[sort_field]), r['id']))
+        # \x00 separa campos para que una coincidencia no cruce de uno a otro
+        self._texts = ['\x00'.join(fold(row[f]) for f in fields) for row in self.rows]
+        # Listas de posiciones en orden de `sort_field`: se recorren en orden y
+        # se corta al llegar a `limit`, sin ordenar ni intersectar conjuntos.
+        grams: dict[str, list[int]] = {}
+        prefixes: dict[str, list[int]] = {}
+        for pos, text in enumerate(self._texts):
+            for gram in _trigrams(text):
+                grams.setdefault(gram, []).append(pos)
+            words = text.replace('\x00', ' ').split()
+            for prefix in {w[:1] for w in words} | {w[:2] for w in words if len(w) > 1}:
+                prefixes.setdefault(prefix, []).append(pos)
+        self._grams = grams
+        self._prefixes = prefixes
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        q = fold(query).strip()
+        if not q:
+            return self.rows[:limit]
+        if len(q) >= 3:
+            # La lista de trigrama más corta acota los candidatos; la subcadena se comprueba
+            shortest = min((self._grams.get(g, ()) for g in _trigrams(q)), key=len)
+            matches = (pos for pos in shortest if q in self._texts[pos])
+        else:
+            matches = iter(self._prefixes.get(q, ()))
+        result = []
+        for pos in matches:
+            result.append(self.rows[pos])
+            if len(result) >= limit:
+                break
+        return result
+
+
+_indexes: dict[tuple[str, str], tuple[int, PrefixIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _source_version(db, counter):
+    row = db.execute('SELECT version FROM autocomplete_versions WHERE source = ?', (counter,)).fetchone()
+    return row[0] if row else 0
+
+
+def get_index(db, source) -> PrefixIndex:
+    """PrefixIndex de `source`, reconstruido si su versión en la BD ha cambiado."""
+    sql, fields, sort_field, counter = SOURCES[source]
+    key = (current_app.config.get('DATABASE', '') if has_app_context() else f'conn:{id(db)}', source)
+    version = _source_version(db, counter)
+    cached = _indexes.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
+    index = PrefixIndex(db.execute(sql).fetchall(), fields, sort_field)
+    with _indexes_lock:
+        current = _indexes.get(key)
+        # Distinta, no sólo mayor: tras restaurar o recrear la BD el contador baja
+        if current is None or current[0] != version:
+            _indexes[key] = (version, index)
+    return index
+
+
+def warm_autocomplete(db):
+    """Construye todos los índices (p. ej. al arrancar un worker). Devuelve {fuente: filas}."""
+    return {source: len(get_index(db, source)) for source in SOURCES}
+
+
+_warm_thread = None
+_warm_lock = threading.Lock()
+
+
+def _warm_loop(app):
+    with app.app_context():
+        try:
+            counts = warm_autocomplete(get_db())
+            app.logger.info("Índices de autocompletado cargados: %s", counts)
+        except Exception:
+            app.logger.exception("Error cargando los índices de autocompletado")
+
+
+def ensure_autocomplete_warm():
+    """
+    Carga una vez por proceso los índices de autocompletado en un hilo, si
+    AUTOCOMPLETE_WARM está activo, para que la primera pulsación de cada
+    worker no pague la construcción.
+    """
+    global _warm_thread
+    if _warm_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("AUTOCOMPLETE_WARM", True):
+        return
+    with _warm_lock:
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_warm_loop, args=(app,), name="autocomplete-warm", daemon=True)
+            _warm_thread.start()
+
+
+def _search(source):
     query = request.args.get('q', '').strip()
     db = get_db()
     if db is None:
         return jsonify({"error": "Database connection error"}), 500
-    clients = db.execute(
-        'SELECT id, nombre FROM clientes WHERE nombre LIKE ? ORDER BY nombre LIMIT 10',
-        (f'%{query}%',)
-    ).fetchall()
-    return jsonify([dict(client) for client in clients])
+    return jsonify(get_index(db, source).search(query))
+
+
+# Autocompletion endpoint for clients
+@bp.route('/clients')
+def autocomplete_clients():
+    """Provides autocompletion suggestions for client names based on a query string."""
+    return _search('clientes')
 
 # Autocompletion endpoint for materials
 @bp.route('/materials')
 def autocomplete_materials():
     """Provides autocompletion suggestions for material names and SKUs based on a query string."""
-    query = request.args.get('q', '').strip()
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "Database connection error"}), 500
-    materials = db.execute(
-        'SELECT id, nombre, sku FROM materiales WHERE nombre LIKE ? OR sku LIKE ? ORDER BY nombre LIMIT 10',
-        (f'%{query}%', f'%{query}%')
-    ).fetchall()
-    return jsonify([dict(material) for material in materials])
+    return _search('materiales')
 
 # Autocompletion endpoint for services
 @bp.route('/services')
 def autocomplete_services():
     """Provides autocompletion suggestions for service names and descriptions based on a query string."""
-    query = request.args.get('q', '').strip()
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "Database connection error"}), 500
-    services = db.execute(
-        'SELECT id, name, description FROM services WHERE name LIKE ? OR description LIKE ? ORDER BY name LIMIT 10',
-        (f'%{query}%', f'%{query}%')
-    ).fetchall()
-    return jsonify([dict(service) for service in services])
+    return _search('servicios')
 
 # Autocompletion endpoint for technicians and freelancers
 @bp.route('/technicians_freelancers')
 def autocomplete_technicians_freelancers():
     """Provides autocompletion suggestions for technician and freelancer usernames based on a query string."""
-    query = request.args.get('q', '').strip()
-    db = get_db()
-    if db is None:
-        return jsonify({"error": "Database connection error"}), 500
-    users = db.execute(
-        "SELECT id, username FROM users WHERE (role = 'tecnico' OR role = 'autonomo') AND username LIKE ? ORDER BY username LIMIT 10",
-        (f'%{query}%',)
-    ).fetchall()
-    return jsonify([dict(user) for user in users])
+    return _search('tecnicos')
@@ -0,0 +1,85 @@
+# backend/blob_store.py
+"""
+Almacén de ficheros direccionado por contenido (PDF de presupuestos firmados,
+imágenes de firma).
+
+Cada fichero se guarda una sola vez en BLOB_FOLDER/<2 primeros hex>/<sha256>
+y se registra en la tabla blobs; las filas de negocio guardan sólo el hash.
+Como el contenido de un hash no cambia nunca, /blobs/<sha256> se sirve con
+Cache-Control immutable y ETag = hash, y guardar dos veces los mismos bytes
+no ocupa más disco. El hash (256 bits) hace además de enlace no adivinable,
+así los PDF se pueden enviar al cliente sin que tenga sesión.
+"""
+import hashlib
+import os
+import re
+
+from flask import Blueprint, current_app, send_file, url_for
+
+from backend.db_utils import get_db
+
+bp = Blueprint('blobs', __name__, url_prefix='/blobs')
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+MAX_AGE = 365 * 24 * 3600
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(current_app.config['BLOB_FOLDER'], sha256[:2], sha256)
+
+
+def store_blob(db, data: bytes, content_type: str) -> str:
+    """
+    Guarda `data` (si no estaba ya) y devuelve su sha256. No hace commit. El
+    fichero se escribe en un temporal y se renombra: nunca hay un blob a medias
+    con el nombre definitivo.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    db.execute(
+        'INSERT OR IGNORE INTO blobs (sha256, content_type, size) VALUES (?, ?, ?)',
+        (sha256, content_type, len(data)),
+    )
+    return sha256
+
+
+def read_blob(sha256: str) -> bytes:
+    with open(blob_path(sha256), 'rb') as f:
+        return f.read()
+
+
+def blob_url(sha256: str, external=False) -> str:
+    return url_for('blobs.get_blob', sha256=sha256, _external=external)
+
+
+def public_blob_url(sha256: str, base_url=None) -> str:
+    """
+    Enlace absoluto para enviar fuera de la aplicación (WhatsApp). El host sale
+    de PUBLIC_BASE_URL o, si no está configurada, de `base_url` (la raíz de la
+    petición que originó el documento); fuera de una petición real url_for
+    sólo sabría el host si hay SERVER_NAME.
+    """
+    base_url = current_app.config.get('PUBLIC_BASE_URL') or base_url
+    if not base_url:
+        return blob_url(sha256, external=True)
+    return f"{base_url.rstrip('/')}/blobs/{sha256}"
+
+
+@bp.route('/<sha256>')
+def get_blob(sha256):
+    db = get_db()
+    row = None
+    if db is not None and _SHA256_RE.match(sha256):
+        row = db.execute('SELECT content_type FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+    if row is None or not os.path.exists(blob_path(sha256)):
+        return 'Fichero no encontrado', 404
+    response = send_file(blob_path(sha256), mimetype=row['content_type'], etag=sha256, max_age=MAX_AGE, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,106 @@
+# backend/calendar_feed.py
+"""
+Eventos del calendario (/api/trabajos) para una ventana [start, end).
+
+FullCalendar pide sólo el rango visible (parámetros start/end en ISO 8601),
+así que los trabajos se leen con dos consultas por rango sobre índices (los
+creados dentro de la ventana y los que empezaron antes y siguen abiertos en
+ella) proyectando sólo las columnas del evento, y los mantenimientos
+recurrentes se expanden en sus ocurrencias dentro de la ventana.
+"""
+from datetime import date, datetime, timedelta, timezone
+
+from .recurrence import FREQUENCIES, occurrences, parse_date
+
+DEFAULT_WINDOW_DAYS = 42  # rejilla mensual de FullCalendar (6 semanas)
+MAX_WINDOW_DAYS = 400
+
+TICKETS_IN_WINDOW_SQL = """
+    SELECT id, COALESCE(titulo, descripcion) AS title, fecha_creacion, fecha_fin
+    FROM tickets
+    WHERE fecha_creacion >= ? AND fecha_creacion < ?
+    UNION ALL
+    SELECT id, COALESCE(titulo, descripcion), fecha_creacion, fecha_fin
+    FROM tickets
+    WHERE fecha_fin >= ? AND +fecha_creacion < ?
+"""
+# Segunda rama por idx_tickets_fecha_fin: el '+' evita que SQLite use
+# idx_tickets_fecha_creacion para `fecha_creacion < ?`, que recorrería todo
+# el histórico. Sin ORDER BY por la misma razón; se ordena en Python.
+
+# Mantenimientos activos (mantenimientos_programados, los que genera
+# maintenance_scheduler) que pueden caer en la ventana: recurrentes con la
+# próxima fecha anterior al fin, o puntuales con la fecha dentro. Las
+# ocurrencias se calculan desde fecha_inicio, como el generador de tickets;
+# las anteriores a proxima_fecha_mantenimiento ya son tickets.
+_RECURRING = ", ".join(f"'{name}'" for name in FREQUENCIES)
+MAINTENANCES_IN_WINDOW_SQL = f"""
+    SELECT id, COALESCE(descripcion, 'Mantenimiento ' || tipo_mantenimiento) AS title, tipo_mantenimiento,
+           COALESCE(fecha_inicio, proxima_fecha_mantenimiento) AS anchor, proxima_fecha_mantenimiento
+    FROM mantenimientos_programados
+    WHERE estado = 'activo'
+      AND proxima_fecha_mantenimiento < ?
+      AND (lower(trim(tipo_mantenimiento)) IN ({_RECURRING}) OR proxima_fecha_mantenimiento >= ?)
+    ORDER BY id
+"""
+
+
+def _parse_bound(value) -> datetime:
+    """datetime naive en UTC (como CURRENT_TIMESTAMP) desde un parámetro ISO 8601."""
+    value = value.strip()
+    if "T" in value:
+        # El '+' de la zona horaria llega como espacio si no se codificó en la URL
+        value = value.replace(" ", "+")
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_window(args, today=None):
+    """
+    (start, end) desde los parámetros de FullCalendar. Sin parámetros, las
+    seis semanas desde el día 1 del mes actual. ValueError si son inválidos o
+    la ventana supera MAX_WINDOW_DAYS.
+    """
+    raw_start, raw_end = args.get("start"), args.get("end")
+    if raw_start:
+        start = _parse_bound(raw_start)
+    else:
+        start = datetime.combine((today or date.today()).replace(day=1), datetime.min.time())
+    end = _parse_bound(raw_end) if raw_end else start + timedelta(days=DEFAULT_WINDOW_DAYS)
+    if end <= start:
+        raise ValueError("end debe ser posterior a start")
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise ValueError(f"La ventana no puede superar {MAX_WINDOW_DAYS} días")
+    return start, end
+
+
+def fetch_events(db, start: datetime, end: datetime) -> list[dict]:
+    """Trabajos y ocurrencias de mantenimientos en [start, end), formato FullCalendar."""
+    start_text, end_text = start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")
+    events = [
+        {"id": row[0], "title": row[1], "start": row[2], "end": row[3], "type": "job"}
+        for row in sorted(
+            db.execute(TICKETS_IN_WINDOW_SQL, (start_text, end_text, start_text, start_text)).fetchall(),
+            key=lambda row: (row[2] or "", row[0]),
+        )
+    ]
+
+    first_day = start.date()
+    # Fin exclusivo en días: si la ventana acaba a mitad de un día, ese día entra
+    last_day = end.date() + timedelta(days=1) if end.time() != datetime.min.time() else end.date()
+    for row in db.execute(MAINTENANCES_IN_WINDOW_SQL, (last_day.isoformat(), first_day.isoformat())).fetchall():
+        anchor, next_due = parse_date(row[3]), parse_date(row[4])
+        if anchor is None or next_due is None:
+            continue
+        for day in occurrences(anchor, row[2], max(first_day, next_due), last_day):
+            events.append({
+                "id": row[0],
+                "groupId": f"maintenance-{row[0]}",
+                "title": row[1],
+                "start": day.isoformat(),
+                "allDay": True,
+                "type": "maintenance",
+            })
+    return events
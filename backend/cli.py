@@ -35,6 +35,320 @@ def seed_command():
     click.echo(click.style("Siembra de datos completada.", fg="green"))
 
 
+@click.command("db-check-indexes")
+@with_appcontext
+def check_indexes_command():
+    """Falla si alguna consulta del catálogo caliente hace un SCAN completo de tabla."""
+    import sqlite3
+
+    from flask import current_app
+
+    from .query_catalog import HOT_QUERIES, find_full_scans
+
+    # Conexión propia y no la del pool: SQLite no revalida el esquema de los
+    # EXPLAIN cacheados, así que una conexión longeva podría dar planes obsoletos.
+    try:
+        db = sqlite3.connect(current_app.config["DATABASE"])
+    except sqlite3.Error as e:
+        raise click.ClickException(f"No se pudo abrir la base de datos: {e}")
+    try:
+        failures = find_full_scans(db)
+    finally:
+        db.close()
+    for name in sorted(HOT_QUERIES):
+        if name in failures:
+            click.echo(click.style(f"FALLO {name}: " + "; ".join(failures[name]), fg="red"))
+        else:
+            click.echo(f"ok    {name}")
+    if failures:
+        raise click.ClickException(
+            f"{len(failures)} de {len(HOT_QUERIES)} consultas calientes sin índice."
+        )
+    click.echo(click.style("Todas las consultas calientes usan índices.", fg="green"))
+
+
+@click.command("kpi-rebuild")
+@click.option("--check", is_flag=True, help="Sólo verificar; no reparar. Sale con error si hay desviaciones.")
+@with_appcontext
+def kpi_rebuild_command(check):
+    """Verifica la tabla kpi_counters contra tickets/clientes y repara desviaciones."""
+    from .db_utils import get_db as get_sqlite_db
+    from .metrics import check_kpi_counters, rebuild_kpi_counters
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    drift = check_kpi_counters(db) if check else rebuild_kpi_counters(db)
+    for kind, value, stored, actual in drift:
+        click.echo(f"{kind}={value!r}: guardado {stored}, real {actual}")
+    if not drift:
+        click.echo(click.style("kpi_counters está al día.", fg="green"))
+    elif check:
+        raise click.ClickException(f"{len(drift)} contadores desviados.")
+    else:
+        click.echo(click.style(f"{len(drift)} contadores reparados.", fg="yellow"))
+
+
+@click.command("outbox-dispatch")
+@with_appcontext
+def outbox_dispatch_command():
+    """Entrega todas las notificaciones pendientes y vencidas de notification_outbox."""
+    from .db_utils import get_db as get_sqlite_db
+    from .outbox import drain_outbox
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    totals = drain_outbox(db)
+    click.echo(
+        f"{totals['claimed']} reclamadas, {totals['sent']} enviadas, {totals['errors']} con error."
+    )
+
+
+@click.command("inbound-process")
+@with_appcontext
+def inbound_process_command():
+    """Procesa los eventos entrantes pendientes y vencidos de inbound_events."""
+    from .db_utils import get_db as get_sqlite_db
+    from .inbound_events import drain_inbound_events
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    totals = drain_inbound_events(db)
+    click.echo(
+        f"{totals['claimed']} reclamados, {totals['processed']} procesados, {totals['errors']} con error."
+    )
+
+
+@click.command("phone-directory-rebuild")
+@click.option("--check", is_flag=True, help="Sólo verificar; no reparar. Sale con error si hay desviaciones.")
+@with_appcontext
+def phone_directory_rebuild_command(check):
+    """Verifica phone_directory contra providers/clientes/users y la repara."""
+    from .db_utils import get_db as get_sqlite_db
+    from .phone_directory import check_phone_directory, rebuild_phone_directory
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    missing, extra = check_phone_directory(db) if check else rebuild_phone_directory(db)
+    if not missing and not extra:
+        click.echo(click.style("phone_directory está al día.", fg="green"))
+    elif check:
+        raise click.ClickException(f"phone_directory desviada: {missing} filas faltan, {extra} sobran.")
+    else:
+        click.echo(click.style(f"phone_directory reparada: {missing} filas faltaban, {extra} sobraban.", fg="yellow"))
+
+
+@click.command("wa-logs-archive")
+@click.option("--days", type=int, default=None, help="Días que se conservan en la tabla (WA_LOG_RETENTION_DAYS).")
+@click.option("--batch-size", type=int, default=None, help="Filas por transacción (WA_LOG_ARCHIVE_BATCH_SIZE).")
+@click.option("--max-batches", type=int, default=None, help="Parar tras N lotes (por defecto, hasta terminar).")
+@click.option("--dry-run", is_flag=True, help="Sólo contar las filas que se archivarían.")
+@with_appcontext
+def wa_logs_archive_command(days, batch_size, max_batches, dry_run):
+    """Mueve los logs de WhatsApp antiguos a las tablas de archivo mensuales."""
+    from .db_utils import get_db as get_sqlite_db
+    from .wa_logs import archive_old_logs, count_archivable
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    if dry_run:
+        click.echo(f"{count_archivable(db, days)} filas se archivarían.")
+        return
+    result = archive_old_logs(db, days=days, batch_size=batch_size, max_batches=max_batches)
+    click.echo(f"{result['moved']} filas anteriores a {result['cutoff']} archivadas en {result['batches']} lotes.")
+    for month, count in sorted(result["months"].items()):
+        click.echo(f"  {month}: {count}")
+
+
+@click.command("wa-delivery-report")
+@click.option("--days", type=int, default=7, show_default=True, help="Días hacia atrás.")
+@with_appcontext
+def wa_delivery_report_command(days):
+    """Entregas y latencias de envío→entrega→lectura de WhatsApp por día."""
+    from .db_utils import get_db as get_sqlite_db
+    from .wa_status import delivery_report
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    rows = delivery_report(db, days=days)
+    if not rows:
+        click.echo("Sin mensajes salientes en el periodo.")
+        return
+
+    def _secs(value):
+        return "-" if value is None else f"{value:.1f}s"
+
+    click.echo(f"{'día':<10} {'enviados':>8} {'entreg.':>8} {'leídos':>8} {'fallidos':>8} "
+               f"{'media entrega':>14} {'máx entrega':>12} {'media lectura':>14}")
+    for row in rows:
+        click.echo(
+            f"{row['day']:<10} {row['messages']:>8} {row['delivered']:>8} {row['read']:>8} {row['failed']:>8} "
+            f"{_secs(row['avg_delivery_s']):>14} {_secs(row['max_delivery_s']):>12} {_secs(row['avg_read_s']):>14}"
+        )
+
+
+@click.command("maintenance-run")
+@click.option("--date", "run_date", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+              help="Fecha de referencia YYYY-MM-DD (por defecto hoy).")
+@click.option("--batch-size", type=int, default=None, help="Mantenimientos por transacción.")
+@with_appcontext
+def maintenance_run_command(run_date, batch_size):
+    """Genera los tickets de los mantenimientos programados vencidos."""
+    from .db_utils import get_db as get_sqlite_db
+    from .maintenance_scheduler import run_due_maintenances
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    stats = run_due_maintenances(db, today=run_date.date() if run_date else None, batch_size=batch_size)
+    for maintenance_id, reason in stats["errores"]:
+        click.echo(click.style(f"  Mantenimiento {maintenance_id}: {reason}", fg="red"))
+    click.echo(
+        f"{stats['tickets']} tickets generados de {stats['mantenimientos']} mantenimientos "
+        f"({stats['ya_generados']} ya generados) en {stats['lotes']} lotes, "
+        f"{stats['segundos']:.3f} s ({stats['tickets_por_segundo']:.0f} tickets/s)."
+    )
+
+
+@click.command("sla-check")
+@with_appcontext
+def sla_check_command():
+    """Escala los tickets con el SLA vencido y muestra los incumplimientos acumulados."""
+    from .db_utils import get_db as get_sqlite_db
+    from .sla_monitor import SlaMonitor, breach_stats
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    monitor = SlaMonitor()
+    pending = monitor.rebuild(db)
+    escalated = monitor.escalate_due(db)
+    click.echo(f"{len(escalated)} tickets escalados ({pending} con SLA pendiente).")
+    stats = breach_stats(db)
+    click.echo(f"Incumplimientos acumulados: {stats['total']}")
+    for dimension in ("cliente", "tecnico", "prioridad"):
+        for entry in stats[dimension][:10]:
+            click.echo(f"  {dimension} {entry.get('nombre') or entry['key']}: {entry['breaches']}")
+
+
+@click.command("receipts-render")
+@click.option("--from", "date_from", type=click.DateTime(formats=["%Y-%m-%d"]), required=True,
+              help="Primer día de pagos (YYYY-MM-DD).")
+@click.option("--to", "date_to", type=click.DateTime(formats=["%Y-%m-%d"]), required=True,
+              help="Último día de pagos, incluido (YYYY-MM-DD).")
+@click.option("--workers", type=int, default=None, help="Procesos de renderizado (por defecto, todos los núcleos).")
+@with_appcontext
+def receipts_render_command(date_from, date_to, workers):
+    """Regenera los recibos PDF de los trabajos pagados en un rango de fechas."""
+    from datetime import timedelta
+
+    from flask import current_app
+
+    from .db_utils import get_db as get_sqlite_db
+    from .receipt_worker import render_receipts_for_range
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    # url_for (tickets.recibo_url) necesita un contexto de petición
+    with current_app.test_request_context():
+        stats = render_receipts_for_range(
+            db, date_from.strftime("%Y-%m-%d"), (date_to + timedelta(days=1)).strftime("%Y-%m-%d"), workers=workers
+        )
+    for ticket_id, reason in stats["errors"].items():
+        click.echo(click.style(f"  Ticket {ticket_id}: {reason}", fg="red"))
+    click.echo(
+        f"{stats['rendered']} de {stats['tickets']} recibos generados con {stats['workers']} procesos, "
+        f"{stats['seconds']:.2f} s ({stats['per_second']:.0f} recibos/s)."
+    )
+
+
+@click.command("quote-signatures-migrate")
+@with_appcontext
+def quote_signatures_migrate_command():
+    """Mueve las firmas en línea de presupuestos al almacén por contenido y encola sus PDF."""
+    from flask import current_app
+
+    from .db_utils import get_db as get_sqlite_db
+    from .quote_pdf import drain_signed_quote_jobs, migrate_inline_signatures
+    from .receipt_worker import create_pool
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    moved, broken = migrate_inline_signatures(db)
+    click.echo(f"{moved} firmas movidas a blobs, {broken} dañadas (se quedan en línea).")
+    # url_for (/blobs/<sha256>) necesita un contexto de petición
+    pool = create_pool(current_app.config["RECEIPT_POOL_SIZE"])
+    try:
+        with current_app.test_request_context():
+            totals = drain_signed_quote_jobs(db, pool)
+    finally:
+        pool.shutdown()
+    click.echo(f"{totals['rendered']} PDF firmados generados, {totals['errors']} con error.")
+
+
+@click.command("search-rebuild")
+@click.option("--check", is_flag=True, help="Sólo verificar; no reconstruir. Sale con error si hay desviaciones.")
+@with_appcontext
+def search_rebuild_command(check):
+    """Verifica el índice de búsqueda (search_index) y lo reconstruye."""
+    from .db_utils import get_db as get_sqlite_db
+    from .search import check_search_index, rebuild_search_index
+
+    db = get_sqlite_db()
+    if db is None:
+        raise click.ClickException("No se pudo abrir la base de datos.")
+    drift = check_search_index(db)
+    for kind, (indexed, expected) in drift.items():
+        click.echo(f"  {kind}: {indexed} indexados, {expected} esperados")
+    if check:
+        if drift:
+            raise click.ClickException(f"search_index desviado en {len(drift)} tipos.")
+        click.echo(click.style("search_index está al día.", fg="green"))
+        return
+    count = rebuild_search_index(db)
+    click.echo(click.style(f"search_index reconstruido: {count} documentos.", fg="green"))
+
+
+@click.command("quote-parser-bench")
+@click.option("--corpus", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Corpus JSONL (por defecto backend/data/quote_replies.jsonl).")
+@click.option("--seconds", type=float, default=2.0, show_default=True, help="Duración de la medida de rendimiento.")
+@click.option("--show-failures", is_flag=True, help="Lista los campos mal extraídos.")
+def quote_parser_bench_command(corpus, seconds, show_failures):
+    """Mide precisión por campo y mensajes/segundo del parser de respuestas de proveedores."""
+    from .quote_parser import CORPUS_PATH, benchmark, evaluate, load_corpus
+
+    messages = load_corpus(corpus or CORPUS_PATH)
+    report = evaluate(messages)
+    click.echo(f"{report['messages']} mensajes, {report['exact'] * 100:.1f}% extraídos sin errores")
+    for field, precision in report["precision"].items():
+        click.echo(f"  {field:<14} {precision * 100:6.1f}%")
+    if show_failures:
+        for text, field, expected, got in report["failures"]:
+            click.echo(f"  [{field}] esperado {expected!r}, obtenido {got!r}: {text}")
+    click.echo(f"{benchmark(messages, min_seconds=seconds):,.0f} mensajes/s")
+
+
 def register_cli(app):
     app.cli.add_command(init_db_command)
     app.cli.add_command(seed_command)
+    app.cli.add_command(check_indexes_command)
+    app.cli.add_command(kpi_rebuild_command)
+    app.cli.add_command(outbox_dispatch_command)
+    app.cli.add_command(inbound_process_command)
+    app.cli.add_command(phone_directory_rebuild_command)
+    app.cli.add_command(quote_parser_bench_command)
+    app.cli.add_command(wa_logs_archive_command)
+    app.cli.add_command(wa_delivery_report_command)
+    app.cli.add_command(search_rebuild_command)
+    app.cli.add_command(maintenance_run_command)
+    app.cli.add_command(sla_check_command)
+    app.cli.add_command(receipts_render_command)
+    app.cli.add_command(quote_signatures_migrate_command)
@@ -2,6 +2,7 @@ from flask import Blueprint, flash, redirect, render_template, request, url_for,
 from flask_login import current_user, login_required
 
 from backend import db
+from backend.metrics import invalidate_dashboard_kpis
 from backend.models import get_table_class
 from backend.forms import ClientForm
 
@@ -49,6 +50,7 @@ def add_client():
             )
             db.session.add(new_client)
             db.session.commit()
+            invalidate_dashboard_kpis()
             flash('Client added successfully.', 'success')
             return redirect(url_for('clients.list_clients'))
         except Exception as e:
@@ -105,6 +107,7 @@ def delete_client(client_id):
 
         db.session.delete(client)
         db.session.commit()
+        invalidate_dashboard_kpis()
         flash('Cliente eliminado correctamente.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -1,13 +1,18 @@
 # backend/db.py
 import csv
 import os
+import queue
 import sqlite3
 import sys
+import threading
+import time
 import traceback
 
 from flask import current_app, g
 from werkzeug.security import generate_password_hash
 
+from .sql_stats import InstrumentedConnection
+
 
 def _ensure_dir_for_db(path: str) -> None:
     """
@@ -35,14 +40,192 @@ def _ensure_dir_for_db(path: str) -> None:
         os.makedirs(dir_, exist_ok=True)
 
 
+# --- Pool de conexiones SQLite ---
+# Valores por defecto; se pueden sobreescribir en app.config (ver create_app).
+DEFAULT_POOL_SIZE = 8
+DEFAULT_POOL_TIMEOUT = 10.0          # segundos esperando una conexión libre
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+DEFAULT_CACHE_SIZE_KIB = 16384       # 16 MiB de caché de páginas por conexión
+DEFAULT_MMAP_SIZE = 128 * 1024 * 1024
+
+
+def _is_memory_db(path: str) -> bool:
+    return not path or path in {":memory:", "sqlite://", "sqlite:///:memory:"} or path.startswith("file::memory:")
+
+
+class SQLitePool:
+    """
+    Pool de conexiones sqlite3 por proceso y por fichero de base de datos.
+
+    Cada petición hace checkout de una conexión (get_db) y la devuelve al
+    terminar el app context (close_db). Las conexiones se crean una sola vez
+    con los PRAGMA aplicados y se reutilizan en orden LIFO para mantener
+    caliente la caché de páginas. Es seguro entre los hilos de waitress:
+    una conexión sólo la usa un hilo a la vez.
+    """
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT,
+                 busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, cache_size_kib=DEFAULT_CACHE_SIZE_KIB,
+                 mmap_size=DEFAULT_MMAP_SIZE):
+        self.path = path
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.busy_timeout_ms = int(busy_timeout_ms)
+        self.cache_size_kib = int(cache_size_kib)
+        self.mmap_size = int(mmap_size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,  # la conexión viaja entre hilos al volver al pool
+            factory=InstrumentedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{self.cache_size_kib}")
+        conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={self.busy_timeout_ms}")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # Pre-calentado: fuerza la lectura y el parseo del esquema una sola vez.
+        conn.execute("SELECT name FROM sqlite_master LIMIT 1").fetchall()
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                t0 = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        f"SQLite pool exhausted ({self.size} connections busy for {self.timeout}s)"
+                    ) from None
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += time.perf_counter() - t0
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            self._in_use -= 1
+        try:
+            # Lo que no se haya confirmado en la petición se descarta, igual que
+            # cuando la conexión se cerraba al final de cada petición.
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._discarded += 1
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": self.path,
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_ms": round(self._wait_time * 1000, 3),
+                "discarded": self._discarded,
+            }
+
+
+_pools: dict[tuple[int, str], SQLitePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: str | None = None) -> SQLitePool:
+    """Devuelve (creándolo si hace falta) el pool del proceso actual para `path`."""
+    cfg = current_app.config
+    path = path or cfg["DATABASE"]
+    key = (os.getpid(), path)  # tras un fork (gunicorn) cada worker crea su propio pool
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = SQLitePool(
+                    path,
+                    size=cfg.get("DB_POOL_SIZE", DEFAULT_POOL_SIZE),
+                    timeout=cfg.get("DB_POOL_TIMEOUT", DEFAULT_POOL_TIMEOUT),
+                    busy_timeout_ms=cfg.get("SQLITE_BUSY_TIMEOUT_MS", DEFAULT_BUSY_TIMEOUT_MS),
+                    cache_size_kib=cfg.get("SQLITE_CACHE_SIZE_KIB", DEFAULT_CACHE_SIZE_KIB),
+                    mmap_size=cfg.get("SQLITE_MMAP_SIZE", DEFAULT_MMAP_SIZE),
+                )
+                _pools[key] = pool
+    return pool
+
+
+def get_pool_stats() -> list[dict]:
+    """Estadísticas de los pools de este proceso (para monitorización)."""
+    pid = os.getpid()
+    return [pool.stats() for (owner, _), pool in list(_pools.items()) if owner == pid]
+
+
 def get_db():
     if "db" not in g:
         try:
             path = current_app.config["DATABASE"]
-            # Ensure the directory for the database file exists
-            _ensure_dir_for_db(path)
-            g.db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
-            g.db.row_factory = sqlite3.Row
+            if _is_memory_db(path):
+                # Una BD en memoria es distinta por conexión: no se puede compartir.
+                g.db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, factory=InstrumentedConnection)
+                g.db.row_factory = sqlite3.Row
+            else:
+                # Ensure the directory for the database file exists
+                _ensure_dir_for_db(path)
+                pool = get_pool(path)
+                g.db = pool.acquire()
+                g._db_pool = pool
         except sqlite3.Error as e:
             # Log the error to console, as dbmod.log_error would call get_db() again
             print(f"ERROR: Could not connect to database in get_db: {e}")
@@ -53,7 +236,12 @@ def get_db():
 
 def close_db(e=None):
     db = g.pop("db", None)
-    if db is not None:
+    pool = g.pop("_db_pool", None)
+    if db is None:
+        return
+    if pool is not None:
+        pool.release(db)
+    else:
         db.close()
 
 def init_db_func():
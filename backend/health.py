@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
 
+from backend.db_utils import get_pool_stats
+
 bp = Blueprint("health", __name__, url_prefix="/healthz")
 
 @bp.route("/")
@@ -9,3 +11,11 @@ def health_check():
     Returns a 200 OK status if the app is running.
     """
     return jsonify({"status": "ok"}), 200
+
+@bp.route("/db")
+def db_pool_stats():
+    """
+    Estadísticas del pool de conexiones SQLite de este proceso
+    (checkouts, esperas y tiempo total de espera).
+    """
+    return jsonify({"status": "ok", "pools": get_pool_stats()}), 200
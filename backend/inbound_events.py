@@ -0,0 +1,215 @@
+# backend/inbound_events.py
+"""
+Ingesta idempotente de los webhooks entrantes de WhatsApp (tabla inbound_events).
+
+El webhook sólo verifica la firma y guarda cada mensaje en inbound_events con
+un INSERT ... ON CONFLICT DO NOTHING sobre (source, event_id), donde event_id
+es el wamid: los reintentos de Meta no se duplican y la respuesta sale en
+milisegundos, muy dentro del timeout del webhook.
+
+Un hilo en segundo plano (arrancado con la primera petición del proceso y
+despertado por cada webhook) procesa los eventos por
+lotes en orden de llegada, todos en una transacción con un SAVEPOINT por
+evento: un evento que falla se reintenta con espera exponencial sin deshacer
+el resto del lote; tras INBOUND_MAX_ATTEMPTS queda 'failed'.
+`flask inbound-process` procesa la cola desde la línea de comandos.
+"""
+import json
+import threading
+
+from flask import current_app
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_POLL_INTERVAL = 5.0
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def extract_messages(payload):
+    """[(wamid, mensaje)] de un payload de webhook de la WhatsApp Cloud API."""
+    messages = []
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            for msg in (change.get("value") or {}).get("messages") or []:
+                if msg.get("id"):
+                    messages.append((msg["id"], msg))
+    return messages
+
+
+def record_inbound_events(db, payload, source="meta"):
+    """
+    Guarda los mensajes del payload (los ya vistos se ignoran) y hace commit.
+    Devuelve (nuevos, recibidos).
+    """
+    messages = extract_messages(payload)
+    if not messages:
+        return 0, 0
+    before = db.total_changes
+    db.executemany(
+        "INSERT INTO inbound_events (source, event_id, payload) VALUES (?, ?, ?) "
+        "ON CONFLICT (source, event_id) DO NOTHING",
+        [(source, event_id, json.dumps(msg, ensure_ascii=False)) for event_id, msg in messages],
+    )
+    db.commit()
+    return db.total_changes - before, len(messages)
+
+
+def _claim_batch(db, batch_size, lease_seconds):
+    """Reclama hasta batch_size eventos pendientes y vencidos, en orden de llegada."""
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            """
+            SELECT id, source, event_id, payload, attempts
+            FROM inbound_events
+            WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+            """,
+            (batch_size,),
+        ).fetchall()
+        if rows:
+            db.executemany(
+                "UPDATE inbound_events SET attempts = attempts + 1, "
+                "next_attempt_at = datetime('now', ?) WHERE id = ?",
+                [(f"+{int(lease_seconds)} seconds", row["id"]) for row in rows],
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows
+
+
+def _handle_event(db, row):
+    from .whatsapp_meta import handle_incoming_message
+
+    msg = json.loads(row["payload"])
+    body = (msg.get("text") or {}).get("body", "")
+    # Si el proveedor responde citando el RFQ, Meta manda su wamid en context.id
+    context_id = (msg.get("context") or {}).get("id")
+    return handle_incoming_message(
+        msg.get("from") or "", body, row["event_id"], db=db, commit=False, context_message_id=context_id
+    )
+
+
+def process_inbound_events(db, batch_size=None, handler=None):
+    """
+    Procesa un lote de inbound_events. Devuelve un dict con los eventos
+    reclamados, procesados y con error. `handler(db, row)` por defecto pasa el
+    mensaje a whatsapp_meta.handle_incoming_message sin commit.
+    """
+    handler = handler or _handle_event
+    batch_size = batch_size or int(_config("INBOUND_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    rows = _claim_batch(db, batch_size, _config("INBOUND_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+    result = {"claimed": len(rows), "processed": 0, "errors": 0}
+    if not rows:
+        return result
+
+    max_attempts = int(_config("INBOUND_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+    retry_base = float(_config("INBOUND_RETRY_BASE_SECONDS", DEFAULT_RETRY_BASE_SECONDS))
+    done, retry, failed = [], [], []
+    db.execute("BEGIN")
+    try:
+        for row in rows:
+            db.execute("SAVEPOINT inbound_event")
+            try:
+                handler(db, row)
+            except Exception as e:  # el evento se reintenta; el resto del lote sigue
+                db.execute("ROLLBACK TO inbound_event")
+                current_app.logger.warning("Inbound: error procesando %s: %s", row["event_id"], e)
+                if row["attempts"] + 1 >= max_attempts:
+                    failed.append((str(e), row["id"]))
+                else:
+                    delay = retry_base * (2 ** row["attempts"])
+                    retry.append((str(e), f"+{int(delay)} seconds", row["id"]))
+            else:
+                done.append((row["id"],))
+            db.execute("RELEASE inbound_event")
+        db.executemany(
+            "UPDATE inbound_events SET status = 'done', processed_at = datetime('now'), last_error = NULL WHERE id = ?",
+            done,
+        )
+        db.executemany(
+            "UPDATE inbound_events SET last_error = ?, next_attempt_at = datetime('now', ?) WHERE id = ?",
+            retry,
+        )
+        db.executemany(
+            "UPDATE inbound_events SET status = 'failed', last_error = ? WHERE id = ?",
+            failed,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    result["processed"] = len(done)
+    result["errors"] = len(retry) + len(failed)
+    return result
+
+
+def drain_inbound_events(db, handler=None):
+    """Procesa lotes hasta que no quede nada vencido. Devuelve los totales."""
+    totals = {"claimed": 0, "processed": 0, "errors": 0}
+    while True:
+        result = process_inbound_events(db, handler=handler)
+        for key in totals:
+            totals[key] += result[key]
+        if result["claimed"] == 0:
+            return totals
+
+
+# --- Hilo procesador ---
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def _worker_loop(app):
+    from .db_utils import get_db
+
+    interval = float(app.config.get("INBOUND_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        try:
+            with app.app_context():
+                drain_inbound_events(get_db())
+        except Exception:
+            app.logger.exception("Inbound: error en el procesador")
+
+
+def ensure_inbound_worker():
+    """
+    Arranca el hilo procesador de este proceso si INBOUND_WORKER está activo.
+    Al arrancar drena en seguida los eventos que quedaron pendientes o con
+    reintento programado antes de un reinicio.
+    """
+    global _worker_thread
+    if _worker_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("INBOUND_WORKER", True):
+        return
+    with _worker_lock:
+        if _worker_thread is None:
+            _worker_thread = threading.Thread(
+                target=_worker_loop, args=(app,), name="inbound-events", daemon=True
+            )
+            _worker_thread.start()
+            _wake.set()
+
+
+def wake_inbound_worker():
+    """Despierta (y arranca si hace falta) el hilo procesador de este proceso."""
+    if not current_app.config.get("INBOUND_WORKER", True):
+        return
+    ensure_inbound_worker()
+    _wake.set()
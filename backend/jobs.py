@@ -1,3 +1,4 @@
+import base64
 import json
 import os
 import sqlite3  # Added for IntegrityError
@@ -8,6 +9,7 @@ from flask import (
     current_app,
     flash,
     g,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -16,10 +18,15 @@ from flask import (
 from flask_login import current_user, login_required
 from werkzeug.utils import secure_filename
 
+from backend import rfq
 from backend.db_utils import get_db
 # from backend.forms import get_client_choices, get_freelancer_choices  # New imports -> This was causing an error
-from backend.market_study import get_market_study_for_material  # Import the helper
-from backend.whatsapp import send_whatsapp_text  # Import send_whatsapp_text
+from backend.market_study import get_market_studies_for_materials
+from backend.messaging import send_text_or_template, send_whatsapp_text
+from backend.metrics import invalidate_dashboard_kpis
+from backend.outbox import wake_dispatcher
+from backend.providers import get_provider_choices
+from backend.receipt_worker import enqueue_receipt, wake_receipt_worker
 from backend.whatsapp_meta import save_whatsapp_log  # Import save_whatsapp_log
 
 bp = Blueprint('jobs', __name__, url_prefix='/jobs')
@@ -81,10 +88,9 @@ def add_job():
                     flash('¡Trabajo añadido correctamente!')
 
                     # --- Notification Logic ---
-                    from .notifications import (
-                        add_notification,
-                        send_whatsapp_notification,
-                    )
+                    # Se encolan en notification_outbox dentro de esta transacción;
+                    # el despachador de backend.outbox las entrega tras el commit.
+                    from .outbox import enqueue_notifications
                     # Get client name for notification message
                     cursor = db.execute('SELECT nombre FROM clientes WHERE id = ?', (cliente_id,))
                     client_name_row = cursor.fetchone()
@@ -99,15 +105,8 @@ def add_job():
                         f"Nuevo trabajo añadido por {g.user.username}: {titulo} para {client_name}."
                     )
 
-                    # Notify creator
-                    add_notification(db, g.user.id, notification_message)
-                    send_whatsapp_notification(db, g.user.id, notification_message)
-
-                    # Notify admins
-                    for admin in admin_users:
-                        if admin['id'] != g.user.id: # Avoid double notification for creator if they are admin
-                            add_notification(db, admin['id'], notification_message)
-                            send_whatsapp_notification(db, admin['id'], notification_message)
+                    # Notify creator and admins (enqueue_notifications skips duplicates)
+                    enqueue_notifications(db, [g.user.id] + [admin['id'] for admin in admin_users], notification_message)
 
                     # Notify assigned freelancer
                     if autonomo_id:
@@ -115,8 +114,7 @@ def add_job():
                         freelancer_user = cursor.fetchone()
                         if freelancer_user:
                             freelancer_notification_message = f"Se te ha asignado un nuevo trabajo: {titulo} para {client_name}."
-                            add_notification(db, freelancer_user['id'], freelancer_notification_message)
-                            send_whatsapp_notification(db, freelancer_user['id'], freelancer_notification_message)
+                            enqueue_notifications(db, [freelancer_user['id']], freelancer_notification_message)
                     # --- End Notification Logic ---
 
                     # Record income in financial_transactions if created as Paid
@@ -143,6 +141,8 @@ def add_job():
                         flash('Provisión de fondos registrada como gasto.', 'info')
 
                     db.commit()
+                    invalidate_dashboard_kpis()
+                    wake_dispatcher()
                     return redirect(url_for('jobs.list_jobs')) # Assuming a list_jobs route exists
                 except sqlite3.Error as e:
                     db.rollback()
@@ -179,6 +179,133 @@ def add_job():
     except Exception as e:
         current_app.logger.error(f"Error in add_job: {e}", exc_info=True)
         return "An internal server error occurred.", 500
+
+
+# --- Listado de trabajos: paginación por cursor (keyset) y filtros ---
+
+JOBS_PAGE_SIZE = 50
+JOBS_MAX_PAGE_SIZE = 200
+
+# filtro de la query string -> condición SQL (todas por igualdad salvo el rango de fechas)
+_JOB_LIST_FILTERS = {
+    'estado': 't.estado = ?',
+    'prioridad': 't.prioridad = ?',
+    'tipo': 't.tipo = ?',
+    'asignado_a': 't.asignado_a = ?',
+    'cliente_id': 't.cliente_id = ?',
+    'desde': 't.fecha_creacion >= ?',
+    'hasta': 't.fecha_creacion < ?',
+}
+
+
+def encode_job_cursor(fecha_creacion, job_id):
+    """
+    Cursor opaco para la siguiente página: la clave (fecha_creacion, id) de la
+    última fila. Una fecha NULL viaja como null en el JSON, no como "None".
+    """
+    raw = json.dumps([fecha_creacion, job_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_job_cursor(cursor):
+    """Devuelve (fecha_creacion, id) o None si el cursor no es válido; la fecha puede ser None."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        fecha_creacion, job_id = json.loads(raw)
+        return (None if fecha_creacion is None else str(fecha_creacion)), int(job_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_job_list_args(args):
+    """Extrae filtros, cursor y tamaño de página de request.args."""
+    filters = {}
+    for name in _JOB_LIST_FILTERS:
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+    # 'hasta' es inclusivo para el usuario (una fecha YYYY-MM-DD cubre todo el día)
+    if 'hasta' in filters and len(filters['hasta']) == 10:
+        filters['hasta'] = filters['hasta'] + ' 23:59:59.999'
+    try:
+        limit = int(args.get('limit', JOBS_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = JOBS_PAGE_SIZE
+    limit = max(1, min(limit, JOBS_MAX_PAGE_SIZE))
+    return filters, decode_job_cursor(args.get('cursor')), limit
+
+
+def build_job_list_query(filters, cursor=None, limit=JOBS_PAGE_SIZE, now=None):
+    """
+    Construye (sql, params) para una página del listado de trabajos.
+
+    Orden estable por (fecha_creacion DESC, id DESC); el cursor es la clave de la
+    última fila ya servida, así que cada página cuesta lo mismo sin importar lo
+    lejos que esté (no hay OFFSET). El próximo evento de cada ticket se obtiene
+    con una subconsulta correlacionada en vez de un JOIN que duplicaría filas.
+    Se pide una fila más de `limit` para saber si hay página siguiente.
+
+    Los tickets sin fecha_creacion van al final (NULL es el menor valor en
+    SQLite). Un cursor con fecha None recorre sólo ese tramo (id < ?); un
+    cursor con fecha los excluye, y fetch_job_page completa la página con
+    ellos. `cursor=(None, None)` pide el tramo NULL desde el principio.
+    """
+    now = now or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    where, params = [], [now]
+    for name, value in filters.items():
+        where.append(_JOB_LIST_FILTERS[name])
+        params.append(value)
+    if cursor is not None:
+        fecha_creacion, job_id = cursor
+        if fecha_creacion is not None:
+            where.append('(t.fecha_creacion, t.id) < (?, ?)')
+            params.extend(cursor)
+        else:
+            where.append('t.fecha_creacion IS NULL')
+            if job_id is not None:
+                where.append('t.id < ?')
+                params.append(job_id)
+
+    sql = """
+        SELECT t.id, t.titulo, t.descripcion, t.estado, t.prioridad, t.tipo, t.fecha_creacion,
+               t.cliente_id, c.nombre AS client_name,
+               t.asignado_a, u.username AS assigned_to_name,
+               e.inicio AS next_event_start, e.fin AS next_event_end
+        FROM tickets t
+        LEFT JOIN clientes c ON t.cliente_id = c.id
+        LEFT JOIN users u ON t.asignado_a = u.id
+        LEFT JOIN eventos e ON e.id = (
+            SELECT e2.id FROM eventos e2
+            WHERE e2.ticket_id = t.id AND e2.inicio >= ?
+            ORDER BY e2.inicio, e2.id
+            LIMIT 1
+        )
+    """
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY t.fecha_creacion DESC, t.id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def fetch_job_page(db, filters, cursor=None, limit=JOBS_PAGE_SIZE):
+    """Devuelve (filas, next_cursor); next_cursor es None en la última página."""
+    sql, params = build_job_list_query(filters, cursor, limit)
+    rows = db.execute(sql, params).fetchall()
+    if cursor is not None and cursor[0] is not None and len(rows) <= limit:
+        # La comparación por filas deja fuera las fechas NULL, que van detrás
+        sql, params = build_job_list_query(filters, (None, None), limit - len(rows))
+        rows += db.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_job_cursor(last['fecha_creacion'], last['id'])
+    return rows, next_cursor
+
+
 @bp.route('/')
 @login_required
 def list_jobs():
@@ -187,18 +314,29 @@ def list_jobs():
         flash('Database connection error.', 'error')
         return redirect(url_for('index')) # Redirect to a safe page, e.g., index or login
 
-    cursor = db.execute(
-        """
-        SELECT t.id, t.descripcion, t.estado, t.prioridad, t.tipo, c.nombre as client_name, u.username as assigned_to_name, e.inicio, e.fin
-        FROM tickets t
-        LEFT JOIN clientes c ON t.cliente_id = c.id
-        LEFT JOIN users u ON t.asignado_a = u.id
-        LEFT JOIN eventos e ON t.id = e.ticket_id
-        ORDER BY t.created_at DESC
-        """
+    filters, cursor, limit = parse_job_list_args(request.args)
+    jobs, next_cursor = fetch_job_page(db, filters, cursor, limit)
+    clients = db.execute('SELECT id, nombre FROM clientes ORDER BY nombre').fetchall()
+    users = db.execute('SELECT id, username FROM users ORDER BY username').fetchall()
+    return render_template(
+        'jobs/list.html',
+        jobs=jobs,
+        filters={k: request.args[k] for k in _JOB_LIST_FILTERS if request.args.get(k)},
+        next_cursor=next_cursor,
+        limit=limit,
+        clients=clients,
+        users=users,
     )
-    jobs = cursor.fetchall()
-    return render_template('trabajos/list.html', jobs=jobs)
+
+
+@bp.route('/api')
+@login_required
+def list_jobs_json():
+    """Misma consulta que list_jobs, en JSON: {"jobs": [...], "next_cursor": ...}."""
+    db = get_db()
+    filters, cursor, limit = parse_job_list_args(request.args)
+    jobs, next_cursor = fetch_job_page(db, filters, cursor, limit)
+    return jsonify({'jobs': [dict(row) for row in jobs], 'next_cursor': next_cursor})
 
 @bp.route('/<int:job_id>')
 @login_required
@@ -211,10 +349,10 @@ def view_job(job_id):
     cursor = db.execute(
         '''
         SELECT
-            t.id, t.descripcion, t.estado, t.fecha_creacion, t.fecha_inicio, t.fecha_fin,
+            t.id, t.titulo, t.descripcion, t.estado, t.fecha_creacion, t.fecha_inicio, t.fecha_fin,
             t.cliente_id, c.nombre AS client_name, c.telefono AS client_phone, c.email AS client_email,
             t.asignado_a, u.username AS assigned_user_name, u.email AS assigned_user_email,
-            t.prioridad, t.tipo_trabajo, t.ubicacion, t.observaciones, t.presupuesto_aprobado,
+            t.prioridad, t.tipo AS tipo_trabajo, t.observaciones, t.presupuesto_aprobado,
             t.costo_estimado, t.costo_real, t.margen_beneficio, t.fecha_cierre,
             t.metodo_pago, t.estado_pago, t.fecha_pago, t.provision_fondos, t.fecha_transferencia
         FROM tickets t
@@ -236,7 +374,7 @@ def view_job(job_id):
         SELECT
             js.service_id, s.name, s.description, js.quantity, js.price_per_unit, js.total_price
         FROM job_services js
-        JOIN services s ON js.service_id = s.id
+        JOIN servicios s ON js.service_id = s.id
         WHERE js.job_id = ?
         ''',
         (job_id,)
@@ -256,18 +394,15 @@ def view_job(job_id):
     )
     materials = cursor.fetchall()
 
-    # Fetch all providers for the quote request dropdown
-    cursor = db.execute(
-        'SELECT id, nombre FROM providers ORDER BY nombre'
-    )
-    providers = cursor.fetchall()
+    # Providers for the quote request dropdown (shared cached lookup)
+    providers = get_provider_choices(db)
 
     # Fetch existing provider quotes for this job
     cursor = db.execute(
         '''
         SELECT
             pq.id, pq.material_id, pq.provider_id, p.nombre as provider_name, pq.quote_amount, pq.status, pq.quote_date,
-            pq.payment_status, pq.payment_date # New fields
+            pq.payment_status, pq.payment_date
         FROM provider_quotes pq
         JOIN providers p ON pq.provider_id = p.id
         WHERE pq.job_id = ?
@@ -284,12 +419,12 @@ def view_job(job_id):
             quotes_by_material[quote['material_id']] = []
         quotes_by_material[quote['material_id']].append(quote)
 
-    # Fetch market study data for each material
+    # Latest market study for all materials at once
+    market_studies = get_market_studies_for_materials(db, [m['material_id'] for m in materials])
     materials_with_market_study = []
     for material in materials:
         material_dict = dict(material)
-        market_study_data = get_market_study_for_material(material['material_id'])
-        material_dict['market_study'] = market_study_data
+        material_dict['market_study'] = market_studies.get(material['material_id'])
         materials_with_market_study.append(material_dict)
 
     # Fetch freelancer quotes for this job
@@ -305,20 +440,22 @@ def view_job(job_id):
         ''',
         (job_id,)
     )
-    freelancer_quotes = cursor.fetchall()
+    freelancer_quotes = [dict(f_quote) for f_quote in cursor.fetchall()]
 
-    # For each freelancer quote, fetch its associated files
-    freelancer_quotes_with_files = []
-    for f_quote in freelancer_quotes:
-        f_quote_dict = dict(f_quote)
+    # Files for all freelancer quotes in a single query
+    files_by_quote = {f_quote['id']: [] for f_quote in freelancer_quotes}
+    if files_by_quote:
+        placeholders = ','.join('?' * len(files_by_quote))
         cursor = db.execute(
-            'SELECT id, url, tipo FROM ficheros WHERE presupuesto_id = ?',
-            (f_quote['id'],)
+            f'SELECT id, presupuesto_id, url, tipo FROM ficheros WHERE presupuesto_id IN ({placeholders}) ORDER BY id',
+            list(files_by_quote)
         )
-        f_quote_dict['files'] = cursor.fetchall()
-        freelancer_quotes_with_files.append(f_quote_dict)
+        for file in cursor.fetchall():
+            files_by_quote[file['presupuesto_id']].append(file)
+    for f_quote in freelancer_quotes:
+        f_quote['files'] = files_by_quote[f_quote['id']]
 
-    return render_template('jobs/view.html', job=job, services=services, materials=materials_with_market_study, providers=providers, quotes_by_material=quotes_by_material, freelancer_quotes=freelancer_quotes_with_files)
+    return render_template('jobs/view.html', job=job, services=services, materials=materials_with_market_study, providers=providers, quotes_by_material=quotes_by_material, freelancer_quotes=freelancer_quotes)
 
 @bp.route('/<int:job_id>/edit', methods=('GET', 'POST'))
 @login_required
@@ -388,6 +525,7 @@ def edit_job(job_id):
                 flash(error, 'error')
             else:
                 # --- 4. Update Database ---
+                receipt_queued = False
                 db.execute(
                     '''UPDATE tickets SET
                        cliente_id = ?, asignado_a = ?, tipo = ?, titulo = ?, descripcion = ?, estado = ?,
@@ -427,32 +565,15 @@ def edit_job(job_id):
                     )
                     flash('Ingreso registrado en transacciones financieras.', 'info')
 
-                    # Generate PDF receipt
-                    from backend.receipt_generator import generate_receipt_pdf
-                    pdf_filename = f"recibo_{job_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-                    upload_folder = current_app.config['UPLOAD_FOLDER']
-                    os.makedirs(upload_folder, exist_ok=True)
-                    pdf_filepath = os.path.join(upload_folder, pdf_filename)
-
-                    # Fetch data needed for PDF
-                    job_details_for_pdf = { 'id': job_id, 'description': descripcion, 'status': estado, 'payment_method': metodo_pago, 'payment_status': estado_pago, 'amount': total_amount }
-                    cursor = db.execute('SELECT nombre as name, telefono as phone, email FROM clientes WHERE id = ?', (cliente_id,))
-                    client_details_for_pdf = cursor.fetchone()
-                    company_details = {'name': 'Grupo Koal', 'address': 'Valencia, España', 'phone': 'N/A', 'email': 'info@grupokoal.com'}
-
-                    generate_receipt_pdf(
-                        output_path=pdf_filepath,
-                        job_details=job_details_for_pdf,
-                        client_details=dict(client_details_for_pdf),
-                        company_details=company_details
-                    )
-
-                    # Update job with new PDF receipt URL
-                    pdf_url = url_for('uploaded_file', filename=pdf_filename)
-                    db.execute('UPDATE tickets SET recibo_url = ? WHERE id = ?', (pdf_url, job_id))
-                    flash('Recibo PDF generado y guardado.', 'success')
+                    # El recibo PDF se genera fuera de la petición (backend.receipt_worker)
+                    enqueue_receipt(db, job_id)
+                    receipt_queued = True
 
                 db.commit()
+                invalidate_dashboard_kpis()
+                if receipt_queued:
+                    wake_receipt_worker()
+                    flash('El recibo PDF se está generando; aparecerá en el trabajo en unos segundos.', 'info')
                 return redirect(url_for('jobs.list_jobs'))
 
         except sqlite3.Error as e:
@@ -518,9 +639,11 @@ def request_material_quote(job_id, material_id):
             f"Por favor, envíanos tu mejor precio y disponibilidad."
         )
 
-        # Send WhatsApp message
+        # Send WhatsApp message (template if the provider's 24h window is closed)
         to_number = provider['whatsapp_number']
-        message_id = send_whatsapp_text(to_number, message_body)
+        message_id, _kind = send_text_or_template(
+            db, to_number, message_body, current_app.config.get('WHATSAPP_RFQ_TEMPLATE')
+        )
 
         if message_id:
             # Insert into provider_quotes table
@@ -558,8 +681,7 @@ def request_material_quote(job_id, material_id):
                 message_body=message_body,
                 whatsapp_message_id=None,
                 status='failed',
-                error_info='Failed to get message ID from WhatsApp API',
-                user_id=g.user.id # Added user_id
+                error_info='Failed to get message ID from WhatsApp API'
             )
 
     except Exception as e:
@@ -568,6 +690,62 @@ def request_material_quote(job_id, material_id):
 
     return redirect(url_for('jobs.view_job', job_id=job_id))
 
+@bp.route('/<int:job_id>/materials/request_quotes', methods=['POST'])
+@login_required
+def request_material_quotes_bulk(job_id):
+    """
+    RFQ de varios materiales a varios proveedores en paralelo (ver backend/rfq.py).
+    Sin provider_ids se eligen los top_n proveedores de la categoría de los
+    materiales. Responde JSON con el resumen por proveedor si se pide JSON.
+    """
+    db = get_db()
+    payload = request.get_json(silent=True) or {}
+    material_ids = payload.get('material_ids') or request.form.getlist('material_ids')
+    provider_ids = payload.get('provider_ids') or request.form.getlist('provider_ids')
+    wants_json = request.is_json or request.accept_mimetypes.best == 'application/json'
+
+    try:
+        material_ids = [int(m) for m in material_ids]
+        provider_ids = [int(p) for p in provider_ids]
+        top_n = int(payload.get('top_n') or request.form.get('top_n') or rfq.DEFAULT_TOP_PROVIDERS)
+    except (TypeError, ValueError):
+        if wants_json:
+            return jsonify({'error': 'material_ids, provider_ids y top_n deben ser enteros'}), 400
+        flash('Selección de materiales o proveedores no válida.', 'error')
+        return redirect(url_for('jobs.view_job', job_id=job_id))
+
+    if not material_ids:
+        material_ids = [row['material_id'] for row in db.execute(
+            'SELECT material_id FROM job_materials WHERE job_id = ?', (job_id,)
+        ).fetchall()]
+    if not provider_ids:
+        provider_ids = [row['id'] for row in rfq.top_providers_for_materials(db, material_ids, top_n)]
+
+    if not material_ids or not provider_ids:
+        if wants_json:
+            return jsonify({'error': 'No hay materiales o proveedores para solicitar cotización'}), 400
+        flash('No hay materiales o proveedores para solicitar cotización.', 'error')
+        return redirect(url_for('jobs.view_job', job_id=job_id))
+
+    try:
+        results = rfq.fan_out_rfq(db, job_id, material_ids, provider_ids)
+    except sqlite3.Error as e:
+        current_app.logger.error(f"Error registrando RFQ del trabajo {job_id}: {e}", exc_info=True)
+        if wants_json:
+            return jsonify({'error': str(e)}), 500
+        flash(f'Ocurrió un error al solicitar las cotizaciones: {e}', 'error')
+        return redirect(url_for('jobs.view_job', job_id=job_id))
+
+    summary = {status: sum(1 for r in results if r['status'] == status) for status in ('sent', 'failed', 'skipped')}
+    if wants_json:
+        return jsonify({'job_id': job_id, 'material_ids': material_ids, 'summary': summary, 'results': results})
+    flash(
+        f"Solicitudes de cotización: {summary['sent']} enviadas, {summary['failed']} con error, "
+        f"{summary['skipped']} omitidas.",
+        'success' if summary['sent'] and not summary['failed'] else 'warning',
+    )
+    return redirect(url_for('jobs.view_job', job_id=job_id))
+
 @bp.route('/<int:trabajo_id>/gastos/add', methods=('GET', 'POST'))
 @login_required
 def add_gasto(trabajo_id):
@@ -0,0 +1,194 @@
+# backend/maintenance_scheduler.py
+"""
+Generación de tickets para los mantenimientos programados vencidos.
+
+run_due_maintenances() recorre los mantenimientos activos con
+proxima_fecha_mantenimiento <= hoy en lotes de MAINTENANCE_BATCH_SIZE; cada
+lote es una transacción con un executemany para los tickets, otro para
+mantenimiento_ocurrencias y otro para avanzar las fechas. Las fechas salen
+de backend.recurrence (desde fecha_inicio, sin la deriva de sumar 30/90/365
+días) y la clave (mantenimiento_id, fecha_prevista) de
+mantenimiento_ocurrencias hace que repetir una ejecución, o lanzarla desde
+dos procesos, no duplique tickets. Un mantenimiento con datos inválidos o un
+lote que falla no detienen el resto.
+
+Se ejecuta con `flask maintenance-run` (cron) o, con MAINTENANCE_SCHEDULER=1,
+desde un hilo del propio proceso cada MAINTENANCE_SCHEDULER_INTERVAL segundos.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+from flask import current_app
+
+from .recurrence import next_occurrence, occurrences, parse_date
+
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_INTERVAL = 3600.0
+
+_DUE_SQL = """
+    SELECT id, cliente_id, equipo_id, tipo_mantenimiento, descripcion, creado_por,
+           proxima_fecha_mantenimiento, fecha_inicio
+    FROM mantenimientos_programados
+    WHERE estado = 'activo' AND proxima_fecha_mantenimiento <= ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+
+def plan_maintenance(row, today: date):
+    """
+    (fechas vencidas, nueva próxima fecha, ancla) para un mantenimiento.
+    Nueva próxima fecha None = puntual, ya no vuelve. ValueError si las fechas no son válidas.
+    """
+    due_from = parse_date(row["proxima_fecha_mantenimiento"])
+    anchor = parse_date(row["fecha_inicio"]) or due_from
+    if due_from is None or anchor is None:
+        raise ValueError(f"fecha inválida: {row['proxima_fecha_mantenimiento']!r}")
+    frequency = row["tipo_mantenimiento"]
+    due = list(occurrences(anchor, frequency, due_from, today + timedelta(days=1))) or [due_from]
+    return due, next_occurrence(anchor, frequency, today), anchor
+
+
+def _generate_batch(db, rows, today):
+    """Genera los tickets de `rows` en una transacción. Devuelve (tickets, ya generados, errores)."""
+    errors = []
+    plans = {}
+    for row in rows:
+        try:
+            plans[row["id"]] = (row, *plan_maintenance(row, today))
+        except ValueError as e:
+            errors.append((row["id"], str(e)))
+    if not plans:
+        return 0, 0, errors
+
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        placeholders = ",".join("?" * len(plans))
+        done = {
+            (r[0], r[1])
+            for r in db.execute(
+                f"SELECT mantenimiento_id, fecha_prevista FROM mantenimiento_ocurrencias "
+                f"WHERE mantenimiento_id IN ({placeholders})",
+                list(plans),
+            ).fetchall()
+        }
+        pending = [
+            (row, day.isoformat())
+            for row, due, _, _ in plans.values()
+            for day in due
+            if (row["id"], day.isoformat()) not in done
+        ]
+        skipped = sum(len(due) for _, due, _, _ in plans.values()) - len(pending)
+
+        # Con el lock de escritura tomado, los ids nuevos son los que superan el máximo actual
+        last_id = db.execute("SELECT COALESCE(MAX(id), 0) FROM tickets").fetchone()[0]
+        db.executemany(
+            "INSERT INTO tickets (cliente_id, equipo_id, tipo, titulo, descripcion, estado, creado_por, fecha_inicio) "
+            "VALUES (?, ?, ?, ?, ?, 'Pendiente', ?, ?)",
+            [
+                (row["cliente_id"], row["equipo_id"],
+                 f"Mantenimiento Programado: {row['tipo_mantenimiento']}",
+                 f"Mantenimiento {row['tipo_mantenimiento']} ({day})",
+                 row["descripcion"] or f"Mantenimiento programado para {row['tipo_mantenimiento']}",
+                 row["creado_por"], day)
+                for row, day in pending
+            ],
+        )
+        ticket_ids = [r[0] for r in db.execute("SELECT id FROM tickets WHERE id > ? ORDER BY id", (last_id,))]
+        db.executemany(
+            "INSERT INTO mantenimiento_ocurrencias (mantenimiento_id, fecha_prevista, ticket_id) VALUES (?, ?, ?)",
+            [(row["id"], day, ticket_id) for (row, day), ticket_id in zip(pending, ticket_ids)],
+        )
+        db.executemany(
+            "UPDATE mantenimientos_programados SET proxima_fecha_mantenimiento = COALESCE(?, proxima_fecha_mantenimiento), "
+            "fecha_inicio = ?, estado = CASE WHEN ? IS NULL THEN 'completado' ELSE estado END WHERE id = ?",
+            [
+                (next_due and next_due.isoformat(), anchor.isoformat(), next_due and next_due.isoformat(), maintenance_id)
+                for maintenance_id, (_, _, next_due, anchor) in plans.items()
+            ],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(pending), skipped, errors
+
+
+def run_due_maintenances(db, today=None, batch_size=None):
+    """
+    Genera los tickets de todos los mantenimientos vencidos a `today`.
+    Devuelve un resumen: mantenimientos, tickets, ya_generados, lotes,
+    errores [(id, motivo)], segundos y tickets_por_segundo.
+    """
+    today = today or date.today()
+    if batch_size is None:
+        batch_size = int(current_app.config.get("MAINTENANCE_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    if db.in_transaction:
+        db.commit()
+    stats = {"mantenimientos": 0, "tickets": 0, "ya_generados": 0, "lotes": 0, "errores": []}
+    started = time.perf_counter()
+    cursor = 0
+    while True:
+        rows = db.execute(_DUE_SQL, (today.isoformat(), cursor, batch_size)).fetchall()
+        if not rows:
+            break
+        cursor = rows[-1]["id"]
+        stats["mantenimientos"] += len(rows)
+        stats["lotes"] += 1
+        try:
+            created, skipped, errors = _generate_batch(db, rows, today)
+        except Exception as e:
+            current_app.logger.exception("Mantenimientos: error en el lote %d-%d", rows[0]["id"], cursor)
+            stats["errores"].extend((row["id"], str(e)) for row in rows)
+            continue
+        stats["tickets"] += created
+        stats["ya_generados"] += skipped
+        stats["errores"].extend(errors)
+    stats["segundos"] = time.perf_counter() - started
+    stats["tickets_por_segundo"] = stats["tickets"] / stats["segundos"] if stats["segundos"] else 0.0
+    if stats["tickets"]:
+        from .metrics import invalidate_dashboard_kpis
+
+        invalidate_dashboard_kpis()
+    current_app.logger.info(
+        "Mantenimientos: %d tickets de %d mantenimientos en %d lotes, %.3f s (%.0f tickets/s), %d errores",
+        stats["tickets"], stats["mantenimientos"], stats["lotes"], stats["segundos"],
+        stats["tickets_por_segundo"], len(stats["errores"]),
+    )
+    return stats
+
+
+# --- Planificador en el proceso ---
+
+_scheduler_lock = threading.Lock()
+_scheduler_thread = None
+
+
+def _scheduler_loop(app):
+    from .db_utils import get_db
+
+    interval = float(app.config.get("MAINTENANCE_SCHEDULER_INTERVAL", DEFAULT_INTERVAL))
+    while True:
+        try:
+            with app.app_context():
+                run_due_maintenances(get_db())
+        except Exception:
+            app.logger.exception("Mantenimientos: error en el planificador")
+        time.sleep(interval)
+
+
+def ensure_scheduler():
+    """Arranca el hilo planificador de este proceso si MAINTENANCE_SCHEDULER está activo."""
+    global _scheduler_thread
+    if _scheduler_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("MAINTENANCE_SCHEDULER", False):
+        return
+    with _scheduler_lock:
+        if _scheduler_thread is None:
+            _scheduler_thread = threading.Thread(
+                target=_scheduler_loop, args=(app,), name="maintenance-scheduler", daemon=True
+            )
+            _scheduler_thread.start()
@@ -191,6 +191,32 @@ def get_market_study_for_material(material_id: int) -> dict | None:
         return dict(study)
     return None
 
+def get_market_studies_for_materials(db, material_ids) -> dict[int, dict]:
+    """
+    Latest market study for each material in one windowed query:
+    {material_id: {...}}. Materials without a study are absent from the result.
+    """
+    material_ids = sorted({int(m) for m in material_ids})
+    if not material_ids:
+        return {}
+    placeholders = ','.join('?' * len(material_ids))
+    rows = db.execute(
+        f'''SELECT material_id, price_avg, price_min, price_max, difficulty, sources_json
+            FROM (
+                SELECT mr.material_id, mr.price_avg, mr.price_min, mr.price_max, mr.difficulty, mr.sources_json,
+                       ROW_NUMBER() OVER (PARTITION BY mr.material_id ORDER BY mr.created_at DESC, mr.id DESC) AS rn
+                FROM market_research mr
+                WHERE mr.material_id IN ({placeholders})
+            )
+            WHERE rn = 1''',
+        material_ids
+    ).fetchall()
+    studies = {}
+    for row in rows:
+        study = dict(row)
+        studies[study.pop('material_id')] = study
+    return studies
+
 # --- Market Study Routes ---
 @bp.route('/list')
 @login_required
@@ -7,6 +7,7 @@ from backend.auth import login_required
 from backend.db_utils import get_db
 from backend.forms import MaterialForm
 from backend.market_study import get_market_study_for_material  # New import
+from backend.providers import get_provider_choices
 
 bp = Blueprint('materials', __name__, url_prefix='/materials')
 
@@ -60,7 +61,7 @@ def add_material():
     db = get_db()
     form = MaterialForm()
     # Populate provider choices
-    providers = db.execute('SELECT id, nombre FROM providers ORDER BY nombre').fetchall()
+    providers = get_provider_choices(db)
     form.proveedor_principal_id.choices = [(p['id'], p['nombre']) for p in providers]
     form.proveedor_principal_id.choices.insert(0, ('', 'Seleccione un proveedor'))
 
@@ -113,7 +114,7 @@ def edit_material(material_id):
 
     form = MaterialForm(obj=material)
     # Populate provider choices
-    providers = db.execute('SELECT id, nombre FROM providers ORDER BY nombre').fetchall()
+    providers = get_provider_choices(db)
     form.proveedor_principal_id.choices = [(p['id'], p['nombre']) for p in providers]
     form.proveedor_principal_id.choices.insert(0, ('', 'Seleccione un proveedor'))
 
@@ -0,0 +1,293 @@
+# backend/messaging.py
+"""
+Interfaz única de envío de WhatsApp (MessagingBackend).
+
+Todos los envíos de la app (auth, jobs, quotes, rfq, la bandeja de
+notificaciones y las respuestas de los webhooks) pasan por get_backend(), que
+devuelve la implementación configurada en MESSAGING_BACKEND:
+
+  meta    WhatsApp Cloud API vía wa_client (Session keep-alive compartida)
+  twilio  API de Twilio, con un único twilio.rest.Client por proceso
+  fake    en memoria, sin red: registra cada envío y permite inyectar latencia
+          (MESSAGING_FAKE_LATENCY, segundos) y errores
+          (MESSAGING_FAKE_ERROR_RATE, 0..1, o FakeBackend.fail_next())
+
+Con MESSAGING_BACKEND=fake se pueden hacer pruebas de carga del reparto de
+notificaciones y de los webhooks (FakeBackend.inbound_payload()) en local.
+
+Los métodos devuelven el id del mensaje (wamid de Meta, SID de Twilio) y
+lanzan una excepción si el envío falla, para que los llamantes reintenten.
+El ritmo y los reintentos de los backends reales los aplica wa_throttle.
+"""
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from flask import current_app, has_app_context
+
+from .wa_throttle import get_scheduler, session_window_open
+
+DEFAULT_BACKEND = "meta"
+
+
+def _cfg(key, default=None):
+    value = os.environ.get(key)
+    if value is None and has_app_context():
+        value = current_app.config.get(key)
+    return default if value is None else value
+
+
+class MessagingBackend:
+    """Interfaz común de los backends de envío."""
+
+    name = None
+
+    def send_text(self, to: str, text: str) -> str | None:
+        """Envía un texto libre y devuelve el id del mensaje."""
+        raise NotImplementedError
+
+    def send_template(self, to: str, template_name: str, lang: str = "es") -> str | None:
+        """Envía una plantilla aprobada y devuelve el id del mensaje."""
+        raise NotImplementedError
+
+
+class MetaBackend(MessagingBackend):
+    """WhatsApp Cloud API (Graph API de Meta) a través de wa_client."""
+
+    name = "meta"
+
+    def send_text(self, to, text):
+        from . import wa_client
+
+        return wa_client.response_message_id(wa_client.send_whatsapp_text(to, text))
+
+    def send_template(self, to, template_name, lang="es"):
+        from . import wa_client
+
+        return wa_client.response_message_id(wa_client.send_whatsapp_template(to, template_name, lang=lang))
+
+
+class TwilioBackend(MessagingBackend):
+    """
+    WhatsApp vía Twilio. El Client (y su pool HTTP) se crea una vez por proceso
+    y se recrea tras un fork o si cambian las credenciales. En send_template,
+    `template_name` es el Content SID (HX...) de la plantilla en Twilio.
+    """
+
+    name = "twilio"
+
+    def __init__(self):
+        self._client = None
+        self._client_key = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def credentials():
+        return os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN"), os.getenv("TWILIO_WA_FROM")
+
+    def get_client(self):
+        sid, token, _wa_from = self.credentials()
+        key = (os.getpid(), sid, token)
+        if self._client is None or self._client_key != key:
+            with self._lock:
+                if self._client is None or self._client_key != key:
+                    from twilio.rest import Client
+
+                    self._client, self._client_key = Client(sid, token), key
+        return self._client
+
+    def _create(self, to, **params):
+        from .phone_directory import to_e164
+
+        sid, token, wa_from = self.credentials()
+        if not all([sid, token, wa_from]):
+            raise RuntimeError("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN o TWILIO_WA_FROM sin configurar")
+        client = self.get_client()
+        number = to_e164(to) or to
+        # Ritmo por número emisor y por destinatario, con reintentos en 429/5xx
+        message = get_scheduler().call(
+            wa_from,
+            number,
+            lambda: client.messages.create(from_=wa_from, to=f"whatsapp:{number}", **params),
+        )
+        return message.sid
+
+    def send_text(self, to, text):
+        return self._create(to, body=text)
+
+    def send_template(self, to, template_name, lang="es"):
+        return self._create(to, content_sid=template_name)
+
+
+class FakeSendError(Exception):
+    """Error inyectado por FakeBackend."""
+
+
+class FakeBackend(MessagingBackend):
+    """
+    Backend en memoria para tests y pruebas de carga. Cada envío espera
+    `latency` segundos (fuera del lock, así que los envíos concurrentes se
+    solapan como con la red), falla con probabilidad `error_rate` o con el
+    siguiente error de fail_next(), y queda registrado en `calls`.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=None, sleep=time.sleep):
+        self.latency = float(latency)
+        self.error_rate = float(error_rate)
+        self.calls = []
+        self._sleep = sleep
+        self._random = random.Random(seed)
+        self._errors = deque()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def fail_next(self, error=None, times=1):
+        """Hace fallar los próximos `times` envíos con `error` (FakeSendError por defecto)."""
+        with self._lock:
+            for _ in range(times):
+                self._errors.append(error or FakeSendError("Error simulado"))
+
+    def clear(self):
+        with self._lock:
+            self.calls.clear()
+            self._errors.clear()
+
+    def sent(self, to=None):
+        """Envíos correctos (opcionalmente sólo los dirigidos a `to`)."""
+        with self._lock:
+            return [c for c in self.calls if c["message_id"] and (to is None or c["to"] == to)]
+
+    def _send(self, kind, to, **payload):
+        if self.latency > 0:
+            self._sleep(self.latency)
+        with self._lock:
+            if self._errors:
+                error = self._errors.popleft()
+            elif self.error_rate and self._random.random() < self.error_rate:
+                error = FakeSendError("Error simulado")
+            else:
+                error = None
+            message_id = None if error else f"wamid.fake.{next(self._ids)}"
+            self.calls.append({
+                "kind": kind,
+                "to": to,
+                **payload,
+                "message_id": message_id,
+                "error": str(error) if error else None,
+                "at": time.time(),
+            })
+        if error:
+            raise error
+        return message_id
+
+    def send_text(self, to, text):
+        return self._send("text", to, text=text)
+
+    def send_template(self, to, template_name, lang="es"):
+        return self._send("template", to, template=template_name, lang=lang)
+
+    @staticmethod
+    def inbound_payload(from_number, text, message_id=None, phone_number_id="fake"):
+        """Payload de webhook de la Cloud API con un mensaje de texto entrante."""
+        message_id = message_id or f"wamid.fake.in.{from_number}.{time.time_ns()}"
+        return {
+            "object": "whatsapp_business_account",
+            "entry": [{
+                "id": "fake",
+                "changes": [{
+                    "field": "messages",
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": {"phone_number_id": phone_number_id},
+                        "messages": [{
+                            "from": from_number,
+                            "id": message_id,
+                            "timestamp": str(int(time.time())),
+                            "type": "text",
+                            "text": {"body": text},
+                        }],
+                    },
+                }],
+            }],
+        }
+
+
+# --- Selección del backend ---
+
+_backends: dict[str, MessagingBackend] = {}
+_override = None
+_backends_lock = threading.Lock()
+
+
+def _build(name):
+    if name == "meta":
+        return MetaBackend()
+    if name == "twilio":
+        return TwilioBackend()
+    if name == "fake":
+        return FakeBackend(
+            latency=float(_cfg("MESSAGING_FAKE_LATENCY", 0)),
+            error_rate=float(_cfg("MESSAGING_FAKE_ERROR_RATE", 0)),
+        )
+    raise ValueError(f"MESSAGING_BACKEND desconocido: {name!r}")
+
+
+def get_backend(name=None) -> MessagingBackend:
+    """
+    Backend del proceso: `name` o, por defecto, el de set_backend() o el
+    configurado en MESSAGING_BACKEND. Cada backend se crea una sola vez.
+    """
+    if name is None:
+        if _override is not None:
+            return _override
+        name = str(_cfg("MESSAGING_BACKEND", DEFAULT_BACKEND)).lower()
+    backend = _backends.get(name)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None:
+                backend = _backends[name] = _build(name)
+    return backend
+
+
+def set_backend(backend: MessagingBackend):
+    """Fuerza un backend para todo el proceso (tests, pruebas de carga)."""
+    global _override
+    _override = backend
+    return backend
+
+
+def reset_backend():
+    """Quita el backend forzado y descarta los ya creados."""
+    global _override
+    with _backends_lock:
+        _override = None
+        _backends.clear()
+
+
+# --- Atajos usados por el resto de la app ---
+
+def send_whatsapp_text(to: str, text: str) -> str | None:
+    """Envía un texto de WhatsApp por el backend configurado; devuelve el id del mensaje."""
+    return get_backend().send_text(to, text)
+
+
+def send_whatsapp_template(to: str, template_name: str, lang="es") -> str | None:
+    """Envía una plantilla de WhatsApp por el backend configurado; devuelve el id del mensaje."""
+    return get_backend().send_template(to, template_name, lang=lang)
+
+
+def send_text_or_template(db, to: str, text: str, template_name=None, lang="es"):
+    """
+    Texto libre si la ventana de 24 h del destinatario está abierta; si no y hay
+    plantilla configurada, la plantilla (fuera de ventana se rechaza el texto).
+    Devuelve (id del mensaje, 'text' | 'template').
+    """
+    if template_name and not session_window_open(db, to):
+        return send_whatsapp_template(to, template_name, lang=lang), "template"
+    return send_whatsapp_text(to, text), "text"
@@ -1,104 +1,181 @@
 # backend/metrics.py
 import sqlite3
+import threading
+import time
 from typing import Any
 
+from flask import current_app, has_app_context
+
 # Sinónimos por categoría
 PENDING_STATES = {"abierto", "pendiente", "pendientes", "nuevo", "nueva", "pendiente_asignacion", "por_asignar", "por_programar"}
 IN_PROGRESS_STATES = {"en_curso", "progreso", "en_progreso", "asignado", "programado"}
 DONE_STATES = {"completado", "finalizado", "cerrado", "hecho"}
 CANCELLED_STATES = {"cancelado", "anulado", "rechazado"}
-
-TABLE_CANDIDATES = ("trabajos", "jobs", "tickets")
-STATUS_COL_CANDIDATES = ("estado", "status", "estado_trabajo")
-
-def _detect_table_and_status_column(conn: sqlite3.Connection) -> tuple[str, str]:
-    cur = conn.cursor()
-    # Detectar tabla
-    cur.execute(
-        f"SELECT name FROM sqlite_master WHERE type='table' AND name IN ({','.join(['?']*len(TABLE_CANDIDATES))})",
-        TABLE_CANDIDATES
-    )
-    row = cur.fetchone()
-    if not row:
-        # Por compatibilidad con instalaciones limpias de test, creamos una tabla mínima
-        table = "trabajos"
-        cur.execute("CREATE TABLE IF NOT EXISTS trabajos (id INTEGER PRIMARY KEY, estado TEXT)")
-    else:
-        table = row[0]
-
-    # Detectar columna de estado
-    cur.execute(f"PRAGMA table_info({table})")
-    cols = {r[1].lower(): r[1] for r in cur.fetchall()}  # {lower_name: real_name}
-    status_col_real = None
-    for cand in STATUS_COL_CANDIDATES:
-        if cand in cols:
-            status_col_real = cols[cand]
-            break
-
-    if not status_col_real:
-        # Añadir columna estado si no existe (modo defensivo)
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN estado TEXT")
-        status_col_real = "estado"
-
-    # Índice para rendimiento
-    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{status_col_real} ON {table}({status_col_real})")
-
-    conn.commit()
-    return table, status_col_real
-
-def _count_by_values(conn: sqlite3.Connection, table: str, col: str, values: list[str]) -> int:
-    if not values:
-        return 0
-    placeholders = ",".join(["?"] * len(values))
-    sql = f"SELECT COUNT(*) FROM {table} WHERE LOWER({col}) IN ({placeholders})"
-    cur = conn.cursor()
-    cur.execute(sql, [v.lower() for v in values])
-    return int(cur.fetchone()[0])
-
-def get_dashboard_kpis(conn: sqlite3.Connection) -> dict[str, Any]:
-    cur = conn.cursor()
-
-    total = cur.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
-
-    # Los tests consideran "pendientes" como estado == 'abierto'
-    pendientes = cur.execute(
-        "SELECT COUNT(*) FROM tickets WHERE estado = ?",
-        ("abierto",)
-    ).fetchone()[0]
-
-    en_curso = cur.execute(
-        "SELECT COUNT(*) FROM tickets WHERE estado = ?",
-        ("en_progreso",)
-    ).fetchone()[0]
-
-    completados = cur.execute(
-        "SELECT COUNT(*) FROM tickets WHERE estado = ?",
-        ("finalizado",)
-    ).fetchone()[0]
-
-    cancelados = cur.execute(
-        "SELECT COUNT(*) FROM tickets WHERE estado = ?",
-        ("cancelado",)
-    ).fetchone()[0]
-
-    pagos_pendientes = cur.execute(
-        "SELECT COUNT(*) FROM tickets WHERE estado_pago IS NULL OR estado_pago <> 'Pagado'"
-    ).fetchone()[0]
-
-    total_clientes = cur.execute(
-        "SELECT COUNT(*) FROM clientes"
-    ).fetchone()[0]
-
-    # ← CLAVE QUE FALTABA PARA EL TEST
-    abiertos = int(total) - int(completados) - int(cancelados)
-
-    return {
-        "total": int(total),
-        "pendientes": int(pendientes),
-        "en_curso": int(en_curso),
-        "completados": int(completados),
-        "cancelados": int(cancelados),
-        "pagos_pendientes": int(pagos_pendientes),
-        "total_clientes": int(total_clientes),
-        "abiertos": int(abiertos),  # <- nuevo
+PAID_STATES = {"pagado"}
+
+# Segundos que un resultado de KPIs puede servirse desde caché. Las escrituras
+# sobre tickets/clientes de este proceso invalidan antes (invalidate_dashboard_kpis);
+# el TTL acota el desfase frente a escrituras de otros workers.
+DEFAULT_KPI_CACHE_TTL = 30.0
+
+_kpi_cache: dict[str, tuple[float, dict[str, Any]]] = {}
+_kpi_cache_lock = threading.Lock()
+_kpi_generation = 0  # sube en cada invalidación; evita guardar un cálculo ya obsoleto
+
+
+def normalize_state(value: str | None) -> str:
+    """'En Progreso' -> 'en_progreso', None -> ''."""
+    return "_".join((value or "").strip().lower().replace("-", " ").split())
+
+
+def _state_category(value: str | None) -> str | None:
+    state = normalize_state(value)
+    if state in PENDING_STATES:
+        return "pendientes"
+    if state in IN_PROGRESS_STATES:
+        return "en_curso"
+    if state in DONE_STATES:
+        return "completados"
+    if state in CANCELLED_STATES:
+        return "cancelados"
+    return None
+
+
+def _kpis_from_counts(estado_counts: dict[str, int], pago_counts: dict[str, int], total_clientes: int) -> dict[str, Any]:
+    kpis = {
+        "total": 0,
+        "pendientes": 0,
+        "en_curso": 0,
+        "completados": 0,
+        "cancelados": 0,
+        "pagos_pendientes": 0,
     }
+    for estado, count in estado_counts.items():
+        kpis["total"] += count
+        category = _state_category(estado)
+        if category:
+            kpis[category] += count
+    for estado_pago, count in pago_counts.items():
+        if normalize_state(estado_pago) not in PAID_STATES:
+            kpis["pagos_pendientes"] += count
+
+    kpis["total_clientes"] = int(total_clientes)
+    kpis["abiertos"] = kpis["total"] - kpis["completados"] - kpis["cancelados"]
+    return kpis
+
+
+def count_kpi_sources(conn: sqlite3.Connection) -> dict[tuple[str, str], int]:
+    """
+    Recuento real, con una única agregación agrupada sobre tickets, en el mismo
+    formato que kpi_counters: {(kind, value): count}. Es O(n); sólo se usa para
+    verificar/reconstruir los contadores o si la tabla aún no existe.
+    """
+    counts: dict[tuple[str, str], int] = {}
+    rows = conn.execute(
+        "SELECT COALESCE(estado, ''), COALESCE(estado_pago, ''), COUNT(*) FROM tickets GROUP BY 1, 2"
+    ).fetchall()
+    for estado, estado_pago, count in rows:
+        counts[("estado", estado)] = counts.get(("estado", estado), 0) + count
+        counts[("estado_pago", estado_pago)] = counts.get(("estado_pago", estado_pago), 0) + count
+    counts[("clientes", "")] = int(conn.execute("SELECT COUNT(*) FROM clientes").fetchone()[0])
+    return counts
+
+
+def read_kpi_counters(conn: sqlite3.Connection) -> dict[tuple[str, str], int]:
+    """Lee kpi_counters (mantenida por triggers): tantas filas como estados distintos."""
+    rows = conn.execute("SELECT kind, value, count FROM kpi_counters WHERE count <> 0").fetchall()
+    return {(kind, value): count for kind, value, count in rows}
+
+
+def _kpis_from_counters(counters: dict[tuple[str, str], int]) -> dict[str, Any]:
+    estado_counts = {value: n for (kind, value), n in counters.items() if kind == "estado"}
+    pago_counts = {value: n for (kind, value), n in counters.items() if kind == "estado_pago"}
+    return _kpis_from_counts(estado_counts, pago_counts, counters.get(("clientes", ""), 0))
+
+
+def compute_dashboard_kpis(conn: sqlite3.Connection) -> dict[str, Any]:
+    """
+    KPIs a partir de kpi_counters, sin recorrer tickets. Si la base de datos
+    todavía no tiene la tabla (migración pendiente) se recurre a la agregación.
+    """
+    try:
+        counters = read_kpi_counters(conn)
+    except sqlite3.OperationalError:
+        counters = count_kpi_sources(conn)
+    return _kpis_from_counters(counters)
+
+
+def check_kpi_counters(conn: sqlite3.Connection) -> list[tuple[str, str, int, int]]:
+    """Devuelve las diferencias (kind, value, guardado, real) entre kpi_counters y los datos."""
+    stored = read_kpi_counters(conn)
+    actual = count_kpi_sources(conn)
+    drift = []
+    for key in sorted(set(stored) | set(actual)):
+        if stored.get(key, 0) != actual.get(key, 0):
+            drift.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+    return drift
+
+
+def rebuild_kpi_counters(conn: sqlite3.Connection) -> list[tuple[str, str, int, int]]:
+    """
+    Verifica kpi_counters y, si hay desviaciones, la reescribe desde cero.
+    BEGIN IMMEDIATE bloquea a otros escritores mientras se recuenta, para que
+    ningún alta/edición de tickets se cuele entre el recuento y la reescritura.
+    Devuelve las desviaciones encontradas.
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        drift = check_kpi_counters(conn)
+        if drift:
+            conn.execute("DELETE FROM kpi_counters")
+            conn.executemany(
+                "INSERT INTO kpi_counters (kind, value, count) VALUES (?, ?, ?)",
+                [(kind, value, count) for (kind, value), count in count_kpi_sources(conn).items()],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if drift:
+        invalidate_dashboard_kpis()
+    return drift
+
+
+def _cache_key(conn: sqlite3.Connection) -> str:
+    if has_app_context():
+        return current_app.config.get("DATABASE", "")
+    return f"conn:{id(conn)}"
+
+
+def _cache_ttl() -> float:
+    if has_app_context():
+        return float(current_app.config.get("KPI_CACHE_TTL", DEFAULT_KPI_CACHE_TTL))
+    return DEFAULT_KPI_CACHE_TTL
+
+
+def invalidate_dashboard_kpis() -> None:
+    """Descarta los KPIs cacheados. Llamar tras escribir en tickets o clientes."""
+    global _kpi_generation
+    with _kpi_cache_lock:
+        _kpi_generation += 1
+        _kpi_cache.clear()
+
+
+def get_dashboard_kpis(conn: sqlite3.Connection, use_cache: bool = True) -> dict[str, Any]:
+    key = _cache_key(conn)
+    now = time.monotonic()
+    if use_cache:
+        cached = _kpi_cache.get(key)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+
+    generation = _kpi_generation
+    kpis = compute_dashboard_kpis(conn)
+    ttl = _cache_ttl()
+    if use_cache and ttl > 0:
+        with _kpi_cache_lock:
+            if generation == _kpi_generation:
+                _kpi_cache[key] = (now + ttl, kpis)
+    return dict(kpis)
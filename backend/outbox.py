@@ -0,0 +1,279 @@
+# backend/outbox.py
+"""
+Bandeja de salida de notificaciones (tabla notification_outbox).
+
+Las vistas encolan las notificaciones con enqueue_notifications() dentro de su
+propia transacción, así que la notificación existe si y sólo si el cambio de
+negocio se confirmó, y la petición no espera a ninguna llamada HTTP.
+
+Un hilo en segundo plano (arrancado con la primera petición del proceso, así
+lo pendiente de antes de un reinicio no espera al próximo encolado) vacía la
+bandeja por lotes:
+  - canal 'app': un único executemany sobre notifications y marca las filas
+    como enviadas, todo en la misma transacción;
+  - canal 'whatsapp': envíos concurrentes a la Graph API y reintentos con
+    espera exponencial; tras OUTBOX_MAX_ATTEMPTS la fila queda 'failed'.
+
+Reclamar un lote adelanta next_attempt_at (un "lease"): si el proceso muere a
+mitad de envío, las filas vuelven a estar disponibles al vencer el lease.
+`flask outbox-dispatch` procesa la bandeja desde la línea de comandos.
+"""
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .wa_client import response_message_id
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_SEND_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_BASE_SECONDS = 30
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_POLL_INTERVAL = 5.0
+
+CHANNELS = ("app", "whatsapp")
+
+
+def enqueue_notifications(db, user_ids, message, whatsapp=True):
+    """
+    Encola `message` para cada usuario (sin duplicados y en orden). No hace
+    commit: la fila se confirma con la transacción del llamante, que debe
+    llamar a wake_dispatcher() después del commit.
+    """
+    seen = set()
+    rows = []
+    for user_id in user_ids:
+        if user_id is None or user_id in seen:
+            continue
+        seen.add(user_id)
+        rows.append((user_id, message, "app"))
+        if whatsapp:
+            rows.append((user_id, message, "whatsapp"))
+    if rows:
+        db.executemany(
+            "INSERT INTO notification_outbox (user_id, message, channel) VALUES (?, ?, ?)", rows
+        )
+    return len(rows)
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _claim_batch(db, batch_size, lease_seconds):
+    """Reclama hasta batch_size filas pendientes y vencidas; devuelve sus filas."""
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            """
+            SELECT id, user_id, message, channel, attempts
+            FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+            """,
+            (batch_size,),
+        ).fetchall()
+        if rows:
+            db.executemany(
+                "UPDATE notification_outbox SET attempts = attempts + 1, "
+                "next_attempt_at = datetime('now', ?) WHERE id = ?",
+                [(f"+{int(lease_seconds)} seconds", row["id"]) for row in rows],
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows
+
+
+def _deliver_app(db, rows):
+    db.executemany(
+        "INSERT INTO notifications (user_id, message) VALUES (?, ?)",
+        [(row["user_id"], row["message"]) for row in rows],
+    )
+    db.executemany(
+        "UPDATE notification_outbox SET status = 'sent', sent_at = datetime('now'), last_error = NULL WHERE id = ?",
+        [(row["id"],) for row in rows],
+    )
+    db.commit()
+
+
+def _deliver_whatsapp(db, rows, send, concurrency, max_attempts, retry_base):
+    user_ids = sorted({row["user_id"] for row in rows})
+    placeholders = ",".join("?" * len(user_ids))
+    numbers = {
+        r["id"]: r["whatsapp_number"]
+        for r in db.execute(
+            f"SELECT id, whatsapp_number FROM users WHERE id IN ({placeholders}) "
+            "AND whatsapp_opt_in = 1 AND whatsapp_number IS NOT NULL AND whatsapp_number <> ''",
+            user_ids,
+        ).fetchall()
+    }
+    if db.in_transaction:
+        db.commit()
+
+    skipped = [row for row in rows if row["user_id"] not in numbers]
+    to_send = [row for row in rows if row["user_id"] in numbers]
+
+    def _send(row):
+        try:
+            return row, response_message_id(send(numbers[row["user_id"]], row["message"])), None
+        except Exception as e:  # cualquier fallo del envío se reintenta
+            return row, None, str(e)
+
+    results = []
+    if to_send:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(to_send)))) as pool:
+            results = list(pool.map(_send, to_send))
+
+    from_number = _config("WHATSAPP_PHONE_NUMBER_ID", None)
+    logs, sent, retry, failed = [], [], [], []
+    for row, message_id, error in results:
+        to_number = numbers[row["user_id"]]
+        if message_id:
+            sent.append((row["id"],))
+            logs.append(("outbound", from_number, to_number, row["message"], message_id, "sent", None))
+            continue
+        error = error or "Failed to get message ID from WhatsApp API"
+        logs.append(("outbound", from_number, to_number, row["message"], None, "failed", error))
+        if row["attempts"] + 1 >= max_attempts:
+            failed.append((error, row["id"]))
+        else:
+            delay = retry_base * (2 ** row["attempts"])
+            retry.append((error, f"+{int(delay)} seconds", row["id"]))
+
+    try:
+        if logs:
+            db.executemany(
+                "INSERT INTO whatsapp_message_logs (direction, from_number, to_number, message_body, "
+                "whatsapp_message_id, status, error_info) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                logs,
+            )
+        db.executemany(
+            "UPDATE notification_outbox SET status = 'sent', sent_at = datetime('now'), last_error = NULL WHERE id = ?",
+            sent,
+        )
+        db.executemany(
+            "UPDATE notification_outbox SET status = 'skipped', last_error = 'Opt-in or number missing' WHERE id = ?",
+            [(row["id"],) for row in skipped],
+        )
+        db.executemany(
+            "UPDATE notification_outbox SET last_error = ?, next_attempt_at = datetime('now', ?) WHERE id = ?",
+            retry,
+        )
+        db.executemany(
+            "UPDATE notification_outbox SET status = 'failed', last_error = ? WHERE id = ?",
+            failed,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(sent), len(retry) + len(failed)
+
+
+def dispatch_outbox(db, send=None, batch_size=None):
+    """
+    Procesa un lote de la bandeja. Devuelve un dict con las filas reclamadas,
+    enviadas y con error. `send(to_number, text)` por defecto es
+    el send_text del backend de messaging.
+    """
+    if send is None:
+        from .messaging import get_backend
+
+        send = get_backend().send_text
+
+    batch_size = batch_size or int(_config("OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    rows = _claim_batch(db, batch_size, _config("OUTBOX_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+    result = {"claimed": len(rows), "sent": 0, "errors": 0}
+    if not rows:
+        return result
+
+    app_rows = [row for row in rows if row["channel"] == "app"]
+    wa_rows = [row for row in rows if row["channel"] == "whatsapp"]
+    if app_rows:
+        try:
+            _deliver_app(db, app_rows)
+            result["sent"] += len(app_rows)
+        except sqlite3.Error:
+            db.rollback()
+            current_app.logger.exception("Outbox: error insertando %d notificaciones", len(app_rows))
+            result["errors"] += len(app_rows)
+    if wa_rows:
+        sent, errors = _deliver_whatsapp(
+            db,
+            wa_rows,
+            send,
+            int(_config("OUTBOX_SEND_CONCURRENCY", DEFAULT_SEND_CONCURRENCY)),
+            int(_config("OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+            float(_config("OUTBOX_RETRY_BASE_SECONDS", DEFAULT_RETRY_BASE_SECONDS)),
+        )
+        result["sent"] += sent
+        result["errors"] += errors
+    return result
+
+
+def drain_outbox(db, send=None):
+    """Procesa lotes hasta que no quede nada vencido. Devuelve los totales."""
+    totals = {"claimed": 0, "sent": 0, "errors": 0}
+    while True:
+        result = dispatch_outbox(db, send=send)
+        for key in totals:
+            totals[key] += result[key]
+        if result["claimed"] == 0:
+            return totals
+
+
+# --- Hilo despachador ---
+
+_wake = threading.Event()
+_dispatcher_lock = threading.Lock()
+_dispatcher_thread = None
+
+
+def _dispatcher_loop(app):
+    from .db_utils import get_db
+
+    interval = float(app.config.get("OUTBOX_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        try:
+            with app.app_context():
+                drain_outbox(get_db())
+        except Exception:
+            app.logger.exception("Outbox: error en el despachador")
+
+
+def ensure_dispatcher():
+    """
+    Arranca el hilo despachador de este proceso si OUTBOX_DISPATCHER está
+    activo. Al arrancar drena en seguida lo que quedó de antes de un reinicio
+    (pendientes, reintentos programados y leases vencidos).
+    """
+    global _dispatcher_thread
+    if _dispatcher_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("OUTBOX_DISPATCHER", True):
+        return
+    with _dispatcher_lock:
+        if _dispatcher_thread is None:
+            _dispatcher_thread = threading.Thread(
+                target=_dispatcher_loop, args=(app,), name="notification-outbox", daemon=True
+            )
+            _dispatcher_thread.start()
+            _wake.set()
+
+
+def wake_dispatcher():
+    """Despierta (y arranca si hace falta) el hilo despachador de este proceso."""
+    if not current_app.config.get("OUTBOX_DISPATCHER", True):
+        return
+    ensure_dispatcher()
+    _wake.set()
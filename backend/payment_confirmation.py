@@ -3,6 +3,7 @@ from datetime import datetime
 from flask import Blueprint, flash, render_template, request
 
 from backend.db_utils import get_db
+from backend.metrics import invalidate_dashboard_kpis
 
 bp = Blueprint('payment_confirmation', __name__, url_prefix='/payment')
 
@@ -40,6 +41,7 @@ def confirm_payment(ticket_id, token):
                 ("Pagado", ticket_id)
             )
             db.commit()
+            invalidate_dashboard_kpis()
             flash('¡Pago confirmado con éxito! Gracias.', 'success')
             return render_template('payment_confirmation/success.html', ticket_id=ticket_id)
         except Exception as e:
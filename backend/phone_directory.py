@@ -0,0 +1,160 @@
+# backend/phone_directory.py
+"""
+Directorio de teléfonos normalizados (tabla phone_directory).
+
+Los números llegan en formatos distintos: Meta manda "34600111222", Twilio
+"whatsapp:+34600111222" y en la BD hay "600 11 12 22" o "+34-600-111-222".
+to_e164() los lleva todos a E.164 ("+34600111222"); los números nacionales
+de 9 cifras se asumen españoles (DEFAULT_COUNTRY_CODE).
+
+phone_directory guarda (número canónico, tipo, id) para providers, clientes y
+users. La mantienen los triggers de schema.sql en cada alta, edición y baja,
+con la misma normalización en SQL (vista phone_directory_source), así que
+siempre está al día y resolver un remitente es una sola búsqueda por clave
+primaria. Encima hay una caché LRU en proceso de los números conocidos
+(PHONE_DIRECTORY_CACHE_SIZE entradas, PHONE_DIRECTORY_CACHE_TTL segundos).
+`flask phone-directory-rebuild` la verifica y repara.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+
+DEFAULT_COUNTRY_CODE = "34"
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL = 300.0
+
+# Equivalentes a los GLOB de phone_directory_source (sólo dígitos ASCII)
+_STRIP_RE = re.compile(r"[ \-()./]")
+_INTERNATIONAL_RE = re.compile(r"\+[1-9][0-9]*")
+_DOUBLE_ZERO_RE = re.compile(r"00[1-9][0-9]*")
+_NATIONAL_RE = re.compile(r"[6789][0-9]{8}")
+_BARE_INTERNATIONAL_RE = re.compile(r"[1-9][0-9]{9,}")
+
+
+def to_e164(raw) -> str | None:
+    """
+    Número en E.164 ("+34600111222") o None si no parece un teléfono.
+    Debe coincidir con la normalización SQL de la vista phone_directory_source.
+    """
+    if raw is None:
+        return None
+    s = _STRIP_RE.sub("", str(raw).lower().replace("whatsapp:", ""))
+    if _INTERNATIONAL_RE.fullmatch(s):
+        number = s
+    elif _DOUBLE_ZERO_RE.fullmatch(s):
+        number = "+" + s[2:]
+    elif _NATIONAL_RE.fullmatch(s):
+        number = "+" + DEFAULT_COUNTRY_CODE + s
+    elif _BARE_INTERNATIONAL_RE.fullmatch(s):
+        number = "+" + s
+    else:
+        return None
+    return number if 9 <= len(number) <= 16 else None
+
+
+# --- Caché LRU ---
+
+_cache: "OrderedDict[tuple[str, str], tuple[float, dict]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_generation = 0
+
+
+def invalidate_phone_directory():
+    """Vacía la caché (llamar tras cambiar teléfonos de proveedores, clientes o usuarios)."""
+    global _cache_generation
+    with _cache_lock:
+        _cache_generation += 1
+        _cache.clear()
+
+
+def _cache_settings():
+    if not has_app_context():
+        return DEFAULT_CACHE_SIZE, DEFAULT_CACHE_TTL, ""
+    config = current_app.config
+    return (
+        int(config.get("PHONE_DIRECTORY_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        float(config.get("PHONE_DIRECTORY_CACHE_TTL", DEFAULT_CACHE_TTL)),
+        config.get("DATABASE", ""),
+    )
+
+
+def lookup_number(db, number) -> dict[str, int]:
+    """{tipo: id} para un número ya canónico (el id más bajo si hay varios del mismo tipo)."""
+    return {
+        row[0]: row[1]
+        for row in db.execute(
+            "SELECT kind, MIN(entity_id) FROM phone_directory WHERE number = ? GROUP BY kind", (number,)
+        ).fetchall()
+    }
+
+
+def resolve_number(db, raw) -> dict[str, int]:
+    """
+    {'provider': id, 'client': id, 'user': id} (sólo los tipos que existan) para
+    un número en cualquier formato; {} si no es un teléfono o no está registrado.
+    """
+    number = to_e164(raw)
+    if number is None:
+        return {}
+    size, ttl, db_key = _cache_settings()
+    key = (db_key, number)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] > now:
+            _cache.move_to_end(key)
+            return cached[1]
+        generation = _cache_generation
+
+    found = lookup_number(db, number)
+    # Sólo se cachean aciertos: un alta nueva se ve al momento sin invalidar;
+    # las ediciones y bajas llaman a invalidate_phone_directory().
+    if found and ttl > 0 and size > 0:
+        with _cache_lock:
+            if generation == _cache_generation:
+                _cache[key] = (now + ttl, found)
+                _cache.move_to_end(key)
+                while len(_cache) > size:
+                    _cache.popitem(last=False)
+    return found
+
+
+# --- Verificación / reconstrucción ---
+
+def check_phone_directory(conn: sqlite3.Connection) -> tuple[int, int]:
+    """(filas que faltan, filas sobrantes) de phone_directory frente a los datos."""
+    missing = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT number, kind, entity_id FROM phone_directory_source "
+        "EXCEPT SELECT number, kind, entity_id FROM phone_directory)"
+    ).fetchone()[0]
+    extra = conn.execute(
+        "SELECT COUNT(*) FROM (SELECT number, kind, entity_id FROM phone_directory "
+        "EXCEPT SELECT number, kind, entity_id FROM phone_directory_source)"
+    ).fetchone()[0]
+    return missing, extra
+
+
+def rebuild_phone_directory(conn: sqlite3.Connection) -> tuple[int, int]:
+    """Verifica phone_directory y, si no cuadra, la reescribe. Devuelve las diferencias."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        missing, extra = check_phone_directory(conn)
+        if missing or extra:
+            conn.execute("DELETE FROM phone_directory")
+            conn.execute(
+                "INSERT OR IGNORE INTO phone_directory (number, kind, entity_id) "
+                "SELECT number, kind, entity_id FROM phone_directory_source"
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if missing or extra:
+        invalidate_phone_directory()
+    return missing, extra
@@ -14,6 +14,7 @@ from werkzeug.utils import secure_filename
 
 from backend.auth import login_required
 from backend.db_utils import get_db
+from backend.phone_directory import invalidate_phone_directory
 
 bp = Blueprint('profile', __name__, url_prefix='/profile')
 
@@ -89,6 +90,7 @@ def edit_profile():
                     (nombre, email, telefono, nif, avatar_url, user_id)
                 )
                 db.commit()
+                invalidate_phone_directory()
                 flash('¡Perfil actualizado correctamente!')
                 return redirect(url_for('profile.user_profile'))
             except db.IntegrityError:
@@ -1,12 +1,53 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+import threading
+import time
+
+from flask import Blueprint, current_app, flash, has_app_context, redirect, render_template, request, url_for
 from flask_login import current_user
 
 from backend.auth import login_required
 from backend.db_utils import get_db
 from backend.forms import ProviderForm
+from backend.phone_directory import invalidate_phone_directory
 
 bp = Blueprint('providers', __name__, url_prefix='/proveedores')
 
+# Lista (id, nombre) de proveedores para los desplegables. Cambia poco y se pide en
+# cada vista de trabajo/material, así que se cachea por base de datos; las altas,
+# ediciones y bajas de este módulo la invalidan.
+DEFAULT_PROVIDER_CHOICES_TTL = 300.0
+
+_provider_choices_cache: dict[str, tuple[float, list[dict]]] = {}
+_provider_choices_lock = threading.Lock()
+_provider_choices_generation = 0
+
+
+def invalidate_provider_choices():
+    global _provider_choices_generation
+    with _provider_choices_lock:
+        _provider_choices_generation += 1
+        _provider_choices_cache.clear()
+
+
+def get_provider_choices(db):
+    """[{'id': ..., 'nombre': ...}] ordenada por nombre, servida desde caché."""
+    key = current_app.config.get('DATABASE', '') if has_app_context() else f'conn:{id(db)}'
+    ttl = DEFAULT_PROVIDER_CHOICES_TTL
+    if has_app_context():
+        ttl = float(current_app.config.get('PROVIDER_CHOICES_TTL', DEFAULT_PROVIDER_CHOICES_TTL))
+    now = time.monotonic()
+    cached = _provider_choices_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    generation = _provider_choices_generation
+    choices = [dict(row) for row in db.execute('SELECT id, nombre FROM providers ORDER BY nombre').fetchall()]
+    if ttl > 0:
+        with _provider_choices_lock:
+            if generation == _provider_choices_generation:
+                _provider_choices_cache[key] = (now + ttl, choices)
+    return choices
+
+
 @bp.route('/')
 @login_required
 def list_providers():
@@ -58,6 +99,7 @@ def add_provider():
                 (form.nombre.data, form.telefono.data, form.email.data, form.tipo_proveedor.data),
             )
             db.commit()
+            invalidate_provider_choices()
             flash('Provider added successfully.', 'success')
             return redirect(url_for('providers.list_providers'))
         except db.IntegrityError:
@@ -98,6 +140,8 @@ def edit_provider(provider_id):
                 (form.nombre.data, form.telefono.data, form.email.data, form.tipo_proveedor.data, provider_id),
             )
             db.commit()
+            invalidate_provider_choices()
+            invalidate_phone_directory()
             flash('Provider updated successfully.', 'success')
             return redirect(url_for('providers.list_providers'))
         except db.IntegrityError:
@@ -133,6 +177,8 @@ def delete_provider(provider_id):
 
         db.execute('DELETE FROM providers WHERE id = ?', (provider_id,))
         db.commit()
+        invalidate_provider_choices()
+        invalidate_phone_directory()
         flash('Provider deleted successfully.', 'success')
     except Exception as e:
         flash(f'Error deleting provider: {e}', 'error')
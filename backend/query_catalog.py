@@ -0,0 +1,427 @@
+# backend/query_catalog.py
+"""
+Catálogo de consultas "calientes" (las que se ejecutan en cada vista o webhook
+frecuente) y comprobación de sus planes con EXPLAIN QUERY PLAN.
+
+`flask db-check-indexes` recorre el catálogo y falla si alguna consulta acaba
+en un recorrido completo de tabla (SCAN sin índice). Al añadir una consulta
+nueva en un camino caliente, regístrala aquí con register_query().
+"""
+import re
+import sqlite3
+
+HOT_QUERIES: dict[str, dict] = {}
+
+# "SCAN t" / "SCAN TABLE tickets AS t" sin "USING ... INDEX" => recorrido completo
+_FULL_SCAN_RE = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+def register_query(name: str, sql: str, params: tuple = (), allow_scan: tuple = ()):
+    """
+    Registra una consulta del catálogo.
+
+    params: valores de ejemplo para poder preparar la consulta.
+    allow_scan: tablas (o alias) pequeñas por diseño en las que un SCAN es aceptable.
+    """
+    HOT_QUERIES[name] = {"sql": sql, "params": tuple(params), "allow_scan": set(allow_scan)}
+
+
+def explain_query(db: sqlite3.Connection, sql: str, params: tuple = ()) -> list[str]:
+    """Devuelve las líneas de detalle de EXPLAIN QUERY PLAN para `sql`."""
+    rows = db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[3] for row in rows]
+
+
+def find_full_scans(db: sqlite3.Connection, names=None) -> dict[str, list[str]]:
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre el catálogo y devuelve
+    {nombre_consulta: [detalles con SCAN completo]} sólo para las que fallan.
+    Una consulta que no se puede preparar (columna/tabla inexistente) también
+    se considera fallo.
+    """
+    failures = {}
+    for name in names or sorted(HOT_QUERIES):
+        entry = HOT_QUERIES[name]
+        try:
+            details = explain_query(db, entry["sql"], entry["params"])
+        except sqlite3.Error as e:
+            failures[name] = [f"error: {e}"]
+            continue
+        scans = []
+        for detail in details:
+            match = _FULL_SCAN_RE.match(detail.strip())
+            if match and match.group(1) not in entry["allow_scan"]:
+                scans.append(detail)
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+# --- Consultas registradas ---
+
+register_query(
+    "jobs.list_jobs",
+    """
+    SELECT t.id, t.titulo, t.estado, t.fecha_creacion, c.nombre AS client_name, u.username AS assigned_to_name,
+           e.inicio AS next_event_start, e.fin AS next_event_end
+    FROM tickets t
+    LEFT JOIN clientes c ON t.cliente_id = c.id
+    LEFT JOIN users u ON t.asignado_a = u.id
+    LEFT JOIN eventos e ON e.id = (
+        SELECT e2.id FROM eventos e2
+        WHERE e2.ticket_id = t.id AND e2.inicio >= ?
+        ORDER BY e2.inicio, e2.id
+        LIMIT 1
+    )
+    WHERE (t.fecha_creacion, t.id) < (?, ?)
+    ORDER BY t.fecha_creacion DESC, t.id DESC
+    LIMIT ?
+    """,
+    ("2024-01-01 00:00:00", "2024-01-01 00:00:00", 100, 51),
+)
+
+register_query(
+    "jobs.list_jobs.by_assignee",
+    """
+    SELECT t.id FROM tickets t
+    WHERE t.asignado_a = ? AND (t.fecha_creacion, t.id) < (?, ?)
+    ORDER BY t.fecha_creacion DESC, t.id DESC
+    LIMIT ?
+    """,
+    (1, "2024-01-01 00:00:00", 100, 51),
+)
+
+register_query(
+    "jobs.view_job.materials",
+    """
+    SELECT jm.material_id, m.nombre, m.sku, jm.quantity, jm.price_per_unit, jm.total_price
+    FROM job_materials jm
+    JOIN materiales m ON jm.material_id = m.id
+    WHERE jm.job_id = ?
+    """,
+    (1,),
+)
+
+register_query(
+    "jobs.view_job.provider_quotes",
+    """
+    SELECT pq.id, pq.material_id, pq.provider_id, p.nombre as provider_name, pq.quote_amount, pq.status, pq.quote_date
+    FROM provider_quotes pq
+    JOIN providers p ON pq.provider_id = p.id
+    WHERE pq.job_id = ?
+    """,
+    (1,),
+)
+
+register_query(
+    "jobs.view_job.freelancer_quotes",
+    """
+    SELECT p.id, p.total, p.estado, p.fecha_creacion, u.username AS freelancer_name
+    FROM presupuestos p
+    JOIN users u ON p.freelancer_id = u.id
+    WHERE p.ticket_id = ? AND p.freelancer_id IS NOT NULL
+    ORDER BY p.fecha_creacion DESC
+    """,
+    (1,),
+)
+
+register_query(
+    "jobs.view_job.quote_files",
+    "SELECT id, presupuesto_id, url, tipo FROM ficheros WHERE presupuesto_id IN (?, ?, ?) ORDER BY id",
+    (1, 2, 3),
+)
+
+register_query(
+    "jobs.view_job.market_studies",
+    """
+    SELECT material_id, price_avg, price_min, price_max, difficulty, sources_json
+    FROM (
+        SELECT mr.material_id, mr.price_avg, mr.price_min, mr.price_max, mr.difficulty, mr.sources_json,
+               ROW_NUMBER() OVER (PARTITION BY mr.material_id ORDER BY mr.created_at DESC, mr.id DESC) AS rn
+        FROM market_research mr
+        WHERE mr.material_id IN (?, ?, ?)
+    )
+    WHERE rn = 1
+    """,
+    (1, 2, 3),
+)
+
+register_query(
+    "freelancers.dashboard",
+    """
+    SELECT t.id, t.titulo, t.descripcion, t.estado, t.fecha_creacion, t.fecha_inicio, c.nombre AS client_name
+    FROM tickets t
+    JOIN clientes c ON t.cliente_id = c.id
+    WHERE t.asignado_a = ?
+    ORDER BY t.fecha_creacion DESC
+    """,
+    (1,),
+)
+
+register_query(
+    "notifications.unread_notifications_count",
+    "SELECT COUNT(id) FROM notifications WHERE user_id = ? AND is_read = 0",
+    (1,),
+)
+
+register_query(
+    "whatsapp_meta.handle_incoming_message.last_outbound",
+    """
+    SELECT job_id, material_id, whatsapp_message_id
+    FROM whatsapp_message_logs
+    WHERE provider_id = ? AND direction = 'outbound'
+    ORDER BY timestamp DESC, id DESC
+    LIMIT 1
+    """,
+    (1,),
+)
+
+register_query(
+    "whatsapp_meta.handle_incoming_message.rfq_quotes",
+    """
+    SELECT id, job_id, material_id FROM provider_quotes
+    WHERE provider_id = ? AND status = 'pending' AND whatsapp_message_id = ?
+    ORDER BY material_id
+    """,
+    (1, "wamid.x"),
+)
+
+register_query(
+    "whatsapp_meta.handle_incoming_message.pending_quote",
+    """
+    SELECT id, job_id, material_id FROM provider_quotes
+    WHERE job_id = ? AND material_id = ? AND provider_id = ? AND status = 'pending'
+    ORDER BY id DESC
+    LIMIT 1
+    """,
+    (1, 1, 1),
+)
+
+register_query(
+    "phone_directory.lookup_number",
+    "SELECT kind, MIN(entity_id) FROM phone_directory WHERE number = ? GROUP BY kind",
+    ("+34600000000",),
+)
+
+register_query(
+    "wa_throttle.session_window_open",
+    "SELECT MAX(timestamp) FROM whatsapp_message_logs WHERE direction = 'inbound' AND from_number IN (?, ?)",
+    ("+34600000000", "34600000000"),
+)
+
+register_query(
+    "inbound_events.claim_batch",
+    """
+    SELECT id, source, event_id, payload, attempts
+    FROM inbound_events
+    WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+    ORDER BY next_attempt_at, id
+    LIMIT ?
+    """,
+    (100,),
+)
+
+register_query(
+    "rfq.open_session_windows",
+    """
+    SELECT DISTINCT from_number FROM whatsapp_message_logs
+    WHERE direction = 'inbound' AND from_number IN (?, ?)
+      AND timestamp > datetime(?, ?)
+    """,
+    ("34600000000", "34600000001", "now", "-24 hours"),
+)
+
+register_query(
+    "rfq.top_providers_for_materials",
+    """
+    SELECT p.id, p.nombre, p.whatsapp_number, COUNT(m2.id) AS quotes_in_category
+    FROM providers p
+    LEFT JOIN provider_quotes pq
+           ON pq.provider_id = p.id AND pq.status IN ('received', 'accepted')
+    LEFT JOIN materiales m2
+           ON m2.id = pq.material_id
+          AND m2.categoria IN (SELECT m.categoria FROM materiales m WHERE m.id IN (?, ?))
+    WHERE p.is_active = 1 AND p.whatsapp_number IS NOT NULL AND p.whatsapp_number <> ''
+    GROUP BY p.id
+    ORDER BY quotes_in_category DESC, p.nombre
+    LIMIT ?
+    """,
+    (1, 2, 8),
+    allow_scan=("p",),  # pocos proveedores; el recuento va por índice
+)
+
+register_query(
+    "wa_logs.fetch_log_page",
+    """
+    SELECT id, timestamp, direction, from_number, to_number, status, whatsapp_message_id,
+           job_id, provider_id, substr(message_body, 1, 200) AS message_body, error_info
+    FROM whatsapp_message_logs
+    WHERE (timestamp, id) < (?, ?)
+    ORDER BY timestamp DESC, id DESC
+    LIMIT ?
+    """,
+    ("2024-01-01 00:00:00", 100, 51),
+)
+
+register_query(
+    "wa_logs.archive_batch",
+    """
+    SELECT id, strftime('%Y%m', timestamp) AS month FROM whatsapp_message_logs
+    WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?
+    """,
+    ("2024-01-01 00:00:00", 500),
+)
+
+register_query(
+    "wa_status.apply_status_updates",
+    "SELECT DISTINCT whatsapp_message_id FROM whatsapp_message_logs WHERE whatsapp_message_id IN (?, ?)",
+    ("SM1", "SM2"),
+)
+
+register_query(
+    "wa_status.delivery_report",
+    """
+    SELECT whatsapp_message_id, MIN(COALESCE(sent_at, timestamp)), MIN(delivered_at), MIN(read_at), MIN(failed_at)
+    FROM whatsapp_message_logs
+    WHERE direction = 'outbound' AND whatsapp_message_id IS NOT NULL AND timestamp >= ?
+    GROUP BY whatsapp_message_id
+    """,
+    ("2024-01-01 00:00:00",),
+)
+
+register_query(
+    "autocomplete.source_version",
+    "SELECT version FROM autocomplete_versions WHERE source = ?",
+    ("clientes",),
+)
+
+register_query(
+    "calendar_feed.tickets_in_window",
+    """
+    SELECT id, COALESCE(titulo, descripcion) AS title, fecha_creacion, fecha_fin
+    FROM tickets
+    WHERE fecha_creacion >= ? AND fecha_creacion < ?
+    UNION ALL
+    SELECT id, COALESCE(titulo, descripcion), fecha_creacion, fecha_fin
+    FROM tickets
+    WHERE fecha_fin >= ? AND +fecha_creacion < ?
+    """,
+    ("2024-01-01 00:00:00", "2024-02-12 00:00:00", "2024-01-01 00:00:00", "2024-01-01 00:00:00"),
+)
+
+register_query(
+    "calendar_feed.maintenances_in_window",
+    """
+    SELECT id, COALESCE(descripcion, 'Mantenimiento ' || tipo_mantenimiento) AS title, tipo_mantenimiento,
+           COALESCE(fecha_inicio, proxima_fecha_mantenimiento) AS anchor, proxima_fecha_mantenimiento
+    FROM mantenimientos_programados
+    WHERE estado = 'activo'
+      AND proxima_fecha_mantenimiento < ?
+      AND (lower(trim(tipo_mantenimiento)) IN ('monthly', 'mensual') OR proxima_fecha_mantenimiento >= ?)
+    ORDER BY id
+    """,
+    ("2024-02-12", "2024-01-01"),
+)
+
+register_query(
+    "maintenance_scheduler.due",
+    """
+    SELECT id, cliente_id, equipo_id, tipo_mantenimiento, descripcion, creado_por,
+           proxima_fecha_mantenimiento, fecha_inicio
+    FROM mantenimientos_programados
+    WHERE estado = 'activo' AND proxima_fecha_mantenimiento <= ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+    """,
+    ("2024-01-01", 0, 200),
+)
+
+register_query(
+    "sla_monitor.pending",
+    """
+    SELECT id, sla_due FROM tickets
+    WHERE sla_due IS NOT NULL AND sla_breached_at IS NULL
+      AND lower(COALESCE(estado, '')) NOT IN ('cerrado', 'cancelado', 'completado', 'finalizado')
+    """,
+)
+
+register_query(
+    "sla_monitor.sync",
+    "SELECT seq, ticket_id FROM sla_ticket_changes WHERE seq > ? ORDER BY seq",
+    (0,),
+)
+
+register_query(
+    "receipt_worker.claim",
+    """
+    SELECT * FROM receipt_jobs
+    WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+    ORDER BY next_attempt_at, id
+    LIMIT ?
+    """,
+    (20,),
+)
+
+register_query(
+    "receipt_worker.payload",
+    """
+    SELECT t.id, t.descripcion, t.estado, t.metodo_pago, t.estado_pago,
+           c.nombre AS client_name, c.telefono AS client_phone, c.email AS client_email, c.is_ngo,
+           (SELECT ft.amount FROM financial_transactions ft
+            WHERE ft.ticket_id = t.id AND ft.type = 'income'
+            ORDER BY ft.transaction_date DESC, ft.id DESC LIMIT 1) AS amount
+    FROM tickets t
+    LEFT JOIN clientes c ON c.id = t.cliente_id
+    WHERE t.id IN (?, ?)
+    """,
+    (1, 2),
+)
+
+register_query(
+    "receipt_worker.paid_in_range",
+    """
+    SELECT DISTINCT ticket_id FROM financial_transactions
+    WHERE type = 'income' AND transaction_date >= ? AND transaction_date < ? AND ticket_id IS NOT NULL
+    ORDER BY ticket_id
+    """,
+    ("2024-01-01", "2024-02-01"),
+)
+
+register_query(
+    "quotes.client_sign_quote",
+    """
+    SELECT p.*, cl.nombre as client_name, cl.whatsapp_number FROM presupuestos p
+    JOIN tickets t ON p.ticket_id = t.id JOIN clientes cl ON t.cliente_id = cl.id
+    WHERE p.signature_token = ?
+    """,
+    ("token",),
+)
+
+register_query(
+    "quote_pdf.claim",
+    """
+    SELECT * FROM quote_pdf_jobs
+    WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+    ORDER BY next_attempt_at, id
+    LIMIT ?
+    """,
+    (20,),
+)
+
+register_query(
+    "blob_store.get_blob",
+    "SELECT content_type FROM blobs WHERE sha256 = ?",
+    ("0" * 64,),
+)
+
+register_query(
+    "market_study.get_market_study_for_material",
+    """
+    SELECT mr.price_avg, mr.price_min, mr.price_max, mr.difficulty, mr.sources_json
+    FROM market_research mr
+    WHERE mr.material_id = ?
+    ORDER BY mr.created_at DESC
+    LIMIT 1
+    """,
+    (1,),
+)
@@ -0,0 +1,295 @@
+# backend/quote_parser.py
+"""
+Parser de respuestas de proveedores a una solicitud de cotización.
+
+parse_quote_reply() recorre el mensaje una sola vez con una única expresión
+regular precompilada (una alternativa con nombre por tipo de token) y extrae:
+
+  amount        importe (float) o None
+  currency      'EUR' por defecto, 'USD' si el mensaje lo indica
+  vat_included  True ("IVA incluido"), False ("+ IVA", "sin IVA") o None
+  delivery_date fecha de entrega ISO (dd/mm[/aa], "15 de marzo", "mañana",
+                "en 3 días", "el jueves", "48h") o None
+  stock         'in_stock', 'no_stock', 'on_order' o None
+
+Las fechas, cantidades con unidad ("10 uds", "25 m"), porcentajes y teléfonos
+se reconocen como tales y nunca se toman por importe. Entre los importes
+candidatos gana el que lleva moneda y/o sigue a una palabra clave ("precio",
+"total"...); a igualdad, el primero.
+
+El corpus etiquetado está en backend/data/quote_replies.jsonl y
+`flask quote-parser-bench` mide precisión por campo y mensajes/segundo.
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+from datetime import date, timedelta
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), "data", "quote_replies.jsonl")
+FIELDS = ("amount", "currency", "vat_included", "delivery_date", "stock")
+
+_MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+_WEEKDAYS = {"lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3, "viernes": 4, "sabado": 5, "domingo": 6}
+_NUMBER_WORDS = {
+    "un": 1, "una": 1, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+    "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "quince": 15,
+}
+_CURRENCIES = {"€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR", "$": "USD", "usd": "USD", "dolares": "USD"}
+
+_NUM = r"\d{1,3}(?:[.,]\d{3})+(?:[.,]\d{1,2})?(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)"
+_CUR = r"€|euros?\b|eur\b|\$|usd\b|dolares\b"
+_UNIT = (
+    r"%|x\b|uds?\b|u\.|unidades\b|piezas?\b|cajas?\b|rollos?\b|sacos?\b|palets?\b|m2\b|m3\b|ml\b|mm\b|cm\b|"
+    r"m\b|metros\b|kg\b|kilos\b|l\b|litros\b|min\b|minutos\b|a(?:n|ñ)os\b"
+)
+_WORD_NUMBER = "|".join(_NUMBER_WORDS)
+
+# El orden de las alternativas importa: las fechas y plazos van antes que los
+# números sueltos, y "no disponible" antes que "disponible".
+_TOKEN_RE = re.compile(
+    rf"""
+      (?P<date>\b(?P<d>\d{{1,2}})[/-](?P<m>\d{{1,2}})(?:[/-](?P<y>\d{{2,4}}))?(?![.,]?\d))
+    | (?P<date_dots>\b(?P<dd>\d{{1,2}})\.(?P<dm>\d{{1,2}})\.(?P<dy>\d{{4}})\b)
+    | (?P<date_text>\b(?P<td>\d{{1,2}})\s+de\s+(?P<tm>{"|".join(_MONTHS)})\b)
+    | (?P<in_days>\b(?:en|tarda|tardan|tardamos|unos|unas)\s+(?P<n>\d{{1,2}}|{_WORD_NUMBER})\s+(?P<span>dias?|semanas?)(?:\s+(?:habiles|laborables))?\b)
+    | (?P<hours>\b(?P<h>24|48|72|96)\s*(?:h\b|horas\b))
+    | (?P<day_after>\bpasado\s+manana\b)
+    | (?P<tomorrow>\bmanana\b)
+    | (?P<today>\bhoy\b)
+    | (?P<weekday>\b(?:el\s+|este\s+|proximo\s+|el\s+proximo\s+)?(?P<wd>{"|".join(_WEEKDAYS)})\b)
+    | (?P<vat_ex>(?:\+|\bmas\b|\bsin\b)\s*(?:el\s+)?iva\b|\biva\s+(?:no\s+incluido|aparte|excluido|no\s+incl)|\bbase\s+imponible\b)
+    | (?P<vat_in>\biva\s+(?:incl(?:uido)?|inc)\b\.?|\bcon\s+(?:el\s+)?iva\b|\bivai\b|\biva\s+ya\s+incluido\b)
+    | (?P<no_stock>\bsin\s+(?:stock|existencias)\b|\bno\s+(?:hay|tenemos|queda|quedan|nos\s+queda[n]?)(?:\s+(?:stock|existencias|unidades|material))?\b
+        |\bagotad[oa]s?\b|\bno\s+disponibles?\b|\brotura\s+de\s+stock\b|\bfuera\s+de\s+stock\b)
+    | (?P<on_order>\bbajo\s+pedido\b|\bpor\s+encargo\b|\bhay\s+que\s+pedir(?:lo|los)?\b|\bpedido\s+a\s+fabrica\b|\ba\s+pedido\b)
+    | (?P<in_stock>\ben\s+stock\b|\bhay\s+stock\b|\btenemos\s+(?:stock|existencias)\b|\blos?\s+tenemos\b|\blas?\s+tenemos\b
+        |\bdisponibles?\b|\ben\s+almacen\b)
+    | (?P<keyword>\b(?:precio|importe|total|coste|costo|cotizacion|presupuesto|valor|tarifa|pvp|neto|cuesta|cuestan|vale|valen|sale\s+(?:a|por)|seria[n]?|son)\b)
+    | (?P<delivery_kw>\b(?:entrega|entregamos|plazo|llega|llegaria|servimos|serviria|envio|enviamos|recibir|para\s+el)\b)
+    | (?P<pre_amount>(?P<pre_cur>€|\$|\beur\b|\busd\b)\s*(?P<pre_num>{_NUM}))
+    | (?P<amount>(?P<num>{_NUM})(?:\s*(?P<cur>{_CUR})|\s*(?P<unit>{_UNIT}))?)
+    | (?P<currency>{_CUR})
+    """,
+    re.VERBOSE,
+)
+
+_KEYWORD_REACH = 30     # caracteres tras una palabra clave en los que un importe "la sigue"
+_DELIVERY_REACH = 40
+_PHONE_DIGITS = 7       # enteros sin moneda de 7+ cifras: teléfonos, referencias
+_SEPARATORS_RE = re.compile(r"[.,]")
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes ("Mañana" -> "manana"), conservando €."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def parse_number(raw: str) -> float:
+    """'1.234,56' / '1,234.56' / '12,5' / '1.200' -> float (grupos de 3 = miles)."""
+    last = max(raw.rfind("."), raw.rfind(","))
+    if last < 0:
+        return float(raw)
+    if len(raw) - last - 1 == 3:
+        return float(_SEPARATORS_RE.sub("", raw))  # "1.200", "1.234.567": separadores de miles
+    return float(f"{_SEPARATORS_RE.sub('', raw[:last])}.{raw[last + 1:]}")
+
+
+def _safe_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _calendar_date(day, month, year, today):
+    if year is None:
+        candidate = _safe_date(today.year, month, day)
+        if candidate and candidate < today:
+            candidate = _safe_date(today.year + 1, month, day)
+        return candidate
+    if year < 100:
+        year += 2000
+    return _safe_date(year, month, day)
+
+
+def parse_quote_reply(text: str, today: date | None = None) -> dict:
+    """Extrae importe, moneda, IVA, fecha de entrega y stock de un mensaje."""
+    today = today or date.today()
+    result = {"amount": None, "currency": None, "vat_included": None, "delivery_date": None, "stock": None}
+    if not text:
+        result["currency"] = "EUR"
+        return result
+
+    best_amount = None          # (puntuación, -posición, importe, moneda)
+    delivery = None             # (puntuación, fecha)
+    last_keyword_end = -10**6
+    last_delivery_end = -10**6
+    any_currency = None
+
+    for match in _TOKEN_RE.finditer(_normalize(text)):
+        kind = match.lastgroup
+        start = match.start()
+        found_date = None
+
+        if kind == "amount" or kind == "pre_amount":
+            if kind == "amount":
+                raw, cur, unit = match.group("num"), match.group("cur"), match.group("unit")
+            else:
+                raw, cur, unit = match.group("pre_num"), match.group("pre_cur"), None
+            if unit:
+                continue  # cantidad, porcentaje o medida
+            if not cur and raw.isdigit() and len(raw) >= _PHONE_DIGITS:
+                continue
+            amount = parse_number(raw)
+            score = (2 if cur else 0) + (1 if start - last_keyword_end <= _KEYWORD_REACH else 0)
+            currency = _CURRENCIES.get(cur.strip()) if cur else None
+            if currency:
+                any_currency = any_currency or currency
+            candidate = (score, -start, amount, currency)
+            if best_amount is None or candidate[:2] > best_amount[:2]:
+                best_amount = candidate
+        elif kind == "currency":
+            any_currency = any_currency or _CURRENCIES.get(match.group(kind))
+        elif kind == "keyword":
+            last_keyword_end = match.end()
+        elif kind == "delivery_kw":
+            last_delivery_end = match.end()
+        elif kind == "vat_in":
+            result["vat_included"] = True
+        elif kind == "vat_ex":
+            result["vat_included"] = False
+        elif kind in ("no_stock", "on_order", "in_stock"):
+            # Manda la primera afirmación explícita de stock
+            result["stock"] = result["stock"] or kind
+        elif kind == "date":
+            y = match.group("y")
+            found_date = _calendar_date(int(match.group("d")), int(match.group("m")), int(y) if y else None, today)
+        elif kind == "date_dots":
+            found_date = _calendar_date(int(match.group("dd")), int(match.group("dm")), int(match.group("dy")), today)
+        elif kind == "date_text":
+            found_date = _calendar_date(int(match.group("td")), _MONTHS[match.group("tm")], None, today)
+        elif kind == "in_days":
+            n = match.group("n")
+            n = int(n) if n.isdigit() else _NUMBER_WORDS[n]
+            found_date = today + timedelta(days=n * (7 if match.group("span").startswith("semana") else 1))
+        elif kind == "hours":
+            found_date = today + timedelta(days=int(match.group("h")) // 24)
+        elif kind == "day_after":
+            found_date = today + timedelta(days=2)
+        elif kind == "tomorrow":
+            found_date = today + timedelta(days=1)
+        elif kind == "today":
+            found_date = today
+        elif kind == "weekday":
+            ahead = (_WEEKDAYS[match.group("wd")] - today.weekday()) % 7 or 7
+            found_date = today + timedelta(days=ahead)
+
+        if found_date is not None:
+            # Una fecha tras "entrega", "plazo"... gana a la primera que aparezca
+            score = 1 if start - last_delivery_end <= _DELIVERY_REACH else 0
+            if delivery is None or score > delivery[0]:
+                delivery = (score, found_date)
+
+    if best_amount is not None:
+        result["amount"] = best_amount[2]
+        result["currency"] = best_amount[3]
+    result["currency"] = result["currency"] or any_currency or "EUR"
+    if delivery is not None:
+        result["delivery_date"] = delivery[1].isoformat()
+    return result
+
+
+# "Material 12011", "ID: 12011", "ref. 12011", "#12011" (el RFQ lista "(ID: <id>)")
+_MATERIAL_ID_RE = re.compile(r"(?:\b(?:id|material|ref)\b\.?\s*:?\s*|#\s*)(\d+)\b")
+
+
+def split_reply_by_material(text: str, materials) -> dict:
+    """
+    Reparte una respuesta a un RFQ de varios materiales: {material_id: trozo}.
+
+    `materials` son pares (id, nombre). Cada mención de un material, por su
+    ID o por su nombre, abre un trozo que llega hasta la siguiente mención;
+    el texto de la mención no entra en el trozo, así el ID no se toma por
+    importe. Los materiales que no se mencionan no aparecen en el resultado.
+    """
+    normalized = _normalize(text or "")
+    names = {material_id: _normalize(nombre or "").strip() for material_id, nombre in materials}
+    mentions = [
+        (match.start(), match.end(), int(match.group(1)))
+        for match in _MATERIAL_ID_RE.finditer(normalized)
+        if int(match.group(1)) in names
+    ]
+    for material_id, name in names.items():
+        if name:
+            mentions.extend(
+                (match.start(), match.end(), material_id)
+                for match in re.finditer(rf"(?<!\w){re.escape(name)}(?!\w)", normalized)
+            )
+    # A igual inicio gana la mención más larga; las solapadas se descartan
+    mentions.sort(key=lambda m: (m[0], -m[1]))
+    kept = []
+    for mention in mentions:
+        if not kept or mention[0] >= kept[-1][1]:
+            kept.append(mention)
+    parts = {}
+    for i, (_, end, material_id) in enumerate(kept):
+        stop = kept[i + 1][0] if i + 1 < len(kept) else len(normalized)
+        parts.setdefault(material_id, []).append(normalized[end:stop])
+    return {material_id: " ".join(chunks) for material_id, chunks in parts.items()}
+
+
+# --- Corpus y banco de pruebas ---
+
+def load_corpus(path=CORPUS_PATH) -> list[dict]:
+    """Mensajes etiquetados: {"text", "today", <campos esperados>} por línea."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(corpus, parser=parse_quote_reply) -> dict:
+    """
+    Precisión por campo (aciertos / mensajes) y lista de fallos
+    [(texto, campo, esperado, obtenido)].
+    """
+    hits = {field: 0 for field in FIELDS}
+    failures = []
+    for item in corpus:
+        got = parser(item["text"], date.fromisoformat(item["today"]))
+        for field in FIELDS:
+            expected = item.get(field)
+            if field == "currency" and expected is None:
+                expected = "EUR"
+            if got[field] == expected:
+                hits[field] += 1
+            else:
+                failures.append((item["text"], field, expected, got[field]))
+    total = len(corpus) or 1
+    exact = len(corpus) - len({text for text, *_ in failures})
+    return {
+        "messages": len(corpus),
+        "precision": {field: hits[field] / total for field in FIELDS},
+        "exact": exact / total,
+        "failures": failures,
+    }
+
+
+def benchmark(corpus, parser=parse_quote_reply, min_seconds=1.0) -> float:
+    """Mensajes por segundo recorriendo el corpus durante al menos min_seconds."""
+    samples = [(item["text"], date.fromisoformat(item["today"])) for item in corpus]
+    if not samples:
+        return 0.0
+    parsed = 0
+    t0 = time.perf_counter()
+    while True:
+        for text, today in samples:
+            parser(text, today)
+        parsed += len(samples)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_seconds:
+            return parsed / elapsed
@@ -0,0 +1,293 @@
+# backend/quote_pdf.py
+"""
+PDF de presupuestos firmados.
+
+client_sign_quote guarda la imagen de la firma en backend.blob_store (en
+presupuestos sólo queda client_signature_sha256), encola el presupuesto en
+quote_pdf_jobs y despierta al hilo de documentos de backend.receipt_worker,
+que comparte su pool de procesos con los recibos. Cada PDF (datos del
+presupuesto, líneas y la firma incrustada) se renderiza en el pool y se
+guarda también por contenido: presupuestos.signed_pdf_sha256 lo referencia
+y signed_pdf_url apunta a /blobs/<sha256>. Los PDF se generan con
+invariant=1 (sin fecha de creación ni id aleatorio), así renderizar dos
+veces el mismo presupuesto firmado da el mismo hash y no duplica el fichero.
+Tras guardar el PDF se envía el enlace al cliente por WhatsApp; su host sale
+de PUBLIC_BASE_URL o de la raíz de la petición de firma
+(quote_pdf_jobs.base_url), nunca del contexto ficticio del hilo.
+"""
+import base64
+import binascii
+import io
+import re
+from functools import lru_cache
+
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .blob_store import blob_url, public_blob_url, read_blob, store_blob
+from .receipt_generator import COMPANY_DETAILS
+from .receipt_worker import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LEASE_SECONDS,
+    DEFAULT_MAX_ATTEMPTS,
+    claim_batch,
+    finish_jobs,
+    run_in_pool,
+)
+
+MAX_SIGNATURE_BYTES = 512 * 1024
+
+_DATA_URL_RE = re.compile(r'^data:(image/(?:png|jpeg));base64,(.+)$', re.DOTALL)
+_MAGIC = {'image/png': b'\x89PNG\r\n\x1a\n', 'image/jpeg': b'\xff\xd8\xff'}
+
+_QUOTE_SQL = """
+    SELECT p.id, p.ticket_id, p.total, p.fecha_creacion, p.client_signed_by, p.client_signature_date,
+           p.client_signature_sha256, p.client_signature_data,
+           cl.nombre AS client_name, cl.whatsapp_number
+    FROM presupuestos p
+    JOIN tickets t ON t.id = p.ticket_id
+    JOIN clientes cl ON cl.id = t.cliente_id
+    WHERE p.id IN ({placeholders})
+"""
+
+
+def decode_signature(data_url):
+    """(bytes, content_type) de la firma enviada por el canvas; ValueError si no es una imagen válida."""
+    match = _DATA_URL_RE.match((data_url or '').strip())
+    if not match:
+        raise ValueError('La firma debe ser una imagen PNG o JPEG.')
+    content_type, encoded = match.groups()
+    if len(encoded) > MAX_SIGNATURE_BYTES * 4 // 3 + 4:
+        raise ValueError('La imagen de la firma es demasiado grande.')
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('La imagen de la firma está dañada.') from None
+    if not data.startswith(_MAGIC[content_type]):
+        raise ValueError('La imagen de la firma está dañada.')
+    return data, content_type
+
+
+def enqueue_signed_quote(db, quote_id, base_url=None, notify=True):
+    """
+    Encola el PDF firmado de `quote_id`. `base_url` (request.url_root de la
+    petición de firma) da el host del enlace enviado al cliente si no hay
+    PUBLIC_BASE_URL. Con notify=False (backfill de firmas antiguas) sólo se
+    genera el PDF, sin avisar al cliente por WhatsApp. No hace commit; llamar
+    a wake_receipt_worker() tras el commit.
+    """
+    db.execute(
+        "INSERT INTO quote_pdf_jobs (presupuesto_id, base_url, notify) VALUES (?, ?, ?)",
+        (quote_id, base_url, 1 if notify else 0),
+    )
+
+
+@lru_cache(maxsize=None)
+def _styles():
+    return getSampleStyleSheet()
+
+
+def render_signed_quote_pdf(payload):
+    """Bytes del PDF del presupuesto firmado. Se ejecuta en los procesos del pool."""
+    styles = _styles()
+    quote = payload['quote']
+    story = [
+        Paragraph(payload['company_details'].get('name', 'Grupo Koal'), styles['h1']),
+        Paragraph(payload['company_details'].get('address', ''), styles['Normal']),
+        Paragraph(payload['company_details'].get('email', ''), styles['Normal']),
+        Spacer(1, 0.2 * inch),
+        Paragraph(f"Presupuesto #{quote['id']} - Trabajo #{quote['ticket_id']}", styles['h2']),
+        Paragraph(f"Fecha: {quote['fecha_creacion'] or ''}", styles['Normal']),
+        Paragraph(f"Cliente: {quote['client_name'] or 'N/A'}", styles['Normal']),
+        Spacer(1, 0.2 * inch),
+    ]
+
+    rows = [['Descripción', 'Cantidad', 'Precio Unitario', 'Total Ítem']]
+    for descripcion, qty, precio_unit in payload['items']:
+        rows.append([
+            Paragraph(descripcion or '', styles['Normal']),
+            f"{qty:.2f}", f"{precio_unit:.2f} €", f"{qty * precio_unit:.2f} €",
+        ])
+    table = Table(rows, colWidths=[3.4 * inch, 0.9 * inch, 1.2 * inch, 1.1 * inch], repeatRows=1)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ]))
+    story += [table, Spacer(1, 0.2 * inch), Paragraph(f"Total: {quote['total'] or 0.0:.2f} €", styles['h2'])]
+
+    story.append(Spacer(1, 0.3 * inch))
+    signature = payload.get('signature')
+    if signature:
+        width, height = ImageReader(io.BytesIO(signature)).getSize()
+        draw_width = 2.5 * inch
+        story.append(Image(io.BytesIO(signature), width=draw_width, height=draw_width * height / max(width, 1)))
+    story.append(Paragraph("__________________________________", styles['Normal']))
+    story.append(Paragraph(
+        f"Firmado por {quote['client_signed_by'] or 'N/A'} el {quote['client_signature_date'] or ''}", styles['Normal']
+    ))
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter, invariant=1, title=f"Presupuesto {quote['id']}").build(story)
+    return buffer.getvalue()
+
+
+def _signature_bytes(row):
+    if row['client_signature_sha256']:
+        return read_blob(row['client_signature_sha256'])
+    if row['client_signature_data']:  # firmas anteriores al almacén por contenido
+        return decode_signature(row['client_signature_data'])[0]
+    return None
+
+
+def load_quote_payloads(db, quote_ids):
+    """
+    ({quote_id: payload para render_signed_quote_pdf}, {quote_id: número de
+    WhatsApp}, {quote_id: error}). Una firma perdida o dañada sólo deja fuera
+    su presupuesto.
+    """
+    placeholders = ",".join("?" * len(quote_ids))
+    quotes = db.execute(_QUOTE_SQL.format(placeholders=placeholders), quote_ids).fetchall()
+    items = {}
+    for row in db.execute(
+        f"SELECT presupuesto_id, descripcion, qty, precio_unit FROM presupuesto_items "
+        f"WHERE presupuesto_id IN ({placeholders}) ORDER BY id",
+        quote_ids,
+    ):
+        items.setdefault(row['presupuesto_id'], []).append(
+            (row['descripcion'], float(row['qty'] or 0.0), float(row['precio_unit'] or 0.0))
+        )
+    payloads, phones, errors = {}, {}, {}
+    for row in quotes:
+        try:
+            signature = _signature_bytes(row)
+        except (OSError, ValueError) as e:
+            errors[row['id']] = f"{type(e).__name__}: {e}"
+            continue
+        payloads[row['id']] = {
+            'quote': {key: row[key] for key in (
+                'id', 'ticket_id', 'total', 'fecha_creacion', 'client_name', 'client_signed_by', 'client_signature_date'
+            )},
+            'items': items.get(row['id'], []),
+            'signature': signature,
+            'company_details': COMPANY_DETAILS,
+        }
+        phones[row['id']] = row['whatsapp_number']
+    return payloads, phones, errors
+
+
+def process_signed_quote_jobs(db, pool, batch_size=None):
+    """Procesa un lote de quote_pdf_jobs. Devuelve {'claimed', 'rendered', 'errors'}."""
+    from .messaging import send_whatsapp_text
+
+    config = current_app.config
+    batch_size = batch_size or int(config.get("RECEIPT_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    rows = claim_batch(db, "quote_pdf_jobs", batch_size, config.get("RECEIPT_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+    result = {"claimed": len(rows), "rendered": 0, "errors": 0}
+    if not rows:
+        return result
+
+    quote_ids = list(dict.fromkeys(row["presupuesto_id"] for row in rows))
+    base_urls = {row["presupuesto_id"]: row["base_url"] for row in rows if row["base_url"]}
+    notify = {row["presupuesto_id"] for row in rows if row["notify"]}
+    payloads, phones, quote_errors = load_quote_payloads(db, quote_ids)
+    pdfs, render_errors, broken = run_in_pool(
+        pool, render_signed_quote_pdf, {quote_id: (payload,) for quote_id, payload in payloads.items()}
+    )
+    quote_errors.update(render_errors)
+    errors = {row["id"]: quote_errors[row["presupuesto_id"]] for row in rows if row["presupuesto_id"] in quote_errors}
+
+    urls = {}
+    try:
+        for quote_id, pdf in pdfs.items():
+            sha256 = store_blob(db, pdf, 'application/pdf')
+            if quote_id in notify or quote_id in base_urls or config.get("PUBLIC_BASE_URL"):
+                urls[quote_id] = public_blob_url(sha256, base_urls.get(quote_id))
+            else:
+                # Backfill sin host conocido: enlace relativo, no http://localhost/...
+                urls[quote_id] = blob_url(sha256)
+            db.execute(
+                "UPDATE presupuestos SET signed_pdf_sha256 = ?, signed_pdf_url = ? WHERE id = ?",
+                (sha256, urls[quote_id], quote_id),
+            )
+        result["rendered"], result["errors"] = finish_jobs(
+            db, "quote_pdf_jobs", rows,
+            {row["id"] for row in rows if row["presupuesto_id"] in pdfs},
+            errors,
+            int(config.get("RECEIPT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS)),
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if errors:
+        current_app.logger.warning("Presupuestos firmados: %d PDF con error: %s", len(errors), errors)
+
+    for quote_id, url in urls.items():
+        if quote_id not in notify or not phones.get(quote_id):
+            continue
+        client_name = payloads[quote_id]['quote']['client_name']
+        try:
+            send_whatsapp_text(
+                phones[quote_id],
+                f"¡Hola {client_name}! Tu presupuesto {quote_id} ha sido firmado y aprobado. Puedes verlo aquí: {url}",
+            )
+        except Exception:
+            current_app.logger.exception("Presupuestos firmados: no se pudo enviar el PDF %d por WhatsApp", quote_id)
+    if broken:
+        # El lote ya quedó anotado (los fallidos se reintentan); el hilo recrea el pool
+        raise BrokenProcessPool("Un proceso del pool de documentos terminó de forma inesperada")
+    return result
+
+
+def drain_signed_quote_jobs(db, pool):
+    """Procesa lotes hasta vaciar la cola. Devuelve los totales."""
+    totals = {"claimed": 0, "rendered": 0, "errors": 0}
+    while True:
+        result = process_signed_quote_jobs(db, pool)
+        for key in totals:
+            totals[key] += result[key]
+        if result["claimed"] == 0:
+            return totals
+
+
+def migrate_inline_signatures(db, batch_size=200):
+    """
+    Mueve las firmas antiguas de presupuestos.client_signature_data al
+    almacén por contenido y encola el PDF de las que no lo tienen. Devuelve
+    (firmas movidas, firmas dañadas).
+    """
+    moved, broken, last_id = 0, 0, 0
+    while True:
+        rows = db.execute(
+            "SELECT id, client_signature_data, signed_pdf_sha256 FROM presupuestos "
+            "WHERE client_signature_data IS NOT NULL AND id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return moved, broken
+        last_id = rows[-1]['id']
+        for row in rows:
+            try:
+                data, content_type = decode_signature(row['client_signature_data'])
+            except ValueError:
+                broken += 1
+                continue
+            sha256 = store_blob(db, data, content_type)
+            db.execute(
+                "UPDATE presupuestos SET client_signature_sha256 = ?, client_signature_data = NULL WHERE id = ?",
+                (sha256, row['id']),
+            )
+            if not row['signed_pdf_sha256']:
+                # Firmas de hace tiempo: el cliente ya fue avisado al firmar
+                enqueue_signed_quote(db, row['id'], notify=False)
+            moved += 1
+        db.commit()
@@ -1,10 +1,8 @@
-import os
 import secrets
 from datetime import datetime, timedelta
 
 from flask import (
     Blueprint,
-    current_app,
     flash,
     redirect,
     render_template,
@@ -13,8 +11,11 @@ from flask import (
 )
 
 from backend.auth import login_required
+from backend.blob_store import store_blob
 from backend.db_utils import get_db
-from backend.wa_client import send_whatsapp_text  # For sending signed PDF via WhatsApp
+from backend.messaging import send_whatsapp_text
+from backend.quote_pdf import decode_signature, enqueue_signed_quote
+from backend.receipt_worker import wake_receipt_worker
 
 bp = Blueprint('quotes', __name__, url_prefix='/quotes')
 
@@ -326,7 +327,7 @@ def client_sign_quote(token):
         return redirect(url_for('auth.login')) # Or a generic error page
     # Find the quote by token
     quote = db.execute(
-        'SELECT p.*, c.nombre as client_name, cl.whatsapp_number FROM presupuestos p JOIN tickets t ON p.ticket_id = t.id JOIN clientes cl ON t.cliente_id = cl.id WHERE p.signature_token = ?',
+        'SELECT p.*, cl.nombre as client_name, cl.whatsapp_number FROM presupuestos p JOIN tickets t ON p.ticket_id = t.id JOIN clientes cl ON t.cliente_id = cl.id WHERE p.signature_token = ?',
         (token,)
     ).fetchone()
 
@@ -335,7 +336,7 @@ def client_sign_quote(token):
         return redirect(url_for('auth.login')) # Or a generic error page
 
     # Check if already signed
-    if quote['client_signature_data']:
+    if quote['client_signature_sha256'] or quote['client_signature_data']:
         flash('Este presupuesto ya ha sido firmado.', 'info')
         return render_template('quotes/client_sign_quote.html', quote=quote, signed=True)
 
@@ -354,37 +355,28 @@ def client_sign_quote(token):
             return render_template('quotes/client_sign_quote.html', quote=quote, items=items, token=token)
 
         try:
-            # Update quote with signature data
+            signature, content_type = decode_signature(signature_data)
+        except ValueError as e:
+            flash(str(e), 'error')
+            return render_template('quotes/client_sign_quote.html', quote=quote, items=items, token=token)
+
+        try:
+            # La firma va al almacén por contenido; el presupuesto sólo guarda su hash
+            signature_sha256 = store_blob(db, signature, content_type)
             db.execute(
-                'UPDATE presupuestos SET client_signature_data = ?, client_signature_date = ?, client_signed_by = ?, estado = ? WHERE id = ?',
-                (signature_data, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), client_name, 'Aprobado', quote['id'])
+                'UPDATE presupuestos SET client_signature_sha256 = ?, client_signature_data = NULL, client_signature_date = ?, client_signed_by = ?, estado = ? WHERE id = ?',
+                (signature_sha256, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), client_name, 'Aprobado', quote['id'])
             )
 
-            # --- Generate Signed PDF ---
-            # For simplicity, let's assume generate_receipt_pdf can handle quote data
-            # and embed signature. This will need a proper PDF generation library.
-            # For now, we'll mock the PDF generation and store a placeholder URL.
-            pdf_filename = f"presupuesto_firmado_{quote['id']}_{datetime.now().strftime('%Y%m%d%H%M%S')}.pdf"
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            os.makedirs(upload_folder, exist_ok=True)
-            pdf_filepath = os.path.join(upload_folder, pdf_filename)
-
-            # Mock PDF generation (replace with actual PDF library call)
-            # generate_receipt_pdf(output_path=pdf_filepath, quote_details=quote, items=items, signature_data=signature_data)
-            with open(pdf_filepath, 'w') as f:
-                f.write(f"Presupuesto {quote['id']} firmado por {client_name} el {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Total: {quote['total']} EUR\n")
-                f.write("Firma: (ver imagen adjunta o datos de firma)")
-
-            signed_pdf_url = url_for('uploaded_file', filename=pdf_filename, _external=True)
-            db.execute('UPDATE presupuestos SET signed_pdf_url = ? WHERE id = ?', (signed_pdf_url, quote['id']))
+            # --- Signed PDF ---
+            # Se renderiza fuera de la petición (backend.quote_pdf), que también
+            # envía el enlace por WhatsApp cuando el PDF está listo
+            enqueue_signed_quote(db, quote['id'], request.url_root)
             db.commit()
+            wake_receipt_worker()
 
-            # --- Send Signed PDF via WhatsApp ---
             if quote['whatsapp_number']:
-                whatsapp_message = f"¡Hola {quote['client_name']}! Tu presupuesto {quote['id']} ha sido firmado y aprobado. Puedes verlo aquí: {signed_pdf_url}"
-                send_whatsapp_text(quote['whatsapp_number'], whatsapp_message)
-                flash('Presupuesto firmado y enviado por WhatsApp.', 'success')
+                flash('Recibirás el presupuesto firmado por WhatsApp en unos momentos.', 'success')
             else:
                 flash('Presupuesto firmado. No se pudo enviar por WhatsApp (número no disponible).', 'warning')
 
@@ -1,18 +1,72 @@
+import io
+import os
 from datetime import datetime
+from functools import lru_cache
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer
+
+COMPANY_DETAILS = {'name': 'Grupo Koal', 'address': 'Valencia, España', 'phone': 'N/A', 'email': 'info@grupokoal.com'}
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static', 'logo.jpg')
+
+
+# La hoja de estilos y el logo se cargan una vez por proceso (cada worker de
+# backend.receipt_worker los precarga con warm_up())
+@lru_cache(maxsize=None)
+def _styles():
+    return getSampleStyleSheet()
+
+
+@lru_cache(maxsize=None)
+def _logo_bytes():
+    if not os.path.exists(LOGO_PATH):
+        return None
+    with open(LOGO_PATH, 'rb') as f:
+        return f.read()
+
+
+def warm_up():
+    """Carga estilos, logo y métricas de fuentes renderizando un recibo en memoria."""
+    generate_receipt_pdf(io.BytesIO(), {'id': 0}, {}, COMPANY_DETAILS)
 
 
 def generate_receipt_pdf(output_path, job_details, client_details, company_details, is_ngo=False, technician_details=None):
-    doc = SimpleDocTemplate(output_path, pagesize=letter)
-    styles = getSampleStyleSheet()
+    """
+    Genera el recibo en `output_path` (ruta o fichero abierto). Con una ruta
+    se escribe primero en un temporal y se renombra, así nunca se sirve un PDF
+    a medio escribir.
+    """
+    styles = _styles()
     story = []
 
-    # Company Details\n    if not is_ngo:\n        # Add Company Logo\n        logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), \'..\\\static\\\logo.jpg\') # Adjust path as needed\n        if os.path.exists(logo_path):\n            story.append(Image(logo_path, width=1.5*inch, height=0.75*inch))\n            story.append(Spacer(1, 0.1 * inch))\n\n        story.append(Paragraph(company_details.get(\'name\', \'Grupo Koal\'), styles[\'h1\']))\n        story.append(Paragraph(company_details.get(\'address\', \'Dirección de la Empresa\'), styles[\'Normal\']))\n        story.append(Paragraph(company_details.get(\'phone\', \'Teléfono de la Empresa\'), styles[\'Normal\']))\n        story.append(Paragraph(company_details.get(\'email\', \'Email de la Empresa\'), styles[\'Normal\']))\n        story.append(Spacer(1, 0.2 * inch))\n\n        # Company Greeting/Reminder\n        company_greeting = \"Gracias por confiar en Grupo Koal. ¡Estamos para servirte!\"\n        story.append(Paragraph(company_greeting, styles[\'Italic\']))\n        story.append(Spacer(1, 0.2 * inch))\n    else:\n        story.append(Paragraph(company_details.get(\'name\', \'Grupo Koal\'), styles[\'h1\'])) # Still show company name for NGO\n        story.append(Spacer(1, 0.2 * inch))\n\n    # Receipt Title and Date\n    story.append(Paragraph(f\"Recibo de Pago - Trabajo #{job_details[\'id\']}\", styles[\'h2\']))
-    story.append(Paragraph(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Normal']))
+    # Company Details
+    if not is_ngo:
+        logo = _logo_bytes()
+        if logo:
+            story.append(Image(io.BytesIO(logo), width=1.5 * inch, height=0.75 * inch))
+            story.append(Spacer(1, 0.1 * inch))
+
+        story.append(Paragraph(company_details.get('name', 'Grupo Koal'), styles['h1']))
+        story.append(Paragraph(company_details.get('address', 'Dirección de la Empresa'), styles['Normal']))
+        story.append(Paragraph(company_details.get('phone', 'Teléfono de la Empresa'), styles['Normal']))
+        story.append(Paragraph(company_details.get('email', 'Email de la Empresa'), styles['Normal']))
+        story.append(Spacer(1, 0.2 * inch))
+
+        # Company Greeting/Reminder
+        company_greeting = "Gracias por confiar en Grupo Koal. ¡Estamos para servirte!"
+        story.append(Paragraph(company_greeting, styles['Italic']))
+        story.append(Spacer(1, 0.2 * inch))
+    else:
+        story.append(Paragraph(company_details.get('name', 'Grupo Koal'), styles['h1']))  # Still show company name for NGO
+        story.append(Spacer(1, 0.2 * inch))
+
+    # Receipt Title and Date
+    story.append(Paragraph(f"Recibo de Pago - Trabajo #{job_details['id']}", styles['h2']))
+    issued_at = job_details.get('date') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    story.append(Paragraph(f"Fecha: {issued_at}", styles['Normal']))
     story.append(Spacer(1, 0.2 * inch))
 
     # Client Details
@@ -45,4 +99,10 @@ def generate_receipt_pdf(output_path, job_details, client_details, company_detai
     story.append(Paragraph("__________________________________", styles['Normal']))
     story.append(Paragraph("Firma del Cliente / Confirmación de Pago", styles['Normal']))
 
-    doc.build(story)
+    if not isinstance(output_path, (str, os.PathLike)):
+        SimpleDocTemplate(output_path, pagesize=letter).build(story)
+        return output_path
+    tmp_path = f"{output_path}.tmp"
+    SimpleDocTemplate(tmp_path, pagesize=letter).build(story)
+    os.replace(tmp_path, output_path)
+    return output_path
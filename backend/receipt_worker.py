@@ -0,0 +1,356 @@
+# backend/receipt_worker.py
+"""
+Generación de recibos PDF fuera de la petición.
+
+edit_job encola un trabajo en receipt_jobs dentro de su transacción
+(enqueue_receipt) y despierta al hilo de este proceso tras el commit (el
+hilo arranca con la primera petición, así lo encolado antes de un reinicio
+no espera al próximo pago). El
+hilo reclama lotes (mismo esquema de "lease" que notification_outbox), lee
+los datos de cada ticket, renderiza los PDF en un ProcessPoolExecutor de
+RECEIPT_POOL_SIZE procesos (ReportLab es CPU puro; cada proceso precarga
+estilos, logo y fuentes una vez) y escribe tickets.recibo_url y el estado
+de los trabajos en una transacción por lote. Con RECEIPT_POOL_SIZE=0 se
+renderiza en el propio hilo. Si un proceso del pool muere, el lote en curso
+se anota como fallido (se reintenta) y el hilo recrea el pool.
+
+render_receipts_for_range() (`flask receipts-render`) regenera los recibos
+de los pagos de un rango de fechas usando todos los núcleos.
+
+El mismo hilo y el mismo pool procesan también los PDF de presupuestos
+firmados (quote_pdf_jobs, backend.quote_pdf); claim_batch y finish_jobs
+sirven a las dos colas.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from flask import current_app, url_for
+
+from .receipt_generator import COMPANY_DETAILS, generate_receipt_pdf, warm_up
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_POLL_INTERVAL = 30.0
+
+_RECEIPT_SQL = """
+    SELECT t.id, t.descripcion, t.estado, t.metodo_pago, t.estado_pago,
+           c.nombre AS client_name, c.telefono AS client_phone, c.email AS client_email, c.is_ngo,
+           (SELECT ft.amount FROM financial_transactions ft
+            WHERE ft.ticket_id = t.id AND ft.type = 'income'
+            ORDER BY ft.transaction_date DESC, ft.id DESC LIMIT 1) AS amount
+    FROM tickets t
+    LEFT JOIN clientes c ON c.id = t.cliente_id
+    WHERE t.id IN ({placeholders})
+"""
+
+
+def enqueue_receipt(db, ticket_id):
+    """Encola el recibo de `ticket_id`. No hace commit; llamar a wake_receipt_worker() tras el commit."""
+    db.execute("INSERT INTO receipt_jobs (ticket_id) VALUES (?)", (ticket_id,))
+
+
+def render_receipt(output_path, payload):
+    """Se ejecuta en los procesos del pool: sólo recibe datos planos, nunca la conexión."""
+    generate_receipt_pdf(output_path, **payload)
+    return output_path
+
+
+class _InlineExecutor(Executor):
+    """Executor síncrono para RECEIPT_POOL_SIZE=0."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def create_pool(size):
+    """Pool de procesos con estilos y fuentes precargados (spawn: el proceso padre tiene hilos)."""
+    if size <= 0:
+        return _InlineExecutor()
+    return ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"), initializer=warm_up)
+
+
+def load_payloads(db, ticket_ids):
+    """
+    {ticket_id: argumentos de generate_receipt_pdf} leídos en una consulta. El
+    importe es el del último ingreso del ticket en financial_transactions.
+    """
+    payloads = {}
+    for start in range(0, len(ticket_ids), 500):
+        chunk = ticket_ids[start:start + 500]
+        rows = db.execute(_RECEIPT_SQL.format(placeholders=",".join("?" * len(chunk))), chunk).fetchall()
+        for row in rows:
+            payloads[row["id"]] = {
+                "job_details": {
+                    "id": row["id"], "description": row["descripcion"], "status": row["estado"],
+                    "payment_method": row["metodo_pago"], "payment_status": row["estado_pago"], "amount": float(row["amount"] or 0.0),
+                },
+                "client_details": {"name": row["client_name"], "phone": row["client_phone"], "email": row["client_email"]},
+                "company_details": COMPANY_DETAILS,
+                "is_ngo": bool(row["is_ngo"]),
+            }
+    return payloads
+
+
+def _output_path(upload_folder, ticket_id, stamp):
+    return os.path.join(upload_folder, f"recibo_{ticket_id}_{stamp}.pdf")
+
+
+def run_in_pool(pool, fn, calls):
+    """
+    Ejecuta fn(*args) en el pool para cada {clave: args}. Devuelve
+    (resultados, errores, roto); roto indica que un proceso del pool murió
+    (BrokenProcessPool) y hay que recrear el pool antes de seguir.
+    """
+    futures, errors, broken = {}, {}, False
+    for key, args in calls.items():
+        try:
+            futures[key] = pool.submit(fn, *args)
+        except BrokenProcessPool as e:
+            errors[key], broken = f"{type(e).__name__}: {e}", True
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except BrokenProcessPool as e:
+            errors[key], broken = f"{type(e).__name__}: {e}", True
+        except Exception as e:
+            errors[key] = f"{type(e).__name__}: {e}"
+    return results, errors, broken
+
+
+def _render_all(pool, payloads, upload_folder):
+    """
+    Renderiza `payloads` en el pool. Devuelve ({ticket_id: nombre de fichero},
+    {ticket_id: error}, pool roto).
+    """
+    os.makedirs(upload_folder, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    rendered, failed, broken = run_in_pool(
+        pool, render_receipt,
+        {ticket_id: (_output_path(upload_folder, ticket_id, stamp), payload) for ticket_id, payload in payloads.items()},
+    )
+    return {ticket_id: os.path.basename(path) for ticket_id, path in rendered.items()}, failed, broken
+
+
+def claim_batch(db, table, batch_size, lease_seconds):
+    """
+    Reclama hasta `batch_size` trabajos pendientes de `table` (receipt_jobs,
+    quote_pdf_jobs): suma un intento y los aparta `lease_seconds` segundos, así
+    otro proceso no los toma mientras se renderizan. Hace commit.
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            f"""
+            SELECT * FROM {table}
+            WHERE status = 'pending' AND next_attempt_at <= datetime('now')
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+            """,
+            (batch_size,),
+        ).fetchall()
+        if rows:
+            db.executemany(
+                f"UPDATE {table} SET attempts = attempts + 1, next_attempt_at = datetime('now', ?) WHERE id = ?",
+                [(f"+{int(lease_seconds)} seconds", row["id"]) for row in rows],
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows
+
+
+def finish_jobs(db, table, rows, succeeded, errors, max_attempts):
+    """
+    Marca `rows` de `table` como hechos (id en `succeeded`) o fallidos: se
+    reintentan en un minuto hasta `max_attempts` intentos. `errors`: {id: motivo}.
+    No hace commit. Devuelve (hechos, con error).
+    """
+    done, retry, dead = [], [], []
+    for row in rows:
+        if row["id"] in succeeded:
+            done.append((row["id"],))
+        else:
+            error = (errors.get(row["id"]) or "Documento no encontrado", row["id"])
+            (dead if row["attempts"] + 1 >= max_attempts else retry).append(error)
+    db.executemany(
+        f"UPDATE {table} SET status = 'done', finished_at = datetime('now'), last_error = NULL WHERE id = ?", done
+    )
+    db.executemany(
+        f"UPDATE {table} SET next_attempt_at = datetime('now', '+60 seconds'), last_error = ? WHERE id = ?", retry
+    )
+    db.executemany(
+        f"UPDATE {table} SET status = 'failed', finished_at = datetime('now'), last_error = ? WHERE id = ?", dead
+    )
+    return len(done), len(retry) + len(dead)
+
+
+def process_receipt_jobs(db, pool, batch_size=None):
+    """Procesa un lote de receipt_jobs. Devuelve {'claimed', 'rendered', 'errors'}."""
+    config = current_app.config
+    batch_size = batch_size or int(config.get("RECEIPT_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    max_attempts = int(config.get("RECEIPT_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+    rows = claim_batch(db, "receipt_jobs", batch_size, config.get("RECEIPT_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+    result = {"claimed": len(rows), "rendered": 0, "errors": 0}
+    if not rows:
+        return result
+
+    # Varios trabajos del mismo ticket generan un solo PDF
+    payloads = load_payloads(db, list(dict.fromkeys(row["ticket_id"] for row in rows)))
+    rendered, failed, broken = _render_all(pool, payloads, config["UPLOAD_FOLDER"])
+    try:
+        db.executemany(
+            "UPDATE tickets SET recibo_url = ? WHERE id = ?",
+            [(url_for("uploaded_file", filename=filename), ticket_id) for ticket_id, filename in rendered.items()],
+        )
+        result["rendered"], result["errors"] = finish_jobs(
+            db, "receipt_jobs", rows,
+            {row["id"] for row in rows if row["ticket_id"] in rendered},
+            {row["id"]: failed.get(row["ticket_id"], "Ticket no encontrado") for row in rows},
+            max_attempts,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if failed:
+        current_app.logger.warning("Recibos: %d PDF con error: %s", len(failed), failed)
+    if broken:
+        # El lote ya quedó anotado (los fallidos se reintentan); el hilo recrea el pool
+        raise BrokenProcessPool("Un proceso del pool de recibos terminó de forma inesperada")
+    return result
+
+
+def drain_receipt_jobs(db, pool):
+    """Procesa lotes hasta vaciar la cola. Devuelve los totales."""
+    totals = {"claimed": 0, "rendered": 0, "errors": 0}
+    while True:
+        result = process_receipt_jobs(db, pool)
+        for key in totals:
+            totals[key] += result[key]
+        if result["claimed"] == 0:
+            return totals
+
+
+def render_receipts_for_range(db, date_from, date_to, workers=None, chunk_size=500):
+    """
+    Regenera los recibos de los tickets con un ingreso registrado en
+    [date_from, date_to) (financial_transactions.transaction_date), con
+    `workers` procesos (por defecto todos los núcleos). Devuelve un resumen.
+    """
+    started = time.perf_counter()
+    ticket_ids = [
+        row[0]
+        for row in db.execute(
+            """
+            SELECT DISTINCT ticket_id FROM financial_transactions
+            WHERE type = 'income' AND transaction_date >= ? AND transaction_date < ? AND ticket_id IS NOT NULL
+            ORDER BY ticket_id
+            """,
+            (date_from, date_to),
+        ).fetchall()
+    ]
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    stats = {"tickets": len(ticket_ids), "rendered": 0, "errors": {}, "workers": workers}
+    pool = create_pool(workers if ticket_ids else 0)
+    try:
+        for start in range(0, len(ticket_ids), chunk_size):
+            payloads = load_payloads(db, ticket_ids[start:start + chunk_size])
+            rendered, failed, broken = _render_all(pool, payloads, current_app.config["UPLOAD_FOLDER"])
+            db.executemany(
+                "UPDATE tickets SET recibo_url = ? WHERE id = ?",
+                [(url_for("uploaded_file", filename=filename), ticket_id) for ticket_id, filename in rendered.items()],
+            )
+            db.commit()
+            stats["rendered"] += len(rendered)
+            stats["errors"].update(failed)
+            if broken:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = create_pool(workers)
+    finally:
+        pool.shutdown()
+    stats["seconds"] = time.perf_counter() - started
+    stats["per_second"] = stats["rendered"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+# --- Hilo de recibos ---
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def _drain_documents(app, pool):
+    """
+    Una pasada del hilo: recibos y presupuestos firmados. Devuelve el pool
+    para la siguiente; si un proceso murió (OOM, segfault) el pool queda roto
+    para siempre, así que se descarta y se crea otro.
+    """
+    from .db_utils import get_db
+    from .quote_pdf import drain_signed_quote_jobs
+
+    try:
+        # url_for necesita un contexto de petición para construir recibo_url
+        with app.app_context(), app.test_request_context():
+            drain_receipt_jobs(get_db(), pool)
+            drain_signed_quote_jobs(get_db(), pool)
+    except BrokenProcessPool:
+        app.logger.error("Recibos: un proceso del pool terminó de forma inesperada; se recrea el pool")
+        pool.shutdown(wait=False, cancel_futures=True)
+        _wake.set()
+        return create_pool(int(app.config.get("RECEIPT_POOL_SIZE", DEFAULT_POOL_SIZE)))
+    except Exception:
+        app.logger.exception("Recibos: error en el hilo de generación")
+    return pool
+
+
+def _worker_loop(app):
+    interval = float(app.config.get("RECEIPT_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+    pool = create_pool(int(app.config.get("RECEIPT_POOL_SIZE", DEFAULT_POOL_SIZE)))
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        pool = _drain_documents(app, pool)
+
+
+def ensure_receipt_worker():
+    """
+    Arranca el hilo de recibos y presupuestos firmados de este proceso si
+    RECEIPT_WORKER está activo. Al arrancar drena en seguida lo que quedó en
+    receipt_jobs y quote_pdf_jobs antes de un reinicio.
+    """
+    global _worker_thread
+    if _worker_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("RECEIPT_WORKER", True):
+        return
+    with _worker_lock:
+        if _worker_thread is None:
+            _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name="receipt-worker", daemon=True)
+            _worker_thread.start()
+            _wake.set()
+
+
+def wake_receipt_worker():
+    """Despierta (y arranca si hace falta) el hilo de recibos y presupuestos firmados de este proceso."""
+    if not current_app.config.get("RECEIPT_WORKER", True):
+        return
+    ensure_receipt_worker()
+    _wake.set()
@@ -0,0 +1,90 @@
+# backend/recurrence.py
+"""
+Reglas de recurrencia de los mantenimientos programados.
+
+Las fechas se calculan siempre desde la fecha ancla (n-ésima ocurrencia =
+ancla + n periodos) y no encadenando sumas, así un mantenimiento del día 31
+cae el 30 de abril y vuelve al 31 en mayo en vez de derivar mes a mes como
+con timedelta(days=30).
+"""
+import calendar
+from datetime import date, datetime, timedelta
+
+# frecuencia -> (meses, días) por periodo; acepta los nombres en inglés de
+# scheduled_maintenance.frequency y los españoles de los formularios
+FREQUENCIES = {
+    'weekly': (0, 7), 'semanal': (0, 7),
+    'biweekly': (0, 14), 'quincenal': (0, 14),
+    'monthly': (1, 0), 'mensual': (1, 0),
+    'bimonthly': (2, 0), 'bimestral': (2, 0),
+    'quarterly': (3, 0), 'trimestral': (3, 0),
+    'semiannually': (6, 0), 'semestral': (6, 0),
+    'annually': (12, 0), 'yearly': (12, 0), 'anual': (12, 0),
+}
+
+
+def parse_date(value) -> date | None:
+    """date desde 'YYYY-MM-DD[ HH:MM:SS]', date o datetime; None si no se puede."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def add_months(day: date, months: int) -> date:
+    """`day` + `months` meses, ajustando al último día del mes si no existe."""
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def is_recurring(frequency) -> bool:
+    return (frequency or '').strip().lower() in FREQUENCIES
+
+
+def nth_occurrence(anchor: date, frequency, n: int) -> date:
+    """Ocurrencia n (0 = el ancla) de la regla `frequency`."""
+    months, days = FREQUENCIES[(frequency or '').strip().lower()]
+    return add_months(anchor, months * n) + timedelta(days=days * n)
+
+
+def _index_before(anchor: date, months: int, days: int, day: date) -> int:
+    """Un n cuya ocurrencia no pasa de `day` (un periodo nunca dura más de months * 31 + days días)."""
+    return max(0, (day - anchor).days) // (months * 31 + days)
+
+
+def occurrences(anchor: date, frequency, start: date, end: date):
+    """
+    Ocurrencias en [start, end) a partir de `anchor` (incluido). Sin regla
+    reconocida, el ancla es la única ocurrencia.
+    """
+    if not is_recurring(frequency):
+        if start <= anchor < end:
+            yield anchor
+        return
+    months, days = FREQUENCIES[frequency.strip().lower()]
+    n = _index_before(anchor, months, days, start)
+    while True:
+        day = nth_occurrence(anchor, frequency, n)
+        if day >= end:
+            return
+        if day >= start:
+            yield day
+        n += 1
+
+
+def next_occurrence(anchor: date, frequency, after: date) -> date | None:
+    """Primera ocurrencia posterior a `after`; None si no es recurrente y el ancla ya pasó."""
+    if not is_recurring(frequency):
+        return anchor if anchor > after else None
+    months, days = FREQUENCIES[frequency.strip().lower()]
+    n = _index_before(anchor, months, days, after)
+    while (day := nth_occurrence(anchor, frequency, n)) <= after:
+        n += 1
+    return day
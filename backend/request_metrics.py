@@ -0,0 +1,196 @@
+# backend/request_metrics.py
+"""
+Métricas HTTP por endpoint en formato Prometheus (GET /metrics).
+
+Cada hilo de waitress escribe en su propio bucket (threading.local), así que
+el camino caliente no toma ningún lock: sólo el primer uso de un hilo registra
+su bucket en la lista global. /metrics suma los buckets de todos los hilos.
+Los contadores de un hilo que termina se conservan (su bucket sigue en la lista).
+"""
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, g, request
+
+from .sql_stats import get_request_sql_stats
+
+# Límites superiores (segundos) de los buckets de los histogramas
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+bp = Blueprint("request_metrics", __name__)
+
+_local = threading.local()
+_buckets: list["_ThreadBucket"] = []
+_buckets_lock = threading.Lock()  # sólo para registrar buckets nuevos y para leerlos
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n):
+        self.counts = [0] * (n + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, bounds, value):
+        i = 0
+        for bound in bounds:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _ThreadBucket:
+    __slots__ = ("latency", "db_time", "db_queries", "responses", "in_flight")
+
+    def __init__(self):
+        self.latency: dict[str, _Histogram] = {}
+        self.db_time: dict[str, _Histogram] = {}
+        self.db_queries: dict[str, int] = {}
+        self.responses: dict[tuple[str, str, int], int] = {}
+        self.in_flight = 0
+
+
+def _bucket() -> _ThreadBucket:
+    bucket = getattr(_local, "bucket", None)
+    if bucket is None:
+        bucket = _local.bucket = _ThreadBucket()
+        with _buckets_lock:
+            _buckets.append(bucket)
+    return bucket
+
+
+def _endpoint() -> str:
+    return request.endpoint or "unmatched"
+
+
+def _observe(histograms, bounds, endpoint, value):
+    hist = histograms.get(endpoint)
+    if hist is None:
+        hist = histograms[endpoint] = _Histogram(len(bounds))
+    hist.observe(bounds, value)
+
+
+def _start_request():
+    _bucket().in_flight += 1
+    g._metrics_in_flight = True
+
+
+def _record_response(response):
+    bucket = _bucket()
+    endpoint = _endpoint()
+    t0 = g.get("_t0")  # lo fija inject_request_id
+    elapsed = time.perf_counter() - t0 if t0 is not None else 0.0
+
+    _observe(bucket.latency, LATENCY_BUCKETS, endpoint, elapsed)
+    key = (endpoint, request.method, response.status_code)
+    bucket.responses[key] = bucket.responses.get(key, 0) + 1
+
+    stats = get_request_sql_stats()
+    if stats is not None:
+        _observe(bucket.db_time, DB_TIME_BUCKETS, endpoint, stats.total_ms / 1000.0)
+        bucket.db_queries[endpoint] = bucket.db_queries.get(endpoint, 0) + stats.count
+
+    if current_app.config.get("ACCESS_LOG", True):
+        current_app.logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={"latency_ms": round(elapsed * 1000.0, 3)},
+        )
+    return response
+
+
+def _finish_request(exc=None):
+    if g.pop("_metrics_in_flight", None):
+        _bucket().in_flight -= 1
+
+
+def init_app(app):
+    """
+    Registra los hooks. Llamar después de sql_stats.init_app: los after_request
+    se ejecutan en orden inverso, así éste ve g.sql_stats antes de que se retire.
+    """
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_finish_request)
+    app.register_blueprint(bp)
+
+
+# --- Exposición ---
+
+def _snapshot():
+    """Suma los buckets de todos los hilos (copias de los dicts, sin bloquear a los escritores)."""
+    with _buckets_lock:
+        buckets = list(_buckets)
+    latency, db_time, db_queries, responses, in_flight = {}, {}, {}, {}, 0
+    for bucket in buckets:
+        in_flight += bucket.in_flight
+        for merged, source in ((latency, bucket.latency), (db_time, bucket.db_time)):
+            for endpoint, hist in source.copy().items():
+                acc = merged.setdefault(endpoint, [[0] * len(hist.counts), 0.0, 0])
+                acc[0] = [a + b for a, b in zip(acc[0], hist.counts)]
+                acc[1] += hist.sum
+                acc[2] += hist.count
+        for endpoint, count in bucket.db_queries.copy().items():
+            db_queries[endpoint] = db_queries.get(endpoint, 0) + count
+        for key, count in bucket.responses.copy().items():
+            responses[key] = responses.get(key, 0) + count
+    return latency, db_time, db_queries, responses, in_flight
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _render_histogram(lines, name, help_text, bounds, data):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for endpoint in sorted(data):
+        counts, total, count = data[endpoint]
+        ep = _label(endpoint)
+        cumulative = 0
+        for bound, n in zip(bounds + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{endpoint="{ep}",le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{endpoint="{ep}"}} {total:.6f}')
+        lines.append(f'{name}_count{{endpoint="{ep}"}} {count}')
+
+
+def render_metrics() -> str:
+    latency, db_time, db_queries, responses, in_flight = _snapshot()
+    lines = []
+    _render_histogram(
+        lines, "http_request_duration_seconds", "Latencia de las peticiones HTTP por endpoint.",
+        LATENCY_BUCKETS, latency,
+    )
+    _render_histogram(
+        lines, "http_request_db_seconds", "Tiempo en base de datos por petición y endpoint.",
+        DB_TIME_BUCKETS, db_time,
+    )
+    lines.append("# HELP http_request_db_queries_total Consultas SQL ejecutadas por endpoint.")
+    lines.append("# TYPE http_request_db_queries_total counter")
+    for endpoint in sorted(db_queries):
+        lines.append(f'http_request_db_queries_total{{endpoint="{_label(endpoint)}"}} {db_queries[endpoint]}')
+    lines.append("# HELP http_responses_total Respuestas HTTP por endpoint, método y código.")
+    lines.append("# TYPE http_responses_total counter")
+    for (endpoint, method, status) in sorted(responses):
+        lines.append(
+            f'http_responses_total{{endpoint="{_label(endpoint)}",method="{method}",status="{status}"}} '
+            f"{responses[(endpoint, method, status)]}"
+        )
+    lines.append("# HELP http_requests_in_flight Peticiones en curso.")
+    lines.append("# TYPE http_requests_in_flight gauge")
+    lines.append(f"http_requests_in_flight {in_flight}")
+    return "\n".join(lines) + "\n"
+
+
+@bp.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,198 @@
+# backend/rfq.py
+"""
+Solicitud de cotización (RFQ) a varios proveedores a la vez.
+
+Un RFQ de M materiales a N proveedores envía un único mensaje por proveedor
+(con todos los materiales) y los N envíos van en paralelo por un pool
+acotado (RFQ_SEND_CONCURRENCY), así que la petición tarda más o menos lo
+que un envío, no N·M envíos en serie. El ritmo por emisor/destinatario y los
+reintentos los sigue aplicando wa_throttle.
+
+Las filas de provider_quotes y whatsapp_message_logs (una por proveedor y
+material, con el mismo wamid, para que handle_incoming_message enlace la
+respuesta con todo el RFQ y reparta los importes por material) se escriben
+al final en una sola transacción.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .messaging import send_whatsapp_template, send_whatsapp_text
+from .wa_client import response_message_id
+from .wa_throttle import SESSION_WINDOW, current_wait_limit, limit_wait, number_variants
+
+DEFAULT_SEND_CONCURRENCY = 8
+DEFAULT_TOP_PROVIDERS = 8
+
+
+def top_providers_for_materials(db, material_ids, limit=DEFAULT_TOP_PROVIDERS):
+    """
+    Proveedores activos con WhatsApp, ordenados por cuántas cotizaciones han
+    respondido para materiales de las mismas categorías que `material_ids`.
+    """
+    if not material_ids:
+        return []
+    placeholders = ",".join("?" * len(material_ids))
+    return db.execute(
+        f"""
+        SELECT p.id, p.nombre, p.whatsapp_number, COUNT(m2.id) AS quotes_in_category
+        FROM providers p
+        LEFT JOIN provider_quotes pq
+               ON pq.provider_id = p.id AND pq.status IN ('received', 'accepted')
+        LEFT JOIN materiales m2
+               ON m2.id = pq.material_id
+              AND m2.categoria IN (SELECT m.categoria FROM materiales m WHERE m.id IN ({placeholders}))
+        WHERE p.is_active = 1 AND p.whatsapp_number IS NOT NULL AND p.whatsapp_number <> ''
+        GROUP BY p.id
+        ORDER BY quotes_in_category DESC, p.nombre
+        LIMIT ?
+        """,
+        (*material_ids, limit),
+    ).fetchall()
+
+
+def open_session_windows(db, numbers, now="now"):
+    """
+    Subconjunto de `numbers` con la ventana de 24 h abierta (una sola consulta
+    en vez de una session_window_open por proveedor). `now` en formato SQLite.
+    """
+    # forma registrada -> números pedidos que se escriben así (ver number_variants)
+    by_variant = {}
+    for number in set(numbers):
+        for variant in number_variants(number):
+            by_variant.setdefault(variant, set()).add(number)
+    if not by_variant:
+        return set()
+    variants = sorted(by_variant)
+    placeholders = ",".join("?" * len(variants))
+    hours = int(SESSION_WINDOW.total_seconds() // 3600)
+    rows = db.execute(
+        f"""
+        SELECT DISTINCT from_number FROM whatsapp_message_logs
+        WHERE direction = 'inbound' AND from_number IN ({placeholders})
+          AND timestamp > datetime(?, ?)
+        """,
+        (*variants, now, f"-{hours} hours"),
+    ).fetchall()
+    return {number for row in rows for number in by_variant[row[0]]}
+
+
+def build_rfq_message(provider_name, job_id, materials):
+    lines = [f"Hola {provider_name},", f"Necesitamos cotización para el trabajo ID: {job_id}:"]
+    for material in materials:
+        descripcion = f" - {material['descripcion']}" if material["descripcion"] else ""
+        lines.append(f"• {material['nombre']} (ID: {material['id']}){descripcion}")
+    lines.append("Por favor, envíanos tu mejor precio y disponibilidad para cada material.")
+    return "\n".join(lines)
+
+
+def fan_out_rfq(db, job_id, material_ids, provider_ids, send_text=None, send_template=None):
+    """
+    Envía el RFQ a cada proveedor en paralelo y registra el resultado.
+    Devuelve [{provider_id, provider, status, kind, message_id, error}] en el
+    orden de `provider_ids`; status es 'sent', 'failed' o 'skipped'.
+    """
+    send_text = send_text or send_whatsapp_text
+    send_template = send_template or send_whatsapp_template
+    template_name = current_app.config.get("WHATSAPP_RFQ_TEMPLATE")
+
+    material_ids = list(dict.fromkeys(int(m) for m in material_ids))
+    provider_ids = list(dict.fromkeys(int(p) for p in provider_ids))
+    if not material_ids or not provider_ids:
+        return []
+
+    placeholders = ",".join("?" * len(material_ids))
+    materials = db.execute(
+        f"SELECT id, nombre, descripcion FROM materiales WHERE id IN ({placeholders}) ORDER BY id",
+        material_ids,
+    ).fetchall()
+    placeholders = ",".join("?" * len(provider_ids))
+    providers = {
+        row["id"]: row
+        for row in db.execute(
+            f"SELECT id, nombre, whatsapp_number FROM providers WHERE id IN ({placeholders})", provider_ids
+        ).fetchall()
+    }
+    numbers = [p["whatsapp_number"] for p in providers.values() if p["whatsapp_number"]]
+    windows = open_session_windows(db, numbers) if template_name else set()
+    if db.in_transaction:
+        db.commit()  # no retener la transacción de lectura durante los envíos
+
+    results = {}
+    jobs = []
+    for provider_id in provider_ids:
+        provider = providers.get(provider_id)
+        if provider is None or not provider["whatsapp_number"] or not materials:
+            results[provider_id] = {
+                "provider_id": provider_id,
+                "provider": provider["nombre"] if provider else None,
+                "status": "skipped",
+                "kind": None,
+                "message_id": None,
+                "error": "Proveedor no encontrado o sin número de WhatsApp" if materials else "Sin materiales",
+            }
+            continue
+        body = build_rfq_message(provider["nombre"], job_id, materials)
+        use_template = bool(template_name) and provider["whatsapp_number"] not in windows
+        jobs.append((provider, body, use_template))
+
+    app = current_app._get_current_object()
+    wait_limit = current_wait_limit()  # el tope de la petición vale también en los hilos del pool
+
+    def _send(job):
+        provider, body, use_template = job
+        with app.app_context(), limit_wait(wait_limit):
+            try:
+                if use_template:
+                    response = send_template(provider["whatsapp_number"], template_name)
+                else:
+                    response = send_text(provider["whatsapp_number"], body)
+                message_id = response_message_id(response)
+                error = None if message_id else "Failed to get message ID from WhatsApp API"
+            except Exception as e:  # un proveedor que falla no aborta el resto
+                message_id, error = None, str(e)
+        return provider, body, "template" if use_template else "text", message_id, error
+
+    if jobs:
+        concurrency = int(current_app.config.get("RFQ_SEND_CONCURRENCY", DEFAULT_SEND_CONCURRENCY))
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs)))) as pool:
+            sent = list(pool.map(_send, jobs))
+    else:
+        sent = []
+
+    from_number = current_app.config.get("WHATSAPP_PHONE_NUMBER_ID")
+    quotes, logs = [], []
+    for provider, body, kind, message_id, error in sent:
+        status = "sent" if message_id else "failed"
+        for material in materials:
+            if message_id:
+                quotes.append((job_id, material["id"], provider["id"], "pending", message_id, "pending"))
+            logs.append((job_id, material["id"], provider["id"], "outbound", from_number,
+                         provider["whatsapp_number"], body, message_id, status, error))
+        results[provider["id"]] = {
+            "provider_id": provider["id"],
+            "provider": provider["nombre"],
+            "status": status,
+            "kind": kind,
+            "message_id": message_id,
+            "error": error,
+        }
+
+    try:
+        if quotes:
+            db.executemany(
+                "INSERT INTO provider_quotes (job_id, material_id, provider_id, status, whatsapp_message_id, payment_status) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                quotes,
+            )
+        if logs:
+            db.executemany(
+                "INSERT INTO whatsapp_message_logs (job_id, material_id, provider_id, direction, from_number, "
+                "to_number, message_body, whatsapp_message_id, status, error_info) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                logs,
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [results[provider_id] for provider_id in provider_ids]
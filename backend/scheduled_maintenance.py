@@ -1,9 +1,8 @@
-from datetime import datetime, timedelta
-
 from flask import Blueprint, flash, g, redirect, render_template, request, url_for
 
 from backend.auth import login_required
 from backend.db_utils import get_db
+from backend.maintenance_scheduler import run_due_maintenances
 
 bp = Blueprint('scheduled_maintenance', __name__, url_prefix='/mantenimientos')
 
@@ -54,15 +53,14 @@ def add_maintenance():
             try:
                 db.execute(
                     '''INSERT INTO mantenimientos_programados
-                       (cliente_id, equipo_id, tipo_mantenimiento, proxima_fecha_mantenimiento, descripcion, creado_por)
-                       VALUES (?, ?, ?, ?, ?, ?)''',
-                    (cliente_id, equipo_id if equipo_id else None, tipo_mantenimiento, proxima_fecha_mantenimiento, descripcion, creado_por)
+                       (cliente_id, equipo_id, tipo_mantenimiento, proxima_fecha_mantenimiento, fecha_inicio, descripcion, creado_por)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (cliente_id, equipo_id if equipo_id else None, tipo_mantenimiento, proxima_fecha_mantenimiento,
+                     proxima_fecha_mantenimiento, descripcion, creado_por)
                 )
-                db.commit()
-                flash('¡Mantenimiento programado añadido correctamente!')
-
                 # --- Notification Logic ---
-                from .notifications import add_notification, send_whatsapp_notification
+                # Encoladas en notification_outbox en la misma transacción que el alta
+                from .outbox import enqueue_notifications, wake_dispatcher
                 # Get client name for notification message
                 client_name_row = db.execute('SELECT nombre FROM clientes WHERE id = ?', (cliente_id,)).fetchone()
                 client_name = client_name_row['nombre'] if client_name_row else 'Cliente desconocido'
@@ -77,16 +75,12 @@ def add_maintenance():
                     f"con fecha {proxima_fecha_mantenimiento}."
                 )
 
-                # Notify creator
-                add_notification(db, creado_por, notification_message)
-                send_whatsapp_notification(db, creado_por, notification_message)
-
-                # Notify admins
-                for admin in admin_users:
-                    if admin['id'] != creado_por: # Avoid double notification for creator if they are admin
-                        add_notification(db, admin['id'], notification_message)
-                        send_whatsapp_notification(db, admin['id'], notification_message)
+                # Notify creator and admins (enqueue_notifications skips duplicates)
+                enqueue_notifications(db, [creado_por] + [admin['id'] for admin in admin_users], notification_message)
                 # --- End Notification Logic ---
+                db.commit()
+                wake_dispatcher()
+                flash('¡Mantenimiento programado añadido correctamente!')
                 return redirect(url_for('scheduled_maintenance.list_maintenances'))
             except Exception as e:
                 db.rollback()
@@ -132,42 +126,40 @@ def edit_maintenance(maintenance_id):
                 db.execute(
                     '''UPDATE mantenimientos_programados SET
                        cliente_id = ?, equipo_id = ?, tipo_mantenimiento = ?,
-                       proxima_fecha_mantenimiento = ?, descripcion = ?, estado = ?
+                       proxima_fecha_mantenimiento = ?, fecha_inicio = ?, descripcion = ?, estado = ?
                        WHERE id = ?''',
                     (cliente_id, equipo_id if equipo_id else None, tipo_mantenimiento,
-                     proxima_fecha_mantenimiento, descripcion, estado, maintenance_id)
+                     proxima_fecha_mantenimiento,
+                     # Una fecha nueva empieza una serie nueva desde ella
+                     maintenance['fecha_inicio'] if proxima_fecha_mantenimiento == original_proxima_fecha else proxima_fecha_mantenimiento,
+                     descripcion, estado, maintenance_id)
                 )
-                db.commit()
-                flash('¡Mantenimiento programado actualizado correctamente!')
-
                 # --- WhatsApp Notification for Status/Date Changes ---
+                # Encolada en notification_outbox en la misma transacción que el cambio
+                from .outbox import wake_dispatcher
                 from .notifications import send_whatsapp_notification
 
-                # Fetch client and creator details for notifications
+                # Fetch client details for the message
                 client_data = db.execute(
-                    'SELECT nombre, whatsapp_number, whatsapp_opt_in FROM clientes WHERE id = ?',
+                    'SELECT nombre FROM clientes WHERE id = ?',
                     (cliente_id,)
                 ).fetchone()
-                creator_data = db.execute(
-                    'SELECT username, whatsapp_number, whatsapp_opt_in FROM users WHERE id = ?',
-                    (maintenance['creado_por'],)
-                ).fetchone()
 
                 if estado != original_estado or proxima_fecha_mantenimiento != original_proxima_fecha:
-                    change_message = f"El mantenimiento programado para {client_data['nombre']} ({tipo_mantenimiento}) ha sido actualizado.\n"
+                    client_name = client_data['nombre'] if client_data else 'Cliente desconocido'
+                    change_message = f"El mantenimiento programado para {client_name} ({tipo_mantenimiento}) ha sido actualizado.\n"
                     if estado != original_estado:
                         change_message += f"Estado: de '{original_estado}' a '{estado}'.\n"
                     if proxima_fecha_mantenimiento != original_proxima_fecha:
                         change_message += f"Fecha: de '{original_proxima_fecha}' a '{proxima_fecha_mantenimiento}'.\n"
 
-                    # Notify client
-                    if client_data and client_data['whatsapp_opt_in'] and client_data['whatsapp_number']:
-                        send_whatsapp_notification(db, client_data['id'], change_message)
-
-                    # Notify creator
-                    if creator_data and creator_data['whatsapp_opt_in'] and creator_data['whatsapp_number']:
-                        send_whatsapp_notification(db, creator_data['id'], change_message)
+                    # Notify creator (the outbox skips users without opt-in or number).
+                    # Clients are not users, so they cannot be notified through the outbox.
+                    send_whatsapp_notification(db, maintenance['creado_por'], change_message)
                 # --- End WhatsApp Notification for Status/Date Changes ---
+                db.commit()
+                wake_dispatcher()
+                flash('¡Mantenimiento programado actualizado correctamente!')
 
                 return redirect(url_for('scheduled_maintenance.list_maintenances'))
             except Exception as e:
@@ -184,49 +176,10 @@ def generate_tickets_manual():
     if db is None:
         flash('Database connection error.', 'error')
         return redirect(url_for('scheduled_maintenance.list_maintenances'))
-    # Fetch maintenances due today or in the past
-    today = datetime.now().strftime('%Y-%m-%d')
-    due_maintenances = db.execute(
-        '''SELECT mp.id, mp.cliente_id, mp.equipo_id, mp.tipo_mantenimiento, mp.descripcion, mp.creado_por
-           FROM mantenimientos_programados mp
-           WHERE mp.proxima_fecha_mantenimiento <= ? AND mp.estado = 'activo'''
-        , (today,)
-    ).fetchall()
-
-    generated_count = 0
-    for maintenance in due_maintenances:
-        try:
-            # Create a new ticket for the due maintenance
-            db.execute(
-                '''INSERT INTO tickets (cliente_id, equipo_id, tipo, descripcion, estado, creado_por)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                (maintenance['cliente_id'], maintenance['equipo_id'],
-                 f"Mantenimiento Programado: {maintenance['tipo_mantenimiento']}",
-                 maintenance['descripcion'] or f"Mantenimiento programado para {maintenance['tipo_mantenimiento']}",
-                 'Pendiente', maintenance['creado_por'])
-            )
-            # Update the next scheduled date for the maintenance (e.g., add 1 month, 3 months, 1 year)
-            # This is a simplified example, real logic would be more complex based on tipo_mantenimiento
-            current_date = datetime.strptime(maintenance['proxima_fecha_mantenimiento'], '%Y-%m-%d')
-            if maintenance['tipo_mantenimiento'] == 'mensual':
-                next_date = current_date + timedelta(days=30) # Approx 1 month
-            elif maintenance['tipo_mantenimiento'] == 'trimestral':
-                next_date = current_date + timedelta(days=90) # Approx 3 months
-            elif maintenance['tipo_mantenimiento'] == 'anual':
-                next_date = current_date + timedelta(days=365) # Approx 1 year
-            else:
-                next_date = current_date + timedelta(days=7) # Default to 1 week if type unknown
-
-            db.execute(
-                'UPDATE mantenimientos_programados SET proxima_fecha_mantenimiento = ? WHERE id = ?',
-                (next_date.strftime('%Y-%m-%d'), maintenance['id'])
-            )
-            generated_count += 1
-        except Exception as e:
-            db.rollback()
-            flash(f"Error al generar ticket para mantenimiento {maintenance['id']}: {e}")
-            return redirect(url_for('scheduled_maintenance.list_maintenances'))
-
-    db.commit()
-    flash(f'Se generaron {generated_count} tickets de mantenimiento.')
+    # Misma generación que `flask maintenance-run`: por lotes, idempotente y
+    # sin abandonar el resto si un mantenimiento falla
+    stats = run_due_maintenances(db)
+    for maintenance_id, reason in stats['errores']:
+        flash(f"Error al generar ticket para mantenimiento {maintenance_id}: {reason}")
+    flash(f"Se generaron {stats['tickets']} tickets de mantenimiento.")
     return redirect(url_for('scheduled_maintenance.list_maintenances'))
@@ -34,6 +34,21 @@ DROP TABLE IF EXISTS material_research;
 DROP TABLE IF EXISTS whatsapp_templates;
 DROP TABLE IF EXISTS user_permissions;
 DROP TABLE IF EXISTS role_permissions;
+DROP TABLE IF EXISTS kpi_counters;
+DROP TABLE IF EXISTS notification_outbox;
+DROP TABLE IF EXISTS inbound_events;
+DROP VIEW IF EXISTS phone_directory_source;
+DROP TABLE IF EXISTS phone_directory;
+DROP TABLE IF EXISTS autocomplete_versions;
+DROP VIEW IF EXISTS search_source;
+DROP TABLE IF EXISTS search_index;
+DROP TABLE IF EXISTS mantenimiento_ocurrencias;
+DROP TABLE IF EXISTS mantenimientos_programados;
+DROP TABLE IF EXISTS sla_ticket_changes;
+DROP TABLE IF EXISTS sla_breach_counters;
+DROP TABLE IF EXISTS receipt_jobs;
+DROP TABLE IF EXISTS quote_pdf_jobs;
+DROP TABLE IF EXISTS blobs;
 
 CREATE TABLE error_log (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -133,6 +148,7 @@ CREATE TABLE IF NOT EXISTS tickets (
     prioridad TEXT DEFAULT 'Media', -- 'Baja', 'Media', 'Alta', 'Urgente'
     estado TEXT DEFAULT 'Abierto', -- 'Abierto', 'En Progreso', 'Pendiente', 'Cerrado', 'Cancelado'
     sla_due TEXT, -- Fecha y hora de vencimiento del SLA
+    sla_breached_at TEXT, -- Cuándo se escaló por SLA vencido (backend.sla_monitor)
     asignado_a INTEGER, -- ID del usuario (técnico/autónomo) asignado
     creado_por INTEGER NOT NULL, -- ID del usuario que creó el ticket
     fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -245,9 +261,13 @@ CREATE TABLE IF NOT EXISTS presupuestos (
     total REAL NOT NULL,
     billing_entity_type TEXT, -- 'Cliente' or 'Proveedor'
     billing_entity_id INTEGER,
-    client_signature_data TEXT,
+    client_signature_data TEXT, -- Firmas antiguas en línea; las nuevas van a blobs (client_signature_sha256)
+    client_signature_sha256 TEXT,
     client_signature_date TEXT,
     client_signed_by TEXT,
+    signature_token TEXT,
+    token_expires TEXT,
+    signed_pdf_sha256 TEXT,
     signed_pdf_url TEXT,
     FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE CASCADE,
     FOREIGN KEY (freelancer_id) REFERENCES users (id) ON DELETE SET NULL
@@ -307,6 +327,11 @@ CREATE TABLE IF NOT EXISTS whatsapp_message_logs (
     whatsapp_message_id TEXT,
     status TEXT, -- e.g., 'sent', 'delivered', 'read', 'failed', 'received', 'processed', 'unprocessed'
     error_info TEXT,
+    -- Primera vez que se vio cada estado de entrega (backend.wa_status)
+    sent_at TEXT,
+    delivered_at TEXT,
+    read_at TEXT,
+    failed_at TEXT,
     FOREIGN KEY (job_id) REFERENCES tickets (id) ON DELETE SET NULL,
     FOREIGN KEY (material_id) REFERENCES materiales (id) ON DELETE SET NULL,
     FOREIGN KEY (provider_id) REFERENCES providers (id) ON DELETE SET NULL
@@ -325,6 +350,9 @@ CREATE TABLE IF NOT EXISTS provider_quotes (
     whatsapp_message_id TEXT,
     payment_status TEXT DEFAULT 'pending', -- New column
     payment_date TEXT, -- New column
+    vat_included INTEGER, -- extraídos de la respuesta por backend/quote_parser.py
+    delivery_date TEXT,
+    stock_status TEXT, -- in_stock, no_stock, on_order
     FOREIGN KEY (job_id) REFERENCES tickets (id) ON DELETE CASCADE,
     FOREIGN KEY (material_id) REFERENCES materiales (id) ON DELETE CASCADE,
     FOREIGN KEY (provider_id) REFERENCES providers (id) ON DELETE CASCADE
@@ -451,6 +479,37 @@ CREATE TABLE IF NOT EXISTS scheduled_maintenance (
     FOREIGN KEY (assigned_to) REFERENCES users (id) ON DELETE SET NULL
 );
 
+-- Mantenimientos recurrentes de clientes: backend.maintenance_scheduler genera
+-- sus tickets (`flask maintenance-run`)
+CREATE TABLE IF NOT EXISTS mantenimientos_programados (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cliente_id INTEGER NOT NULL,
+    equipo_id INTEGER,
+    tipo_mantenimiento TEXT NOT NULL, -- 'mensual', 'trimestral', 'semestral', 'anual'
+    descripcion TEXT,
+    ultima_fecha_mantenimiento TEXT,
+    proxima_fecha_mantenimiento TEXT NOT NULL,
+    fecha_inicio TEXT, -- Ancla de la recurrencia; las fechas se calculan desde ella
+    estado TEXT DEFAULT 'activo', -- 'activo', 'pausado', 'completado'
+    creado_por INTEGER NOT NULL,
+    fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (cliente_id) REFERENCES clientes (id) ON DELETE CASCADE,
+    FOREIGN KEY (creado_por) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS idx_mantenimientos_estado_proxima ON mantenimientos_programados (estado, proxima_fecha_mantenimiento);
+
+-- Una fila por ocurrencia generada: la clave (mantenimiento, fecha) hace que
+-- repetir una ejecución nunca duplique tickets
+CREATE TABLE IF NOT EXISTS mantenimiento_ocurrencias (
+    mantenimiento_id INTEGER NOT NULL,
+    fecha_prevista TEXT NOT NULL,
+    ticket_id INTEGER,
+    generado_en TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (mantenimiento_id, fecha_prevista),
+    FOREIGN KEY (mantenimiento_id) REFERENCES mantenimientos_programados (id) ON DELETE CASCADE,
+    FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE SET NULL
+) WITHOUT ROWID;
+
 CREATE TABLE IF NOT EXISTS material_research (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     material_id INTEGER NOT NULL,
@@ -489,5 +548,483 @@ CREATE TABLE IF NOT EXISTS role_permissions (
     FOREIGN KEY (permission_id) REFERENCES permissions (id) ON DELETE CASCADE
 );
 
+-- Índices secundarios para las consultas calientes (ver backend/query_catalog.py)
+CREATE INDEX IF NOT EXISTS idx_tickets_asignado_fecha ON tickets (asignado_a, fecha_creacion);
+CREATE INDEX IF NOT EXISTS idx_tickets_cliente_fecha ON tickets (cliente_id, fecha_creacion);
+CREATE INDEX IF NOT EXISTS idx_tickets_fecha_creacion ON tickets (fecha_creacion, id);
+CREATE INDEX IF NOT EXISTS idx_tickets_fecha_fin ON tickets (fecha_fin) WHERE fecha_fin IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_tickets_sla_pending ON tickets (sla_due) WHERE sla_due IS NOT NULL AND sla_breached_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_notifications_user_read ON notifications (user_id, is_read);
+CREATE INDEX IF NOT EXISTS idx_wa_logs_provider_dir_ts ON whatsapp_message_logs (provider_id, direction, timestamp);
+CREATE INDEX IF NOT EXISTS idx_wa_logs_inbound_from ON whatsapp_message_logs (from_number, timestamp) WHERE direction = 'inbound';
+CREATE INDEX IF NOT EXISTS idx_wa_logs_timestamp ON whatsapp_message_logs (timestamp);
+CREATE INDEX IF NOT EXISTS idx_wa_logs_message_id ON whatsapp_message_logs (whatsapp_message_id) WHERE whatsapp_message_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_provider_quotes_job_mat_prov ON provider_quotes (job_id, material_id, provider_id, status);
+CREATE INDEX IF NOT EXISTS idx_provider_quotes_provider_status ON provider_quotes (provider_id, status);
+CREATE INDEX IF NOT EXISTS idx_market_research_material_created ON market_research (material_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_ficheros_presupuesto ON ficheros (presupuesto_id);
+CREATE INDEX IF NOT EXISTS idx_eventos_ticket_inicio ON eventos (ticket_id, inicio);
+CREATE INDEX IF NOT EXISTS idx_presupuestos_ticket_fecha ON presupuestos (ticket_id, fecha_creacion);
+
+-- Contadores materializados para los KPIs del dashboard (backend/metrics.py).
+-- kind: 'estado' | 'estado_pago' | 'clientes'; value: valor bruto ('' si NULL).
+CREATE TABLE IF NOT EXISTS kpi_counters (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, value)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado', COALESCE(NEW.estado, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado_pago', COALESCE(NEW.estado_pago, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_delete AFTER DELETE ON tickets
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado' AND value = COALESCE(OLD.estado, '');
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado_pago' AND value = COALESCE(OLD.estado_pago, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_update AFTER UPDATE OF estado, estado_pago ON tickets
+WHEN OLD.estado IS NOT NEW.estado OR OLD.estado_pago IS NOT NEW.estado_pago
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado' AND value = COALESCE(OLD.estado, '');
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado', COALESCE(NEW.estado, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado_pago' AND value = COALESCE(OLD.estado_pago, '');
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado_pago', COALESCE(NEW.estado_pago, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_kpi_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('clientes', '', 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_kpi_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'clientes' AND value = '';
+END;
+
+-- Bandeja de salida de notificaciones (backend/outbox.py). channel: 'app' | 'whatsapp';
+-- status: 'pending' | 'sent' | 'skipped' | 'failed'.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    sent_at TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox (next_attempt_at, id) WHERE status = 'pending';
+
+-- Eventos entrantes de webhooks (backend/inbound_events.py), uno por mensaje;
+-- (source, event_id) único: los reintentos del proveedor no se duplican.
+CREATE TABLE IF NOT EXISTS inbound_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL DEFAULT 'meta',
+    event_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    received_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    processed_at TEXT,
+    UNIQUE (source, event_id)
+);
+CREATE INDEX IF NOT EXISTS idx_inbound_events_pending ON inbound_events (next_attempt_at, id) WHERE status = 'pending';
+
+-- Teléfonos normalizados a E.164 (backend/phone_directory.py). La vista aplica la
+-- misma normalización que phone_directory.to_e164(); los triggers la mantienen al día.
+CREATE TABLE IF NOT EXISTS phone_directory (
+    number TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    PRIMARY KEY (number, kind, entity_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_phone_directory_entity ON phone_directory (kind, entity_id);
+
+CREATE VIEW IF NOT EXISTS phone_directory_source AS
+WITH raw (kind, entity_id, s) AS (
+    SELECT 'provider', id, whatsapp_number FROM providers
+    UNION ALL SELECT 'provider', id, telefono FROM providers
+    UNION ALL SELECT 'client', id, whatsapp_number FROM clientes
+    UNION ALL SELECT 'client', id, telefono FROM clientes
+    UNION ALL SELECT 'user', id, whatsapp_number FROM users
+    UNION ALL SELECT 'user', id, telefono FROM users
+),
+stripped (kind, entity_id, s) AS (
+    SELECT kind, entity_id,
+           REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(TRIM(s)),
+               'whatsapp:', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', ''), '/', '')
+    FROM raw WHERE s IS NOT NULL
+),
+canonical (kind, entity_id, number) AS (
+    SELECT kind, entity_id,
+           CASE
+               WHEN s GLOB '+[1-9]*' AND substr(s, 2) NOT GLOB '*[^0-9]*' THEN s
+               WHEN s GLOB '00[1-9]*' AND s NOT GLOB '*[^0-9]*' THEN '+' || substr(s, 3)
+               WHEN s GLOB '[6789]????????' AND s NOT GLOB '*[^0-9]*' THEN '+34' || s
+               WHEN s GLOB '[1-9]*' AND s NOT GLOB '*[^0-9]*' AND length(s) >= 10 THEN '+' || s
+           END
+    FROM stripped
+)
+SELECT DISTINCT number, kind, entity_id FROM canonical
+WHERE number IS NOT NULL AND length(number) BETWEEN 9 AND 16;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_insert AFTER INSERT ON providers
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'provider' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_update AFTER UPDATE OF id, telefono, whatsapp_number ON providers
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'provider' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'provider' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_delete AFTER DELETE ON providers
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'provider' AND entity_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'client' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_update AFTER UPDATE OF id, telefono, whatsapp_number ON clientes
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'client' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'client' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'client' AND entity_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_insert AFTER INSERT ON users
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'user' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_update AFTER UPDATE OF id, telefono, whatsapp_number ON users
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'user' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'user' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_delete AFTER DELETE ON users
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'user' AND entity_id = OLD.id;
+END;
+
+-- Versión por tabla de los índices de autocompletado en memoria (backend/autocomplete.py):
+-- cada alta, edición o baja la incrementa y los workers reconstruyen su índice.
+CREATE TABLE IF NOT EXISTS autocomplete_versions (
+    source TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_update AFTER UPDATE OF nombre ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_insert AFTER INSERT ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_update AFTER UPDATE OF nombre, sku ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_delete AFTER DELETE ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_insert AFTER INSERT ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_update AFTER UPDATE OF name, description ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_delete AFTER DELETE ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_insert AFTER INSERT ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_update AFTER UPDATE OF username, role ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_delete AFTER DELETE ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+
+-- Búsqueda de texto completo (backend/search.py). Una sola tabla FTS5 para todos
+-- los tipos; rowid = id * 8 + código de tipo, así los triggers localizan cada
+-- documento por rowid. search_source define el texto indexado de cada tipo.
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(0.0, 5.0, 1.0)');
+
+CREATE VIEW IF NOT EXISTS search_source AS
+SELECT id * 8 + 1 AS doc_id, 'ticket' AS kind, id AS entity_id, titulo AS title,
+       TRIM(COALESCE(descripcion, '') || ' ' || COALESCE(observaciones, '')) AS body
+FROM tickets
+UNION ALL
+SELECT id * 8 + 2, 'cliente', id, nombre,
+       TRIM(COALESCE(email, '') || ' ' || COALESCE(nif, '') || ' ' || COALESCE(direccion, '') || ' ' || COALESCE(ciudad, ''))
+FROM clientes
+UNION ALL
+SELECT id * 8 + 3, 'material', id, nombre,
+       TRIM(sku || ' ' || COALESCE(descripcion, '') || ' ' || COALESCE(categoria, ''))
+FROM materiales
+UNION ALL
+SELECT id * 8 + 4, 'presupuesto_item', id, '', descripcion
+FROM presupuesto_items
+UNION ALL
+SELECT id * 8 + 5, 'whatsapp', id, '', message_body
+FROM whatsapp_message_logs WHERE message_body <> '';
+
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'ticket' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_update AFTER UPDATE OF titulo, descripcion, observaciones ON tickets
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'ticket' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_delete AFTER DELETE ON tickets
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'cliente' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_update AFTER UPDATE OF nombre, email, nif, direccion, ciudad ON clientes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'cliente' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_insert AFTER INSERT ON materiales
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'material' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_update AFTER UPDATE OF sku, nombre, descripcion, categoria ON materiales
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'material' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_delete AFTER DELETE ON materiales
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_insert AFTER INSERT ON presupuesto_items
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'presupuesto_item' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_update AFTER UPDATE OF descripcion ON presupuesto_items
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'presupuesto_item' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_delete AFTER DELETE ON presupuesto_items
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_insert AFTER INSERT ON whatsapp_message_logs
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'whatsapp' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_update AFTER UPDATE OF message_body ON whatsapp_message_logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 5;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'whatsapp' AND entity_id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_delete AFTER DELETE ON whatsapp_message_logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 5;
+END;
+
+-- Vigilancia de SLA (backend.sla_monitor). sla_ticket_changes es el registro
+-- de tickets cuyo SLA puede haber cambiado: cada proceso lo lee desde su
+-- último seq para parchear su montículo en memoria sin releer tickets.
+CREATE TABLE IF NOT EXISTS sla_ticket_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Incumplimientos acumulados por cliente, técnico y prioridad (la que tenía
+-- el ticket al vencer, antes de subirla)
+CREATE TABLE IF NOT EXISTS sla_breach_counters (
+    dimension TEXT NOT NULL, -- 'cliente', 'tecnico', 'prioridad'
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_insert AFTER INSERT ON tickets
+WHEN NEW.sla_due IS NOT NULL
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_update AFTER UPDATE OF sla_due, estado, sla_breached_at ON tickets
+WHEN (OLD.sla_due IS NOT NULL OR NEW.sla_due IS NOT NULL)
+    AND (OLD.sla_due IS NOT NEW.sla_due OR OLD.estado IS NOT NEW.estado OR OLD.sla_breached_at IS NOT NEW.sla_breached_at)
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_delete AFTER DELETE ON tickets
+WHEN OLD.sla_due IS NOT NULL
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_breach AFTER UPDATE OF sla_breached_at ON tickets
+WHEN OLD.sla_breached_at IS NULL AND NEW.sla_breached_at IS NOT NULL
+BEGIN
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('cliente', NEW.cliente_id, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('tecnico', COALESCE(NEW.asignado_a, ''), 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('prioridad', COALESCE(OLD.prioridad, ''), 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+END;
+
+-- Cola de recibos PDF (backend/receipt_worker.py); status: 'pending' | 'done' | 'failed'.
+CREATE TABLE IF NOT EXISTS receipt_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT,
+    FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_receipt_jobs_pending ON receipt_jobs (next_attempt_at, id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_financial_transactions_ticket ON financial_transactions (ticket_id, type, transaction_date);
+CREATE INDEX IF NOT EXISTS idx_financial_transactions_income_date ON financial_transactions (transaction_date, ticket_id) WHERE type = 'income';
+
+-- Ficheros direccionados por contenido (backend/blob_store.py): BLOB_FOLDER/<sha256[:2]>/<sha256>.
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+-- Cola de PDF de presupuestos firmados (backend/quote_pdf.py); mismos estados que receipt_jobs.
+CREATE TABLE IF NOT EXISTS quote_pdf_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    presupuesto_id INTEGER NOT NULL,
+    base_url TEXT, -- Raíz de la petición de firma: host del enlace enviado si no hay PUBLIC_BASE_URL
+    notify INTEGER NOT NULL DEFAULT 1, -- 0: backfill de firmas antiguas, sin WhatsApp al cliente
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT,
+    FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_quote_pdf_jobs_pending ON quote_pdf_jobs (next_attempt_at, id) WHERE status = 'pending';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_presupuestos_signature_token ON presupuestos (signature_token) WHERE signature_token IS NOT NULL;
+
 -- All INSERT statements moved to the end
 INSERT OR IGNORE INTO permissions (code, descripcion) VALUES ('view_reports', 'Ver informes contables');
\ No newline at end of file
@@ -0,0 +1,209 @@
+# backend/search.py
+"""
+Búsqueda de texto completo sobre trabajos, clientes, materiales, líneas de
+presupuesto y mensajes de WhatsApp (tabla FTS5 search_index).
+
+search_index la mantienen los triggers de schema.sql a partir de la vista
+search_source; rowid = id * 8 + código de tipo (KIND_CODES). El ranking es
+BM25 con el título pesando 5 veces más que el cuerpo (configurado como
+'rank' de la tabla, así FTS5 ordena sin calcularlo aparte), y los
+fragmentos salen de snippet(). `flask search-rebuild` verifica y reconstruye
+el índice.
+"""
+import re
+import sqlite3
+
+from flask import Blueprint, jsonify, render_template, request, url_for
+from flask_login import login_required
+from markupsafe import Markup, escape
+
+from backend.db_utils import get_db
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+KIND_CODES = {'ticket': 1, 'cliente': 2, 'material': 3, 'presupuesto_item': 4, 'whatsapp': 5}
+KIND_LABELS = {
+    'ticket': 'Trabajos',
+    'cliente': 'Clientes',
+    'material': 'Materiales',
+    'presupuesto_item': 'Líneas de presupuesto',
+    'whatsapp': 'WhatsApp',
+}
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+# Marcas del fragmento: caracteres de control que no aparecen en el texto y
+# se sustituyen por <mark> después de escapar el HTML
+_HL_START, _HL_END = "\x02", "\x03"
+
+
+def build_match_query(text) -> str | None:
+    """
+    Expresión MATCH segura para el texto del usuario: cada palabra entre
+    comillas (sin sintaxis FTS5) y la última como prefijo. None si no hay palabras.
+    """
+    terms = _TERM_RE.findall(text or "")
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _highlight(snippet):
+    return Markup(str(escape(snippet or "")).replace(_HL_START, "<mark>").replace(_HL_END, "</mark>"))
+
+
+def search(db, text, kind=None, limit=PAGE_SIZE, offset=0):
+    """
+    {'results': [...], 'facets': {tipo: coincidencias}, 'total': n}. Cada
+    resultado: kind, id, title, snippet (HTML con <mark>) y score (BM25;
+    más negativo = más relevante). `kind` filtra por tipo; las facetas
+    siempre cuentan todos los tipos.
+    """
+    match = build_match_query(text)
+    if match is None:
+        return {'results': [], 'facets': {}, 'total': 0}
+    # El tipo se saca del rowid (id * 8 + código): leer la columna `kind`
+    # obligaría a FTS5 a cargar el contenido de cada coincidencia
+    kinds = {code: name for name, code in KIND_CODES.items()}
+    facets = {
+        kinds[row[0]]: row[1]
+        for row in db.execute(
+            "SELECT rowid % 8, COUNT(*) FROM search_index WHERE search_index MATCH ? GROUP BY 1", (match,)
+        ).fetchall()
+        if row[0] in kinds
+    }
+    sql = (
+        "SELECT rowid, kind, title, "
+        f"snippet(search_index, -1, '{_HL_START}', '{_HL_END}', '…', 16) AS snippet, rank AS score "
+        "FROM search_index WHERE search_index MATCH ?"
+    )
+    params = [match]
+    if kind:
+        sql += " AND rowid % 8 = ?"
+        params.append(KIND_CODES[kind])
+    sql += " ORDER BY rank LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+    results = [
+        {
+            'kind': row['kind'],
+            'id': row['rowid'] // 8,
+            'title': row['title'],
+            'snippet': _highlight(row['snippet']),
+            'score': row['score'],
+        }
+        for row in db.execute(sql, params).fetchall()
+    ]
+    total = facets.get(kind, 0) if kind else sum(facets.values())
+    return {'results': results, 'facets': facets, 'total': total}
+
+
+def attach_links(db, results):
+    """Añade 'url' a cada resultado (las líneas y mensajes enlazan a su presupuesto o trabajo)."""
+    item_ids = [r['id'] for r in results if r['kind'] == 'presupuesto_item']
+    log_ids = [r['id'] for r in results if r['kind'] == 'whatsapp']
+    quotes, jobs = {}, {}
+    if item_ids:
+        quotes = dict(db.execute(
+            f"SELECT id, presupuesto_id FROM presupuesto_items WHERE id IN ({','.join('?' * len(item_ids))})",
+            item_ids,
+        ).fetchall())
+    if log_ids:
+        jobs = dict(db.execute(
+            f"SELECT id, job_id FROM whatsapp_message_logs WHERE id IN ({','.join('?' * len(log_ids))})",
+            log_ids,
+        ).fetchall())
+    for result in results:
+        kind, entity_id = result['kind'], result['id']
+        if kind == 'ticket':
+            result['url'] = url_for('jobs.view_job', job_id=entity_id)
+        elif kind == 'cliente':
+            result['url'] = url_for('clients.view_client', client_id=entity_id)
+        elif kind == 'material':
+            result['url'] = url_for('materials.view_material', material_id=entity_id)
+        elif kind == 'presupuesto_item' and quotes.get(entity_id):
+            result['url'] = url_for('quotes.view_quote', quote_id=quotes[entity_id])
+        elif kind == 'whatsapp' and jobs.get(entity_id):
+            result['url'] = url_for('jobs.view_job', job_id=jobs[entity_id])
+        else:
+            result['url'] = None
+    return results
+
+
+def _parse_args(args):
+    text = (args.get('q') or '').strip()
+    kind = args.get('kind') if args.get('kind') in KIND_CODES else None
+    try:
+        limit = max(1, min(int(args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = PAGE_SIZE
+    try:
+        page = max(1, int(args.get('page', 1)))
+    except (TypeError, ValueError):
+        page = 1
+    return text, kind, limit, page
+
+
+@bp.route('/')
+@login_required
+def search_page():
+    text, kind, limit, page = _parse_args(request.args)
+    found = search(get_db(), text, kind, limit, (page - 1) * limit)
+    attach_links(get_db(), found['results'])
+    return render_template(
+        'search/results.html',
+        q=text,
+        kind=kind,
+        page=page,
+        limit=limit,
+        labels=KIND_LABELS,
+        has_next=page * limit < found['total'],
+        **found,
+    )
+
+
+@bp.route('/api')
+@login_required
+def search_api():
+    """Misma búsqueda que search_page, en JSON."""
+    text, kind, limit, page = _parse_args(request.args)
+    found = search(get_db(), text, kind, limit, (page - 1) * limit)
+    attach_links(get_db(), found['results'])
+    for result in found['results']:
+        result['snippet'] = str(result['snippet'])
+    return jsonify(found)
+
+
+# --- Verificación / reconstrucción ---
+
+def check_search_index(conn: sqlite3.Connection) -> dict[str, tuple[int, int]]:
+    """{tipo: (documentos indexados, documentos esperados)} sólo para los que no cuadran."""
+    indexed = dict(conn.execute("SELECT kind, COUNT(*) FROM search_index GROUP BY kind").fetchall())
+    expected = dict(conn.execute("SELECT kind, COUNT(*) FROM search_source GROUP BY kind").fetchall())
+    return {
+        kind: (indexed.get(kind, 0), expected.get(kind, 0))
+        for kind in sorted(set(indexed) | set(expected))
+        if indexed.get(kind, 0) != expected.get(kind, 0)
+    }
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> int:
+    """Reescribe search_index desde search_source y lo optimiza. Devuelve los documentos indexados."""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM search_index")
+        conn.execute(
+            "INSERT INTO search_index (rowid, kind, title, body) SELECT doc_id, kind, title, body FROM search_source"
+        )
+        count = conn.execute("SELECT COUNT(*) FROM search_index").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    conn.commit()
+    return count
@@ -0,0 +1,333 @@
+# backend/sla_monitor.py
+"""
+Vigilancia de tickets.sla_due.
+
+Cada proceso mantiene un montículo (heap) en memoria con los tickets
+abiertos y sin escalar, ordenado por sla_due: se carga al arrancar con una
+consulta sobre idx_tickets_sla_pending y se parchea leyendo
+sla_ticket_changes desde el último seq visto (los triggers de schema.sql
+apuntan ahí cada alta, cambio de sla_due/estado o baja). El hilo duerme
+hasta el próximo vencimiento o SLA_SYNC_INTERVAL, lo que llegue antes, así
+que nunca recorre la tabla de tickets.
+
+Al vencer un SLA el ticket se escala: se marca sla_breached_at (sólo un
+proceso lo consigue, la condición `sla_breached_at IS NULL` hace de
+reclamación), sube un nivel de prioridad y se avisa al técnico asignado y a
+los administradores por notification_outbox. El trigger
+trg_sla_tickets_breach acumula los incumplimientos por cliente, técnico y
+prioridad en sla_breach_counters (breach_stats()).
+
+Con SLA_MONITOR=0 el hilo no arranca; `flask sla-check` hace una pasada.
+"""
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+DEFAULT_SYNC_INTERVAL = 5.0
+DEFAULT_CHANGES_RETENTION = 3600
+
+CLOSED_STATES = ("cerrado", "cancelado", "completado", "finalizado")
+PRIORITY_LADDER = ("Baja", "Media", "Alta", "Urgente")
+
+_CLOSED_SQL = ", ".join(f"'{state}'" for state in CLOSED_STATES)
+_PENDING_SQL = f"""
+    SELECT id, sla_due FROM tickets
+    WHERE sla_due IS NOT NULL AND sla_breached_at IS NULL
+      AND lower(COALESCE(estado, '')) NOT IN ({_CLOSED_SQL})
+"""
+
+
+def parse_due(value) -> datetime | None:
+    """
+    datetime naive (hora local, como se introduce en los formularios) desde
+    sla_due. Una fecha sin hora vence al acabar ese día.
+    """
+    if not value:
+        return None
+    text = str(value).strip()
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    if len(text) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def is_open(estado) -> bool:
+    return (estado or "").strip().lower() not in CLOSED_STATES
+
+
+def bump_priority(prioridad):
+    """Siguiente nivel de PRIORITY_LADDER ('Urgente' se queda; sin prioridad conocida, 'Alta')."""
+    try:
+        index = PRIORITY_LADDER.index(prioridad)
+    except ValueError:
+        return "Alta"
+    return PRIORITY_LADDER[min(index + 1, len(PRIORITY_LADDER) - 1)]
+
+
+class SlaHeap:
+    """
+    Montículo mínimo de (sla_due, ticket_id) con borrado perezoso: `_due`
+    guarda el vencimiento vigente de cada ticket y las entradas del montículo
+    que no coinciden se descartan al llegar arriba.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._due = {}
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, ticket_id):
+        return ticket_id in self._due
+
+    def push(self, ticket_id, due):
+        if self._due.get(ticket_id) == due:
+            return
+        self._due[ticket_id] = due
+        heapq.heappush(self._heap, (due, ticket_id))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(d, t) for t, d in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def discard(self, ticket_id):
+        self._due.pop(ticket_id, None)
+
+    def peek(self):
+        """(sla_due, ticket_id) más próximo o None."""
+        while self._heap:
+            due, ticket_id = self._heap[0]
+            if self._due.get(ticket_id) == due:
+                return due, ticket_id
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Saca y devuelve los ticket_id con sla_due <= now, del más antiguo al más reciente."""
+        due_ids = []
+        while (top := self.peek()) is not None and top[0] <= now:
+            heapq.heappop(self._heap)
+            del self._due[top[1]]
+            due_ids.append(top[1])
+        return due_ids
+
+
+def escalate_ticket(db, ticket_id, now):
+    """
+    Escala `ticket_id` si sigue abierto, vencido y sin escalar. Devuelve
+    True si este proceso lo escaló. Las notificaciones quedan encoladas en la
+    misma transacción; el llamante debe llamar a wake_dispatcher().
+    """
+    from .outbox import enqueue_notifications
+
+    row = db.execute(
+        "SELECT id, titulo, prioridad, estado, sla_due, asignado_a, sla_breached_at FROM tickets WHERE id = ?",
+        (ticket_id,),
+    ).fetchone()
+    if row is None or row["sla_breached_at"] or not is_open(row["estado"]):
+        return False
+    due = parse_due(row["sla_due"])
+    if due is None or due > now:
+        return False
+    new_priority = bump_priority(row["prioridad"])
+    try:
+        claimed = db.execute(
+            "UPDATE tickets SET sla_breached_at = ?, prioridad = ? WHERE id = ? AND sla_breached_at IS NULL",
+            (now.strftime("%Y-%m-%d %H:%M:%S"), new_priority, ticket_id),
+        ).rowcount
+        if claimed:
+            admins = db.execute(
+                "SELECT u.id FROM users u JOIN user_roles ur ON u.id = ur.user_id "
+                "JOIN roles r ON ur.role_id = r.id WHERE r.code = ?",
+                ("admin",),
+            ).fetchall()
+            message = (
+                f"SLA vencido en el trabajo #{ticket_id} «{row['titulo']}» (vencía {row['sla_due']}). "
+                f"Prioridad: {row['prioridad'] or 'sin prioridad'} → {new_priority}."
+            )
+            enqueue_notifications(db, [row["asignado_a"]] + [admin["id"] for admin in admins], message)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return bool(claimed)
+
+
+class SlaMonitor:
+    """Montículo de SLA de un proceso y su posición en sla_ticket_changes."""
+
+    def __init__(self):
+        self.heap = SlaHeap()
+        self.last_seq = 0
+        self._lock = threading.Lock()
+
+    def rebuild(self, db):
+        """Carga los tickets pendientes de vencer. Devuelve cuántos hay."""
+        # El seq se lee antes: un cambio concurrente se volverá a aplicar (es idempotente)
+        last_seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM sla_ticket_changes").fetchone()[0]
+        heap = SlaHeap()
+        for ticket_id, sla_due in db.execute(_PENDING_SQL).fetchall():
+            due = parse_due(sla_due)
+            if due is not None:
+                heap.push(ticket_id, due)
+        with self._lock:
+            self.heap, self.last_seq = heap, last_seq
+        return len(heap)
+
+    def sync(self, db):
+        """Aplica los cambios de sla_ticket_changes posteriores a last_seq. Devuelve cuántos tickets."""
+        changes = db.execute(
+            "SELECT seq, ticket_id FROM sla_ticket_changes WHERE seq > ? ORDER BY seq", (self.last_seq,)
+        ).fetchall()
+        if not changes:
+            return 0
+        if changes[0][0] > self.last_seq + 1:
+            # Hueco: los cambios se purgaron antes de leerlos (proceso parado mucho tiempo)
+            self.rebuild(db)
+            return len(self.heap)
+        ticket_ids = list(dict.fromkeys(ticket_id for _, ticket_id in changes))
+        rows = {}
+        for start in range(0, len(ticket_ids), 500):
+            chunk = ticket_ids[start:start + 500]
+            for row in db.execute(
+                f"SELECT id, sla_due, estado, sla_breached_at FROM tickets WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall():
+                rows[row["id"]] = row
+        with self._lock:
+            for ticket_id in ticket_ids:
+                row = rows.get(ticket_id)
+                due = parse_due(row["sla_due"]) if row is not None else None
+                if due is None or row["sla_breached_at"] or not is_open(row["estado"]):
+                    self.heap.discard(ticket_id)
+                else:
+                    self.heap.push(ticket_id, due)
+            self.last_seq = changes[-1][0]
+        return len(ticket_ids)
+
+    def next_due(self):
+        with self._lock:
+            top = self.heap.peek()
+        return top[0] if top else None
+
+    def escalate_due(self, db, now=None):
+        """Escala los tickets vencidos a `now`. Devuelve los ids escalados por este proceso."""
+        now = now or datetime.now()
+        with self._lock:
+            due_ids = self.heap.pop_due(now)
+        escalated = []
+        for ticket_id in due_ids:
+            try:
+                if escalate_ticket(db, ticket_id, now):
+                    escalated.append(ticket_id)
+            except Exception:
+                # Sale del montículo hasta el próximo cambio del ticket o rebuild()
+                current_app.logger.exception("SLA: error escalando el ticket %s", ticket_id)
+        if escalated:
+            from .outbox import wake_dispatcher
+
+            current_app.logger.info("SLA: %d tickets escalados (%s)", len(escalated), escalated)
+            wake_dispatcher()
+        return escalated
+
+
+def prune_changes(db, older_than_seconds=DEFAULT_CHANGES_RETENTION):
+    """Borra el registro de cambios ya antiguo. Devuelve las filas borradas."""
+    deleted = db.execute(
+        "DELETE FROM sla_ticket_changes WHERE changed_at < datetime('now', ?)", (f"-{int(older_than_seconds)} seconds",)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def breach_stats(db):
+    """
+    Incumplimientos acumulados: {'total': n, 'cliente': [...], 'tecnico': [...],
+    'prioridad': [...]}, cada lista ordenada de más a menos incumplimientos.
+    Lee sla_breach_counters (una fila por valor), no los tickets.
+    """
+    stats = {"total": 0, "cliente": [], "tecnico": [], "prioridad": []}
+    rows = db.execute(
+        """
+        SELECT s.dimension, s.key, s.count, c.nombre AS cliente, u.username AS tecnico
+        FROM sla_breach_counters s
+        LEFT JOIN clientes c ON s.dimension = 'cliente' AND c.id = s.key
+        LEFT JOIN users u ON s.dimension = 'tecnico' AND u.id = s.key
+        WHERE s.count > 0
+        ORDER BY s.dimension, s.count DESC, s.key
+        """
+    ).fetchall()
+    for row in rows:
+        entry = {"key": row["key"], "breaches": row["count"]}
+        if row["dimension"] == "cliente":
+            entry["nombre"] = row["cliente"]
+        elif row["dimension"] == "tecnico":
+            entry["nombre"] = row["tecnico"] or ("Sin asignar" if row["key"] == "" else None)
+        stats[row["dimension"]].append(entry)
+    stats["total"] = sum(entry["breaches"] for entry in stats["prioridad"])
+    return stats
+
+
+# --- Hilo vigilante ---
+
+monitor = SlaMonitor()
+_wake = threading.Event()
+_monitor_lock = threading.Lock()
+_monitor_thread = None
+
+
+def _monitor_loop(app):
+    from .db_utils import get_db
+
+    interval = float(app.config.get("SLA_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL))
+    retention = int(app.config.get("SLA_CHANGES_RETENTION", DEFAULT_CHANGES_RETENTION))
+    try:
+        with app.app_context():
+            monitor.rebuild(get_db())
+    except Exception:
+        app.logger.exception("SLA: error cargando el montículo")
+    last_prune = time.monotonic()
+    while True:
+        timeout = interval
+        next_due = monitor.next_due()
+        if next_due is not None:
+            timeout = min(interval, max(0.0, (next_due - datetime.now()).total_seconds()))
+        _wake.wait(timeout)
+        _wake.clear()
+        try:
+            with app.app_context():
+                db = get_db()
+                monitor.sync(db)
+                monitor.escalate_due(db)
+                if time.monotonic() - last_prune > retention:
+                    prune_changes(db, retention)
+                    last_prune = time.monotonic()
+        except Exception:
+            app.logger.exception("SLA: error en el vigilante")
+
+
+def ensure_sla_monitor():
+    """Arranca el hilo vigilante de este proceso si SLA_MONITOR está activo."""
+    global _monitor_thread
+    if _monitor_thread is not None:
+        return
+    app = current_app._get_current_object()
+    if not app.config.get("SLA_MONITOR", True):
+        return
+    with _monitor_lock:
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=_monitor_loop, args=(app,), name="sla-monitor", daemon=True)
+            _monitor_thread.start()
+
+
+def wake_sla_monitor():
+    """Fuerza una sincronización inmediata (p. ej. tras guardar un ticket con SLA)."""
+    _wake.set()
@@ -0,0 +1,200 @@
+# backend/sql_stats.py
+"""
+Instrumentación SQL por petición.
+
+Cada sentencia ejecutada durante una petición, tanto por las conexiones
+sqlite3 de get_db() como por el engine de SQLAlchemy, se anota en g.sql_stats:
+número de consultas, tiempo total en BD y las más lentas. Las que superan
+SLOW_QUERY_MS se registran en el logger de la app (JsonFormatter, con el
+request_id de la petición) con el SQL normalizado. Con SQL_SERVER_TIMING
+activado la respuesta lleva la cabecera `Server-Timing: db;dur=...`.
+"""
+import heapq
+import re
+import sqlite3
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+
+DEFAULT_SLOW_QUERY_MS = 200.0
+SLOWEST_KEPT = 5
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Forma canónica de una sentencia para agrupar y registrar: sin comentarios,
+    literales sustituidos por ? y listas IN (?, ?, ...) colapsadas.
+    """
+    sql = _COMMENT_RE.sub(" ", sql)
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class RequestSQLStats:
+    """Acumulador de una petición: nº de consultas, ms totales y las SLOWEST_KEPT más lentas."""
+
+    __slots__ = ("count", "total_ms", "_slowest")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self._slowest = []  # min-heap de (ms, sql)
+
+    def add(self, sql: str, duration_ms: float):
+        self.count += 1
+        self.total_ms += duration_ms
+        if len(self._slowest) < SLOWEST_KEPT:
+            heapq.heappush(self._slowest, (duration_ms, sql))
+        elif duration_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, (duration_ms, sql))
+
+    @property
+    def slowest(self) -> list[tuple[float, str]]:
+        """[(ms, sql normalizado)] de mayor a menor."""
+        return [(ms, normalize_sql(sql)) for ms, sql in sorted(self._slowest, reverse=True)]
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "slowest": [{"ms": round(ms, 3), "sql": sql} for ms, sql in self.slowest],
+        }
+
+
+def record_query(sql: str, duration_ms: float):
+    """Anota una sentencia en la petición en curso y registra las lentas."""
+    if not has_app_context():
+        return
+    stats = g.get("sql_stats")
+    if stats is not None:
+        stats.add(sql, duration_ms)
+    threshold = float(current_app.config.get("SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+    if threshold >= 0 and duration_ms >= threshold:
+        current_app.logger.warning(
+            "Consulta lenta (%.1f ms): %s",
+            duration_ms,
+            normalize_sql(sql),
+            extra={"latency_ms": round(duration_ms, 3), "sql": normalize_sql(sql)},
+        )
+
+
+# --- sqlite3 (get_db) ---
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, (time.perf_counter() - t0) * 1000.0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, (time.perf_counter() - t0) * 1000.0)
+
+    def executescript(self, sql_script):
+        t0 = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query(sql_script, (time.perf_counter() - t0) * 1000.0)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Conexión sqlite3 cuyas sentencias se cronometran (pasar como factory= a
+    sqlite3.connect). Connection.execute() de C no pasa por cursor(), así que
+    los atajos se redirigen a un InstrumentedCursor. Se mide execute(): para
+    un SELECT incluye ordenar/agrupar y obtener la primera fila, no el fetch
+    del resto.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+# --- SQLAlchemy ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_stats_t0", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    t0 = conn.info["sql_stats_t0"].pop()
+    record_query(statement, (time.perf_counter() - t0) * 1000.0)
+
+
+def _handle_error(exception_context):
+    # Una sentencia fallida no llega a after_cursor_execute: descartar su t0
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("sql_stats_t0"):
+        t0 = conn.info["sql_stats_t0"].pop()
+        record_query(exception_context.statement or "", (time.perf_counter() - t0) * 1000.0)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+# --- Hooks de petición ---
+
+def get_request_sql_stats() -> RequestSQLStats | None:
+    return g.get("sql_stats") if has_app_context() else None
+
+
+def _start_request_stats():
+    g.sql_stats = RequestSQLStats()
+
+
+def _finish_request_stats(response):
+    stats = g.pop("sql_stats", None)
+    if stats is None:
+        return response
+    if current_app.config.get("SQL_SERVER_TIMING"):
+        timing = f"db;dur={stats.total_ms:.1f};desc=\"{stats.count} queries\""
+        existing = response.headers.get("Server-Timing")
+        response.headers["Server-Timing"] = f"{existing}, {timing}" if existing else timing
+    if stats.count and has_request_context():
+        current_app.logger.debug(
+            "SQL %s %s: %d consultas, %.1f ms",
+            request.method,
+            request.path,
+            stats.count,
+            stats.total_ms,
+            extra={"latency_ms": round(stats.total_ms, 3)},
+        )
+    return response
+
+
+def init_app(app, db=None):
+    """Registra los hooks de petición y, si se pasa, instrumenta el engine de SQLAlchemy."""
+    app.before_request(_start_request_stats)
+    app.after_request(_finish_request_stats)
+    if db is not None:
+        with app.app_context():
+            instrument_engine(db.engine)
@@ -5,6 +5,7 @@ from werkzeug.security import generate_password_hash
 
 from backend.auth import login_required
 from backend.db_utils import get_db
+from backend.phone_directory import invalidate_phone_directory
 
 
 bp = Blueprint('users', __name__, url_prefix='/users')
@@ -175,6 +176,7 @@ def edit_user(user_id):
                     error = f"El rol '{selected_role_code}' seleccionado no es válido."
 
                 db.commit()
+                invalidate_phone_directory()
                 flash('¡Usuario actualizado correctamente!')
                 return redirect(url_for('users.list_users'))
             except sqlite3.IntegrityError:
@@ -206,6 +208,7 @@ def delete_user(user_id):
         db.execute('DELETE FROM users WHERE id = ?', (user_id,))
         db.execute('DELETE FROM user_roles WHERE user_id = ?', (user_id,)) # Also delete from user_roles
         db.commit()
+        invalidate_phone_directory()
         flash('¡Usuario eliminado correctamente!')
     except Exception as e:
         flash(f'Error deleting user: {e}', 'error')
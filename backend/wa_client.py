@@ -1,44 +1,132 @@
+# backend/wa_client.py
+"""
+Transporte único para la WhatsApp Cloud API (Graph API de Meta).
+
+Todas las llamadas salientes pasan por una requests.Session compartida por
+proceso con un pool de conexiones keep-alive a graph.facebook.com, así que
+sólo la primera petición de cada conexión paga DNS + TCP + TLS. Texto y
+plantillas comparten el mismo camino (send_message).
+
+Configuración (entorno o app.config):
+  WHATSAPP_PHONE_NUMBER_ID, WHATSAPP_ACCESS_TOKEN
+  WHATSAPP_GRAPH_VERSION      versión de la Graph API (v22.0)
+  WHATSAPP_POOL_SIZE          conexiones keep-alive por proceso (16)
+  WHATSAPP_CONNECT_TIMEOUT    segundos para conectar (5)
+  WHATSAPP_READ_TIMEOUT       segundos esperando respuesta (15)
+Límites de ritmo y reintentos: ver backend/wa_throttle.py. El resto de la app
+envía a través de backend/messaging.py (MetaBackend usa este módulo).
+"""
 import os
+import threading
 
 import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
 
-GRAPH_BASE = "https://graph.facebook.com/v22.0"
-PHONE_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
-ACCESS_TOKEN = os.getenv("WHATSAPP_ACCESS_TOKEN")
+from .wa_throttle import get_scheduler
 
-def send_whatsapp_text(to_e164: str, text: str):
-    """Envía un mensaje de texto de WhatsApp a un número específico."""
-    url = f"{GRAPH_BASE}/{PHONE_ID}/messages"
+GRAPH_HOST = "https://graph.facebook.com"
+DEFAULT_GRAPH_VERSION = "v22.0"
+DEFAULT_POOL_SIZE = 16
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 15.0
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _cfg(key, default=None):
+    value = os.environ.get(key)
+    if value is None and has_app_context():
+        value = current_app.config.get(key)
+    return default if value is None else value
+
+
+def get_session() -> requests.Session:
+    """Session compartida del proceso (se recrea tras un fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                pool_size = int(_cfg("WHATSAPP_POOL_SIZE", DEFAULT_POOL_SIZE))
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount(GRAPH_HOST, adapter)
+                _session, _session_pid = session, pid
+    return _session
+
+
+def reset_session():
+    """Cierra la Session compartida (p. ej. tras cambiar WHATSAPP_POOL_SIZE)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session, _session_pid = None, None
+
+
+def _timeout(timeout):
+    if timeout is not None:
+        return timeout
+    return (
+        float(_cfg("WHATSAPP_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        float(_cfg("WHATSAPP_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+    )
+
+
+def messages_url() -> str:
+    version = _cfg("WHATSAPP_GRAPH_VERSION", DEFAULT_GRAPH_VERSION)
+    return f"{GRAPH_HOST}/{version}/{_cfg('WHATSAPP_PHONE_NUMBER_ID')}/messages"
+
+
+def send_message(to_e164: str, message_type: str, content: dict, timeout=None):
+    """
+    Envía un mensaje de cualquier tipo ('text', 'template', ...) y devuelve la
+    respuesta JSON de la API. Los errores transitorios se reintentan; si
+    persisten se lanza requests.HTTPError (o WhatsAppRateLimited).
+    """
     headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
+        "Authorization": f"Bearer {_cfg('WHATSAPP_ACCESS_TOKEN')}",
         "Content-Type": "application/json",
     }
     data = {
         "messaging_product": "whatsapp",
         "to": to_e164,         # ejemplo: "346xxxxxxxx"
-        "type": "text",
-        "text": {"body": text}
+        "type": message_type,
+        message_type: content,
     }
-    r = requests.post(url, headers=headers, json=data, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    url = messages_url()
+    timeout = _timeout(timeout)
+
+    def _post():
+        r = get_session().post(url, headers=headers, json=data, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    # Ritmo por phone-number ID y por destinatario, con reintentos (wa_throttle)
+    return get_scheduler().call(_cfg("WHATSAPP_PHONE_NUMBER_ID", ""), to_e164, _post)
+
 
-def send_whatsapp_template(to_e164: str, template_name: str, lang="es"):
+def send_whatsapp_text(to_e164: str, text: str, timeout=None):
+    """Envía un mensaje de texto de WhatsApp a un número específico."""
+    return send_message(to_e164, "text", {"body": text}, timeout=timeout)
+
+
+def send_whatsapp_template(to_e164: str, template_name: str, lang="es", timeout=None):
     """Envía un mensaje de plantilla de WhatsApp a un número específico."""
-    url = f"{GRAPH_BASE}/{PHONE_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "messaging_product": "whatsapp",
-        "to": to_e164,
-        "type": "template",
-        "template": {
-            "name": template_name,
-            "language": {"code": lang}
-        }
-    }
-    r = requests.post(url, headers=headers, json=data, timeout=30)
-    r.raise_for_status()
-    return r.json()
+    return send_message(
+        to_e164,
+        "template",
+        {"name": template_name, "language": {"code": lang}},
+        timeout=timeout,
+    )
+
+
+def response_message_id(response):
+    """wamid de la respuesta de la Graph API ({"messages": [{"id": ...}]}), o None."""
+    if isinstance(response, dict):
+        messages = response.get("messages") or []
+        return messages[0].get("id") if messages else None
+    return response
@@ -0,0 +1,183 @@
+# backend/wa_logs.py
+"""
+Retención y archivo de whatsapp_message_logs.
+
+La tabla "caliente" sólo guarda los últimos WA_LOG_RETENTION_DAYS días (90 por
+defecto); es la que consultan handle_incoming_message, session_window_open y
+el RFQ. `flask wa-logs-archive` mueve las filas más antiguas a tablas
+mensuales whatsapp_message_logs_archive_AAAAMM (según su timestamp) en lotes
+de WA_LOG_ARCHIVE_BATCH_SIZE filas. Cada lote es una transacción corta
+(BEGIN IMMEDIATE, INSERT ... SELECT, DELETE, COMMIT) con una pausa entre lotes
+para no bloquear las escrituras de los webhooks.
+
+El visor /whatsapp/logs pagina por cursor (timestamp, id) sobre la tabla
+caliente o sobre un mes archivado.
+"""
+import base64
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+LOG_TABLE = "whatsapp_message_logs"
+ARCHIVE_PREFIX = "whatsapp_message_logs_archive_"
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_BATCH_PAUSE = 0.05
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_MONTH_RE = re.compile(r"\d{6}")
+PAGE_COLUMNS = (
+    "id, timestamp, direction, from_number, to_number, status, whatsapp_message_id, "
+    "job_id, provider_id, substr(message_body, 1, 200) AS message_body, error_info"
+)
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def archive_table(month: str) -> str:
+    """Nombre de la tabla de archivo de `month` ('AAAAMM')."""
+    if not _MONTH_RE.fullmatch(str(month)):
+        raise ValueError(f"Mes de archivo no válido: {month!r}")
+    return f"{ARCHIVE_PREFIX}{month}"
+
+
+def archive_months(db) -> list[str]:
+    """Meses archivados ('AAAAMM'), del más reciente al más antiguo."""
+    rows = db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name DESC",
+        (ARCHIVE_PREFIX + "%",),
+    ).fetchall()
+    return [row[0][len(ARCHIVE_PREFIX):] for row in rows if _MONTH_RE.fullmatch(row[0][len(ARCHIVE_PREFIX):])]
+
+
+def _columns(db, table):
+    return [row[1] for row in db.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def ensure_archive_table(db, month: str) -> str:
+    """Crea (o completa con columnas nuevas) la tabla de archivo del mes."""
+    table = archive_table(month)
+    db.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {LOG_TABLE} WHERE 0")
+    existing = set(_columns(db, table))
+    for column in _columns(db, LOG_TABLE):
+        if column not in existing:
+            db.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+    db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table} (timestamp, id)")
+    return table
+
+
+def archive_batch(db, cutoff: str, batch_size=DEFAULT_BATCH_SIZE) -> dict[str, int]:
+    """
+    Mueve a su tabla mensual hasta `batch_size` filas con timestamp < `cutoff`
+    (las más antiguas primero) en una sola transacción. Devuelve {mes: filas}.
+    """
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        rows = db.execute(
+            f"SELECT id, strftime('%Y%m', timestamp) AS month FROM {LOG_TABLE} "
+            "WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?",
+            (cutoff, batch_size),
+        ).fetchall()
+        by_month: dict[str, list[int]] = {}
+        for row in rows:
+            by_month.setdefault(row["month"] or "000000", []).append(row["id"])
+        columns = ", ".join(_columns(db, LOG_TABLE))
+        for month, ids in by_month.items():
+            table = ensure_archive_table(db, month)
+            placeholders = ",".join("?" * len(ids))
+            db.execute(
+                f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {LOG_TABLE} WHERE id IN ({placeholders})",
+                ids,
+            )
+            db.execute(f"DELETE FROM {LOG_TABLE} WHERE id IN ({placeholders})", ids)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {month: len(ids) for month, ids in by_month.items()}
+
+
+def retention_cutoff(days, now=None) -> str:
+    # whatsapp_message_logs.timestamp es CURRENT_TIMESTAMP de SQLite, en UTC
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def archive_old_logs(db, days=None, batch_size=None, pause=None, max_batches=None, now=None):
+    """
+    Archiva por lotes todo lo anterior al periodo de retención. Devuelve
+    {'cutoff', 'moved', 'batches', 'months': {mes: filas}}.
+    """
+    days = int(days if days is not None else _config("WA_LOG_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    batch_size = int(batch_size or _config("WA_LOG_ARCHIVE_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+    pause = float(pause if pause is not None else _config("WA_LOG_ARCHIVE_PAUSE", DEFAULT_BATCH_PAUSE))
+    cutoff = retention_cutoff(days, now)
+    result = {"cutoff": cutoff, "moved": 0, "batches": 0, "months": {}}
+    while max_batches is None or result["batches"] < max_batches:
+        moved = archive_batch(db, cutoff, batch_size)
+        if not moved:
+            break
+        result["batches"] += 1
+        for month, count in moved.items():
+            result["moved"] += count
+            result["months"][month] = result["months"].get(month, 0) + count
+        if sum(moved.values()) < batch_size:
+            break
+        if pause > 0:
+            time.sleep(pause)  # deja pasar a otros escritores entre lotes
+    return result
+
+
+def count_archivable(db, days=None, now=None) -> int:
+    days = int(days if days is not None else _config("WA_LOG_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+    return db.execute(
+        f"SELECT COUNT(*) FROM {LOG_TABLE} WHERE timestamp < ?", (retention_cutoff(days, now),)
+    ).fetchone()[0]
+
+
+# --- Visor paginado ---
+
+def encode_log_cursor(timestamp, log_id):
+    raw = json.dumps([timestamp, log_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_log_cursor(cursor):
+    """Devuelve (timestamp, id) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, log_id = json.loads(raw)
+        return str(timestamp), int(log_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def fetch_log_page(db, cursor=None, limit=PAGE_SIZE, month=None):
+    """
+    Una página de logs, del más reciente al más antiguo: (filas, next_cursor).
+    `month` ('AAAAMM') lee la tabla de archivo de ese mes.
+    """
+    table = archive_table(month) if month else LOG_TABLE
+    sql = f"SELECT {PAGE_COLUMNS} FROM {table}"
+    params = []
+    if cursor is not None:
+        sql += " WHERE (timestamp, id) < (?, ?)"
+        params.extend(cursor)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+    rows = db.execute(sql, params).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_log_cursor(rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, next_cursor
@@ -0,0 +1,257 @@
+# backend/wa_status.py
+"""
+Estados de entrega de WhatsApp (queued → sent → delivered → read / failed).
+
+En vez de una fila de whatsapp_message_logs por cada callback de estado, los
+estados se aplican sobre las filas del mensaje saliente original (clave:
+whatsapp_message_id, el SID de Twilio o el wamid de Meta): `status` sólo
+avanza (un 'delivered' tardío no pisa un 'read') y sent_at / delivered_at /
+read_at / failed_at guardan la primera vez que se vio cada estado. Si el
+mensaje no está en la tabla (p. ej. enviado desde la consola de Twilio) se
+crea una única fila para él.
+
+Los callbacks se acumulan en memoria, fusionados por mensaje, y un hilo los
+escribe en una sola transacción cada WA_STATUS_FLUSH_INTERVAL segundos (como
+mucho MAX_FLUSH_INTERVAL) o al llegar a WA_STATUS_BATCH_SIZE mensajes. El
+webhook responde 200 antes de escribir y Twilio no reenvía, así que al salir
+el proceso (sys.exit, SIGTERM de gunicorn) un manejador atexit escribe lo
+acumulado; sólo una muerte brusca (SIGKILL, OOM) pierde la ventana sin
+escribir: como mucho MAX_FLUSH_INTERVAL segundos o WA_STATUS_BATCH_SIZE
+mensajes de estados, nunca los mensajes en sí. delivery_report() resume las
+latencias sent→delivered→read por día (`flask wa-delivery-report`).
+"""
+import atexit
+import threading
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+MAX_FLUSH_INTERVAL = 5.0
+DEFAULT_BATCH_SIZE = 200
+
+# Orden de los estados: un callback sólo cambia `status` si avanza
+STATUS_RANK = {
+    "queued": 0, "accepted": 0, "scheduled": 0, "sending": 1,
+    "sent": 2, "delivered": 3, "read": 4, "undelivered": 5, "failed": 5,
+}
+TIMELINE_COLUMNS = {
+    "sent": "sent_at", "delivered": "delivered_at", "read": "read_at",
+    "undelivered": "failed_at", "failed": "failed_at",
+}
+
+_RANK_SQL = "CASE status " + " ".join(
+    f"WHEN '{status}' THEN {rank}" for status, rank in STATUS_RANK.items()
+) + " ELSE -1 END"
+
+
+def _utcnow():
+    # Mismo formato y zona que CURRENT_TIMESTAMP (columna timestamp)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def combine_updates(target, update):
+    """Fusiona `update` en `target` (ambos dicts por mensaje) y devuelve `target`."""
+    if update.get("rank", -1) >= target.get("rank", -1) and "status" in update:
+        target["status"], target["rank"] = update["status"], update["rank"]
+    for column in ("sent_at", "delivered_at", "read_at", "failed_at"):
+        if update.get(column) and (target.get(column) is None or update[column] < target[column]):
+            target[column] = update[column]
+    for key in ("error", "to_number"):
+        if update.get(key):
+            target.setdefault(key, update[key])
+    return target
+
+
+def status_update(status, at, error=None, to_number=None):
+    """Dict de actualización para un callback de estado."""
+    status = (status or "").lower()
+    update = {"status": status, "rank": STATUS_RANK.get(status, -1), "error": error, "to_number": to_number}
+    column = TIMELINE_COLUMNS.get(status)
+    if column:
+        update[column] = at
+    return update
+
+
+def apply_status_updates(db, updates):
+    """
+    Escribe {message_id: update} en una transacción: UPDATE de las filas
+    existentes e INSERT de una fila para los mensajes desconocidos.
+    """
+    if not updates:
+        return 0
+    ids = list(updates)
+    if db.in_transaction:
+        db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        known = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            known.update(
+                row[0]
+                for row in db.execute(
+                    f"SELECT DISTINCT whatsapp_message_id FROM whatsapp_message_logs "
+                    f"WHERE whatsapp_message_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+            )
+        db.executemany(
+            f"""
+            UPDATE whatsapp_message_logs SET
+                status = CASE WHEN ? > {_RANK_SQL} THEN ? ELSE status END,
+                sent_at = COALESCE(sent_at, ?),
+                delivered_at = COALESCE(delivered_at, ?),
+                read_at = COALESCE(read_at, ?),
+                failed_at = COALESCE(failed_at, ?),
+                error_info = COALESCE(?, error_info)
+            WHERE whatsapp_message_id = ?
+            """,
+            [
+                (u["rank"], u["status"], u.get("sent_at"), u.get("delivered_at"), u.get("read_at"),
+                 u.get("failed_at"), u.get("error"), message_id)
+                for message_id, u in updates.items() if message_id in known
+            ],
+        )
+        db.executemany(
+            "INSERT INTO whatsapp_message_logs (direction, to_number, message_body, whatsapp_message_id, status, "
+            "sent_at, delivered_at, read_at, failed_at, error_info) VALUES ('outbound', ?, '', ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (u.get("to_number"), message_id, u["status"], u.get("sent_at"), u.get("delivered_at"),
+                 u.get("read_at"), u.get("failed_at"), u.get("error"))
+                for message_id, u in updates.items() if message_id not in known
+            ],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(updates)
+
+
+# --- Acumulador en memoria ---
+
+_pending: dict[str, dict] = {}
+_pending_lock = threading.Lock()
+
+
+def record_status(message_id, status, at=None, error=None, to_number=None):
+    """
+    Encola un callback de estado. Con WA_STATUS_FLUSHER desactivado se
+    escribe en el momento (tests, procesos sin hilos).
+    """
+    if not message_id or not status:
+        return
+    at = at or _utcnow()
+    with _pending_lock:
+        combine_updates(_pending.setdefault(message_id, {}), status_update(status, at, error, to_number))
+        size = len(_pending)
+    if not current_app.config.get("WA_STATUS_FLUSHER", True):
+        from .db_utils import get_db
+
+        flush_statuses(get_db())
+        return
+    _wake_flusher(size >= int(current_app.config.get("WA_STATUS_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+
+
+def flush_statuses(db):
+    """Escribe los estados acumulados. Si falla, los devuelve al acumulador."""
+    global _pending
+    with _pending_lock:
+        updates, _pending = _pending, {}
+    try:
+        return apply_status_updates(db, updates)
+    except Exception:
+        with _pending_lock:
+            for message_id, update in updates.items():
+                combine_updates(_pending.setdefault(message_id, {}), update)
+        raise
+
+
+_wake = threading.Event()
+_flusher_lock = threading.Lock()
+_flusher_thread = None
+
+
+def _flusher_loop(app):
+    from .db_utils import get_db
+
+    interval = min(float(app.config.get("WA_STATUS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)), MAX_FLUSH_INTERVAL)
+    while True:
+        _wake.wait(interval)
+        _wake.clear()
+        if not _pending:
+            continue
+        try:
+            with app.app_context():
+                flush_statuses(get_db())
+        except Exception:
+            app.logger.exception("Estados WhatsApp: error escribiendo el lote")
+
+
+def _flush_at_exit(app):
+    """Escribe lo acumulado al terminar el proceso: el hilo es daemon y moriría con él."""
+    if not _pending:
+        return
+    from .db_utils import get_db
+
+    try:
+        with app.app_context():
+            flush_statuses(get_db())
+    except Exception:
+        app.logger.exception("Estados WhatsApp: no se pudo escribir el lote al salir (%d mensajes)", len(_pending))
+
+
+def _wake_flusher(now):
+    """Arranca el hilo si hace falta; `now` fuerza la escritura inmediata (lote lleno)."""
+    global _flusher_thread
+    if _flusher_thread is None:
+        app = current_app._get_current_object()
+        with _flusher_lock:
+            if _flusher_thread is None:
+                _flusher_thread = threading.Thread(
+                    target=_flusher_loop, args=(app,), name="wa-status-flusher", daemon=True
+                )
+                _flusher_thread.start()
+                atexit.register(_flush_at_exit, app)
+    if now:
+        _wake.set()
+
+
+# --- Informe de latencias ---
+
+def delivery_report(db, days=7, now=None):
+    """
+    Por día de envío: mensajes salientes, entregados, leídos y fallidos, y
+    latencias medias/máximas en segundos de envío→entrega y entrega→lectura.
+    Cada mensaje cuenta una vez aunque tenga varias filas (RFQ por material).
+    """
+    now = now or datetime.now(timezone.utc)
+    since = (now - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    rows = db.execute(
+        """
+        SELECT date(sent) AS day,
+               COUNT(*) AS messages,
+               COUNT(delivered) AS delivered,
+               COUNT(read) AS read,
+               COUNT(failed) AS failed,
+               AVG((julianday(delivered) - julianday(sent)) * 86400) AS avg_delivery_s,
+               MAX((julianday(delivered) - julianday(sent)) * 86400) AS max_delivery_s,
+               AVG((julianday(read) - julianday(delivered)) * 86400) AS avg_read_s
+        FROM (
+            SELECT whatsapp_message_id,
+                   MIN(COALESCE(sent_at, timestamp)) AS sent,
+                   MIN(delivered_at) AS delivered,
+                   MIN(read_at) AS read,
+                   MIN(failed_at) AS failed
+            FROM whatsapp_message_logs
+            WHERE direction = 'outbound' AND whatsapp_message_id IS NOT NULL AND timestamp >= ?
+            GROUP BY whatsapp_message_id
+        )
+        GROUP BY day
+        ORDER BY day
+        """,
+        (since,),
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,296 @@
+# backend/wa_throttle.py
+"""
+Planificador de envíos salientes de WhatsApp: limita el ritmo y reintenta.
+
+Meta y Twilio limitan por número emisor (phone-number ID / número 'from') y
+también por par emisor-destinatario. En lugar de fallar a mitad de una ráfaga
+(p. ej. un mantenimiento que avisa a 200 clientes), cada envío pasa por
+OutboundScheduler.call(), que:
+
+  1. espera un token del bucket del emisor (ritmo sostenido + ráfaga);
+  2. respeta un intervalo mínimo entre mensajes al mismo destinatario;
+  3. reintenta los errores transitorios (429, 5xx, fallos de conexión, códigos de
+     throttling de Meta) con espera exponencial y jitter, respetando
+     Retry-After cuando la API lo envía.
+
+Si la espera total supera max_wait se lanza WhatsAppRateLimited en vez de
+bloquear indefinidamente al llamante. Dentro de una petición HTTP el tope
+baja a WHATSAPP_REQUEST_MAX_WAIT (limit_wait, fijado por un hook de
+create_app): la petición no se queda colgada un minuto por un envío; los
+hilos en segundo plano (outbox) conservan el tope largo y reintentan.
+
+Sólo se reintenta lo que no pudo llegar a Meta/Twilio: fallos de conexión,
+429 y 5xx. Un ReadTimeout no: la petición pudo entregarse y reintentarla
+duplicaría el mensaje.
+
+También decide si un mensaje libre es posible: fuera de la ventana de 24 h
+desde el último mensaje entrante del destinatario sólo se admiten plantillas
+(session_window_open).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+
+import requests
+from flask import current_app, has_app_context
+
+from .phone_directory import to_e164
+
+DEFAULT_RATE_PER_SEC = 20.0      # mensajes/s sostenidos por emisor
+DEFAULT_BURST = 40
+DEFAULT_RECIPIENT_INTERVAL = 1.0  # s mínimos entre mensajes al mismo destinatario
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+DEFAULT_MAX_WAIT = 60.0
+DEFAULT_REQUEST_MAX_WAIT = 5.0   # s de espera máxima de un envío hecho dentro de una petición
+RECIPIENT_PRUNE_MIN = 1024       # tamaño a partir del cual se purgan los huecos ya pasados
+SESSION_WINDOW = timedelta(hours=24)
+
+# Códigos de error de la Graph API que indican throttling o fallo transitorio
+META_RETRYABLE_CODES = {4, 80007, 130429, 131000, 131016, 131056, 133004}
+
+
+class WhatsAppRateLimited(Exception):
+    """El envío habría tenido que esperar más de max_wait segundos."""
+
+
+class TokenBucket:
+    """Bucket clásico: `rate` tokens/s, capacidad `burst`. Thread-safe."""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Consume un token (aunque quede en deuda) y devuelve los segundos a esperar."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+def _cfg(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def retry_after_seconds(exc) -> float | None:
+    """Retry-After de una respuesta HTTP (sólo en segundos), si lo hay."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(exc) -> bool:
+    """
+    Errores transitorios que merece la pena reintentar sin riesgo de duplicar
+    el envío: la conexión no llegó a establecerse (ConnectTimeout es también
+    ConnectionError), 429, 5xx o códigos de throttling de la Graph API.
+    """
+    if isinstance(exc, requests.ReadTimeout):
+        return False  # el POST pudo llegar: reintentar podría entregarlo dos veces
+    if isinstance(exc, requests.ConnectionError):
+        return True
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "status", None)
+    if status == 429 or (isinstance(status, int) and status >= 500):
+        return True
+    if response is not None:
+        try:
+            code = (response.json().get("error") or {}).get("code")
+        except (ValueError, AttributeError):
+            code = None
+        return code in META_RETRYABLE_CODES
+    return False
+
+
+# Tope de espera del contexto actual (None: el del planificador); ver limit_wait
+_wait_limit: ContextVar[float | None] = ContextVar("wa_wait_limit", default=None)
+
+
+def current_wait_limit() -> float | None:
+    return _wait_limit.get()
+
+
+def set_wait_limit(seconds):
+    """Fija el tope de espera del contexto actual; devuelve el token para reset_wait_limit()."""
+    return _wait_limit.set(seconds)
+
+
+def reset_wait_limit(token):
+    _wait_limit.reset(token)
+
+
+@contextmanager
+def limit_wait(seconds):
+    """Limita a `seconds` la espera de los envíos hechos dentro del bloque (None: sin límite extra)."""
+    token = set_wait_limit(seconds)
+    try:
+        yield
+    finally:
+        reset_wait_limit(token)
+
+
+class OutboundScheduler:
+    def __init__(self, rate=DEFAULT_RATE_PER_SEC, burst=DEFAULT_BURST,
+                 recipient_interval=DEFAULT_RECIPIENT_INTERVAL, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_cap=DEFAULT_BACKOFF_CAP,
+                 max_wait=DEFAULT_MAX_WAIT, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.recipient_interval = recipient_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_wait = max_wait
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets: dict[str, TokenBucket] = {}
+        self._next_to_recipient: dict[tuple[str, str], float] = {}
+        self._prune_at = RECIPIENT_PRUNE_MIN
+        self._lock = threading.Lock()
+
+    def _bucket(self, sender) -> TokenBucket:
+        bucket = self._buckets.get(sender)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(sender, TokenBucket(self.rate, self.burst, self._clock))
+        return bucket
+
+    def _recipient_delay(self, sender, recipient) -> float:
+        """Reserva el próximo hueco para el par (emisor, destinatario) y devuelve la espera."""
+        if not recipient or self.recipient_interval <= 0:
+            return 0.0
+        key = (sender, recipient)
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_to_recipient.get(key, now))
+            self._next_to_recipient[key] = slot + self.recipient_interval
+            if len(self._next_to_recipient) > self._prune_at:
+                # Un hueco ya pasado no retrasa a nadie: fuera, para no crecer con cada destinatario
+                self._next_to_recipient = {k: t for k, t in self._next_to_recipient.items() if t > now}
+                self._prune_at = max(RECIPIENT_PRUNE_MIN, 2 * len(self._next_to_recipient))
+            return slot - now
+
+    def _max_wait(self) -> float:
+        limit = _wait_limit.get()
+        return self.max_wait if limit is None else min(self.max_wait, limit)
+
+    def _wait_turn(self, sender, recipient, waited):
+        delay = max(self._bucket(sender).reserve(), self._recipient_delay(sender, recipient))
+        max_wait = self._max_wait()
+        if waited + delay > max_wait:
+            raise WhatsAppRateLimited(
+                f"Envío a {recipient} aplazado más de {max_wait:.0f}s por el límite de {sender}"
+            )
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+    def backoff(self, attempt) -> float:
+        """Espera exponencial con 'full jitter': uniforme en [0, min(cap, base·2^intento)]."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def call(self, sender, recipient, send, retryable=is_retryable):
+        """
+        Ejecuta send() respetando los límites de `sender` y `recipient`; reintenta
+        mientras retryable(exc) y queden intentos. Propaga la última excepción.
+        """
+        waited = 0.0
+        attempt = 0
+        while True:
+            waited += self._wait_turn(sender, recipient, waited)
+            try:
+                return send()
+            except Exception as exc:
+                if attempt >= self.max_retries or not retryable(exc):
+                    raise
+                delay = retry_after_seconds(exc)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if waited + delay > self._max_wait():
+                    raise
+                if has_app_context():
+                    current_app.logger.warning(
+                        "WhatsApp: reintento %d para %s en %.2fs (%s)", attempt + 1, recipient, delay, exc
+                    )
+                self._sleep(delay)
+                waited += delay
+                attempt += 1
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> OutboundScheduler:
+    """Planificador del proceso, configurado desde app.config la primera vez."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OutboundScheduler(
+                    rate=float(_cfg("WHATSAPP_RATE_PER_SEC", DEFAULT_RATE_PER_SEC)),
+                    burst=float(_cfg("WHATSAPP_BURST", DEFAULT_BURST)),
+                    recipient_interval=float(_cfg("WHATSAPP_RECIPIENT_INTERVAL", DEFAULT_RECIPIENT_INTERVAL)),
+                    max_retries=int(_cfg("WHATSAPP_MAX_RETRIES", DEFAULT_MAX_RETRIES)),
+                    max_wait=float(_cfg("WHATSAPP_MAX_WAIT", DEFAULT_MAX_WAIT)),
+                )
+    return _scheduler
+
+
+def reset_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = None
+
+
+def number_variants(number) -> list[str]:
+    """
+    Formas en que `number` puede figurar en whatsapp_message_logs.from_number:
+    tal cual, en E.164 ("+34600111222") y E.164 sin '+' (como lo envía Meta).
+    Así un whatsapp_number guardado como "600 111 222" encuentra los entrantes.
+    """
+    variants = {str(number)}
+    e164 = to_e164(number)
+    if e164:
+        variants.update((e164, e164[1:]))
+    return sorted(variants)
+
+
+def session_window_open(db, number, now=None) -> bool:
+    """
+    True si el destinatario escribió en las últimas 24 h (se pueden enviar
+    mensajes libres); si no, sólo se admiten plantillas aprobadas.
+    """
+    variants = number_variants(number)
+    row = db.execute(
+        "SELECT MAX(timestamp) FROM whatsapp_message_logs WHERE direction = 'inbound' "
+        f"AND from_number IN ({','.join('?' * len(variants))})",
+        variants,
+    ).fetchone()
+    last_inbound = row[0] if row else None
+    if not last_inbound:
+        return False
+    now = now or datetime.utcnow()
+    try:
+        last = datetime.fromisoformat(str(last_inbound).replace("T", " ")[:19])
+    except ValueError:
+        return False
+    return now - last < SESSION_WINDOW
@@ -3,35 +3,16 @@ import hashlib
 import hmac
 import os
 
-import requests
 from flask import Blueprint, abort, current_app, jsonify, request
 
-whatsapp_bp = Blueprint("whatsapp", __name__)
+# Envío compartido con el resto de la app (backend configurado en messaging)
+from .messaging import send_whatsapp_text
 
-GRAPH_BASE = "https://graph.facebook.com/v21.0"  # usa la versión que tengas disponible
+whatsapp_bp = Blueprint("whatsapp", __name__)
 
 def _cfg(key, default=None):
     return os.environ.get(key, current_app.config.get(key, default))
 
-def send_whatsapp_text(to_number: str, body: str):
-    """
-    Enviar texto por Cloud API.
-    to_number: '34633660438' (sin +, en E.164 se suele usar +34..., Cloud API admite ambos; usa formato internacional)
-    """
-    phone_id = _cfg("WHATSAPP_PHONE_NUMBER_ID")
-    token    = _cfg("WHATSAPP_ACCESS_TOKEN")
-    url = f"{GRAPH_BASE}/{phone_id}/messages"
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to_number,
-        "type": "text",
-        "text": {"body": body}
-    }
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    r = requests.post(url, json=payload, headers=headers, timeout=10)
-    r.raise_for_status()
-    return r.json()
-
 @whatsapp_bp.get("/whatsapp")
 def verify():
     # Webhook verification (Meta)
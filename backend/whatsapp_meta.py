@@ -2,191 +2,181 @@ import hashlib
 import hmac
 import json
 import os
-import re
+import sqlite3
 
 from flask import Blueprint, current_app, jsonify, request
 
-from .db_utils import _execute_sql, get_db  # Import _execute_sql
-from .wa_client import send_whatsapp_text
+from .db_utils import get_db
+from .inbound_events import record_inbound_events, wake_inbound_worker
+from .phone_directory import resolve_number
+from .quote_parser import parse_quote_reply, split_reply_by_material
+from .messaging import send_whatsapp_text
 
 whatsapp_meta_bp = Blueprint('whatsapp_meta', __name__, url_prefix='/webhooks/whatsapp')
 
 
 
-def save_whatsapp_log(job_id, material_id, provider_id, direction, from_number, to_number, message_body, whatsapp_message_id=None, status=None, error_info=None):
-    db = get_db()
+def save_whatsapp_log(job_id, material_id, provider_id, direction, from_number, to_number, message_body, whatsapp_message_id=None, status=None, error_info=None, db=None, commit=True):
+    db = db or get_db()
     if db is None:
         current_app.logger.error("Database connection error in save_whatsapp_log.")
         return
-    cursor = db.cursor()
-    _execute_sql(
+    db.execute(
         """
         INSERT INTO whatsapp_message_logs (job_id, material_id, provider_id, direction, from_number, to_number, message_body, whatsapp_message_id, status, error_info)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """,
         (job_id, material_id, provider_id, direction, from_number, to_number, message_body, whatsapp_message_id, status, error_info),
-        cursor=cursor,
-        commit=True
     )
+    if commit:
+        db.commit()
     current_app.logger.info(f"WhatsApp log saved: {direction} from {from_number} to {to_number} - {message_body}")
 
-def handle_incoming_message(from_number, message_body, whatsapp_message_id):
+def handle_incoming_message(from_number, message_body, whatsapp_message_id, db=None, commit=True, context_message_id=None):
+    """
+    Procesa la respuesta de un proveedor: la enlaza con su cotización pendiente,
+    extrae el importe y deja constancia en whatsapp_message_logs. Devuelve el
+    estado del log ('processed', 'unprocessed' o 'received'). Con commit=False
+    el llamante confirma (inbound_events procesa lotes en una transacción).
+
+    Un RFQ de varios materiales es un solo mensaje (mismo wamid en todas sus
+    filas de provider_quotes): la respuesta se enlaza con todo el RFQ, el que
+    cita (`context_message_id`, si el proveedor respondió citándolo) o el
+    último enviado, y el importe de cada material sale del trozo del mensaje
+    que lo menciona (quote_parser.split_reply_by_material).
+    """
     current_app.logger.info(f"Incoming WhatsApp message from {from_number}: {message_body}")
 
-    db = get_db()
+    db = db or get_db()
     if db is None:
         current_app.logger.error("Database connection error in handle_incoming_message.")
-        return
-    cursor = db.cursor()
+        return None
+    to_number = current_app.config.get('WHATSAPP_PHONE_NUMBER_ID')
+
+    def _log(status, error_info=None):
+        save_whatsapp_log(
+            job_id=job_id, material_id=material_id, provider_id=provider_id,
+            direction='inbound', from_number=from_number, to_number=to_number,
+            message_body=message_body, whatsapp_message_id=whatsapp_message_id,
+            status=status, error_info=error_info, db=db, commit=commit,
+        )
+        return status
 
-    provider_id = None
     job_id = None
     material_id = None
-    quote_amount = None
-    quote_currency = 'EUR' # Default currency
 
-    # 1. Identify the provider based on from_number
-    # Assuming provider phone numbers are stored in a 'phone_number' column in the 'providers' table
-    # We need to normalize the phone number format for comparison (e.g., remove '+')
-    normalized_from_number = from_number.replace('+', '') # Example normalization
-
-    provider_row = _execute_sql(
-        "SELECT id FROM providers WHERE whatsapp_number = ? OR phone_number = ?",
-        (normalized_from_number, normalized_from_number),
-        cursor=cursor,
-        fetchone=True
-    )
-    if provider_row:
-        provider_id = provider_row['id']
+    # 1. Identify the provider based on from_number (phone_directory: E.164 + caché)
+    provider_id = resolve_number(db, from_number).get('provider')
+    if provider_id:
         current_app.logger.info(f"Identified provider_id: {provider_id} from number {from_number}")
     else:
         current_app.logger.warning(f"Could not identify provider from number: {from_number}")
         # Save log without provider_id, job_id, material_id
-        save_whatsapp_log(
-            job_id=None, material_id=None, provider_id=None,
-            direction='inbound', from_number=from_number,
-            to_number=current_app.config.get('WHATSAPP_PHONE_NUMBER_ID'),
-            message_body=message_body, whatsapp_message_id=whatsapp_message_id,
-            status='received', error_info='Provider not identified'
-        )
-        return # Cannot process further without a provider
-
-    # 2. Find the most recent 'pending' quote request sent to this provider
-    # Look for an outbound message to this provider that is part of a pending quote request
-    # This is a bit tricky. We need to link whatsapp_message_logs to provider_quotes.
-    # A simpler approach for now: find the most recent outbound message to this provider
-    # that has an associated job_id and material_id, and then check if there's a pending quote.
+        return _log('received', 'Provider not identified') # Cannot process further without a provider
 
-    # Find the most recent outbound message to this provider
-    last_outbound_log = _execute_sql(
-        """
-        SELECT job_id, material_id
-        FROM whatsapp_message_logs
-        WHERE provider_id = ? AND direction = 'outbound'
-        ORDER BY timestamp DESC
-        LIMIT 1
-        """,
-        (provider_id,),
-        cursor=cursor,
-        fetchone=True
-    )
-
-    if last_outbound_log and last_outbound_log['job_id'] and last_outbound_log['material_id']:
-        job_id = last_outbound_log['job_id']
-        material_id = last_outbound_log['material_id']
-
-        # Check if there's a pending quote for this job, material, and provider
-        pending_quote = _execute_sql(
+    # 2. Find the RFQ this reply answers: the quoted message if the provider
+    # replied to it, else the most recent outbound message with job/material.
+    pending = []
+    if context_message_id:
+        pending = db.execute(
+            """
+            SELECT id, job_id, material_id FROM provider_quotes
+            WHERE provider_id = ? AND status = 'pending' AND whatsapp_message_id = ?
+            ORDER BY material_id
+            """,
+            (provider_id, context_message_id),
+        ).fetchall()
+    if not pending:
+        last_outbound_log = db.execute(
             """
-            SELECT id FROM provider_quotes
-            WHERE job_id = ? AND material_id = ? AND provider_id = ? AND status = 'pending'
-            ORDER BY id DESC
+            SELECT job_id, material_id, whatsapp_message_id
+            FROM whatsapp_message_logs
+            WHERE provider_id = ? AND direction = 'outbound'
+            ORDER BY timestamp DESC, id DESC
             LIMIT 1
             """,
-            (job_id, material_id, provider_id),
-            cursor=cursor,
-            fetchone=True
-        )
-        if not pending_quote:
+            (provider_id,),
+        ).fetchone()
+        if not (last_outbound_log and last_outbound_log['job_id'] and last_outbound_log['material_id']):
+            current_app.logger.warning(f"No recent outbound message with job/material ID found for provider {provider_id}")
+            return _log('received', 'No recent outbound message with job/material ID')
+        job_id = last_outbound_log['job_id']
+        material_id = last_outbound_log['material_id']
+        if last_outbound_log['whatsapp_message_id']:
+            # Todos los materiales pendientes del mismo mensaje RFQ
+            pending = db.execute(
+                """
+                SELECT id, job_id, material_id FROM provider_quotes
+                WHERE provider_id = ? AND status = 'pending' AND whatsapp_message_id = ? AND job_id = ?
+                ORDER BY material_id
+                """,
+                (provider_id, last_outbound_log['whatsapp_message_id'], job_id),
+            ).fetchall()
+        if not pending:
+            pending = db.execute(
+                """
+                SELECT id, job_id, material_id FROM provider_quotes
+                WHERE job_id = ? AND material_id = ? AND provider_id = ? AND status = 'pending'
+                ORDER BY id DESC
+                LIMIT 1
+                """,
+                (job_id, material_id, provider_id),
+            ).fetchall()
+        if not pending:
             current_app.logger.warning(f"No pending quote found for provider {provider_id}, job {job_id}, material {material_id}")
             # Log and return, as we can't link this response to a specific pending request
-            save_whatsapp_log(
-                job_id=job_id, material_id=material_id, provider_id=provider_id,
-                direction='inbound', from_number=from_number,
-                to_number=current_app.config.get('WHATSAPP_PHONE_NUMBER_ID'),
-                message_body=message_body, whatsapp_message_id=whatsapp_message_id,
-                status='received', error_info='No pending quote found'
-            )
-            return
+            return _log('received', 'No pending quote found')
+    job_id = pending[0]['job_id']
+    material_id = pending[0]['material_id'] if len(pending) == 1 else None
+
+    # 3. Parse the reply: amount, currency, VAT, delivery date and stock (backend.quote_parser)
+    parsed = parse_quote_reply(message_body)
+    current_app.logger.info(f"Parsed quote reply: {parsed}")
+    if len(pending) == 1:
+        replies = {pending[0]['material_id']: parsed}
     else:
-        current_app.logger.warning(f"No recent outbound message with job/material ID found for provider {provider_id}")
-        # Log and return
-        save_whatsapp_log(
-            job_id=None, material_id=None, provider_id=provider_id,
-            direction='inbound', from_number=from_number,
-            to_number=current_app.config.get('WHATSAPP_PHONE_NUMBER_ID'),
-            message_body=message_body, whatsapp_message_id=whatsapp_message_id,
-            status='received', error_info='No recent outbound message with job/material ID'
-        )
-        return
-
-    # 3. Parse the message_body for a quote amount
-    # Enhanced regex to look for numbers near keywords like 'precio', 'costo', 'cotizacion', '€', 'euros'
-    # It tries to capture a number (integer or decimal with comma/dot)
-    # and is more flexible about surrounding text.
-    match = re.search(
-        r'(?:precio|costo|cotizaci[oó]n|valor|total|es)\s*[:=]?\s*(\d+[\.,]?\d*)\s*(?:€|eur|euros)?'
-        r'|(\d+[\.,]?\d*)\s*(?:€|eur|euros)?',
-        message_body, re.IGNORECASE
-    )
-    if match:
-        # Prioritize the number found after a keyword, otherwise take the standalone number
-        quote_amount_str = match.group(1) if match.group(1) else match.group(2)
-        if quote_amount_str:
-            quote_amount_str = quote_amount_str.replace(',', '.') # Replace comma decimal with dot
-            try:
-                quote_amount = float(quote_amount_str)
-                current_app.logger.info(f"Parsed quote amount: {quote_amount}")
-            except ValueError:
-                current_app.logger.warning(f"Could not convert '{quote_amount_str}' to float.")
-        else:
-            current_app.logger.warning(f"Could not extract quote amount from message: {message_body}")
-    else:
-        current_app.logger.warning(f"Could not parse quote amount from message: {message_body}")
-
-    # 4. Update the provider_quotes table
-    if job_id and material_id and provider_id and quote_amount is not None:
-        _execute_sql(
+        placeholders = ','.join('?' * len(pending))
+        materials = db.execute(
+            f"SELECT id, nombre FROM materiales WHERE id IN ({placeholders})",
+            [row['material_id'] for row in pending],
+        ).fetchall()
+        replies = {}
+        for mentioned_id, part in split_reply_by_material(message_body, materials).items():
+            part_parsed = parse_quote_reply(part)
+            # IVA, plazo o stock dichos una vez para todo el pedido valen para cada material
+            for field in ('vat_included', 'delivery_date', 'stock'):
+                if part_parsed[field] is None:
+                    part_parsed[field] = parsed[field]
+            replies[mentioned_id] = part_parsed
+        if not replies and parsed['amount'] is None and parsed['stock'] is not None:
+            # "No tenemos stock" sin nombrar materiales: vale para todo el RFQ
+            replies = {row['material_id']: parsed for row in pending}
+
+    # 4. Update the provider_quotes rows (a "no stock" reply without a price also counts as an answer)
+    answered = [
+        (reply['amount'], reply['currency'], message_body, whatsapp_message_id,
+         reply['vat_included'], reply['delivery_date'], reply['stock'], row['id'])
+        for row in pending
+        for reply in [replies.get(row['material_id'])]
+        if reply and (reply['amount'] is not None or reply['stock'] is not None)
+    ]
+    if answered:
+        db.executemany(
             """
             UPDATE provider_quotes
             SET quote_amount = ?, quote_currency = ?, quote_date = CURRENT_TIMESTAMP,
-                response_message = ?, status = 'received', whatsapp_message_id = ?
-            WHERE job_id = ? AND material_id = ? AND provider_id = ? AND status = 'pending'
+                response_message = ?, status = 'received', whatsapp_message_id = ?,
+                vat_included = ?, delivery_date = ?, stock_status = ?
+            WHERE id = ? AND status = 'pending'
             """,
-            (quote_amount, quote_currency, message_body, whatsapp_message_id,
-             job_id, material_id, provider_id),
-            cursor=cursor,
-            commit=True
-        )
-        current_app.logger.info(f"Updated provider_quotes for job {job_id}, material {material_id}, provider {provider_id} with amount {quote_amount}")
-        # Update the log with the determined job_id, material_id, provider_id
-        save_whatsapp_log(
-            job_id=job_id, material_id=material_id, provider_id=provider_id,
-            direction='inbound', from_number=from_number,
-            to_number=current_app.config.get('WHATSAPP_PHONE_NUMBER_ID'),
-            message_body=message_body, whatsapp_message_id=whatsapp_message_id,
-            status='processed' # Mark as processed after updating quote
-        )
-    else:
-        current_app.logger.warning(f"Not enough info to update provider_quotes. Job: {job_id}, Material: {material_id}, Provider: {provider_id}, Amount: {quote_amount}")
-        # If we couldn't update the quote, log the message with the determined IDs but status 'unprocessed'
-        save_whatsapp_log(
-            job_id=job_id, material_id=material_id, provider_id=provider_id,
-            direction='inbound', from_number=from_number,
-            to_number=current_app.config.get('WHATSAPP_PHONE_NUMBER_ID'),
-            message_body=message_body, whatsapp_message_id=whatsapp_message_id,
-            status='unprocessed', error_info='Failed to update provider_quotes'
+            answered,
         )
+        current_app.logger.info(f"Updated {len(answered)} provider_quotes for job {job_id}, provider {provider_id}")
+        return _log('processed') # Mark as processed after updating quote
+
+    current_app.logger.warning(f"Not enough info to update provider_quotes. Job: {job_id}, Material: {material_id}, Provider: {provider_id}, Amount: {parsed['amount']}")
+    # If we couldn't update the quote, log the message with the determined IDs but status 'unprocessed'
+    return _log('unprocessed', 'Failed to update provider_quotes')
 
 @whatsapp_meta_bp.route('/send_message', methods=['POST'])
 def send_message():
@@ -270,64 +260,34 @@ def verify():
 
 @whatsapp_meta_bp.post("")
 def receive():
-    """Endpoint para recibir mensajes entrantes de WhatsApp y procesar respuestas de proveedores."""
+    """
+    Endpoint para recibir mensajes entrantes de WhatsApp. Sólo verifica la firma
+    y encola los mensajes en inbound_events (idempotente por wamid); el hilo de
+    backend.inbound_events los procesa por lotes.
+    """
     raw = request.get_data()
     if not verify_signature(raw, request.headers.get("X-Hub-Signature-256", "")):
         current_app.logger.warning("Firma de webhook inválida.")
         return "Firma inválida", 403
 
-    payload = request.get_json(force=True, silent=True) or {}
-    current_app.logger.info(f"[WA] incoming: {json.dumps(payload, ensure_ascii=False)}")
+    try:
+        payload = json.loads(raw or b"{}")
+    except ValueError:
+        current_app.logger.warning("Webhook de WhatsApp con JSON inválido.")
+        return "JSON inválido", 400
 
     db = get_db()
     if db is None:
         current_app.logger.error("Database connection failed in WhatsApp webhook.")
         return "Internal Server Error", 500
 
-    # Extrae mensajes entrantes
-    for entry in payload.get("entry", []):
-        for change in entry.get("changes", []):
-            value = change.get("value", {})
-            messages = value.get("messages", [])
-            for msg in messages:
-                from_ = msg.get("from")            # número del cliente/proveedor
-                body  = (msg.get("text", {}) or {}).get("body", "")
-                current_app.logger.info(f"[WA] {from_} dice: {body}")
-
-                # --- Logic to parse supplier responses ---
-                # 1. Find a pending quote request from this provider
-                provider = db.execute('SELECT id FROM proveedores WHERE whatsapp_number = ?', (from_,)).fetchone()
-                if provider:
-                    pending_quote = db.execute(
-                        'SELECT id, material_id, requested_qty FROM provider_quotes WHERE provider_id = ? AND status = ? ORDER BY created_at DESC LIMIT 1',
-                        (provider['id'], 'pending')
-                    ).fetchone()
-
-                    if pending_quote:
-                        # Try to parse price and date from the message body
-                        price_match = re.search(r'(\d+[.,]?\d*)\s*(€|eur|euros)', body, re.IGNORECASE)
-                        date_match = re.search(r'(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})', body)
-
-                        quoted_price = float(price_match.group(1).replace(',', '.')) if price_match else None
-                        promised_date = date_match.group(1) if date_match else None
-
-                        status = 'quoted'
-                        if re.search(r'no\s*stock', body, re.IGNORECASE):
-                            status = 'no_stock'
-
-                        db.execute(
-                            '''UPDATE provider_quotes SET
-                               response_msg_id = ?, quote_amount = ?, promised_date = ?, status = ?, raw_text = ?, updated_at = datetime('now')
-                               WHERE id = ?''',
-                            (msg.get('id'), quoted_price, promised_date, status, body, pending_quote['id'])
-                        )
-                        db.commit()
-                        current_app.logger.info(f"[WA] Updated quote {pending_quote['id']} from {from_} with status {status}.")
-                    else:
-                        current_app.logger.info(f"[WA] Received message from {from_} but no pending quote found.")
-                else:
-                    current_app.logger.info(f"[WA] Received message from unknown provider: {from_}")
-
-                # --- End Logic to parse supplier responses ---
-
+    try:
+        new, received = record_inbound_events(db, payload)
+    except sqlite3.Error as e:
+        # Sin 2xx Meta reintenta la entrega: no se pierde nada
+        current_app.logger.error(f"[WA] Error guardando eventos entrantes: {e}", exc_info=True)
+        return "Internal Server Error", 500
+    if new:
+        wake_inbound_worker()
+    current_app.logger.info(f"[WA] webhook: {received} mensajes, {new} nuevos")
     return "ok", 200
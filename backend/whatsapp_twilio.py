@@ -1,6 +1,6 @@
 import hashlib
 import os
-from datetime import datetime
+import sqlite3
 
 from flask import (
     Blueprint,
@@ -14,33 +14,21 @@ from flask import (
     url_for,
 )
 from twilio.request_validator import RequestValidator
-from twilio.rest import Client
 
+from backend import wa_logs, wa_status
 from backend.auth import login_required
 from backend.db_utils import get_db
+from backend.messaging import get_backend
 
 bp = Blueprint("twilio_wa", __name__, url_prefix="/whatsapp")
 
 def send_whatsapp(to_e164: str, text: str):
-    sid = os.getenv("TWILIO_ACCOUNT_SID")
-    token = os.getenv("TWILIO_AUTH_TOKEN")
-    wa_from = os.getenv("TWILIO_WA_FROM")  # e.g., 'whatsapp:+14155238886'
-
-    if not all([sid, token, wa_from]):
-        current_app.logger.error("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, or TWILIO_WA_FROM not set. Cannot send WhatsApp message.",
-                                   extra={'event': 'whatsapp_send_failed', 'reason': 'missing_credentials'})
-        return None
-
+    """Envía un texto por Twilio (Client compartido del proceso); devuelve el SID o None."""
     try:
-        client = Client(sid, token)
-        message = client.messages.create(
-            from_=wa_from,
-            to=f"whatsapp:{to_e164}",   # ejemplo: +34XXXXXXXXX
-            body=text
-        )
-        current_app.logger.info(f"WhatsApp message sent. SID: {message.sid}",
-                                extra={'event': 'whatsapp_sent', 'message_sid': message.sid, 'to_number_hash': hashlib.sha256(to_e164.encode()).hexdigest()})
-        return message.sid
+        sid = get_backend("twilio").send_text(to_e164, text)
+        current_app.logger.info(f"WhatsApp message sent. SID: {sid}",
+                                extra={'event': 'whatsapp_sent', 'message_sid': sid, 'to_number_hash': hashlib.sha256(to_e164.encode()).hexdigest()})
+        return sid
     except Exception as e:
         current_app.logger.error(f"Error sending WhatsApp message. Error: {e}",
                                    extra={'event': 'whatsapp_send_failed', 'error': str(e), 'to_number_hash': hashlib.sha256(to_e164.encode()).hexdigest()})
@@ -58,31 +46,33 @@ def twilio_whatsapp_webhook():
         current_app.logger.warning("Invalid Twilio signature for webhook.", extra={'event': 'whatsapp_webhook_invalid_signature'})
         abort(403)
 
-    # Ejemplo: leer el mensaje
     from_number = request.form.get("From")        # 'whatsapp:+34...'
-    # text = request.form.get("Body")               # texto recibido - Removed unused variable
-    message_sid = request.form.get("SmsSid") # or MessageSid for WhatsApp
+    message_sid = request.form.get("MessageSid") or request.form.get("SmsSid")
     message_status = request.form.get("MessageStatus")
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    from_number_hash = hashlib.sha256(from_number.encode()).hexdigest() if from_number else None
 
-    db = get_db()
-    if db is None:
-        current_app.logger.error("Database connection error in Twilio WhatsApp webhook.")
-        return "Database connection error", 500
-    if db:
+    if message_sid and message_status:
+        # Callback de estado: se fusiona sobre el mensaje saliente original (por lotes)
+        error_code = request.form.get("ErrorCode")
+        error = None
+        if error_code:
+            error = f"Twilio {error_code}"
+            if request.form.get("ErrorMessage"):
+                error += f": {request.form['ErrorMessage']}"
+        to_number = (request.form.get("To") or "").replace("whatsapp:", "") or None
         try:
-            # Save webhook status (without PII in message body)
-            db.execute(
-                "INSERT INTO whatsapp_message_logs (message_id, status, timestamp, from_number_hash) VALUES (?, ?, ?, ?)",
-                (message_sid, message_status, timestamp, hashlib.sha256(from_number.encode()).hexdigest() if from_number else None)
+            wa_status.record_status(
+                message_sid,
+                message_status,
+                error=error,
+                to_number=to_number,
             )
-            db.commit()
-            current_app.logger.info(f"WhatsApp webhook received: SID={message_sid}, Status={message_status}",
-                                    extra={'event': 'whatsapp_webhook_received', 'message_sid': message_sid, 'status': message_status, 'from_number_hash': hashlib.sha256(from_number.encode()).hexdigest() if from_number else None})
-        except Exception as e:
+        except sqlite3.Error as e:
             current_app.logger.error(f"Error saving WhatsApp webhook status: {e}",
                                      extra={'event': 'whatsapp_webhook_save_error', 'error': str(e), 'message_sid': message_sid})
-            db.rollback()
+            return "Database error", 500
+    current_app.logger.info(f"WhatsApp webhook received: SID={message_sid}, Status={message_status}",
+                            extra={'event': 'whatsapp_webhook_received', 'message_sid': message_sid, 'status': message_status, 'from_number_hash': from_number_hash})
 
     # TODO: procesar -> crear aviso, responder, etc.
     return "OK", 200
@@ -108,7 +98,23 @@ def list_whatsapp_logs():
         flash('Database connection error.', 'error')
         return redirect(url_for('index')) # Redirect to a safe page, e.g., index or login
 
-    logs = db.execute(
-        "SELECT id, message_id, status, timestamp, from_number_hash FROM whatsapp_message_logs ORDER BY timestamp DESC"
-    ).fetchall()
-    return render_template("whatsapp_message_logs/list.html", logs=logs)
+    months = wa_logs.archive_months(db)
+    month = request.args.get("month") or None
+    if month and month not in months:
+        flash('Mes de archivo no encontrado.', 'error')
+        return redirect(url_for('twilio_wa.list_whatsapp_logs'))
+    try:
+        limit = int(request.args.get("limit", wa_logs.PAGE_SIZE))
+    except (TypeError, ValueError):
+        limit = wa_logs.PAGE_SIZE
+    limit = max(1, min(limit, wa_logs.MAX_PAGE_SIZE))
+    cursor = wa_logs.decode_log_cursor(request.args.get("cursor"))
+    logs, next_cursor = wa_logs.fetch_log_page(db, cursor, limit, month=month)
+    return render_template(
+        "whatsapp_message_logs/list.html",
+        logs=logs,
+        next_cursor=next_cursor,
+        limit=limit,
+        month=month,
+        months=months,
+    )
@@ -0,0 +1,141 @@
+"""Add phone_directory with E.164-normalized numbers
+
+Revision ID: 2e8a5d1c7f30
+Revises: 7b3f0c2e9a64
+Create Date: 2026-10-17 16:31:55.092417
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2e8a5d1c7f30'
+down_revision = '7b3f0c2e9a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE TABLE IF NOT EXISTS phone_directory (
+    number TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    entity_id INTEGER NOT NULL,
+    PRIMARY KEY (number, kind, entity_id)
+) WITHOUT ROWID
+    """)
+    op.execute("""
+CREATE INDEX IF NOT EXISTS idx_phone_directory_entity ON phone_directory (kind, entity_id)
+    """)
+    op.execute("""
+CREATE VIEW IF NOT EXISTS phone_directory_source AS
+WITH raw (kind, entity_id, s) AS (
+    SELECT 'provider', id, whatsapp_number FROM providers
+    UNION ALL SELECT 'provider', id, telefono FROM providers
+    UNION ALL SELECT 'client', id, whatsapp_number FROM clientes
+    UNION ALL SELECT 'client', id, telefono FROM clientes
+    UNION ALL SELECT 'user', id, whatsapp_number FROM users
+    UNION ALL SELECT 'user', id, telefono FROM users
+),
+stripped (kind, entity_id, s) AS (
+    SELECT kind, entity_id,
+           REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(REPLACE(LOWER(TRIM(s)),
+               'whatsapp:', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', ''), '/', '')
+    FROM raw WHERE s IS NOT NULL
+),
+canonical (kind, entity_id, number) AS (
+    SELECT kind, entity_id,
+           CASE
+               WHEN s GLOB '+[1-9]*' AND substr(s, 2) NOT GLOB '*[^0-9]*' THEN s
+               WHEN s GLOB '00[1-9]*' AND s NOT GLOB '*[^0-9]*' THEN '+' || substr(s, 3)
+               WHEN s GLOB '[6789]????????' AND s NOT GLOB '*[^0-9]*' THEN '+34' || s
+               WHEN s GLOB '[1-9]*' AND s NOT GLOB '*[^0-9]*' AND length(s) >= 10 THEN '+' || s
+           END
+    FROM stripped
+)
+SELECT DISTINCT number, kind, entity_id FROM canonical
+WHERE number IS NOT NULL AND length(number) BETWEEN 9 AND 16
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_insert AFTER INSERT ON providers
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'provider' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_update AFTER UPDATE OF id, telefono, whatsapp_number ON providers
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'provider' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'provider' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_providers_delete AFTER DELETE ON providers
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'provider' AND entity_id = OLD.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'client' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_update AFTER UPDATE OF id, telefono, whatsapp_number ON clientes
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'client' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'client' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'client' AND entity_id = OLD.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_insert AFTER INSERT ON users
+BEGIN
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'user' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_update AFTER UPDATE OF id, telefono, whatsapp_number ON users
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'user' AND entity_id = OLD.id;
+    INSERT OR IGNORE INTO phone_directory (number, kind, entity_id)
+    SELECT number, kind, entity_id FROM phone_directory_source WHERE kind = 'user' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_phone_directory_users_delete AFTER DELETE ON users
+BEGIN
+    DELETE FROM phone_directory WHERE kind = 'user' AND entity_id = OLD.id;
+END
+    """)
+    # Rellenar con los teléfonos existentes
+    op.execute(
+        "INSERT OR IGNORE INTO phone_directory (number, kind, entity_id) "
+        "SELECT number, kind, entity_id FROM phone_directory_source"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_providers_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_providers_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_providers_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_clientes_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_clientes_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_clientes_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_users_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_users_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_phone_directory_users_delete")
+    op.execute("DROP VIEW IF EXISTS phone_directory_source")
+    op.execute("DROP INDEX IF EXISTS idx_phone_directory_entity")
+    op.execute("DROP TABLE IF EXISTS phone_directory")
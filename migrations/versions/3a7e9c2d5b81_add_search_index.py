@@ -0,0 +1,177 @@
+"""FTS5 full-text search index over tickets, clients, materials, quote items and WhatsApp logs
+
+Revision ID: 3a7e9c2d5b81
+Revises: 8d2f5c1a7e46
+Create Date: 2026-10-17 19:48:20.931745
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7e9c2d5b81'
+down_revision = '8d2f5c1a7e46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+    kind UNINDEXED,
+    title,
+    body,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+    """)
+    op.execute("""
+INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(0.0, 5.0, 1.0)')
+    """)
+    op.execute("""
+CREATE VIEW IF NOT EXISTS search_source AS
+SELECT id * 8 + 1 AS doc_id, 'ticket' AS kind, id AS entity_id, titulo AS title,
+       TRIM(COALESCE(descripcion, '') || ' ' || COALESCE(observaciones, '')) AS body
+FROM tickets
+UNION ALL
+SELECT id * 8 + 2, 'cliente', id, nombre,
+       TRIM(COALESCE(email, '') || ' ' || COALESCE(nif, '') || ' ' || COALESCE(direccion, '') || ' ' || COALESCE(ciudad, ''))
+FROM clientes
+UNION ALL
+SELECT id * 8 + 3, 'material', id, nombre,
+       TRIM(sku || ' ' || COALESCE(descripcion, '') || ' ' || COALESCE(categoria, ''))
+FROM materiales
+UNION ALL
+SELECT id * 8 + 4, 'presupuesto_item', id, '', descripcion
+FROM presupuesto_items
+UNION ALL
+SELECT id * 8 + 5, 'whatsapp', id, '', message_body
+FROM whatsapp_message_logs WHERE message_body <> ''
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'ticket' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_update AFTER UPDATE OF titulo, descripcion, observaciones ON tickets
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'ticket' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_tickets_delete AFTER DELETE ON tickets
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 1;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'cliente' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_update AFTER UPDATE OF nombre, email, nif, direccion, ciudad ON clientes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'cliente' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 2;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_insert AFTER INSERT ON materiales
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'material' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_update AFTER UPDATE OF sku, nombre, descripcion, categoria ON materiales
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'material' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_materiales_delete AFTER DELETE ON materiales
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 3;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_insert AFTER INSERT ON presupuesto_items
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'presupuesto_item' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_update AFTER UPDATE OF descripcion ON presupuesto_items
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'presupuesto_item' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_presupuesto_items_delete AFTER DELETE ON presupuesto_items
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 4;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_insert AFTER INSERT ON whatsapp_message_logs
+BEGIN
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'whatsapp' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_update AFTER UPDATE OF message_body ON whatsapp_message_logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 5;
+    INSERT INTO search_index (rowid, kind, title, body)
+    SELECT doc_id, kind, title, body FROM search_source WHERE kind = 'whatsapp' AND entity_id = NEW.id;
+END
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_search_whatsapp_message_logs_delete AFTER DELETE ON whatsapp_message_logs
+BEGIN
+    DELETE FROM search_index WHERE rowid = OLD.id * 8 + 5;
+END
+    """)
+    # Indexa lo que ya existe
+    op.execute("INSERT INTO search_index (rowid, kind, title, body) SELECT doc_id, kind, title, body FROM search_source")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_search_whatsapp_message_logs_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_whatsapp_message_logs_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_whatsapp_message_logs_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_presupuesto_items_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_presupuesto_items_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_presupuesto_items_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_materiales_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_materiales_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_materiales_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_clientes_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_clientes_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_clientes_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_tickets_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_tickets_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_search_tickets_insert")
+    op.execute("DROP VIEW IF EXISTS search_source")
+    op.execute("DROP TABLE IF EXISTS search_index")
@@ -0,0 +1,53 @@
+"""Add indexes for hot query paths
+
+Revision ID: 3c9d1e7a5b42
+Revises: 6037a22f1fa2
+Create Date: 2026-10-17 10:12:03.114512
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d1e7a5b42'
+down_revision = '6037a22f1fa2'
+branch_labels = None
+depends_on = None
+
+
+# (nombre, tabla, columnas). job_materials/job_services no necesitan índice:
+# su PRIMARY KEY (job_id, ...) ya cubre los filtros por job_id.
+INDEXES = [
+    # freelancers.dashboard: WHERE asignado_a = ? ORDER BY fecha_creacion DESC
+    ('idx_tickets_asignado_fecha', 'tickets', 'asignado_a, fecha_creacion'),
+    # listados por cliente
+    ('idx_tickets_cliente_fecha', 'tickets', 'cliente_id, fecha_creacion'),
+    # jobs.list_jobs / dashboard: ORDER BY fecha_creacion DESC, id DESC
+    ('idx_tickets_fecha_creacion', 'tickets', 'fecha_creacion, id'),
+    # notifications.unread_notifications_count
+    ('idx_notifications_user_read', 'notifications', 'user_id, is_read'),
+    # handle_incoming_message: último outbound por proveedor
+    ('idx_wa_logs_provider_dir_ts', 'whatsapp_message_logs', 'provider_id, direction, timestamp'),
+    # handle_incoming_message / view_job: cotizaciones pendientes
+    ('idx_provider_quotes_job_mat_prov', 'provider_quotes', 'job_id, material_id, provider_id, status'),
+    ('idx_provider_quotes_provider_status', 'provider_quotes', 'provider_id, status'),
+    # get_market_study_for_material: último estudio por material
+    ('idx_market_research_material_created', 'market_research', 'material_id, created_at'),
+    # view_job: ficheros de cada presupuesto de autónomo
+    ('idx_ficheros_presupuesto', 'ficheros', 'presupuesto_id'),
+    # list_jobs: eventos de cada ticket
+    ('idx_eventos_ticket_inicio', 'eventos', 'ticket_id, inicio'),
+    # view_job: presupuestos de autónomos del ticket
+    ('idx_presupuestos_ticket_fecha', 'presupuestos', 'ticket_id, fecha_creacion'),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, _table, _columns in reversed(INDEXES):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
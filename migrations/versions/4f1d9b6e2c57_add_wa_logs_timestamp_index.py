@@ -0,0 +1,23 @@
+"""Index whatsapp_message_logs by timestamp for retention and the log viewer
+
+Revision ID: 4f1d9b6e2c57
+Revises: 9c4e7a2b6d15
+Create Date: 2026-10-17 18:02:13.518940
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1d9b6e2c57'
+down_revision = '9c4e7a2b6d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_wa_logs_timestamp ON whatsapp_message_logs (timestamp)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_wa_logs_timestamp")
@@ -0,0 +1,42 @@
+"""Add notification_outbox table
+
+Revision ID: 5a7c3e9f2b18
+Revises: 8e2f4b6a1d07
+Create Date: 2026-10-17 13:05:12.184402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c3e9f2b18'
+down_revision = '8e2f4b6a1d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    sent_at TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+)
+    """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending "
+        "ON notification_outbox (next_attempt_at, id) WHERE status = 'pending'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_notification_outbox_pending")
+    op.execute("DROP TABLE IF EXISTS notification_outbox")
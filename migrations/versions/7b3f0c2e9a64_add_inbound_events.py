@@ -0,0 +1,42 @@
+"""Add inbound_events table for idempotent webhook ingestion
+
+Revision ID: 7b3f0c2e9a64
+Revises: d41b8e6c0a93
+Create Date: 2026-10-17 15:42:08.517326
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3f0c2e9a64'
+down_revision = 'd41b8e6c0a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE TABLE IF NOT EXISTS inbound_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    source TEXT NOT NULL DEFAULT 'meta',
+    event_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    received_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    processed_at TEXT,
+    UNIQUE (source, event_id)
+)
+    """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_inbound_events_pending "
+        "ON inbound_events (next_attempt_at, id) WHERE status = 'pending'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_inbound_events_pending")
+    op.execute("DROP TABLE IF EXISTS inbound_events")
@@ -0,0 +1,83 @@
+"""SLA watchdog: tickets.sla_breached_at, change log and breach counters
+
+Revision ID: 7b3f2e8a1c94
+Revises: e2b7d4a9c613
+Create Date: 2026-10-17 21:48:19.402877
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3f2e8a1c94'
+down_revision = 'e2b7d4a9c613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE tickets ADD COLUMN sla_breached_at TEXT")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tickets_sla_pending ON tickets (sla_due) "
+        "WHERE sla_due IS NOT NULL AND sla_breached_at IS NULL"
+    )
+    op.execute("""
+CREATE TABLE IF NOT EXISTS sla_ticket_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    changed_at TEXT DEFAULT CURRENT_TIMESTAMP
+)
+    """)
+    op.execute("""
+CREATE TABLE IF NOT EXISTS sla_breach_counters (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key)
+) WITHOUT ROWID
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_insert AFTER INSERT ON tickets
+WHEN NEW.sla_due IS NOT NULL
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (NEW.id);
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_update AFTER UPDATE OF sla_due, estado, sla_breached_at ON tickets
+WHEN (OLD.sla_due IS NOT NULL OR NEW.sla_due IS NOT NULL)
+    AND (OLD.sla_due IS NOT NEW.sla_due OR OLD.estado IS NOT NEW.estado OR OLD.sla_breached_at IS NOT NEW.sla_breached_at)
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (NEW.id);
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_delete AFTER DELETE ON tickets
+WHEN OLD.sla_due IS NOT NULL
+BEGIN
+    INSERT INTO sla_ticket_changes (ticket_id) VALUES (OLD.id);
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_sla_tickets_breach AFTER UPDATE OF sla_breached_at ON tickets
+WHEN OLD.sla_breached_at IS NULL AND NEW.sla_breached_at IS NOT NULL
+BEGIN
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('cliente', NEW.cliente_id, 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('tecnico', COALESCE(NEW.asignado_a, ''), 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+    INSERT INTO sla_breach_counters (dimension, key, count) VALUES ('prioridad', COALESCE(OLD.prioridad, ''), 1)
+        ON CONFLICT (dimension, key) DO UPDATE SET count = count + 1;
+END;
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_sla_tickets_breach")
+    op.execute("DROP TRIGGER IF EXISTS trg_sla_tickets_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_sla_tickets_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_sla_tickets_insert")
+    op.execute("DROP TABLE IF EXISTS sla_breach_counters")
+    op.execute("DROP TABLE IF EXISTS sla_ticket_changes")
+    op.execute("DROP INDEX IF EXISTS idx_tickets_sla_pending")
+    op.execute("ALTER TABLE tickets DROP COLUMN sla_breached_at")
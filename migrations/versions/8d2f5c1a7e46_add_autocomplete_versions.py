@@ -0,0 +1,124 @@
+"""Version counters for the in-memory autocomplete indexes
+
+Revision ID: 8d2f5c1a7e46
+Revises: b6e3a8d4f091
+Create Date: 2026-10-17 19:12:37.806422
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2f5c1a7e46'
+down_revision = 'b6e3a8d4f091'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE TABLE IF NOT EXISTS autocomplete_versions (
+    source TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_update AFTER UPDATE OF nombre ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('clientes', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_insert AFTER INSERT ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_update AFTER UPDATE OF nombre, sku ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_materiales_delete AFTER DELETE ON materiales
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('materiales', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_insert AFTER INSERT ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_update AFTER UPDATE OF name, description ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_servicios_delete AFTER DELETE ON servicios
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('servicios', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_insert AFTER INSERT ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_update AFTER UPDATE OF username, role ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+    op.execute("""
+CREATE TRIGGER IF NOT EXISTS trg_autocomplete_users_delete AFTER DELETE ON users
+BEGIN
+    INSERT INTO autocomplete_versions (source, version) VALUES ('users', 1)
+        ON CONFLICT (source) DO UPDATE SET version = version + 1;
+END;
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_users_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_users_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_users_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_servicios_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_servicios_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_servicios_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_materiales_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_materiales_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_materiales_insert")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_clientes_delete")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_clientes_update")
+    op.execute("DROP TRIGGER IF EXISTS trg_autocomplete_clientes_insert")
+    op.execute("DROP TABLE IF EXISTS autocomplete_versions")
@@ -0,0 +1,103 @@
+"""Add trigger-maintained kpi_counters table
+
+Revision ID: 8e2f4b6a1d07
+Revises: 3c9d1e7a5b42
+Create Date: 2026-10-17 11:40:27.530918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2f4b6a1d07'
+down_revision = '3c9d1e7a5b42'
+branch_labels = None
+depends_on = None
+
+
+# kind: 'estado' | 'estado_pago' | 'clientes'; value: valor bruto ('' si NULL).
+# Los triggers se ejecutan dentro de la transacción de quien escribe, así que
+# los contadores siguen siendo exactos con varios escritores concurrentes.
+STATEMENTS = [
+    """
+CREATE TABLE IF NOT EXISTS kpi_counters (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, value)
+)
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_insert AFTER INSERT ON tickets
+BEGIN
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado', COALESCE(NEW.estado, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado_pago', COALESCE(NEW.estado_pago, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_delete AFTER DELETE ON tickets
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado' AND value = COALESCE(OLD.estado, '');
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado_pago' AND value = COALESCE(OLD.estado_pago, '');
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_kpi_tickets_update AFTER UPDATE OF estado, estado_pago ON tickets
+WHEN OLD.estado IS NOT NEW.estado OR OLD.estado_pago IS NOT NEW.estado_pago
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado' AND value = COALESCE(OLD.estado, '');
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado', COALESCE(NEW.estado, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'estado_pago' AND value = COALESCE(OLD.estado_pago, '');
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('estado_pago', COALESCE(NEW.estado_pago, ''), 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_kpi_clientes_insert AFTER INSERT ON clientes
+BEGIN
+    INSERT INTO kpi_counters (kind, value, count) VALUES ('clientes', '', 1)
+        ON CONFLICT (kind, value) DO UPDATE SET count = count + 1;
+END
+    """,
+    """
+CREATE TRIGGER IF NOT EXISTS trg_kpi_clientes_delete AFTER DELETE ON clientes
+BEGIN
+    UPDATE kpi_counters SET count = count - 1 WHERE kind = 'clientes' AND value = '';
+END
+    """,
+]
+
+TRIGGERS = [
+    'trg_kpi_tickets_insert',
+    'trg_kpi_tickets_delete',
+    'trg_kpi_tickets_update',
+    'trg_kpi_clientes_insert',
+    'trg_kpi_clientes_delete',
+]
+
+
+def upgrade():
+    for statement in STATEMENTS:
+        op.execute(statement)
+    # Carga inicial a partir de los datos existentes
+    op.execute("DELETE FROM kpi_counters")
+    op.execute(
+        "INSERT INTO kpi_counters (kind, value, count) "
+        "SELECT 'estado', COALESCE(estado, ''), COUNT(*) FROM tickets GROUP BY COALESCE(estado, '')"
+    )
+    op.execute(
+        "INSERT INTO kpi_counters (kind, value, count) "
+        "SELECT 'estado_pago', COALESCE(estado_pago, ''), COUNT(*) FROM tickets GROUP BY COALESCE(estado_pago, '')"
+    )
+    op.execute(
+        "INSERT INTO kpi_counters (kind, value, count) SELECT 'clientes', '', COUNT(*) FROM clientes"
+    )
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS kpi_counters')
@@ -0,0 +1,27 @@
+"""Add parsed reply fields to provider_quotes
+
+Revision ID: 9c4e7a2b6d15
+Revises: 2e8a5d1c7f30
+Create Date: 2026-10-17 17:10:41.336208
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e7a2b6d15'
+down_revision = '2e8a5d1c7f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE provider_quotes ADD COLUMN vat_included INTEGER")
+    op.execute("ALTER TABLE provider_quotes ADD COLUMN delivery_date TEXT")
+    op.execute("ALTER TABLE provider_quotes ADD COLUMN stock_status TEXT")
+
+
+def downgrade():
+    op.execute("ALTER TABLE provider_quotes DROP COLUMN stock_status")
+    op.execute("ALTER TABLE provider_quotes DROP COLUMN delivery_date")
+    op.execute("ALTER TABLE provider_quotes DROP COLUMN vat_included")
@@ -0,0 +1,50 @@
+"""Receipt PDF queue and financial_transactions indexes
+
+Revision ID: a4d8c1f6e237
+Revises: 7b3f2e8a1c94
+Create Date: 2026-10-17 23:05:41.118204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8c1f6e237'
+down_revision = '7b3f2e8a1c94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE TABLE IF NOT EXISTS receipt_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticket_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT,
+    FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE CASCADE
+)
+    """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_receipt_jobs_pending ON receipt_jobs (next_attempt_at, id) "
+        "WHERE status = 'pending'"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_financial_transactions_ticket "
+        "ON financial_transactions (ticket_id, type, transaction_date)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_financial_transactions_income_date "
+        "ON financial_transactions (transaction_date, ticket_id) WHERE type = 'income'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_financial_transactions_income_date")
+    op.execute("DROP INDEX IF EXISTS idx_financial_transactions_ticket")
+    op.execute("DROP INDEX IF EXISTS idx_receipt_jobs_pending")
+    op.execute("DROP TABLE IF EXISTS receipt_jobs")
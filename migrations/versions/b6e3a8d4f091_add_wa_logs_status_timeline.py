@@ -0,0 +1,34 @@
+"""Delivery status timeline on whatsapp_message_logs
+
+Revision ID: b6e3a8d4f091
+Revises: 4f1d9b6e2c57
+Create Date: 2026-10-17 18:41:05.274113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3a8d4f091'
+down_revision = '4f1d9b6e2c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE whatsapp_message_logs ADD COLUMN sent_at TEXT")
+    op.execute("ALTER TABLE whatsapp_message_logs ADD COLUMN delivered_at TEXT")
+    op.execute("ALTER TABLE whatsapp_message_logs ADD COLUMN read_at TEXT")
+    op.execute("ALTER TABLE whatsapp_message_logs ADD COLUMN failed_at TEXT")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_wa_logs_message_id ON whatsapp_message_logs (whatsapp_message_id) "
+        "WHERE whatsapp_message_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_wa_logs_message_id")
+    op.execute("ALTER TABLE whatsapp_message_logs DROP COLUMN failed_at")
+    op.execute("ALTER TABLE whatsapp_message_logs DROP COLUMN read_at")
+    op.execute("ALTER TABLE whatsapp_message_logs DROP COLUMN delivered_at")
+    op.execute("ALTER TABLE whatsapp_message_logs DROP COLUMN sent_at")
@@ -0,0 +1,64 @@
+"""Content-addressed blobs, signed-quote PDF queue and presupuestos signature references
+
+Revision ID: b9e3f5a2c718
+Revises: a4d8c1f6e237
+Create Date: 2026-10-17 23:52:07.640391
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e3f5a2c718'
+down_revision = 'a4d8c1f6e237'
+branch_labels = None
+depends_on = None
+
+# signature_token/token_expires ya los usaba quotes.send_quote_for_signature y
+# pueden existir en bases creadas a mano; el downgrade sólo quita los nuevos
+_PRESUPUESTOS_COLUMNS = ('signature_token', 'token_expires', 'client_signature_sha256', 'signed_pdf_sha256')
+
+
+def upgrade():
+    existing = {row[1] for row in op.get_bind().exec_driver_sql("PRAGMA table_info(presupuestos)")}
+    for column in _PRESUPUESTOS_COLUMNS:
+        if column not in existing:
+            op.execute(f"ALTER TABLE presupuestos ADD COLUMN {column} TEXT")
+    op.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_presupuestos_signature_token ON presupuestos (signature_token) "
+        "WHERE signature_token IS NOT NULL"
+    )
+    op.execute("""
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID
+    """)
+    op.execute("""
+CREATE TABLE IF NOT EXISTS quote_pdf_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    presupuesto_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    finished_at TEXT,
+    FOREIGN KEY (presupuesto_id) REFERENCES presupuestos (id) ON DELETE CASCADE
+)
+    """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_quote_pdf_jobs_pending ON quote_pdf_jobs (next_attempt_at, id) "
+        "WHERE status = 'pending'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_quote_pdf_jobs_pending")
+    op.execute("DROP TABLE IF EXISTS quote_pdf_jobs")
+    op.execute("DROP TABLE IF EXISTS blobs")
+    op.execute("DROP INDEX IF EXISTS idx_presupuestos_signature_token")
+    op.execute("ALTER TABLE presupuestos DROP COLUMN signed_pdf_sha256")
+    op.execute("ALTER TABLE presupuestos DROP COLUMN client_signature_sha256")
@@ -0,0 +1,23 @@
+"""Index tickets by fecha_fin for the windowed calendar feed
+
+Revision ID: c5a1e7f93d28
+Revises: 3a7e9c2d5b81
+Create Date: 2026-10-17 20:31:47.201655
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a1e7f93d28'
+down_revision = '3a7e9c2d5b81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS idx_tickets_fecha_fin ON tickets (fecha_fin) WHERE fecha_fin IS NOT NULL")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_tickets_fecha_fin")
@@ -0,0 +1,26 @@
+"""Index inbound WhatsApp logs by sender for the 24h session window
+
+Revision ID: d41b8e6c0a93
+Revises: 5a7c3e9f2b18
+Create Date: 2026-10-17 14:22:48.650193
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b8e6c0a93'
+down_revision = '5a7c3e9f2b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_wa_logs_inbound_from "
+        "ON whatsapp_message_logs (from_number, timestamp) WHERE direction = 'inbound'"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS idx_wa_logs_inbound_from")
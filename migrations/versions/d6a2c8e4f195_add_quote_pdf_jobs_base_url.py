@@ -0,0 +1,23 @@
+"""quote_pdf_jobs.base_url: host of the signing request for the link sent to the client
+
+Revision ID: d6a2c8e4f195
+Revises: b9e3f5a2c718
+Create Date: 2026-10-18 10:12:33.504118
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6a2c8e4f195'
+down_revision = 'b9e3f5a2c718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE quote_pdf_jobs ADD COLUMN base_url TEXT")
+
+
+def downgrade():
+    op.execute("ALTER TABLE quote_pdf_jobs DROP COLUMN base_url")
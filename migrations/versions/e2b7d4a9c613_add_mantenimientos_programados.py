@@ -0,0 +1,56 @@
+"""Recurring maintenance tables and generated-occurrence key for the maintenance scheduler
+
+Revision ID: e2b7d4a9c613
+Revises: c5a1e7f93d28
+Create Date: 2026-10-17 21:04:55.734120
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7d4a9c613'
+down_revision = 'c5a1e7f93d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS mantenimientos_programados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            equipo_id INTEGER,
+            tipo_mantenimiento TEXT NOT NULL,
+            descripcion TEXT,
+            ultima_fecha_mantenimiento TEXT,
+            proxima_fecha_mantenimiento TEXT NOT NULL,
+            fecha_inicio TEXT,
+            estado TEXT DEFAULT 'activo',
+            creado_por INTEGER NOT NULL,
+            fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id) ON DELETE CASCADE,
+            FOREIGN KEY (creado_por) REFERENCES users (id)
+        )
+    """)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_mantenimientos_estado_proxima "
+        "ON mantenimientos_programados (estado, proxima_fecha_mantenimiento)"
+    )
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS mantenimiento_ocurrencias (
+            mantenimiento_id INTEGER NOT NULL,
+            fecha_prevista TEXT NOT NULL,
+            ticket_id INTEGER,
+            generado_en TEXT DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (mantenimiento_id, fecha_prevista),
+            FOREIGN KEY (mantenimiento_id) REFERENCES mantenimientos_programados (id) ON DELETE CASCADE,
+            FOREIGN KEY (ticket_id) REFERENCES tickets (id) ON DELETE SET NULL
+        ) WITHOUT ROWID
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS mantenimiento_ocurrencias")
+    op.execute("DROP INDEX IF EXISTS idx_mantenimientos_estado_proxima")
+    op.execute("DROP TABLE IF EXISTS mantenimientos_programados")
@@ -0,0 +1,23 @@
+"""quote_pdf_jobs.notify: backfill jobs render the PDF without messaging the client
+
+Revision ID: e8b4d1f7a326
+Revises: d6a2c8e4f195
+Create Date: 2026-10-19 09:41:05.218734
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b4d1f7a326'
+down_revision = 'd6a2c8e4f195'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE quote_pdf_jobs ADD COLUMN notify INTEGER NOT NULL DEFAULT 1")
+
+
+def downgrade():
+    op.execute("ALTER TABLE quote_pdf_jobs DROP COLUMN notify")
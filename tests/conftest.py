@@ -1,4 +1,6 @@
 # tests/conftest.py
+import os
+
 import pytest
 from sqlalchemy import inspect
 from backend import create_app, db
@@ -7,13 +9,32 @@ from backend.db_utils import _execute_sql
 from werkzeug.security import generate_password_hash
 
 @pytest.fixture(scope="session")
-def app():
-    app = create_app()
+def app(tmp_path_factory):
+    # BD de la sesión en un temporal: no tocar instance/gestion_avisos.sqlite
+    database = str(tmp_path_factory.mktemp("db") / "test.sqlite")
+    previous = os.environ.get("DATABASE_PATH")
+    os.environ["DATABASE_PATH"] = database
+    try:
+        app = create_app()
+    finally:
+        if previous is None:
+            os.environ.pop("DATABASE_PATH", None)
+        else:
+            os.environ["DATABASE_PATH"] = previous
     app.config.update(
         TESTING=True,
         SECRET_KEY="test-secret",
         SQLALCHEMY_DATABASE_URI="sqlite:///:memory:",
         SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}},
+        # Sin hilo vigilante de SLA: los tests escalan llamando a backend.sla_monitor
+        SLA_MONITOR=False,
+        # Sin hilo despachador: los tests drenan notification_outbox llamando a backend.outbox
+        OUTBOX_DISPATCHER=False,
+        INBOUND_WORKER=False,
+        # Recibos: los tests procesan la cola con backend.receipt_worker, sin hilo ni procesos
+        RECEIPT_WORKER=False,
+        RECEIPT_POOL_SIZE=0,
+        AUTOCOMPLETE_WARM=False,
     )
 
     if 'sqlalchemy' not in app.extensions:
@@ -0,0 +1,76 @@
+import random
+
+from backend import autocomplete
+from backend.autocomplete import PrefixIndex, fold, get_index
+from backend.db_utils import get_db
+
+
+def test_prefix_index_matches_like_semantics():
+    rng = random.Random(19)
+    alphabet = "abcáéñ- "
+    rows = [{"id": i, "nombre": "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 12)))} for i in range(400)]
+    index = PrefixIndex(rows, ("nombre",), "nombre")
+    for query in ("abc", "ane", "a-b", "cñ", "ÁÉ", "b a", "a", "ñ"):
+        q = fold(query).strip()
+        if len(q) >= 3:
+            matches = [r for r in rows if q in fold(r["nombre"])]
+        else:  # 1-2 caracteres: prefijo de alguna palabra
+            matches = [r for r in rows if any(w.startswith(q) for w in fold(r["nombre"]).split())]
+        expected = sorted(matches, key=lambda r: (fold(r["nombre"]), r["id"]))
+        assert index.search(query, limit=1000) == expected
+        assert index.search(query) == expected[:10]
+
+
+def test_autocomplete_endpoints_follow_writes(app, client):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (id, nombre) VALUES (1901, 'Fontanería Pérez')")
+        db.execute("INSERT INTO materiales (id, sku, nombre) VALUES (19011, 'TUB-1901', 'Tubo cobre')")
+        db.execute("INSERT INTO servicios (id, name, description) VALUES (1901, 'Desatasco', 'Urgente con camión')")
+        db.commit()
+        try:
+            assert client.get("/autocomplete/clients?q=perez").get_json() == [{"id": 1901, "nombre": "Fontanería Pérez"}]
+            assert [c["id"] for c in client.get("/autocomplete/clients?q=FO").get_json()] == [1901]
+            assert client.get("/autocomplete/materials?q=tub-19").get_json()[0]["id"] == 19011
+            assert client.get("/autocomplete/services?q=camion").get_json()[0]["name"] == "Desatasco"
+            assert client.get("/autocomplete/technicians_freelancers?q=auton").get_json() == []
+
+            # Las escrituras suben autocomplete_versions y el índice se reconstruye
+            before = get_index(db, "clientes")
+            db.execute("UPDATE clientes SET nombre = 'Electricidad Núñez' WHERE id = 1901")
+            db.execute("UPDATE users SET role = 'autonomo' WHERE id = 2")
+            db.commit()
+            assert client.get("/autocomplete/clients?q=perez").get_json() == []
+            assert client.get("/autocomplete/clients?q=nunez").get_json()[0]["id"] == 1901
+            assert get_index(db, "clientes") is not before
+            assert get_index(db, "clientes") is get_index(db, "clientes")
+            assert client.get("/autocomplete/technicians_freelancers?q=auton").get_json() == [{"id": 2, "username": "autonomo"}]
+        finally:
+            db.execute("DELETE FROM clientes WHERE id = 1901")
+            db.execute("DELETE FROM materiales WHERE id = 19011")
+            db.execute("DELETE FROM servicios WHERE id = 1901")
+            db.execute("UPDATE users SET role = NULL WHERE id = 2")
+            db.commit()
+
+
+def test_index_is_replaced_when_version_goes_back(app):
+    with app.app_context():
+        db = get_db()
+        current = get_index(db, "clientes")
+        key = next(k for k in autocomplete._indexes if k[1] == "clientes")
+        version = autocomplete._indexes[key][0]
+        # Versión en caché por encima de la de la BD (BD restaurada o recreada)
+        autocomplete._indexes[key] = (version + 100, current)
+        rebuilt = get_index(db, "clientes")
+        assert rebuilt is not current
+        assert autocomplete._indexes[key] == (version, rebuilt)
+
+
+def test_autocomplete_indexes_warm_with_first_request(app, client, monkeypatch):
+    monkeypatch.setattr(autocomplete, "_warm_thread", None)
+    monkeypatch.setitem(app.config, "AUTOCOMPLETE_WARM", True)
+    autocomplete._indexes.clear()
+    monkeypatch.delitem(app.extensions, "background_workers_started", raising=False)
+    client.get("/auth/login")
+    autocomplete._warm_thread.join(timeout=5)
+    assert {source for _, source in autocomplete._indexes} == set(autocomplete.SOURCES)
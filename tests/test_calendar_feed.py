@@ -0,0 +1,76 @@
+from datetime import date
+
+from backend.db_utils import get_db
+from backend.recurrence import add_months, occurrences
+
+
+def test_recurrence_is_calendar_correct():
+    assert add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert list(occurrences(date(2025, 1, 31), "monthly", date(2025, 1, 1), date(2025, 6, 1))) == [
+        date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 31), date(2025, 4, 30), date(2025, 5, 31),
+    ]
+    # Ancla muy anterior a la ventana: sólo las ocurrencias dentro
+    assert list(occurrences(date(2000, 2, 29), "anual", date(2025, 1, 1), date(2029, 1, 1))) == [
+        date(2025, 2, 28), date(2026, 2, 28), date(2027, 2, 28), date(2028, 2, 29),
+    ]
+    assert list(occurrences(date(2025, 3, 10), None, date(2025, 3, 1), date(2025, 4, 1))) == [date(2025, 3, 10)]
+    assert list(occurrences(date(2025, 3, 10), None, date(2025, 4, 1), date(2025, 5, 1))) == []
+
+
+def test_api_trabajos_is_windowed_and_conditional(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (id, nombre) VALUES (2101, 'Calendario')")
+        db.executemany(
+            "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, fecha_creacion, fecha_fin) "
+            "VALUES (?, 2101, 'reparacion', 1, ?, ?, ?)",
+            [
+                (2101, "Dentro", "2031-03-10 09:00:00", None),
+                (2102, "Empezado antes", "2031-02-20 09:00:00", "2031-03-02 18:00:00"),
+                (2103, "Antes", "2031-02-01 09:00:00", "2031-02-02 09:00:00"),
+                (2104, "Después", "2031-04-15 09:00:00", None),
+            ],
+        )
+        # Ancla el 31: las ocurrencias salen de fecha_inicio (30 de abril, 31 de marzo)
+        db.executemany(
+            "INSERT INTO mantenimientos_programados (id, cliente_id, tipo_mantenimiento, descripcion, "
+            "proxima_fecha_mantenimiento, fecha_inicio, estado, creado_por) VALUES (?, 2101, ?, ?, ?, ?, ?, 1)",
+            [
+                (2101, "mensual", "Revisión caldera", "2031-03-31", "2030-12-31", "activo"),
+                (2102, "trimestral", "Pausado", "2031-03-15", "2031-03-15", "pausado"),
+                (2103, "puntual", None, "2031-03-20", None, "activo"),
+                # La de marzo ya se generó como ticket: sólo se muestra desde la próxima
+                (2104, "semanal", "Filtros", "2031-04-08", "2031-03-04", "activo"),
+            ],
+        )
+        db.commit()
+        try:
+            auth.login()
+            url = "/api/trabajos?start=2031-03-01T00:00:00Z&end=2031-04-12T00:00:00Z"
+            response = client.get(url)
+            assert response.status_code == 200
+            events = response.get_json()
+            assert [e["id"] for e in events if e["type"] == "job"] == [2102, 2101]
+            maintenances = [(e["id"], e["start"], e["title"]) for e in events if e["type"] == "maintenance"]
+            assert maintenances == [
+                (2101, "2031-03-31", "Revisión caldera"),
+                (2103, "2031-03-20", "Mantenimiento puntual"),
+                (2104, "2031-04-08", "Filtros"),
+            ]
+
+            etag = response.headers["ETag"]
+            cached = client.get(url, headers={"If-None-Match": etag})
+            assert cached.status_code == 304 and cached.data == b""
+
+            db.execute("UPDATE tickets SET titulo = 'Dentro (editado)' WHERE id = 2101")
+            db.commit()
+            assert client.get(url, headers={"If-None-Match": etag}).status_code == 200
+
+            assert client.get("/api/trabajos?start=2031-03-01&end=2031-02-01").status_code == 400
+            assert client.get("/api/trabajos?start=2030-01-01&end=2032-01-01").status_code == 400
+        finally:
+            auth.logout()
+            db.execute("DELETE FROM mantenimientos_programados WHERE id BETWEEN 2101 AND 2104")
+            db.execute("DELETE FROM tickets WHERE id BETWEEN 2101 AND 2104")
+            db.execute("DELETE FROM clientes WHERE id = 2101")
+            db.commit()
@@ -0,0 +1,41 @@
+from backend.db_utils import close_db, get_db, get_pool
+
+
+def test_pool_reuses_tuned_connection(app):
+    with app.app_context():
+        pool = get_pool()
+        before = pool.stats()
+
+    with app.app_context():
+        first = get_db()
+        assert first.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert first.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert first.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert first.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+        assert first.execute("PRAGMA busy_timeout").fetchone()[0] == app.config["SQLITE_BUSY_TIMEOUT_MS"]
+
+    with app.app_context():
+        second = get_db()
+        assert second is first
+
+    with app.app_context():
+        stats = get_pool().stats()
+    assert stats["checkouts"] >= before["checkouts"] + 2
+    assert stats["in_use"] == before["in_use"]
+
+
+def test_uncommitted_work_is_rolled_back_on_release(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (nombre) VALUES ('Pool rollback')")
+        close_db()
+        db = get_db()
+        row = db.execute("SELECT id FROM clientes WHERE nombre = 'Pool rollback'").fetchone()
+        assert row is None
+
+
+def test_pool_stats_endpoint(client):
+    resp = client.get("/healthz/db")
+    assert resp.status_code == 200
+    pools = resp.get_json()["pools"]
+    assert pools and {"checkouts", "waits", "wait_time_ms"} <= set(pools[0])
@@ -0,0 +1,98 @@
+import hashlib
+import hmac
+import json
+
+from backend import inbound_events, whatsapp_meta
+from backend.db_utils import get_db
+from backend.inbound_events import process_inbound_events, record_inbound_events
+
+
+def _payload(wamid, from_number, body):
+    return {"entry": [{"changes": [{"value": {"messages": [
+        {"id": wamid, "from": from_number, "type": "text", "text": {"body": body}}
+    ]}}]}]}
+
+
+def test_webhook_is_idempotent_and_checks_signature(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "INBOUND_WORKER", False)
+    monkeypatch.setattr(whatsapp_meta, "APP_SECRET", "s3cret")
+    raw = json.dumps(_payload("wamid.dup", "34600001301", "hola")).encode()
+    signature = "sha256=" + hmac.new(b"s3cret", raw, hashlib.sha256).hexdigest()
+    headers = {"Content-Type": "application/json", "X-Hub-Signature-256": signature}
+
+    with app.app_context():
+        db = get_db()
+        try:
+            assert client.post("/webhooks/whatsapp", data=raw, headers=headers).status_code == 200
+            assert client.post("/webhooks/whatsapp", data=raw, headers=headers).status_code == 200  # reintento de Meta
+            bad = dict(headers, **{"X-Hub-Signature-256": "sha256=00"})
+            assert client.post("/webhooks/whatsapp", data=raw, headers=bad).status_code == 403
+            rows = db.execute("SELECT status FROM inbound_events WHERE event_id = 'wamid.dup'").fetchall()
+            assert [r["status"] for r in rows] == ["pending"]
+        finally:
+            db.execute("DELETE FROM inbound_events WHERE event_id = 'wamid.dup'")
+            db.commit()
+
+
+def test_worker_applies_quotes_and_retries_failures(app):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO tickets (id, cliente_id, creado_por, titulo, estado, tipo) VALUES (1301, 1, 1, 'Inbound', 'abierto', 'averia')"
+        )
+        db.execute("INSERT INTO materiales (id, sku, nombre) VALUES (13011, 'SKU-13011', 'Tubo')")
+        db.execute("INSERT INTO providers (id, nombre, whatsapp_number) VALUES (1311, 'Prov Inbound', '34600001311')")
+        db.execute(
+            "INSERT INTO provider_quotes (job_id, material_id, provider_id, status) VALUES (1301, 13011, 1311, 'pending')"
+        )
+        db.execute(
+            "INSERT INTO whatsapp_message_logs (job_id, material_id, provider_id, direction, message_body, status) "
+            "VALUES (1301, 13011, 1311, 'outbound', 'RFQ', 'sent')"
+        )
+        db.commit()
+        try:
+            assert record_inbound_events(db, _payload("wamid.q1", "+34600001311", "Precio: 42,50 €")) == (1, 1)
+            assert record_inbound_events(db, _payload("wamid.q1", "+34600001311", "Precio: 42,50 €")) == (0, 1)
+            record_inbound_events(db, _payload("wamid.boom", "34600009999", "?"))
+
+            def handler(db, row):
+                if row["event_id"] == "wamid.boom":
+                    db.execute("INSERT INTO notifications (user_id, message) VALUES (1, 'no debe quedar')")
+                    raise RuntimeError("boom")
+                return whatsapp_meta.handle_incoming_message(
+                    "+34600001311", json.loads(row["payload"])["text"]["body"], row["event_id"], db=db, commit=False
+                )
+
+            assert process_inbound_events(db, handler=handler) == {"claimed": 2, "processed": 1, "errors": 1}
+            quote = db.execute("SELECT status, quote_amount FROM provider_quotes WHERE job_id = 1301").fetchone()
+            assert (quote["status"], quote["quote_amount"]) == ("received", 42.5)
+            events = dict(db.execute(
+                "SELECT event_id, status || ':' || attempts FROM inbound_events WHERE event_id IN ('wamid.q1', 'wamid.boom')"
+            ).fetchall())
+            assert events == {"wamid.q1": "done:1", "wamid.boom": "pending:1"}
+            # El SAVEPOINT deshace sólo lo escrito por el evento fallido
+            assert db.execute("SELECT COUNT(*) FROM notifications WHERE message = 'no debe quedar'").fetchone()[0] == 0
+            # El reintento espera su backoff
+            assert process_inbound_events(db, handler=handler)["claimed"] == 0
+        finally:
+            db.execute("DELETE FROM inbound_events WHERE event_id IN ('wamid.q1', 'wamid.boom')")
+            db.execute("DELETE FROM whatsapp_message_logs WHERE job_id = 1301 OR provider_id = 1311")
+            db.execute("DELETE FROM provider_quotes WHERE job_id = 1301")
+            db.execute("DELETE FROM providers WHERE id = 1311")
+            db.execute("DELETE FROM materiales WHERE id = 13011")
+            db.execute("DELETE FROM tickets WHERE id = 1301")
+            db.commit()
+
+
+def test_inbound_worker_starts_with_first_request(app, client, monkeypatch):
+    # Los reintentos programados antes de un reinicio no esperan al próximo webhook
+    started = []
+    monkeypatch.setattr(inbound_events, "_worker_thread", None)
+    monkeypatch.setattr(inbound_events, "_worker_loop", lambda app: started.append(app))
+    monkeypatch.setitem(app.config, "INBOUND_WORKER", True)
+    inbound_events._wake.clear()
+    monkeypatch.delitem(app.extensions, "background_workers_started", raising=False)
+    client.get("/auth/login")
+    inbound_events._worker_thread.join(timeout=5)
+    assert started == [app] and inbound_events._wake.is_set()
+    inbound_events._wake.clear()
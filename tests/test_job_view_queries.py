@@ -0,0 +1,66 @@
+from backend.db_utils import get_db
+
+
+def _seed(db, job_id, n):
+    """Ticket con n materiales (cada uno con dos estudios de mercado) y n presupuestos con ficheros."""
+    db.execute(
+        "INSERT INTO tickets (id, cliente_id, creado_por, asignado_a, titulo, estado, tipo) VALUES (?, 1, 1, 2, 'Vista', 'abierto', 'averia')",
+        (job_id,),
+    )
+    for i in range(n):
+        material_id = job_id * 10 + i
+        db.execute(
+            "INSERT INTO materiales (id, sku, nombre) VALUES (?, ?, ?)", (material_id, f"SKU-{material_id}", f"Material {i}")
+        )
+        db.execute(
+            "INSERT INTO job_materials (job_id, material_id, quantity, price_per_unit, total_price) VALUES (?, ?, 1, 1, 1)",
+            (job_id, material_id),
+        )
+        db.execute(
+            "INSERT INTO market_research (material_id, price_avg, difficulty, created_at) VALUES (?, 10, 'facil', '2024-01-01')",
+            (material_id,),
+        )
+        db.execute(
+            "INSERT INTO market_research (material_id, price_avg, difficulty, created_at) VALUES (?, 20, 'medio', '2025-01-01')",
+            (material_id,),
+        )
+        cursor = db.execute(
+            "INSERT INTO presupuestos (ticket_id, freelancer_id, total) VALUES (?, 2, 100)", (job_id,)
+        )
+        db.execute(
+            "INSERT INTO ficheros (presupuesto_id, url, tipo) VALUES (?, ?, 'pdf')",
+            (cursor.lastrowid, f"/uploads/{material_id}.pdf"),
+        )
+    db.commit()
+
+
+def _count_queries(client, db, job_id):
+    statements = []
+    db.set_trace_callback(statements.append)
+    try:
+        response = client.get(f"/jobs/{job_id}")
+    finally:
+        db.set_trace_callback(None)
+    assert response.status_code == 200
+    return response, [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def test_view_job_query_count_is_constant(app, client, auth):
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        _seed(db, 1101, 1)
+        _seed(db, 1102, 5)
+        try:
+            _count_queries(client, db, 1101)  # calienta la caché de proveedores
+            _, small = _count_queries(client, db, 1101)
+            response, large = _count_queries(client, db, 1102)
+            assert len(small) == len(large)
+            # Se muestra el estudio de mercado más reciente de cada material
+            assert response.data.count(b"Avg: 20.00") == 5
+            assert b"Avg: 10.00" not in response.data
+            assert response.data.count(b"/uploads/1102") == 5
+        finally:
+            db.execute("DELETE FROM tickets WHERE id IN (1101, 1102)")
+            db.execute("DELETE FROM materiales WHERE id BETWEEN 11010 AND 11029")
+            db.commit()
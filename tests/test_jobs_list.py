@@ -0,0 +1,94 @@
+from backend.db_utils import get_db
+from backend.jobs import build_job_list_query, decode_job_cursor, encode_job_cursor, fetch_job_page
+from backend.metrics import invalidate_dashboard_kpis
+
+
+def _insert_jobs(db):
+    # Misma fecha_creacion para todos: el desempate por id debe mantener el orden estable
+    db.executemany(
+        "INSERT INTO tickets (id, cliente_id, creado_por, titulo, estado, tipo, fecha_creacion) "
+        "VALUES (?, 1, 1, ?, ?, 'averia', '2030-01-01 10:00:00')",
+        [(1000 + i, f"Paginado {i}", "abierto" if i % 2 else "cerrado") for i in range(7)],
+    )
+    db.executemany(
+        "INSERT INTO eventos (ticket_id, titulo, inicio) VALUES (1006, ?, ?)",
+        [("Visita 1", "2099-01-02 09:00"), ("Visita 2", "2099-01-01 09:00"), ("Pasada", "2000-01-01 09:00")],
+    )
+    db.commit()
+
+
+def _cleanup(db):
+    db.execute("DELETE FROM tickets WHERE id BETWEEN 1000 AND 1006")
+    db.commit()
+    invalidate_dashboard_kpis()
+
+
+def test_job_cursor_roundtrip():
+    cursor = encode_job_cursor("2030-01-01 10:00:00", 42)
+    assert decode_job_cursor(cursor) == ("2030-01-01 10:00:00", 42)
+    assert decode_job_cursor("no-es-un-cursor") is None
+    assert decode_job_cursor(encode_job_cursor(None, 7)) == (None, 7)
+
+
+def test_jobs_api_pages_with_cursor_and_filters(app, client, auth):
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        _insert_jobs(db)
+        try:
+            seen, cursor = [], None
+            while True:
+                url = "/jobs/api?limit=3&desde=2030-01-01"
+                if cursor:
+                    url += f"&cursor={cursor}"
+                data = client.get(url).get_json()
+                seen.extend(job["id"] for job in data["jobs"])
+                cursor = data["next_cursor"]
+                if not cursor:
+                    break
+            assert seen == list(range(1006, 999, -1))
+
+            data = client.get("/jobs/api?estado=abierto&desde=2030-01-01").get_json()
+            assert [job["id"] for job in data["jobs"]] == [1005, 1003, 1001]
+
+            # Un ticket con varios eventos aparece una sola vez, con su próxima visita
+            jobs = client.get("/jobs/api?desde=2030-01-01&limit=1").get_json()["jobs"]
+            assert jobs[0]["id"] == 1006
+            assert jobs[0]["next_event_start"] == "2099-01-01 09:00"
+
+            response = client.get("/jobs/?desde=2030-01-01&limit=3")
+            assert response.status_code == 200
+            assert b"Siguiente" in response.data
+        finally:
+            _cleanup(db)
+
+
+def test_job_list_query_uses_keyset_not_offset():
+    sql, params = build_job_list_query({"estado": "abierto"}, cursor=("2030-01-01", 5), limit=10, now="2030-01-01")
+    assert "OFFSET" not in sql
+    assert params == ["2030-01-01", "abierto", "2030-01-01", 5, 11]
+
+
+def test_job_pages_include_tickets_without_fecha_creacion(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO tickets (id, cliente_id, creado_por, titulo, tipo, fecha_creacion) "
+            "VALUES (?, 1, 1, 'Sin fecha', 'sin-fecha-0005', ?)",
+            [(1050, "2030-01-01 10:00:00"), (1051, None), (1052, "2030-01-02 10:00:00"), (1053, None), (1054, None)],
+        )
+        db.commit()
+        try:
+            for limit in (1, 2, 3, 5):
+                seen, cursor = [], None
+                while True:
+                    rows, next_cursor = fetch_job_page(db, {"tipo": "sin-fecha-0005"}, cursor, limit)
+                    seen.extend(row["id"] for row in rows)
+                    if not next_cursor:
+                        break
+                    cursor = decode_job_cursor(next_cursor)
+                # Las fechas NULL van al final, sin repetir ni perder filas
+                assert seen == [1052, 1050, 1054, 1053, 1051]
+        finally:
+            db.execute("DELETE FROM tickets WHERE id BETWEEN 1050 AND 1054")
+            db.commit()
@@ -0,0 +1,71 @@
+from datetime import date
+
+from backend.db_utils import get_db
+from backend.maintenance_scheduler import run_due_maintenances
+
+
+def _maintenance(db, maintenance_id):
+    return db.execute(
+        "SELECT proxima_fecha_mantenimiento, fecha_inicio, estado FROM mantenimientos_programados WHERE id = ?",
+        (maintenance_id,),
+    ).fetchone()
+
+
+def _tickets(db):
+    return db.execute(
+        "SELECT m.mantenimiento_id, m.fecha_prevista, t.cliente_id, t.estado FROM mantenimiento_ocurrencias m "
+        "JOIN tickets t ON t.id = m.ticket_id WHERE m.mantenimiento_id BETWEEN 2201 AND 2205 "
+        "ORDER BY m.mantenimiento_id, m.fecha_prevista"
+    ).fetchall()
+
+
+def test_run_generates_due_tickets_once(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (id, nombre) VALUES (2201, 'Comunidad Mantenimientos')")
+        db.executemany(
+            "INSERT INTO mantenimientos_programados "
+            "(id, cliente_id, tipo_mantenimiento, proxima_fecha_mantenimiento, estado, creado_por) "
+            "VALUES (?, 2201, ?, ?, ?, 1)",
+            [
+                (2201, "mensual", "2031-01-31", "activo"),
+                (2202, "trimestral", "2031-02-15", "activo"),
+                (2203, "mensual", "2031-02-30", "activo"),  # fecha inválida: no bloquea al resto
+                (2204, "anual", "2031-01-01", "pausado"),
+                (2205, "puntual", "2031-03-01", "activo"),
+            ],
+        )
+        db.commit()
+        try:
+            stats = run_due_maintenances(db, today=date(2031, 3, 5), batch_size=2)
+            assert (stats["tickets"], stats["lotes"]) == (4, 2)
+            assert [e[0] for e in stats["errores"]] == [2203]
+            assert [tuple(r) for r in _tickets(db)] == [
+                (2201, "2031-01-31", 2201, "Pendiente"),
+                (2201, "2031-02-28", 2201, "Pendiente"),
+                (2202, "2031-02-15", 2201, "Pendiente"),
+                (2205, "2031-03-01", 2201, "Pendiente"),
+            ]
+            assert tuple(_maintenance(db, 2201)) == ("2031-03-31", "2031-01-31", "activo")
+            assert tuple(_maintenance(db, 2202)) == ("2031-05-15", "2031-02-15", "activo")
+            assert _maintenance(db, 2205)["estado"] == "completado"
+
+            # Repetir la ejecución no duplica, ni aunque la fecha no se hubiera avanzado
+            assert run_due_maintenances(db, today=date(2031, 3, 5))["tickets"] == 0
+            db.execute("UPDATE mantenimientos_programados SET proxima_fecha_mantenimiento = '2031-01-31' WHERE id = 2201")
+            db.commit()
+            rerun = run_due_maintenances(db, today=date(2031, 3, 5))
+            assert (rerun["tickets"], rerun["ya_generados"]) == (0, 2)
+            assert _maintenance(db, 2201)["proxima_fecha_mantenimiento"] == "2031-03-31"
+
+            result = app.test_cli_runner().invoke(args=["maintenance-run", "--date", "2031-04-30"])
+            assert result.exit_code == 0, result.output
+            assert "2 tickets generados" in result.output
+            assert _maintenance(db, 2201)["proxima_fecha_mantenimiento"] == "2031-05-31"
+        finally:
+            db.execute("DELETE FROM tickets WHERE id IN (SELECT ticket_id FROM mantenimiento_ocurrencias "
+                       "WHERE mantenimiento_id BETWEEN 2201 AND 2205)")
+            db.execute("DELETE FROM mantenimiento_ocurrencias WHERE mantenimiento_id BETWEEN 2201 AND 2205")
+            db.execute("DELETE FROM mantenimientos_programados WHERE id BETWEEN 2201 AND 2205")
+            db.execute("DELETE FROM clientes WHERE id = 2201")
+            db.commit()
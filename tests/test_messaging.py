@@ -0,0 +1,118 @@
+import pytest
+
+from backend import messaging
+from backend.db_utils import get_db
+from backend.outbox import drain_outbox, enqueue_notifications
+from backend.wa_throttle import reset_scheduler
+
+
+@pytest.fixture
+def fake_backend():
+    backend = messaging.set_backend(messaging.FakeBackend())
+    yield backend
+    messaging.reset_backend()
+
+
+def test_backend_selected_from_config_and_cached(app, monkeypatch):
+    monkeypatch.setitem(app.config, "MESSAGING_BACKEND", "fake")
+    monkeypatch.setitem(app.config, "MESSAGING_FAKE_LATENCY", 0.25)
+    messaging.reset_backend()
+    try:
+        with app.app_context():
+            backend = messaging.get_backend()
+            assert isinstance(backend, messaging.FakeBackend)
+            assert backend.latency == 0.25
+            assert messaging.get_backend() is backend
+            assert isinstance(messaging.get_backend("meta"), messaging.MetaBackend)
+    finally:
+        messaging.reset_backend()
+
+
+def test_fake_backend_records_and_injects_errors():
+    slept = []
+    backend = messaging.FakeBackend(latency=0.05, sleep=slept.append)
+    first = backend.send_text("34600001601", "hola")
+    backend.fail_next(times=1)
+    with pytest.raises(messaging.FakeSendError):
+        backend.send_template("34600001601", "aviso")
+    assert backend.send_template("34600001602", "aviso") != first
+    assert slept == [0.05, 0.05, 0.05]
+    assert [c["kind"] for c in backend.calls] == ["text", "template", "template"]
+    assert [c["message_id"] for c in backend.sent("34600001601")] == [first]
+
+    always_fails = messaging.FakeBackend(error_rate=1.0, seed=1)
+    with pytest.raises(messaging.FakeSendError):
+        always_fails.send_text("34600001601", "hola")
+
+
+def test_outbox_fan_out_goes_through_backend(app, fake_backend):
+    fake_backend.fail_next()
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE users SET whatsapp_number = '34600001603', whatsapp_opt_in = 1 WHERE id = 2")
+        enqueue_notifications(db, [2], "Messaging test")
+        db.commit()
+        try:
+            assert drain_outbox(db) == {"claimed": 2, "sent": 1, "errors": 1}
+            db.execute("UPDATE notification_outbox SET next_attempt_at = datetime('now') WHERE status = 'pending'")
+            db.commit()
+            assert drain_outbox(db) == {"claimed": 1, "sent": 1, "errors": 0}
+            assert [c["text"] for c in fake_backend.sent("34600001603")] == ["Messaging test"]
+        finally:
+            db.execute("DELETE FROM notification_outbox WHERE message = 'Messaging test'")
+            db.execute("DELETE FROM notifications WHERE message = 'Messaging test'")
+            db.execute("DELETE FROM whatsapp_message_logs WHERE message_body = 'Messaging test'")
+            db.execute("UPDATE users SET whatsapp_number = NULL, whatsapp_opt_in = 0 WHERE id = 2")
+            db.commit()
+
+
+def test_send_message_endpoint_logs_backend_message_id(app, client, fake_backend):
+    with app.app_context():
+        db = get_db()
+        try:
+            response = client.post(
+                "/webhooks/whatsapp/send_message", json={"to": "34600001604", "body": "Hola fake"}
+            )
+            assert response.status_code == 200
+            message_id = response.get_json()["message_id"]
+            assert fake_backend.sent("34600001604")[0]["message_id"] == message_id
+            row = db.execute(
+                "SELECT whatsapp_message_id, status FROM whatsapp_message_logs WHERE message_body = 'Hola fake'"
+            ).fetchone()
+            assert tuple(row) == (message_id, "sent")
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE message_body = 'Hola fake'")
+            db.commit()
+
+
+def test_twilio_client_is_created_once_per_process(app, monkeypatch):
+    import twilio.rest
+
+    created, sent = [], []
+
+    class _Messages:
+        def create(self, **params):
+            sent.append(params)
+            return type("Message", (), {"sid": f"SM{len(sent)}"})()
+
+    class _Client:
+        def __init__(self, sid, token):
+            created.append((sid, token))
+            self.messages = _Messages()
+
+    monkeypatch.setattr(twilio.rest, "Client", _Client)
+    monkeypatch.setenv("TWILIO_ACCOUNT_SID", "AC1")
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "tok")
+    monkeypatch.setenv("TWILIO_WA_FROM", "whatsapp:+14155238886")
+    monkeypatch.setitem(app.config, "WHATSAPP_RECIPIENT_INTERVAL", 0)
+    reset_scheduler()
+    try:
+        with app.app_context():
+            backend = messaging.TwilioBackend()
+            assert backend.send_text("600 00 16 05", "uno") == "SM1"
+            assert backend.send_template("34600001605", "HX123") == "SM2"
+        assert created == [("AC1", "tok")]
+        assert sent[0]["to"] == "whatsapp:+34600001605" and sent[0]["body"] == "uno"
+        assert sent[1]["content_sid"] == "HX123"
+    finally:
+        reset_scheduler()
@@ -0,0 +1,80 @@
+from backend.db_utils import get_db
+from backend.metrics import (
+    compute_dashboard_kpis,
+    get_dashboard_kpis,
+    invalidate_dashboard_kpis,
+    normalize_state,
+)
+
+
+def test_normalize_state():
+    assert normalize_state("En Progreso") == "en_progreso"
+    assert normalize_state("  ABIERTO ") == "abierto"
+    assert normalize_state(None) == ""
+
+
+def test_kpis_cached_until_invalidated(app):
+    with app.app_context():
+        db = get_db()
+        invalidate_dashboard_kpis()
+        before = get_dashboard_kpis(db)
+
+        db.execute(
+            "INSERT INTO tickets (id, cliente_id, creado_por, titulo, estado, tipo, estado_pago) "
+            "VALUES (900, 1, 1, 'KPI cache', 'En Progreso', 'averia', 'Pendiente')"
+        )
+        db.commit()
+        try:
+            # Sin invalidar se sirve la copia cacheada
+            assert get_dashboard_kpis(db) == before
+
+            invalidate_dashboard_kpis()
+            after = get_dashboard_kpis(db)
+            assert after["total"] == before["total"] + 1
+            assert after["en_curso"] == before["en_curso"] + 1
+            assert after["pagos_pendientes"] == before["pagos_pendientes"] + 1
+            assert after == compute_dashboard_kpis(db)
+        finally:
+            db.execute("DELETE FROM tickets WHERE id = 900")
+            db.commit()
+            invalidate_dashboard_kpis()
+
+
+def test_kpi_counters_follow_ticket_writes(app):
+    from backend.metrics import check_kpi_counters
+
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO tickets (id, cliente_id, creado_por, titulo, estado, tipo, estado_pago) "
+            "VALUES (901, 1, 1, 'Triggers', 'abierto', 'averia', 'Pendiente')"
+        )
+        db.execute("UPDATE tickets SET estado = 'finalizado', estado_pago = 'Pagado' WHERE id = 901")
+        db.commit()
+        try:
+            assert check_kpi_counters(db) == []
+            assert compute_dashboard_kpis(db)["completados"] == 2
+        finally:
+            db.execute("DELETE FROM tickets WHERE id = 901")
+            db.commit()
+        assert check_kpi_counters(db) == []
+
+
+def test_kpi_rebuild_command_repairs_drift(app):
+    runner = app.test_cli_runner()
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE kpi_counters SET count = count + 5 WHERE kind = 'estado' AND value = 'abierto'")
+        db.commit()
+
+        result = runner.invoke(args=["kpi-rebuild", "--check"])
+        assert result.exit_code != 0
+        assert "estado='abierto': guardado 8, real 3" in result.output
+
+        result = runner.invoke(args=["kpi-rebuild"])
+        assert result.exit_code == 0, result.output
+        assert "1 contadores reparados." in result.output
+
+        result = runner.invoke(args=["kpi-rebuild", "--check"])
+        assert result.exit_code == 0
+        assert "kpi_counters está al día." in result.output
@@ -0,0 +1,74 @@
+from backend import outbox
+from backend.db_utils import get_db
+from backend.outbox import dispatch_outbox, drain_outbox, enqueue_notifications
+
+
+def test_outbox_follows_caller_transaction(app):
+    with app.app_context():
+        db = get_db()
+        assert enqueue_notifications(db, [1, 2, 1], "rollback", whatsapp=False) == 2
+        db.rollback()
+        assert db.execute("SELECT COUNT(*) FROM notification_outbox WHERE message = 'rollback'").fetchone()[0] == 0
+
+
+def test_outbox_dispatch_batches_and_retries(app):
+    calls = []
+
+    def flaky_send(to_number, text):
+        calls.append(to_number)
+        if len(calls) == 1:
+            raise RuntimeError("timeout")
+        return {"messages": [{"id": "wamid.outbox"}]}
+
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE users SET whatsapp_number = '34600000002', whatsapp_opt_in = 1 WHERE id = 2")
+        enqueue_notifications(db, [1, 2], "Outbox test")
+        db.commit()
+        try:
+            totals = drain_outbox(db, send=flaky_send)
+            assert totals == {"claimed": 4, "sent": 2, "errors": 1}
+            assert db.execute(
+                "SELECT COUNT(*) FROM notifications WHERE message = 'Outbox test'"
+            ).fetchone()[0] == 2
+            rows = dict(db.execute(
+                "SELECT user_id || channel, status FROM notification_outbox WHERE message = 'Outbox test'"
+            ).fetchall())
+            assert rows == {"1app": "sent", "2app": "sent", "1whatsapp": "skipped", "2whatsapp": "pending"}
+
+            # El reintento espera (backoff); al vencer se envía y queda registrado
+            db.execute("UPDATE notification_outbox SET next_attempt_at = datetime('now') WHERE status = 'pending'")
+            db.commit()
+            assert dispatch_outbox(db, send=flaky_send)["sent"] == 1
+            row = db.execute(
+                "SELECT status, attempts FROM notification_outbox WHERE message = 'Outbox test' AND channel = 'whatsapp' AND user_id = 2"
+            ).fetchone()
+            assert (row["status"], row["attempts"]) == ("sent", 2)
+            assert db.execute(
+                "SELECT COUNT(*) FROM whatsapp_message_logs WHERE whatsapp_message_id = 'wamid.outbox'"
+            ).fetchone()[0] == 1
+        finally:
+            db.execute("DELETE FROM notification_outbox WHERE message = 'Outbox test'")
+            db.execute("DELETE FROM notifications WHERE message = 'Outbox test'")
+            db.execute("DELETE FROM whatsapp_message_logs WHERE message_body = 'Outbox test'")
+            db.execute("UPDATE users SET whatsapp_number = NULL, whatsapp_opt_in = 0 WHERE id = 2")
+            db.commit()
+
+
+def test_dispatcher_starts_with_first_request(app, client, monkeypatch):
+    # Tras un reinicio lo pendiente se drena sin esperar a un nuevo encolado
+    started = []
+    monkeypatch.setattr(outbox, "_dispatcher_thread", None)
+    monkeypatch.setattr(outbox, "_dispatcher_loop", lambda app: started.append(app))
+    monkeypatch.setitem(app.config, "OUTBOX_DISPATCHER", True)
+    outbox._wake.clear()
+    monkeypatch.delitem(app.extensions, "background_workers_started", raising=False)
+    client.get("/auth/login")
+    outbox._dispatcher_thread.join(timeout=5)
+    assert started == [app] and outbox._wake.is_set()
+    outbox._wake.clear()
+
+    # Los hilos se arrancan una sola vez: las peticiones siguientes no vuelven a llamar a ensure_*
+    monkeypatch.setattr(outbox, "ensure_dispatcher", lambda: started.append("otra vez"))
+    client.get("/auth/login")
+    assert started == [app]
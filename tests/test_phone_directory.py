@@ -0,0 +1,76 @@
+import pytest
+
+from backend.db_utils import get_db
+from backend.phone_directory import (
+    check_phone_directory,
+    invalidate_phone_directory,
+    rebuild_phone_directory,
+    resolve_number,
+    to_e164,
+)
+
+# Cada formato en Python y en SQL (vista phone_directory_source) debe dar lo mismo
+SAMPLES = [
+    ("+34 600 11 12 22", "+34600111222"),
+    ("whatsapp:+34600111222", "+34600111222"),
+    ("34600111222", "+34600111222"),
+    ("0034-600-111-222", "+34600111222"),
+    ("(600) 111.222", "+34600111222"),
+    ("912345678", "+34912345678"),
+    ("+1 (415) 555-0100", "+14155550100"),
+    ("12345", None),
+    ("600-ABC", None),
+    ("", None),
+]
+
+
+@pytest.mark.parametrize("raw, expected", SAMPLES)
+def test_to_e164(raw, expected):
+    assert to_e164(raw) == expected
+
+
+def test_sql_normalization_matches_python(app):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO providers (id, nombre, telefono) VALUES (?, ?, ?)",
+            [(1400 + i, f"Tel {i}", raw) for i, (raw, _) in enumerate(SAMPLES)],
+        )
+        try:
+            rows = dict(db.execute(
+                "SELECT entity_id, number FROM phone_directory WHERE kind = 'provider' AND entity_id BETWEEN 1400 AND 1499"
+            ).fetchall())
+            assert {1400 + i: expected for i, (_, expected) in enumerate(SAMPLES) if expected} == rows
+        finally:
+            db.rollback()
+
+
+def test_directory_follows_writes_and_resolves(app):
+    with app.app_context():
+        db = get_db()
+        invalidate_phone_directory()
+        db.execute("INSERT INTO providers (id, nombre, whatsapp_number) VALUES (1451, 'Prov Tel', '600 000 145')")
+        db.execute("INSERT INTO clientes (id, nombre, telefono) VALUES (1452, 'Cliente Tel', '+34600000145')")
+        db.commit()
+        try:
+            assert resolve_number(db, "whatsapp:+34600000145") == {"provider": 1451, "client": 1452}
+            assert resolve_number(db, "34600000145") == {"provider": 1451, "client": 1452}
+
+            db.execute("UPDATE providers SET whatsapp_number = '600000146' WHERE id = 1451")
+            db.execute("DELETE FROM clientes WHERE id = 1452")
+            db.commit()
+            invalidate_phone_directory()
+            assert resolve_number(db, "+34600000145") == {}
+            assert resolve_number(db, "+34600000146") == {"provider": 1451}
+
+            # Una desviación (p. ej. escrita sin triggers) se detecta y repara
+            db.execute("DELETE FROM phone_directory WHERE entity_id = 1451")
+            db.commit()
+            assert check_phone_directory(db) == (1, 0)
+            assert rebuild_phone_directory(db) == (1, 0)
+            assert check_phone_directory(db) == (0, 0)
+        finally:
+            db.execute("DELETE FROM providers WHERE id = 1451")
+            db.execute("DELETE FROM clientes WHERE id = 1452")
+            db.commit()
+            invalidate_phone_directory()
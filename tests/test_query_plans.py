@@ -0,0 +1,25 @@
+from backend.db_utils import get_db
+from backend.query_catalog import find_full_scans
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        assert find_full_scans(get_db()) == {}
+
+
+def test_check_indexes_command_reports_scans(app):
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["db-check-indexes"])
+    assert result.exit_code == 0, result.output
+    assert "Todas las consultas calientes usan índices." in result.output
+
+    with app.app_context():
+        db = get_db()
+        db.execute("DROP INDEX idx_notifications_user_read")
+        try:
+            result = runner.invoke(args=["db-check-indexes"])
+            assert result.exit_code != 0
+            assert "FALLO notifications.unread_notifications_count" in result.output
+        finally:
+            db.execute("CREATE INDEX idx_notifications_user_read ON notifications (user_id, is_read)")
+            db.commit()
@@ -0,0 +1,31 @@
+from datetime import date
+
+import pytest
+
+from backend.quote_parser import benchmark, evaluate, load_corpus, parse_number, parse_quote_reply
+
+MONDAY = date(2025, 3, 10)
+
+
+@pytest.mark.parametrize("raw, expected", [("45", 45.0), ("12,5", 12.5), ("12.50", 12.5), ("1.200", 1200.0),
+                                           ("1.234,56", 1234.56), ("1,234.56", 1234.56)])
+def test_parse_number(raw, expected):
+    assert parse_number(raw) == expected
+
+
+def test_dates_quantities_and_phones_are_not_amounts():
+    assert parse_quote_reply("Entrega 15/03, 10 uds, llámame al 600111222", MONDAY) == {
+        "amount": None, "currency": "EUR", "vat_included": None, "delivery_date": "2025-03-15", "stock": None,
+    }
+    parsed = parse_quote_reply("No tenemos stock; bajo pedido en 2 semanas a 330 € + IVA", MONDAY)
+    assert parsed == {
+        "amount": 330.0, "currency": "EUR", "vat_included": False, "delivery_date": "2025-03-24", "stock": "no_stock",
+    }
+
+
+def test_corpus_precision_and_throughput():
+    corpus = load_corpus()
+    report = evaluate(corpus)
+    assert report["messages"] >= 50
+    assert min(report["precision"].values()) >= 0.95, report["failures"]
+    assert benchmark(corpus, min_seconds=0.05) > 0
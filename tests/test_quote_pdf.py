@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import io
+import os
+
+from PIL import Image as PILImage
+
+from backend.blob_store import blob_path, store_blob
+from backend.db_utils import get_db
+from backend.quote_pdf import (
+    drain_signed_quote_jobs,
+    enqueue_signed_quote,
+    load_quote_payloads,
+    render_signed_quote_pdf,
+)
+from backend import receipt_worker
+from backend.receipt_worker import create_pool
+
+
+def _signature_data_url():
+    buffer = io.BytesIO()
+    PILImage.new("RGBA", (400, 200), (0, 0, 0, 0)).save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_store_blob_deduplicates(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "BLOB_FOLDER", str(tmp_path))
+    with app.app_context():
+        db = get_db()
+        first = store_blob(db, b"%PDF-contenido", "application/pdf")
+        second = store_blob(db, b"%PDF-contenido", "application/pdf")
+        db.commit()
+        assert first == second
+        assert db.execute("SELECT COUNT(*) FROM blobs WHERE sha256 = ?", (first,)).fetchone()[0] == 1
+        assert os.listdir(os.path.dirname(blob_path(first))) == [first]
+
+
+def test_sign_quote_stores_signature_and_renders_pdf(app, client, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "BLOB_FOLDER", str(tmp_path))
+    sent = []
+    monkeypatch.setattr("backend.messaging.send_whatsapp_text", lambda to, text: sent.append((to, text)))
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (id, nombre, whatsapp_number) VALUES (2501, 'Cliente Firma', '34600111222')")
+        db.execute("INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo) VALUES (2501, 2501, 'reparacion', 1, 'Obra')")
+        db.execute(
+            "INSERT INTO presupuestos (id, ticket_id, total, signature_token) VALUES (2501, 2501, 150, 'tok-2501')"
+        )
+        db.executemany(
+            "INSERT INTO presupuesto_items (presupuesto_id, descripcion, qty, precio_unit) VALUES (2501, ?, ?, ?)",
+            [("Mano de obra", 2, 50), ("Material", 1, 50)],
+        )
+        db.commit()
+
+    response = client.post("/quotes/sign/tok-2501", data={"client_name": "Ana", "signature_data": "data:text/plain;base64,eA=="})
+    assert response.status_code == 200  # firma inválida: se vuelve a mostrar el formulario
+    response = client.post(
+        "/quotes/sign/tok-2501",
+        data={"client_name": "Ana", "signature_data": _signature_data_url()},
+        base_url="https://avisos.example.com",
+    )
+    assert response.status_code == 302
+
+    with app.app_context(), app.test_request_context():
+        db = get_db()
+        row = db.execute("SELECT * FROM presupuestos WHERE id = 2501").fetchone()
+        assert row["estado"] == "Aprobado" and row["client_signature_data"] is None
+        assert os.path.exists(blob_path(row["client_signature_sha256"]))
+
+        totals = drain_signed_quote_jobs(db, create_pool(0))
+        assert totals == {"claimed": 1, "rendered": 1, "errors": 0}
+        pdf_sha256 = db.execute("SELECT signed_pdf_sha256 FROM presupuestos WHERE id = 2501").fetchone()[0]
+        # El enlace lleva el host de la petición de firma, no el del contexto del hilo
+        assert sent and f"https://avisos.example.com/blobs/{pdf_sha256}" in sent[0][1]
+
+        # Render determinista: el mismo presupuesto da el mismo blob
+        payloads, _, _ = load_quote_payloads(db, [2501])
+        assert hashlib.sha256(render_signed_quote_pdf(payloads[2501])).hexdigest() == pdf_sha256
+
+    response = client.get(f"/blobs/{pdf_sha256}")
+    assert response.status_code == 200 and response.data.startswith(b"%PDF-")
+    assert response.mimetype == "application/pdf"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert client.get(f"/blobs/{pdf_sha256}", headers={"If-None-Match": f'"{pdf_sha256}"'}).status_code == 304
+    assert client.get("/blobs/" + "0" * 64).status_code == 404
+
+
+def test_signed_quote_batch_isolates_missing_signature(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "BLOB_FOLDER", str(tmp_path))
+    monkeypatch.setitem(app.config, "PUBLIC_BASE_URL", "https://publico.example.com/")
+    sent = []
+    monkeypatch.setattr("backend.messaging.send_whatsapp_text", lambda to, text: sent.append((to, text)))
+    with app.app_context(), app.test_request_context():
+        db = get_db()
+        signature = store_blob(db, base64.b64decode(_signature_data_url().split(",", 1)[1]), "image/png")
+        db.execute("INSERT INTO clientes (id, nombre, whatsapp_number) VALUES (2511, 'Cliente Lote', '34600333444')")
+        db.execute("INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo) VALUES (2511, 2511, 'reparacion', 1, 'Obra')")
+        db.executemany(
+            "INSERT INTO presupuestos (id, ticket_id, total, client_signature_sha256) VALUES (?, 2511, 80, ?)",
+            [(2511, signature), (2512, "f" * 64)],  # 2512: el blob de la firma no existe
+        )
+        enqueue_signed_quote(db, 2511, "http://localhost/")
+        enqueue_signed_quote(db, 2512)
+        db.commit()
+
+        totals = drain_signed_quote_jobs(db, create_pool(0))
+        assert totals == {"claimed": 2, "rendered": 1, "errors": 1}
+        jobs = {
+            row["presupuesto_id"]: row
+            for row in db.execute("SELECT presupuesto_id, status, last_error FROM quote_pdf_jobs WHERE presupuesto_id IN (2511, 2512)")
+        }
+        assert jobs[2511]["status"] == "done" and jobs[2511]["last_error"] is None
+        assert jobs[2512]["status"] == "pending" and "FileNotFoundError" in jobs[2512]["last_error"]
+        # PUBLIC_BASE_URL manda sobre la raíz guardada con el trabajo
+        assert sent and "https://publico.example.com/blobs/" in sent[0][1]
+
+
+def test_signature_backfill_renders_pdfs_without_messaging_clients(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "BLOB_FOLDER", str(tmp_path))
+    sent, pools = [], []
+    monkeypatch.setattr("backend.messaging.send_whatsapp_text", lambda to, text: sent.append((to, text)))
+
+    class _RecordingPool(receipt_worker._InlineExecutor):
+        def shutdown(self, wait=True, *, cancel_futures=False):
+            pools.append("shutdown")
+
+    monkeypatch.setattr(receipt_worker, "create_pool", lambda size: _RecordingPool())
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO clientes (id, nombre, whatsapp_number) VALUES (2521, 'Cliente Antiguo', '34600555666')")
+        db.execute("INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo) VALUES (2521, 2521, 'reparacion', 1, 'Obra')")
+        db.execute(
+            "INSERT INTO presupuestos (id, ticket_id, total, estado, client_signature_data) VALUES (2521, 2521, 90, 'Aprobado', ?)",
+            (_signature_data_url(),),
+        )
+        db.commit()
+
+        result = app.test_cli_runner().invoke(args=["quote-signatures-migrate"])
+        assert result.exit_code == 0, result.output
+        assert "1 PDF firmados generados" in result.output
+        row = db.execute("SELECT signed_pdf_sha256, signed_pdf_url FROM presupuestos WHERE id = 2521").fetchone()
+        assert row["signed_pdf_sha256"]
+        # Sin host conocido el enlace queda relativo, y el cliente no recibe un segundo aviso
+        assert row["signed_pdf_url"] == f"/blobs/{row['signed_pdf_sha256']}"
+        assert sent == [] and pools == ["shutdown"]
@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from backend import receipt_worker
+from backend.db_utils import get_db
+from backend.receipt_worker import create_pool, drain_receipt_jobs, enqueue_receipt, render_receipts_for_range
+
+
+def _seed(db):
+    db.execute("INSERT INTO clientes (id, nombre, telefono, email) VALUES (2401, 'Cliente Recibo', '600000000', 'r@x.es')")
+    db.executemany(
+        "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, estado, estado_pago, metodo_pago) "
+        "VALUES (?, 2401, 'reparacion', 1, ?, 'Completado', 'Pagado', 'Efectivo')",
+        [(2401, "Recibo 1"), (2402, "Recibo 2")],
+    )
+    db.executemany(
+        "INSERT INTO financial_transactions (ticket_id, type, amount, transaction_date) VALUES (?, 'income', ?, ?)",
+        [(2401, 121.0, "2031-03-05 10:00:00"), (2402, 60.5, "2031-04-02 10:00:00")],
+    )
+    db.commit()
+
+
+def _receipt_file(app, db, ticket_id):
+    url = db.execute("SELECT recibo_url FROM tickets WHERE id = ?", (ticket_id,)).fetchone()[0]
+    assert url and url.endswith(".pdf")
+    return os.path.join(app.config["UPLOAD_FOLDER"], os.path.basename(url))
+
+
+def test_queue_renders_receipts_and_retries_failures(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    with app.app_context(), app.test_request_context():
+        db = get_db()
+        _seed(db)
+        enqueue_receipt(db, 2401)
+        enqueue_receipt(db, 2401)  # dos pagos del mismo ticket: un solo PDF
+        enqueue_receipt(db, 2402)
+        db.commit()
+
+        render = receipt_worker.render_receipt
+
+        def failing_render(output_path, payload):
+            if payload["job_details"]["id"] == 2402:
+                raise OSError("disco lleno")
+            return render(output_path, payload)
+
+        monkeypatch.setattr(receipt_worker, "render_receipt", failing_render)
+        monkeypatch.setitem(app.config, "RECEIPT_MAX_ATTEMPTS", 1)
+        totals = drain_receipt_jobs(db, create_pool(0))
+        assert totals == {"claimed": 3, "rendered": 2, "errors": 1}
+
+        path = _receipt_file(app, db, 2401)
+        with open(path, "rb") as f:
+            assert f.read(5) == b"%PDF-"
+        assert not os.path.exists(f"{path}.tmp")
+        statuses = dict(
+            db.execute(
+                "SELECT ticket_id, group_concat(DISTINCT status) FROM receipt_jobs "
+                "WHERE ticket_id IN (2401, 2402) GROUP BY ticket_id"
+            ).fetchall()
+        )
+        assert statuses == {2401: "done", 2402: "failed"}
+        assert "disco lleno" in db.execute("SELECT last_error FROM receipt_jobs WHERE ticket_id = 2402").fetchone()[0]
+        assert drain_receipt_jobs(db, create_pool(0))["claimed"] == 0
+
+
+def test_render_receipts_for_range(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    with app.app_context(), app.test_request_context():
+        db = get_db()
+        if db.execute("SELECT 1 FROM clientes WHERE id = 2401").fetchone() is None:
+            _seed(db)
+        stats = render_receipts_for_range(db, "2031-04-01", "2031-05-01", workers=0)
+        assert stats["tickets"] == 1 and stats["rendered"] == 1 and not stats["errors"]
+        assert os.path.exists(_receipt_file(app, db, 2402))
+
+
+class _BrokenPool(Executor):
+    """Pool cuyo proceso murió: todo submit falla con BrokenProcessPool."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        raise BrokenProcessPool("proceso terminado")
+
+
+def test_broken_pool_is_recreated_without_failing_jobs(app, monkeypatch, tmp_path):
+    monkeypatch.setitem(app.config, "UPLOAD_FOLDER", str(tmp_path))
+    with app.app_context(), app.test_request_context():
+        db = get_db()
+        if db.execute("SELECT 1 FROM clientes WHERE id = 2401").fetchone() is None:
+            _seed(db)
+        enqueue_receipt(db, 2402)
+        db.commit()
+        job_id = db.execute("SELECT MAX(id) FROM receipt_jobs").fetchone()[0]
+
+        with pytest.raises(BrokenProcessPool):
+            receipt_worker.process_receipt_jobs(db, _BrokenPool())
+        job = db.execute("SELECT status, attempts, last_error FROM receipt_jobs WHERE id = ?", (job_id,)).fetchone()
+        assert job["status"] == "pending" and job["attempts"] == 1 and "BrokenProcessPool" in job["last_error"]
+
+        # El hilo descarta el pool roto y sigue con uno nuevo
+        broken = _BrokenPool()
+        db.execute("UPDATE receipt_jobs SET next_attempt_at = datetime('now') WHERE id = ?", (job_id,))
+        db.commit()
+        pool = receipt_worker._drain_documents(app, broken)
+        assert pool is not broken
+        receipt_worker._wake.clear()
+        db.execute("UPDATE receipt_jobs SET next_attempt_at = datetime('now') WHERE id = ?", (job_id,))
+        db.commit()
+        receipt_worker._drain_documents(app, pool)
+        assert db.execute("SELECT status FROM receipt_jobs WHERE id = ?", (job_id,)).fetchone()[0] == "done"
+
+
+def test_receipt_worker_starts_with_first_request(app, client, monkeypatch):
+    started = []
+    monkeypatch.setattr(receipt_worker, "_worker_thread", None)
+    monkeypatch.setattr(receipt_worker, "_worker_loop", lambda app: started.append(app))
+    monkeypatch.setitem(app.config, "RECEIPT_WORKER", True)
+    receipt_worker._wake.clear()
+    monkeypatch.delitem(app.extensions, "background_workers_started", raising=False)
+    client.get("/auth/login")
+    receipt_worker._worker_thread.join(timeout=5)
+    assert started == [app] and receipt_worker._wake.is_set()
+    receipt_worker._wake.clear()
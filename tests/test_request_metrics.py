@@ -0,0 +1,44 @@
+import threading
+
+from backend.request_metrics import render_metrics
+
+
+def test_metrics_endpoint_exposes_histograms(client, auth):
+    auth.login()
+    client.get("/jobs/api")
+    client.get("/jobs/api")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_bucket{endpoint="jobs.list_jobs_json",le="+Inf"}' in body
+    assert 'http_responses_total{endpoint="jobs.list_jobs_json",method="GET",status="200"}' in body
+    assert 'http_request_db_seconds_count{endpoint="jobs.list_jobs_json"}' in body
+    assert "http_requests_in_flight 1" in body  # la propia petición a /metrics
+
+
+def _count(body, prefix):
+    for line in body.splitlines():
+        if line.startswith(prefix):
+            return int(line.rsplit(" ", 1)[1])
+    return 0
+
+
+def test_metrics_aggregate_across_threads(app):
+    key = 'http_responses_total{endpoint="health.health_check",method="GET",status="200"}'
+    before = _count(render_metrics(), key)
+
+    def worker():
+        c = app.test_client()
+        for _ in range(5):
+            c.get("/healthz/")
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert _count(render_metrics(), key) == before + 20
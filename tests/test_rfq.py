@@ -0,0 +1,154 @@
+import threading
+
+from backend import rfq, whatsapp_meta
+from backend.db_utils import get_db
+
+
+def _seed(db):
+    db.execute(
+        "INSERT INTO tickets (id, cliente_id, creado_por, asignado_a, titulo, estado, tipo) VALUES (1201, 1, 1, 2, 'RFQ', 'abierto', 'averia')"
+    )
+    for material_id in (12011, 12012):
+        db.execute(
+            "INSERT INTO materiales (id, sku, nombre, categoria) VALUES (?, ?, ?, 'fontaneria')",
+            (material_id, f"SKU-{material_id}", f"Material {material_id}"),
+        )
+        db.execute(
+            "INSERT INTO job_materials (job_id, material_id, quantity, price_per_unit, total_price) VALUES (1201, ?, 1, 1, 1)",
+            (material_id,),
+        )
+    db.executemany(
+        "INSERT INTO providers (id, nombre, whatsapp_number, is_active) VALUES (?, ?, ?, 1)",
+        [(1211, "Prov A", "34600001211"), (1212, "Prov B", "34600001212"), (1213, "Prov C", None)],
+    )
+    # Prov B ya cotizó un material de la misma categoría: va primero en el ranking
+    db.execute(
+        "INSERT INTO provider_quotes (job_id, material_id, provider_id, status) VALUES (1201, 12011, 1212, 'received')"
+    )
+    db.commit()
+
+
+def _cleanup(db):
+    db.execute("DELETE FROM whatsapp_message_logs WHERE job_id = 1201 OR provider_id IN (1211, 1212)")
+    db.execute("DELETE FROM provider_quotes WHERE job_id = 1201")
+    db.execute("DELETE FROM job_materials WHERE job_id = 1201")
+    db.execute("DELETE FROM materiales WHERE id IN (12011, 12012)")
+    db.execute("DELETE FROM providers WHERE id IN (1211, 1212, 1213)")
+    db.execute("DELETE FROM tickets WHERE id = 1201")
+    db.commit()
+
+
+def test_fan_out_sends_concurrently_and_records_in_one_batch(app):
+    barrier = threading.Barrier(2, timeout=5)  # sólo se cruza si los dos envíos están en vuelo a la vez
+    sent_to = []
+
+    def send_text(to_number, text):
+        barrier.wait()
+        sent_to.append(to_number)
+        if to_number == "34600001212":
+            raise RuntimeError("HTTP 500")
+        return {"messages": [{"id": f"wamid.{to_number}"}]}
+
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            assert [p["id"] for p in rfq.top_providers_for_materials(db, [12011], 2)] == [1212, 1211]
+
+            results = rfq.fan_out_rfq(db, 1201, [12011, 12012], [1211, 1212, 1213], send_text=send_text)
+            assert [(r["provider_id"], r["status"]) for r in results] == [
+                (1211, "sent"), (1212, "failed"), (1213, "skipped"),
+            ]
+            assert sorted(sent_to) == ["34600001211", "34600001212"]
+            assert results[1]["error"] == "HTTP 500"
+
+            quotes = db.execute(
+                "SELECT material_id, whatsapp_message_id FROM provider_quotes "
+                "WHERE job_id = 1201 AND status = 'pending' ORDER BY material_id"
+            ).fetchall()
+            assert [tuple(q) for q in quotes] == [(12011, "wamid.34600001211"), (12012, "wamid.34600001211")]
+            logs = db.execute(
+                "SELECT provider_id, status, COUNT(*) FROM whatsapp_message_logs WHERE job_id = 1201 GROUP BY 1, 2"
+            ).fetchall()
+            assert [tuple(r) for r in logs] == [(1211, "sent", 2), (1212, "failed", 2)]
+        finally:
+            _cleanup(db)
+
+
+def test_bulk_endpoint_defaults_to_job_materials_and_top_providers(app, client, auth, monkeypatch):
+    monkeypatch.setattr(rfq, "send_whatsapp_text", lambda to, text: {"messages": [{"id": f"wamid.{to}"}]})
+    auth.login()
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            response = client.post("/jobs/1201/materials/request_quotes", json={"top_n": 1})
+            assert response.status_code == 200
+            data = response.get_json()
+            assert data["material_ids"] == [12011, 12012]
+            assert data["summary"] == {"sent": 1, "failed": 0, "skipped": 0}
+            assert data["results"][0]["provider_id"] == 1212
+        finally:
+            _cleanup(db)
+
+
+def test_open_session_windows_matches_any_number_format(app):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO whatsapp_message_logs (direction, from_number, message_body, timestamp) "
+            "VALUES ('inbound', '34600001299', 'hola', '2030-01-01 10:00:00')"
+        )
+        db.commit()
+        try:
+            numbers = ["+34 600 001 299", "600001299", "34600001298"]
+            assert rfq.open_session_windows(db, numbers, now="2030-01-02 09:00:00") == {"+34 600 001 299", "600001299"}
+            assert rfq.open_session_windows(db, numbers, now="2030-01-02 11:00:00") == set()
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE from_number = '34600001299'")
+            db.commit()
+
+
+def test_reply_to_multi_material_rfq_sets_each_material(app):
+    def send_text(to_number, text):
+        return {"messages": [{"id": f"wamid.rfq.{to_number}"}]}
+
+    def quotes(db):
+        rows = db.execute(
+            "SELECT material_id, status, quote_amount, vat_included FROM provider_quotes "
+            "WHERE job_id = 1201 AND provider_id = 1211 ORDER BY material_id"
+        ).fetchall()
+        return [tuple(r) for r in rows]
+
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            rfq.fan_out_rfq(db, 1201, [12011, 12012], [1211], send_text=send_text)
+            status = whatsapp_meta.handle_incoming_message(
+                "34600001211", "Material 12011: 10 €, Material 12012: 20 € IVA incluido", "wamid.reply1"
+            )
+            assert status == "processed"
+            assert quotes(db) == [(12011, "received", 10.0, 1), (12012, "received", 20.0, 1)]
+            # Todo el RFQ está respondido: otra respuesta ya no tiene a qué enlazarse
+            assert whatsapp_meta.handle_incoming_message("34600001211", "Perdón, 12 €", "wamid.reply2") == "received"
+
+            # Respuestas por partes, una citando el mensaje del RFQ
+            db.execute("DELETE FROM provider_quotes WHERE job_id = 1201 AND provider_id = 1211")
+            db.commit()
+            rfq.fan_out_rfq(db, 1201, [12011, 12012], [1211], send_text=send_text)
+            assert whatsapp_meta.handle_incoming_message("34600001211", "Material 12012 a 7,50 €", "wamid.reply3") == "processed"
+            assert quotes(db) == [(12011, "pending", None, None), (12012, "received", 7.5, None)]
+            assert whatsapp_meta.handle_incoming_message(
+                "34600001211", "El material 12011: 3 €", "wamid.reply4", context_message_id="wamid.rfq.34600001211"
+            ) == "processed"
+            assert quotes(db) == [(12011, "received", 3.0, None), (12012, "received", 7.5, None)]
+
+            # Un precio sin decir de qué material no se asigna a ninguno
+            db.execute("DELETE FROM provider_quotes WHERE job_id = 1201 AND provider_id = 1211")
+            db.commit()
+            rfq.fan_out_rfq(db, 1201, [12011, 12012], [1211], send_text=send_text)
+            assert whatsapp_meta.handle_incoming_message("34600001211", "Todo junto 30 €", "wamid.reply5") == "unprocessed"
+            assert quotes(db) == [(12011, "pending", None, None), (12012, "pending", None, None)]
+        finally:
+            _cleanup(db)
@@ -0,0 +1,83 @@
+from backend import search
+from backend.db_utils import get_db
+
+
+def _seed(db):
+    db.execute("INSERT INTO clientes (id, nombre, ciudad) VALUES (2001, 'Comunidad Jardín', 'Córdoba')")
+    db.execute(
+        "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, descripcion) "
+        "VALUES (2001, 2001, 'reparacion', 1, 'Fuga calefacción', 'Radiador del salón gotea')"
+    )
+    db.execute(
+        "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, descripcion) "
+        "VALUES (2002, 2001, 'revision', 1, 'Revisión anual', 'Comprobar caldera y calefacción')"
+    )
+    db.execute("INSERT INTO materiales (id, sku, nombre, categoria) VALUES (20011, 'RAD-2001', 'Radiador aluminio', 'Calefacción')")
+    db.execute("INSERT INTO presupuestos (id, ticket_id, total) VALUES (2001, 2001, 90)")
+    db.execute(
+        "INSERT INTO presupuesto_items (id, presupuesto_id, descripcion, qty, precio_unit) "
+        "VALUES (2001, 2001, 'Purgado de radiadores', 1, 90)"
+    )
+    db.commit()
+
+
+def _cleanup(db):
+    db.execute("DELETE FROM presupuesto_items WHERE id = 2001")
+    db.execute("DELETE FROM presupuestos WHERE id = 2001")
+    db.execute("DELETE FROM materiales WHERE id = 20011")
+    db.execute("DELETE FROM tickets WHERE id IN (2001, 2002)")
+    db.execute("DELETE FROM clientes WHERE id = 2001")
+    db.commit()
+
+
+def test_build_match_query_quotes_terms():
+    assert search.build_match_query('fuga "cal') == '"fuga" "cal"*'
+    assert search.build_match_query("  -*() ") is None
+
+
+def test_search_ranks_and_follows_writes(app):
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            found = search.search(db, "CALEFACCION")
+            assert found["facets"] == {"ticket": 2, "material": 1}
+            # La coincidencia en el título pesa más que en la descripción
+            assert [(r["kind"], r["id"]) for r in found["results"]][0] == ("ticket", 2001)
+            assert "<mark>calefacción</mark>" in found["results"][0]["snippet"]
+
+            assert [r["id"] for r in search.search(db, "radi", kind="presupuesto_item")["results"]] == [2001]
+            assert search.search(db, "cordoba")["facets"] == {"cliente": 1}
+
+            db.execute("UPDATE tickets SET titulo = 'Fuga fontanería', descripcion = NULL WHERE id = 2001")
+            db.execute("DELETE FROM materiales WHERE id = 20011")
+            db.commit()
+            assert search.search(db, "calefaccion")["facets"] == {"ticket": 1}
+            assert search.search(db, "fontaneria")["results"][0]["id"] == 2001
+            assert search.check_search_index(db) == {}
+
+            db.execute("DELETE FROM search_index WHERE rowid = 2002 * 8 + 1")
+            db.commit()
+            assert search.check_search_index(db)["ticket"][0] + 1 == search.check_search_index(db)["ticket"][1]
+            search.rebuild_search_index(db)
+            assert search.check_search_index(db) == {}
+            assert 2002 in [r["id"] for r in search.search(db, "revision anual", kind="ticket")["results"]]
+        finally:
+            _cleanup(db)
+
+
+def test_search_page_and_api(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            auth.login()
+            data = client.get("/search/api?q=purgado").get_json()
+            assert data["total"] == 1
+            assert data["results"][0]["url"] == "/quotes/2001/view"
+            response = client.get("/search/?q=jardin")
+            assert response.status_code == 200
+            assert "<mark>Jardín</mark>" in response.get_data(as_text=True)
+        finally:
+            auth.logout()
+            _cleanup(db)
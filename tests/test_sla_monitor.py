@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from backend.db_utils import get_db
+from backend.sla_monitor import SlaHeap, SlaMonitor, breach_stats
+
+
+def test_sla_heap_orders_updates_and_discards():
+    heap = SlaHeap()
+    heap.push(1, datetime(2031, 1, 1, 12))
+    heap.push(2, datetime(2031, 1, 1, 9))
+    heap.push(3, datetime(2031, 1, 1, 10))
+    heap.push(2, datetime(2031, 1, 1, 13))  # nuevo vencimiento: la entrada vieja queda obsoleta
+    heap.discard(3)
+    assert heap.peek() == (datetime(2031, 1, 1, 12), 1)
+    assert heap.pop_due(datetime(2031, 1, 1, 12, 30)) == [1]
+    assert len(heap) == 1 and 2 in heap
+    assert heap.pop_due(datetime(2031, 1, 2)) == [2]
+    assert heap.peek() is None
+
+
+def _breaches(stats, dimension, key):
+    return next((e["breaches"] for e in stats[dimension] if e["key"] == key), 0)
+
+
+def test_monitor_escalates_due_tickets_once(app, client, auth, monkeypatch):
+    monkeypatch.setitem(app.config, "OUTBOX_DISPATCHER", False)
+    with app.app_context():
+        db = get_db()
+        before = breach_stats(db)
+        db.execute("INSERT INTO clientes (id, nombre) VALUES (2301, 'Cliente SLA')")
+        db.executemany(
+            "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, prioridad, estado, sla_due, asignado_a) "
+            "VALUES (?, 2301, 'reparacion', 1, ?, ?, ?, ?, ?)",
+            [
+                (2301, "Vencido", "Media", "Abierto", "2031-01-01 10:00:00", 1),
+                (2302, "Más tarde", "Alta", "Abierto", "2031-01-01 12:00:00", None),
+                (2303, "Cerrado", "Media", "Cerrado", "2031-01-01 09:00:00", 1),
+                (2304, "Sin SLA", "Media", "Abierto", None, 1),
+            ],
+        )
+        db.commit()
+        try:
+            monitor = SlaMonitor()
+            monitor.rebuild(db)
+            assert 2301 in monitor.heap and 2302 in monitor.heap
+            assert 2303 not in monitor.heap and 2304 not in monitor.heap
+
+            assert monitor.escalate_due(db, now=datetime(2031, 1, 1, 11)) == [2301]
+            row = db.execute("SELECT prioridad, sla_breached_at FROM tickets WHERE id = 2301").fetchone()
+            assert tuple(row) == ("Alta", "2031-01-01 11:00:00")
+            assert db.execute(
+                "SELECT COUNT(*) FROM notification_outbox WHERE user_id = 1 AND message LIKE 'SLA vencido en el trabajo #2301%'"
+            ).fetchone()[0] == 2  # app + whatsapp
+
+            # Los cambios llegan por sla_ticket_changes, sin releer la tabla
+            db.execute("UPDATE tickets SET sla_due = '2031-01-01 10:30:00' WHERE id = 2302")
+            db.execute(
+                "INSERT INTO tickets (id, cliente_id, tipo, creado_por, titulo, estado, sla_due) "
+                "VALUES (2305, 2301, 'reparacion', 1, 'Cerrado a tiempo', 'Abierto', '2031-01-01 10:45:00')"
+            )
+            db.execute("UPDATE tickets SET estado = 'Cerrado' WHERE id = 2305")
+            db.commit()
+            assert monitor.sync(db) == 3  # incluye la escalada de 2301
+            assert monitor.next_due() == datetime(2031, 1, 1, 10, 30)
+            assert monitor.escalate_due(db, now=datetime(2031, 1, 1, 11)) == [2302]
+            assert db.execute("SELECT prioridad FROM tickets WHERE id = 2302").fetchone()[0] == "Urgente"
+
+            # Otro proceso con su propio montículo no vuelve a escalar
+            other = SlaMonitor()
+            other.rebuild(db)
+            assert other.escalate_due(db, now=datetime(2031, 1, 2)) == []
+
+            stats = breach_stats(db)
+            assert _breaches(stats, "cliente", "2301") == 2
+            assert _breaches(stats, "prioridad", "Media") - _breaches(before, "prioridad", "Media") == 1
+            assert _breaches(stats, "prioridad", "Alta") - _breaches(before, "prioridad", "Alta") == 1
+            assert stats["total"] - before["total"] == 2
+
+            auth.login()
+            data = client.get("/api/sla/breaches").get_json()
+            assert data["ok"] and _breaches(data["data"], "cliente", "2301") == 2
+        finally:
+            auth.logout()
+            db.execute("DELETE FROM notification_outbox WHERE message LIKE 'SLA vencido en el trabajo #230%'")
+            db.execute("DELETE FROM sla_breach_counters WHERE dimension = 'cliente' AND key = '2301'")
+            db.execute("DELETE FROM tickets WHERE id BETWEEN 2301 AND 2305")
+            db.execute("DELETE FROM clientes WHERE id = 2301")
+            db.commit()
@@ -0,0 +1,39 @@
+import logging
+
+from flask import g
+
+from backend import JsonFormatter
+from backend.sql_stats import normalize_sql
+
+
+def test_normalize_sql():
+    sql = """
+        SELECT * FROM tickets -- comentario
+        WHERE estado = 'abierto' AND id IN (1, 2, 3) AND cliente_id = ?
+    """
+    assert normalize_sql(sql) == "SELECT * FROM tickets WHERE estado = ? AND id IN (?...) AND cliente_id = ?"
+
+
+def test_server_timing_and_slow_query_log(app, client, auth):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    app.logger.addHandler(handler)
+    app.config.update(SQL_SERVER_TIMING=True, SLOW_QUERY_MS=0)
+    try:
+        auth.login()
+        response = client.get("/jobs/api", headers={"X-Request-ID": "req-sql-1"})
+    finally:
+        app.config.update(SQL_SERVER_TIMING=False, SLOW_QUERY_MS=200)
+        app.logger.removeHandler(handler)
+
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith("db;dur=")
+    slow = [r for r in records if "FROM tickets t" in (getattr(r, "sql", None) or "")]
+    assert slow
+    # El JsonFormatter incluye el request_id y el SQL normalizado
+    with app.test_request_context():
+        g.request_id = "req-sql-1"
+        line = JsonFormatter().format(slow[0])
+    assert '"request_id": "req-sql-1"' in line
+    assert '"sql": "SELECT t.id' in line
@@ -0,0 +1,51 @@
+import json
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+
+from backend import wa_client
+from backend.wa_throttle import reset_scheduler
+
+
+class _RecordingAdapter(BaseAdapter):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def send(self, request, timeout=None, **kwargs):
+        self.requests.append((request, timeout))
+        response = Response()
+        response.status_code = 200
+        response._content = json.dumps({"messages": [{"id": f"wamid.{len(self.requests)}"}]}).encode()
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def test_text_and_template_share_one_session(app, monkeypatch):
+    monkeypatch.setenv("WHATSAPP_PHONE_NUMBER_ID", "123")
+    monkeypatch.setenv("WHATSAPP_ACCESS_TOKEN", "tok")
+    monkeypatch.setitem(app.config, "WHATSAPP_RECIPIENT_INTERVAL", 0)
+    wa_client.reset_session()
+    reset_scheduler()
+    adapter = _RecordingAdapter()
+    session = wa_client.get_session()
+    session.mount(wa_client.GRAPH_HOST, adapter)
+    try:
+        with app.app_context():
+            assert wa_client.send_whatsapp_text("34600000001", "hola")["messages"][0]["id"] == "wamid.1"
+            wa_client.send_whatsapp_template("34600000001", "aviso", timeout=3)
+        assert wa_client.get_session() is session
+
+        (text_req, text_timeout), (tpl_req, tpl_timeout) = adapter.requests
+        assert text_req.url == "https://graph.facebook.com/v22.0/123/messages"
+        assert text_req.headers["Authorization"] == "Bearer tok"
+        assert json.loads(text_req.body)["text"] == {"body": "hola"}
+        assert json.loads(tpl_req.body)["template"] == {"name": "aviso", "language": {"code": "es"}}
+        assert text_timeout == (wa_client.DEFAULT_CONNECT_TIMEOUT, wa_client.DEFAULT_READ_TIMEOUT)
+        assert tpl_timeout == 3
+    finally:
+        wa_client.reset_session()
+        reset_scheduler()
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from backend import wa_logs
+from backend.db_utils import get_db
+
+
+def _seed(db):
+    db.executemany(
+        "INSERT INTO whatsapp_message_logs (direction, from_number, message_body, timestamp, status) "
+        "VALUES ('inbound', '34600001701', ?, ?, 'received')",
+        [
+            ("Retention old 1", "2026-01-10 09:00:00"),
+            ("Retention old 2", "2026-01-20 09:00:00"),
+            ("Retention old 3", "2026-02-05 09:00:00"),
+            ("Retention recent", "2026-10-01 09:00:00"),
+        ],
+    )
+    db.commit()
+
+
+def _cleanup(db):
+    db.execute("DELETE FROM whatsapp_message_logs WHERE message_body LIKE 'Retention %'")
+    for month in wa_logs.archive_months(db):
+        db.execute(f"DROP TABLE {wa_logs.archive_table(month)}")
+    db.commit()
+
+
+def test_archive_moves_old_rows_in_batches(app):
+    with app.app_context():
+        db = get_db()
+        _seed(db)
+        try:
+            now = datetime(2026, 10, 17)
+            assert wa_logs.count_archivable(db, days=90, now=now) == 3
+            result = wa_logs.archive_old_logs(db, days=90, batch_size=2, pause=0, now=now)
+            assert result["moved"] == 3 and result["batches"] == 2
+            assert result["months"] == {"202601": 2, "202602": 1}
+            assert wa_logs.archive_months(db) == ["202602", "202601"]
+
+            hot = db.execute(
+                "SELECT message_body FROM whatsapp_message_logs WHERE message_body LIKE 'Retention %'"
+            ).fetchall()
+            assert [r[0] for r in hot] == ["Retention recent"]
+            archived = db.execute(
+                f"SELECT message_body FROM {wa_logs.archive_table('202601')} ORDER BY timestamp"
+            ).fetchall()
+            assert [r[0] for r in archived] == ["Retention old 1", "Retention old 2"]
+            assert wa_logs.archive_old_logs(db, days=90, pause=0, now=now)["moved"] == 0
+        finally:
+            _cleanup(db)
+
+
+def test_log_viewer_paginates_hot_and_archived_rows(app, client, auth):
+    with app.app_context():
+        db = get_db()
+        # /whatsapp/logs usa backend.auth.login_required: rol interno, sin verificación de WhatsApp
+        db.execute("UPDATE users SET role = 'admin' WHERE id = 1")
+        _seed(db)
+        auth.login()
+        try:
+            wa_logs.archive_old_logs(db, days=90, pause=0, now=datetime(2026, 10, 17))
+
+            rows, cursor = wa_logs.fetch_log_page(db, limit=1, month="202601")
+            assert rows[0]["message_body"] == "Retention old 2" and cursor
+            rows, cursor = wa_logs.fetch_log_page(db, wa_logs.decode_log_cursor(cursor), limit=1, month="202601")
+            assert rows[0]["message_body"] == "Retention old 1" and cursor is None
+
+            response = client.get("/whatsapp/logs?limit=1")
+            assert response.status_code == 200
+            assert b"Retention recent" in response.data
+            assert b"Archivo 2026-01" in response.data
+            response = client.get("/whatsapp/logs?month=202601")
+            assert b"Retention old 1" in response.data and b"Retention recent" not in response.data
+            assert client.get("/whatsapp/logs?month=199901").status_code == 302
+        finally:
+            db.execute("UPDATE users SET role = NULL WHERE id = 1")
+            _cleanup(db)
+
+
+def test_retention_cutoff_uses_utc_like_current_timestamp(app):
+    with app.app_context():
+        db_now = datetime.strptime(get_db().execute("SELECT CURRENT_TIMESTAMP").fetchone()[0], "%Y-%m-%d %H:%M:%S")
+    cutoff = datetime.strptime(wa_logs.retention_cutoff(0), "%Y-%m-%d %H:%M:%S")
+    assert abs((cutoff - db_now).total_seconds()) < 5
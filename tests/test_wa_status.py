@@ -0,0 +1,95 @@
+from datetime import datetime, timezone
+
+from twilio.request_validator import RequestValidator
+
+from backend import wa_status
+from backend.db_utils import get_db
+
+WEBHOOK_URL = "http://localhost/whatsapp/webhooks/twilio/whatsapp"
+
+
+def _post_status(client, sid, status, **extra):
+    form = {"MessageSid": sid, "MessageStatus": status, "From": "whatsapp:+14155238886",
+            "To": "whatsapp:+34600001801", **extra}
+    signature = RequestValidator("tok").compute_signature(WEBHOOK_URL, form)
+    return client.post(WEBHOOK_URL, data=form, headers={"X-Twilio-Signature": signature})
+
+
+def test_status_callbacks_update_original_message(app, client, monkeypatch):
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "tok")
+    monkeypatch.setitem(app.config, "WA_STATUS_FLUSHER", False)
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO whatsapp_message_logs (direction, to_number, message_body, whatsapp_message_id, status) "
+            "VALUES ('outbound', '34600001801', ?, 'SM1801', 'sent')",
+            [("Status RFQ material 1",), ("Status RFQ material 2",)],
+        )
+        db.commit()
+        try:
+            for status in ("queued", "sent", "read", "delivered"):  # 'delivered' llega tarde
+                assert _post_status(client, "SM1801", status).status_code == 200
+            assert _post_status(client, "SM1899", "undelivered", ErrorCode="63016").status_code == 200
+
+            rows = db.execute(
+                "SELECT status, sent_at IS NOT NULL, delivered_at IS NOT NULL, read_at IS NOT NULL "
+                "FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1801'"
+            ).fetchall()
+            assert [tuple(r) for r in rows] == [("read", 1, 1, 1)] * 2
+            unknown = db.execute(
+                "SELECT direction, to_number, status, error_info, failed_at IS NOT NULL "
+                "FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1899'"
+            ).fetchall()
+            assert [tuple(r) for r in unknown] == [("outbound", "+34600001801", "undelivered", "Twilio 63016", 1)]
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE whatsapp_message_id IN ('SM1801', 'SM1899')")
+            db.commit()
+
+
+def test_callbacks_are_merged_before_writing_and_reported(app):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO whatsapp_message_logs (direction, message_body, whatsapp_message_id, status, timestamp) "
+            "VALUES ('outbound', 'Status report', 'SM1802', 'sent', '2026-10-16 10:00:00')"
+        )
+        db.commit()
+        try:
+            pending = {}
+            for status, at in [("delivered", "2026-10-16 10:00:04"), ("sent", "2026-10-16 10:00:01"),
+                               ("read", "2026-10-16 10:01:04")]:
+                wa_status.combine_updates(pending.setdefault("SM1802", {}), wa_status.status_update(status, at))
+            assert pending["SM1802"]["status"] == "read"
+            before = db.total_changes
+            assert wa_status.apply_status_updates(db, pending) == 1
+            assert db.total_changes - before == 1  # una sola escritura por mensaje
+
+            report = wa_status.delivery_report(db, days=7, now=datetime(2026, 10, 17, tzinfo=timezone.utc))
+            day = next(r for r in report if r["day"] == "2026-10-16")
+            assert (day["messages"], day["delivered"], day["read"], day["failed"]) == (1, 1, 1, 0)
+            assert round(day["avg_delivery_s"]) == 3 and round(day["avg_read_s"]) == 60
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1802'")
+            db.commit()
+
+
+def test_pending_statuses_are_flushed_at_exit(app, monkeypatch):
+    registered = []
+    monkeypatch.setattr(wa_status, "_flusher_thread", None)
+    monkeypatch.setattr(wa_status, "_flusher_loop", lambda app: None)
+    monkeypatch.setattr(wa_status.atexit, "register", lambda fn, *args: registered.append((fn, args)))
+    monkeypatch.setitem(app.config, "WA_STATUS_FLUSHER", True)
+    with app.app_context():
+        db = get_db()
+        try:
+            wa_status.record_status("SM1803", "delivered", to_number="+34600001803")
+            assert db.execute("SELECT COUNT(*) FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1803'").fetchone()[0] == 0
+
+            # Lo acumulado no se pierde al salir el proceso
+            (fn, args), = registered
+            fn(*args)
+            row = db.execute("SELECT status FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1803'").fetchone()
+            assert row["status"] == "delivered" and not wa_status._pending
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE whatsapp_message_id = 'SM1803'")
+            db.commit()
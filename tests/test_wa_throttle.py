@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import pytest
+import requests
+
+from backend.db_utils import get_db
+from backend.wa_throttle import OutboundScheduler, TokenBucket, WhatsAppRateLimited, session_window_open
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _http_error(status, headers=None):
+    response = requests.models.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = b"{}"
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def test_token_bucket_smooths_bursts():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, pytest.approx(0.1), pytest.approx(0.2)]
+    clock.now += 1.0
+    assert bucket.reserve() == 0.0
+
+
+def test_scheduler_paces_recipient_and_retries_with_retry_after():
+    clock = FakeClock()
+    scheduler = OutboundScheduler(rate=100, burst=100, recipient_interval=2.0, clock=clock, sleep=clock.sleep)
+    attempts = []
+
+    def send():
+        attempts.append(clock.now)
+        if len(attempts) == 1:
+            raise _http_error(429, {"Retry-After": "3"})
+        return "ok"
+
+    assert scheduler.call("phone-1", "34600000001", send) == "ok"
+    assert attempts == [0.0, 3.0]  # Retry-After respetado; el intervalo por destinatario ya había pasado
+
+    # Otro mensaje inmediato al mismo destinatario espera su turno
+    assert scheduler.call("phone-1", "34600000001", lambda: "ok") == "ok"
+    assert clock.sleeps[-1] == pytest.approx(2.0)  # el reintento (t=3) también ocupa su hueco
+
+
+def test_scheduler_does_not_retry_client_errors_and_caps_wait():
+    clock = FakeClock()
+    scheduler = OutboundScheduler(rate=1, burst=1, recipient_interval=0, max_wait=5, clock=clock, sleep=clock.sleep)
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise _http_error(400)
+
+    with pytest.raises(requests.HTTPError):
+        scheduler.call("phone-2", "34600000002", bad_request)
+    assert len(calls) == 1
+
+    for _ in range(5):
+        scheduler._bucket("phone-2").reserve()  # agota el bucket: la espera supera max_wait
+    with pytest.raises(WhatsAppRateLimited):
+        scheduler.call("phone-2", "34600000003", lambda: "ok")
+
+
+def test_session_window_open(app):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO whatsapp_message_logs (direction, from_number, message_body, timestamp) "
+            "VALUES ('inbound', '34600009999', 'hola', '2030-01-01 10:00:00')"
+        )
+        db.commit()
+        try:
+            assert session_window_open(db, "34600009999", now=datetime(2030, 1, 2, 9, 0))
+            assert not session_window_open(db, "34600009999", now=datetime(2030, 1, 2, 11, 0))
+            assert not session_window_open(db, "34600000000", now=datetime(2030, 1, 2, 9, 0))
+            # El número del proveedor puede estar guardado en otro formato
+            for stored in ("+34 600 00 99 99", "600009999", "0034600009999", "whatsapp:+34600009999"):
+                assert session_window_open(db, stored, now=datetime(2030, 1, 2, 9, 0))
+        finally:
+            db.execute("DELETE FROM whatsapp_message_logs WHERE from_number = '34600009999'")
+            db.commit()
+
+
+def test_read_timeouts_are_not_retried():
+    clock = FakeClock()
+    scheduler = OutboundScheduler(rate=100, burst=100, recipient_interval=0, clock=clock, sleep=clock.sleep)
+    for exc, expected_calls in ((requests.ReadTimeout("leído a medias"), 1), (requests.ConnectTimeout("sin conexión"), 2)):
+        calls = []
+
+        def send():
+            calls.append(1)
+            if len(calls) == 1:
+                raise exc
+            return "ok"
+
+        if expected_calls == 1:
+            with pytest.raises(requests.ReadTimeout):
+                scheduler.call("phone-4", "34600000004", send)
+        else:
+            assert scheduler.call("phone-4", "34600000004", send) == "ok"
+        assert len(calls) == expected_calls
+
+
+def test_wait_is_capped_lower_inside_a_request(app, monkeypatch):
+    clock = FakeClock()
+    scheduler = OutboundScheduler(rate=1, burst=1, recipient_interval=0, max_wait=60, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        scheduler._bucket("phone-5").reserve()  # ~10 s de cola: vale en segundo plano, no en una petición
+    monkeypatch.setitem(app.config, "WHATSAPP_REQUEST_MAX_WAIT", 5)
+    with app.test_request_context():
+        app.preprocess_request()
+        try:
+            with pytest.raises(WhatsAppRateLimited):
+                scheduler.call("phone-5", "34600000005", lambda: "ok")
+        finally:
+            app.do_teardown_request()
+    # Fuera de la petición vale el tope del planificador (el intento rechazado también gastó su token)
+    assert scheduler.call("phone-5", "34600000005", lambda: "ok") == "ok"
+    assert clock.sleeps[-1] == pytest.approx(11.0)
+
+
+def test_recipient_slots_are_pruned():
+    clock = FakeClock()
+    scheduler = OutboundScheduler(rate=10**6, burst=10**6, recipient_interval=1.0, clock=clock, sleep=clock.sleep)
+    for i in range(5000):
+        scheduler.call("phone-6", f"346{i:08d}", lambda: "ok")
+        clock.now += 0.01
+    assert len(scheduler._next_to_recipient) <= 2048